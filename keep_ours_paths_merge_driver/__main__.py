@@ -1,17 +1,82 @@
 #! /usr/bin/env python3
 
-import logging
 import os
-import shlex
-import subprocess
 import sys
 
-from keep_ours_paths_merge_driver import config
-from keep_ours_paths_merge_driver import json_merge_driver
-from keep_ours_paths_merge_driver import xml_merge_driver
+from keep_ours_paths_merge_driver import client
+
+#
+# Git starts the merge-driver once per file to merge. So the import-time is part of each call. Only the modules needed
+# by the call are imported:
+#
+#   - The merge-driver of the given file-type. The XML-merge-driver imports lxml, the JSON-merge-driver doesn't.
+#   - subprocess and shlex at the time git merge-file is called, or diff3 for the builtin merge.
+#
+# See tests/integration/test_startup.py for the imported modules.
+#
+# If a server is running, the theirs-file is prepared by the server. The call is forwarded before the command line is
+# parsed, and before the merge-driver's modules are imported. See client.py and server.py.
+#
+# With --scope hunks the files are merged first. A merge without conflicts is the result, unless there are
+# always-ours-paths. Otherwise theirs is prepared within the lines of the conflicts, and merged again. If nothing has
+# been prepared, the first merge is the result. See merge.py.
+#
+# If the environment variable KOP_PROFILE_DIR is set, the call is profiled. See profiling.py. With --metrics-file the
+# time per stage is recorded. See metrics.py.
+#
+
+SUBCOMMANDS = ['serve', 'batch', 'strategy', 'merge-tree', 'memo', 'profile', 'stats']
 
 
 def main():
+    if os.getenv('KOP_PROFILE_DIR') and sys.argv[1:2] != ['profile']:
+        # Imported here, as are the profilers by it.
+        from keep_ours_paths_merge_driver import profiling
+        profiling.run(_main, os.environ)
+    else:
+        _main()
+
+
+def _main():
+    if sys.argv[1:2] and sys.argv[1] not in SUBCOMMANDS:
+        # A merge-driver call. If a server is running, it does all but the git merge-file.
+        returncode = client.run(sys.argv[1:], os.getenv('KOP_MERGE_DRVIER_PATHSPATTERNS'))
+        if returncode is not None:
+            sys.exit(returncode)
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        from keep_ours_paths_merge_driver import server
+        server.serve(sys.argv[2:])
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        # Imported here, because it imports concurrent.futures. See batch.py.
+        from keep_ours_paths_merge_driver import batch
+        sys.exit(batch.main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'strategy':
+        # The merge-strategy git-merge-kop. See strategy.py.
+        from keep_ours_paths_merge_driver import strategy
+        sys.exit(strategy.main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'merge-tree':
+        # Without worktree, e.g. in a bare repository. See merge_tree.py.
+        from keep_ours_paths_merge_driver import merge_tree
+        sys.exit(merge_tree.main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'memo':
+        # Inspect or clear the result-memo. See result_memo.py.
+        from keep_ours_paths_merge_driver import result_memo
+        sys.exit(result_memo.main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'profile':
+        # Merge the profile-dumps. See profiling.py.
+        from keep_ours_paths_merge_driver import profiling
+        sys.exit(profiling.main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == 'stats':
+        # Aggregate the metrics-files. See metrics.py.
+        from keep_ours_paths_merge_driver import metrics
+        sys.exit(metrics.main(sys.argv[2:]))
+
+    # Imported after forwarding, see above. config imports argparse and logging.
+    import logging
+    from keep_ours_paths_merge_driver import config
+    from keep_ours_paths_merge_driver import merge
+
     # For parameters see also "Defining a custom merge driver"
     # https://git-scm.com/docs/gitattributes#_defining_a_custom_merge_driver
     cl_parser = config.init_argument_parser()
@@ -25,67 +90,82 @@ def main():
     logger.debug(f"sys.argv: {sys.argv}")
     logger.debug(f"args: {cl_args}")
 
-    #
-    # In the following we're using the following terms for the XML-representations:
-    #
-    #   - filepath: The filename as it is given by the Merge-Driver parameters %O, %A, %B.
-    #               These filenames are temp-files and aren't named as the original ones.
-    #   - doc:      The file as xml.etree.ElementTree, a "XML-document".
-    #   - str:      The file as string.
-    #
-
-    base_filepath = cl_args.base  # %O
-    ours_filepath = cl_args.ours  # %A'
-    theirs_filepath = cl_args.theirs  # %B
-
-    with open(base_filepath) as f_o, open(ours_filepath) as f_a, open(theirs_filepath, newline='') as f_b:
-        base_file_str = f_o.read()
-        ours_file_str = f_a.read()
-        theirs_file_str = f_b.read()
-
-    # The merge-driver makes only sense if all three files have content.
-    # If the file has been added to ours-branch and theirs-branch, but was not present before in base, the base-file
-    # is empty.
-    if base_file_str and ours_file_str and theirs_file_str:
-        paths_from_cl_args_as_list = getattr(cl_args, 'pathspatterns', None)
-        paths_from_environment_as_str = os.getenv('KOP_MERGE_DRVIER_PATHSPATTERNS')
-        logger.debug(f"-p: {paths_from_cl_args_as_list}")
-        logger.debug(f"KOP_MERGE_DRVIER_PATHSPATTERNS: {paths_from_environment_as_str}")
-        # Get path_and_patterns either from environment variable or command-line parameter. Environment variable takes
-        # precedence.
-        paths_and_patterns = config.get_paths_and_patterns(
-            paths_from_environment_as_str, paths_from_cl_args_as_list, cl_args.separator)
-        logger.info(f"paths_and_patterns: {paths_and_patterns}")
-        if paths_and_patterns:
-            # This is the tiny merge-driver-factory.
-            # The choices are limited to 'XML' and 'JSON'. So there is no need to check any alternative to 'XML'.
-            # If not 'XML' it is 'JSON'. 'XML' is the default.
-            if cl_args.filetype == 'XML':
-                merge_driver = xml_merge_driver
-            else:
-                merge_driver = json_merge_driver
-
-            merge_driver.set_paths_and_patterns(paths_and_patterns)
-            prepared_theirs_str = merge_driver.get_prepared_theirs_str(base_file_str, ours_file_str, theirs_file_str)
-
-            if cl_args.stdout:
-                print(prepared_theirs_str)
-
-            with open(theirs_filepath, mode='w', newline='') as f:
-                f.write(prepared_theirs_str)
-        else:
-            logger.info("paths_and_patterns-config is empty."
-                        + " Nothing has been set in command-line-parameter -p"
-                        + " nor in environment-variable KOP_MERGE_DRVIER_PATHSPATTERNS."
-                        + " This means no preparation of theirs-file take place.")
-
-    # From the docs https://git-scm.com/docs/git-merge-file:
-    #   "git merge-file incorporates all changes that lead from the <base-file> to <other-file> into
-    #   <current-file>. The result ordinarily goes into <current-file>.".
-    # Despite ours_a_filename is a temp-file, Git notices the merge-result and will write it to
-    # the regular file in the workspace.
-    cmd = "git merge-file -L ours -L base -L theirs " + ours_filepath + " " + base_filepath + " " + theirs_filepath
-    returncode = subprocess.call(shlex.split(cmd))
+    paths_from_environment_as_str = os.getenv('KOP_MERGE_DRVIER_PATHSPATTERNS')
+    if not cl_args.metrics_file:
+        _merge(cl_args, paths_from_environment_as_str)
+        return
+    from keep_ours_paths_merge_driver import metrics
+    metrics.start(os.getcwd(), cl_args.path, cl_args.filetype,
+                  [path_and_pattern['path'] for path_and_pattern in
+                   merge.get_paths_and_patterns(cl_args, paths_from_environment_as_str)])
+    returncode = None
+    try:
+        _merge(cl_args, paths_from_environment_as_str)
+    except SystemExit as e:
+        returncode = e.code
+        raise
+    finally:
+        metrics.write(metrics.stop(returncode), cl_args.metrics_file)
+
+
+def _merge(cl_args, paths_from_environment_as_str):
+    # Exits by sys.exit() with the exit code of the merge.
+    import logging
+    from keep_ours_paths_merge_driver import config
+    from keep_ours_paths_merge_driver import merge
+    from keep_ours_paths_merge_driver import metrics
+    logger = logging.getLogger()
+    merged_content = None
+    if cl_args.scope == config.SCOPE_HUNKS:
+        metrics.enter('merge-file')
+        merged_content, merged_returncode = merge.merge_files(cl_args)
+        if merged_returncode == 0 and merged_content is not None and not merge.has_always_ours_paths(
+                merge.get_paths_and_patterns(cl_args, paths_from_environment_as_str)):
+            logger.info("Merged without conflicts. Nothing to prepare.")
+            merge.write_file(cl_args.ours, merged_content)
+            sys.exit(0)
+
+    metrics.enter('server')
+    # The server has declined the whole call, or isn't reachable. See client.py.
+    response = client.forward(sys.argv[1:], paths_from_environment_as_str)
+    if response is not None:
+        # The server has written the prepared theirs to the theirs-file. The files are read from there if needed.
+        is_prepared = response['prepared']
+        base_file_content = ours_file_content = theirs_file_content = None
+    else:
+        metrics.enter('read')
+        base_file_content, ours_file_content, theirs_file_content = merge.read_files(cl_args)
+        prepared_theirs = merge.prepare_theirs(
+            cl_args, paths_from_environment_as_str, base_file_content, ours_file_content, theirs_file_content)
+        is_prepared = prepared_theirs is not None
+        if is_prepared:
+            theirs_file_content = prepared_theirs
+            # The builtin merge takes the prepared theirs in-memory.
+            if cl_args.merge_file == config.MERGE_FILE_GIT:
+                metrics.enter('write')
+                merge.write_file(cl_args.theirs, prepared_theirs)
+
+    if not is_prepared and merged_content is not None:
+        # Merging again would give the same result.
+        merge.write_file(cl_args.ours, merged_content)
+        sys.exit(merged_returncode)
+
+    if is_prepared and cl_args.stdout or cl_args.merge_file == config.MERGE_FILE_BUILTIN:
+        if base_file_content is None:
+            metrics.enter('read')
+            base_file_content, ours_file_content, theirs_file_content = merge.read_files(cl_args)
+
+    if is_prepared and cl_args.stdout:
+        # The bytes as written to the theirs-file.
+        sys.stdout.flush()
+        sys.stdout.buffer.write(theirs_file_content)
+        sys.stdout.buffer.flush()
+
+    metrics.enter('merge-file')
+    if cl_args.merge_file == config.MERGE_FILE_BUILTIN:
+        returncode = merge.merge_file_builtin(cl_args.ours, base_file_content, ours_file_content, theirs_file_content)
+    else:
+        returncode = merge.merge_file(cl_args.ours, cl_args.base, cl_args.theirs)
     sys.exit(returncode)
 
 
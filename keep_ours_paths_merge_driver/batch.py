@@ -0,0 +1,255 @@
+import concurrent.futures
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+from keep_ours_paths_merge_driver import config
+from keep_ours_paths_merge_driver import engine
+from keep_ours_paths_merge_driver import merge
+
+logger = logging.getLogger()
+
+#
+# The batch-mode merges many file-triples in one process:
+#
+#   keep_ours_paths_merge_driver batch -p ... [-t XML|JSON] [-m git|builtin] [--manifest-format jsonl|nul]
+#       [--executor process|thread] [-j WORKERS] MANIFEST
+#
+# The manifest lists the file-triples, '-' reads it from stdin. The file-paths are relative to the current working
+# directory. There are two formats:
+#
+#   - jsonl: One JSON-object per line: {"base": "...", "ours": "...", "theirs": "...", "output": "..."}
+#   - nul:   The fields base, ours, theirs, output, each terminated by NUL. E.g. written by
+#               printf '%s\0' base.xml ours.xml theirs.xml merged.xml
+#
+# The output is optional, or empty in the nul-format. It defaults to ours, like the merge-driver writes its result to
+# ours. The base-, ours- and theirs-files aren't changed, the prepared theirs is merged in-memory.
+#
+# The paths-config is parsed once. Each worker compiles it once, and then prepares and merges its share of the
+# triples. The workers are processes by default. lxml releases the GIL while parsing, so threads are an option for
+# XML-files.
+#
+# Per triple a JSON-line is printed to stdout, in the order of the manifest:
+#   {"ours": "...", "output": "...", "exit_status": the number of conflicts or -1 on error, "seconds": ...}
+# with an additional "error" on error. The exit code of the batch is 0 if all triples have been merged without
+# conflicts, 1 if there have been conflicts, and 2 on errors.
+#
+
+MANIFEST_FORMAT_JSONL = 'jsonl'
+MANIFEST_FORMAT_NUL = 'nul'
+MANIFEST_FORMATS = [MANIFEST_FORMAT_JSONL, MANIFEST_FORMAT_NUL]
+EXECUTOR_PROCESS = 'process'
+EXECUTOR_THREAD = 'thread'
+EXECUTORS = [EXECUTOR_PROCESS, EXECUTOR_THREAD]
+MANIFEST_FIELDS = ['base', 'ours', 'theirs', 'output']
+
+# Set per worker by _init_worker().
+_worker_config = {}
+
+
+def available_cpu_count(cgroup_root='/sys/fs/cgroup'):
+    """
+    The number of CPUs the process may use. This is the CPU-affinity, limited by the CPU-quota of the cgroup, as set
+    e.g. by "docker run --cpus" on CI-runners.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cpu_count = len(os.sched_getaffinity(0))
+    else:
+        cpu_count = os.cpu_count() or 1
+
+    quota = period = None
+    try:
+        # cgroup v2: "max 100000" or "<quota> <period>".
+        with open(os.path.join(cgroup_root, 'cpu.max')) as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        try:
+            # cgroup v1: A quota of -1 means unlimited.
+            with open(os.path.join(cgroup_root, 'cpu', 'cpu.cfs_quota_us')) as f:
+                quota = f.read().strip()
+            with open(os.path.join(cgroup_root, 'cpu', 'cpu.cfs_period_us')) as f:
+                period = f.read().strip()
+        except OSError:
+            pass
+    try:
+        if quota is not None and quota not in ('max', '-1'):
+            cpu_count = min(cpu_count, math.ceil(int(quota) / int(period)))
+    except (ValueError, ZeroDivisionError):
+        pass
+
+    return max(cpu_count, 1)
+
+
+def read_manifest(manifest_str, manifest_format=MANIFEST_FORMAT_JSONL):
+    """
+    :return: List of dicts with the keys base, ours, theirs, output.
+    """
+    if manifest_format == MANIFEST_FORMAT_NUL:
+        fields = manifest_str.split('\0')
+        # The last field is terminated by NUL as well.
+        if fields and fields[-1] == '':
+            fields.pop()
+        if len(fields) % len(MANIFEST_FIELDS):
+            raise ValueError(f"The manifest has {len(fields)} fields, expected a multiple of {len(MANIFEST_FIELDS)}:"
+                             + f" {', '.join(MANIFEST_FIELDS)}.")
+        entries = [dict(zip(MANIFEST_FIELDS, fields[i:i + len(MANIFEST_FIELDS)]))
+                   for i in range(0, len(fields), len(MANIFEST_FIELDS))]
+    else:
+        entries = []
+        for line_number, line in enumerate(manifest_str.splitlines(), start=1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            missing = [field for field in MANIFEST_FIELDS[:3] if not entry.get(field)]
+            if missing:
+                raise ValueError(f"Manifest line {line_number}: Missing {', '.join(missing)}.")
+            entries.append(entry)
+
+    for entry in entries:
+        if not entry.get('output'):
+            entry['output'] = entry['ours']
+    return entries
+
+
+def _init_worker(filetype, paths_and_patterns, merge_file, loglevel=None):
+    # A worker-process configures its logging. The worker-threads log by the parent's root logger as it is.
+    if loglevel is not None:
+        config.configure_logger(loglevel)
+    # An engine is thread-safe, so the thread-workers share it. See engine.py.
+    engine_key = (filetype, json.dumps(paths_and_patterns))
+    if _worker_config.get('engine_key') != engine_key:
+        _worker_config.update(engine_key=engine_key, engine=engine.Engine(paths_and_patterns or [], filetype),
+                              has_paths_and_patterns=bool(paths_and_patterns))
+    _worker_config['merge_file'] = merge_file
+
+
+def _prepare_triple(triple):
+    # As in merge.prepare_theirs(), prepare theirs only if all three files have content.
+    if _worker_config['has_paths_and_patterns'] and all(triple):
+        prepared_theirs, _ = _worker_config['engine'].prepare_theirs(*triple)
+        return prepared_theirs
+    return None
+
+
+def merge_entry(entry):
+    """
+    Prepare theirs and merge the triple of the manifest-entry. Runs in a worker.
+
+    :return: The per-triple result, see the module's header.
+    """
+    start = time.perf_counter()
+    result = {'ours': entry['ours'], 'output': entry['output']}
+    try:
+        base_file_content, ours_file_content, theirs_file_content = (
+            merge.read_file_bytes(entry[field]) for field in ['base', 'ours', 'theirs'])
+        prepared_theirs = _prepare_triple((base_file_content, ours_file_content, theirs_file_content))
+        if prepared_theirs is not None:
+            theirs_file_content = prepared_theirs
+        if _worker_config['merge_file'] == config.MERGE_FILE_BUILTIN:
+            merged_content, exit_status = merge.merge_strs_builtin(
+                base_file_content, ours_file_content, theirs_file_content)
+        else:
+            merged_content, exit_status = merge.merge_strs_git(
+                base_file_content, ours_file_content, theirs_file_content)
+        if merged_content is None:
+            result['error'] = 'Cannot merge'
+        else:
+            merge.write_file(entry['output'], merged_content)
+        result['exit_status'] = exit_status
+    except Exception as e:
+        logger.exception(f"merge_entry(); entry: {entry}")
+        result['exit_status'] = -1
+        result['error'] = f'{type(e).__name__}: {e}'
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def run(entries, filetype, paths_and_patterns, merge_file=config.MERGE_FILE_DEFAULT,
+        executor=EXECUTOR_PROCESS, workers=None, loglevel=config.DEFAULT_LOGLEVEL):
+    """
+    :return: List of the per-triple results, in the order of the entries.
+    """
+    return _map(merge_entry, entries, filetype, paths_and_patterns, merge_file, executor, workers, loglevel)
+
+
+def prepare_theirs_contents(triples, filetype, paths_and_patterns, executor=EXECUTOR_PROCESS, workers=None,
+                            loglevel=config.DEFAULT_LOGLEVEL):
+    """
+    Prepare theirs of in-memory file-triples. Used by the merge-strategy, see strategy.py.
+
+    :param triples: List of tuples of the base-, ours- and theirs-content as bytes.
+    :return: List of the prepared theirs, or None if not prepared, in the order of the triples.
+    """
+    return _map(_prepare_triple, triples, filetype, paths_and_patterns, config.MERGE_FILE_DEFAULT, executor, workers,
+                loglevel)
+
+
+def _map(function, items, filetype, paths_and_patterns, merge_file, executor, workers, loglevel):
+    workers = workers or available_cpu_count()
+    initargs = (filetype, paths_and_patterns, merge_file)
+    if executor == EXECUTOR_THREAD:
+        pool_executor = concurrent.futures.ThreadPoolExecutor(workers, initializer=_init_worker, initargs=initargs)
+        chunksize = 1
+    else:
+        pool_executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                               initargs=initargs + (loglevel,))
+        # Fewer round-trips to the processes, but still spread over all workers.
+        chunksize = max(1, len(items) // (workers * 4))
+    logger.info(f"Processing {len(items)} file-triples by {workers} {executor}-workers")
+    with pool_executor:
+        return list(pool_executor.map(function, items, chunksize=chunksize))
+
+
+def init_argument_parser():
+    import argparse
+    parser = argparse.ArgumentParser(prog=f'{config.SCRIPT_NAME} batch',
+                                     description='Prepare and merge the file-triples listed in a manifest.')
+    parser.add_argument('manifest', help="The manifest-file, or '-' for stdin.")
+    parser.add_argument('--manifest-format', choices=MANIFEST_FORMATS, default=MANIFEST_FORMAT_JSONL,
+                        help=f"The manifest-format, one of {MANIFEST_FORMATS}. Defaults to {MANIFEST_FORMAT_JSONL}.")
+    parser.add_argument('--executor', choices=EXECUTORS, default=EXECUTOR_PROCESS,
+                        help=f"The workers, one of {EXECUTORS}. Defaults to {EXECUTOR_PROCESS}.")
+    parser.add_argument('-j', '--workers', type=int,
+                        help="The number of workers. Defaults to the number of CPUs available to the process.")
+    parser.add_argument('-p', '--pathspatterns', nargs='+', metavar='MERGE-STRATEGY:PATH:PATTERN',
+                        help="As in the merge-driver.")
+    parser.add_argument('-s', '--separator', default=config.PATHS_TO_PATTERN_SEPARATOR,
+                        help="As in the merge-driver.")
+    parser.add_argument('-t', '--filetype', choices=config.FILE_TYPES, default=config.FILE_TYPE_DEFAULT,
+                        help="As in the merge-driver.")
+    parser.add_argument('-m', '--merge-file', choices=config.MERGE_FILES, default=config.MERGE_FILE_DEFAULT,
+                        help="As in the merge-driver.")
+    parser.add_argument('-l', '--loglevel', choices=config.LOG_LEVELS, default=config.DEFAULT_LOGLEVEL,
+                        help="As in the merge-driver.")
+    return parser
+
+
+def main(argv):
+    cl_args = init_argument_parser().parse_args(argv)
+    config.configure_logger(cl_args.loglevel)
+
+    if cl_args.manifest == '-':
+        manifest_str = sys.stdin.read()
+    else:
+        manifest_str = merge.read_file(cl_args.manifest)
+    entries = read_manifest(manifest_str, cl_args.manifest_format)
+
+    paths_and_patterns = merge.get_paths_and_patterns(cl_args, os.getenv('KOP_MERGE_DRVIER_PATHSPATTERNS'))
+    logger.info(f"paths_and_patterns: {paths_and_patterns}")
+
+    start = time.perf_counter()
+    results = run(entries, cl_args.filetype, paths_and_patterns, cl_args.merge_file, cl_args.executor,
+                  cl_args.workers, cl_args.loglevel)
+    for result in results:
+        print(json.dumps(result))
+
+    conflicts_count = sum(1 for result in results if result['exit_status'] > 0)
+    errors_count = sum(1 for result in results if 'error' in result)
+    logger.info(f"Merged {len(results)} file-triples in {time.perf_counter() - start:.3f}s;"
+                + f" with conflicts: {conflicts_count}; errors: {errors_count}")
+    if errors_count:
+        return 2
+    return 1 if conflicts_count else 0
@@ -0,0 +1,135 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger()
+
+#
+# The budgets of the preparation of theirs. A pathological file, e.g. a value repeated thousands of times, or a huge
+# generated XML-file, may take minutes or gigabytes to prepare. With budgets the preparation is abandoned instead, and
+# the files are merged unprepared, see merge.prepare_theirs():
+#
+#   - The time-budget is the wall-clock time of the preparation. In the main thread a timer-signal interrupts the
+#     preparation when the budget is exceeded. Python handles the signal between two steps of the Python-code only, so
+#     a parse by lxml or a regex running in C completes before it is interrupted. In other threads the time is checked
+#     at the checkpoints only.
+#   - The memory-budget is the growth of the resident memory of the process since the start of the preparation. It is
+#     checked at the checkpoints. The memory of other preparations running concurrently in the process counts as well.
+#
+# The merge-drivers call check() at their checkpoints: Before and after each parse, per path in the detection and the
+# replacement, and per trial in utils.replace_token(). A checkpoint names the stage and the path, so the log tells
+# where the budget has been exceeded. Without budgets check() returns at once.
+#
+# The budgets are per call: start() sets them in the context of the calling thread, see contextvars. So concurrent
+# calls, e.g. by the engines in the server or the batch, don't see each other's budgets. utils.map_concurrently() runs
+# the threads parsing concurrently in copies of the caller's context, so their checkpoints check the caller's budgets.
+# There is one timer-signal per process. It is started for a call on the main thread only, and raises only in the
+# context of that call.
+#
+
+# The budgets of the preparation running in the current context, set by start().
+_budget = contextvars.ContextVar('budget', default={})
+
+# The budgets the timer-signal has been started for.
+_timer = {}
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def _get_rss():
+    # The resident memory in bytes. /proc/self/statm is Linux-only, elsewhere the peak resident memory is taken.
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        import sys
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS.
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def _get_message(kind, budget):
+    message = f"The {kind}-budget has been exceeded in stage '{budget.get('stage')}'"
+    if budget.get('path') is not None:
+        message += f" at path '{budget['path']}'"
+    return message
+
+
+def start(seconds=None, memory_bytes=None):
+    """
+    Start the budgets in the current context. A budget of None or not positive isn't limited.
+
+    :param seconds: The time-budget.
+    :param memory_bytes: The memory-budget.
+    """
+    stop()
+    budget = {}
+    if memory_bytes is not None and memory_bytes > 0:
+        budget['max_rss'] = _get_rss() + memory_bytes
+    if seconds is not None and seconds > 0:
+        budget['deadline'] = time.monotonic() + seconds
+    if not budget:
+        return
+    budget.update(stage='start', path=None, seconds=seconds, memory_bytes=memory_bytes)
+    _budget.set(budget)
+    # The timer is started last, as it may fire at once.
+    if 'deadline' in budget and threading.current_thread() is threading.main_thread():
+        import signal
+        if hasattr(signal, 'setitimer'):
+            _timer.update(budget=budget, previous_handler=signal.signal(signal.SIGALRM, _on_timer))
+            signal.setitimer(signal.ITIMER_REAL, seconds)
+
+
+def stop():
+    """
+    Stop the budgets of the current context.
+    """
+    try:
+        _stop()
+    except BudgetExceeded:
+        # The timer-signal has fired within _stop(), after the preparation. It fires once, so the teardown is repeated
+        # undisturbed. Otherwise the exception would escape from the caller's finally, and the timer and the budgets
+        # would be left to the next call of the process.
+        _stop()
+
+
+def _stop():
+    # Each step may be repeated. The timer is disarmed first, and the state is cleared last.
+    if _timer and _timer['budget'] is _budget.get():
+        import signal
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, _timer['previous_handler'])
+        _timer.clear()
+    _budget.set({})
+
+
+def _on_timer(signum, frame):
+    budget = _budget.get()
+    # The signal is handled by the main thread, which may have left the call in the meantime.
+    if budget and budget is _timer.get('budget'):
+        raise BudgetExceeded(_get_message('time', budget) + f" ({budget['seconds']}s)")
+
+
+def check(stage=None, path=None):
+    """
+    A checkpoint.
+
+    :param stage: The stage the preparation enters, e.g. 'parse'. None keeps the stage and the path.
+    :param path: The path the stage is working on, if any.
+    :raise BudgetExceeded: If a budget of the current context has been exceeded.
+    """
+    budget = _budget.get()
+    if not budget:
+        return
+    if stage is not None:
+        budget['stage'] = stage
+        budget['path'] = path
+    if 'deadline' in budget and time.monotonic() > budget['deadline']:
+        raise BudgetExceeded(_get_message('time', budget) + f" ({budget['seconds']}s)")
+    if 'max_rss' in budget and _get_rss() > budget['max_rss']:
+        raise BudgetExceeded(_get_message('memory', budget) + f" ({budget['memory_bytes']} bytes)")
@@ -0,0 +1,106 @@
+import os
+import sys
+
+#
+# The client of the server-mode, see server.py. A merge-driver call forwards itself to the server before it imports
+# the merge-driver's modules. So this module imports os and sys only, and socket and json only if there is a socket.
+# It doesn't import config, which imports argparse, nor logging.
+#
+# A call is forwarded twice at most:
+#
+#   1. forward(..., call=True) before the command line is parsed, see __main__.py. The server parses it, prepares the
+#       theirs-file, and responds with the git merge-file command the client runs. If the call needs the client to do
+#       more than that, e.g. --stdout, --merge-file builtin or --metrics-file, the server declines.
+#   2. forward() of a declined call, after the command line has been parsed. The server prepares the theirs-file
+#       only.
+#
+# If the server isn't reachable or fails, it isn't asked again by the same call. The message is logged by the
+# forward() of step 2, as the logger isn't configured before.
+#
+
+# The file-name is config.SCRIPT_NAME + '.sock'.
+SOCKET_FILENAME = 'keep_ours_paths_merge_driver.sock'
+# Seconds a client waits for the response before it prepares the theirs-file itself.
+CLIENT_TIMEOUT = 60
+
+# The failure of the first forward() of the call, if any.
+_failure = {}
+
+
+def get_socket_path():
+    socket_path = os.getenv('KOP_MERGE_DRIVER_SOCKET')
+    if socket_path:
+        return socket_path
+    runtime_dir = os.getenv('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, SOCKET_FILENAME)
+    if os.path.isdir('.git'):
+        return os.path.join('.git', SOCKET_FILENAME)
+    return None
+
+
+def forward(argv, paths_from_environment_as_str, call=False):
+    """
+    Forward the merge-driver call to the server.
+
+    :param call: Ask the server for the whole call, i.e. for the git merge-file command as well, see above.
+    :return: The response, or None if there is no server or it could not handle the request.
+    """
+    if _failure:
+        _log_failure()
+        return None
+    socket_path = get_socket_path()
+    if not socket_path or not os.path.exists(socket_path):
+        return None
+    import json
+    import socket
+    request = {'argv': argv, 'cwd': os.getcwd(), 'paths_from_environment': paths_from_environment_as_str,
+               'call': call}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client_socket:
+            client_socket.settimeout(CLIENT_TIMEOUT)
+            client_socket.connect(socket_path)
+            client_socket.sendall(json.dumps(request).encode() + b'\n')
+            response = json.loads(receive_line(client_socket))
+    except (OSError, ValueError) as e:
+        _failure['message'] = f"forward(); server at {socket_path} not reachable: {e}"
+        _log_failure()
+        return None
+    for log_line in response.get('log', []):
+        print(log_line, file=sys.stderr)
+    if 'error' in response:
+        _failure['message'] = f"forward(); server failed: {response['error']}"
+        _log_failure()
+        return None
+    return response
+
+
+def run(argv, paths_from_environment_as_str):
+    """
+    Forward the whole merge-driver call to the server, and run the git merge-file command it responds with.
+
+    :return: The exit code of git merge-file, or None if the call hasn't been forwarded.
+    """
+    response = forward(argv, paths_from_environment_as_str, call=True)
+    if response is None or 'merge_file_cmd' not in response:
+        return None
+    import subprocess
+    return subprocess.call(response['merge_file_cmd'])
+
+
+def _log_failure():
+    # Logged only once the logger has been configured, see above.
+    import logging
+    if logging.getLogger().handlers:
+        logging.getLogger().debug(_failure['message'])
+
+
+def receive_line(connection):
+    chunks = []
+    while True:
+        chunk = connection.recv(65536)
+        if not chunk:
+            raise ValueError('Connection closed before the end of the message')
+        chunks.append(chunk)
+        if chunk.endswith(b'\n'):
+            return b''.join(chunks)
@@ -22,6 +22,24 @@ MERGE_STRATEGIES = [
     MERGE_STRATEGY_ON_CONFLICT_OURS,
     MERGE_STRATEGY_ALWAYS_OURS
 ]
+# The 3-way file-merge after the preparation of theirs. 'git' calls git merge-file, 'builtin' merges in-process.
+MERGE_FILE_GIT = 'git'
+MERGE_FILE_BUILTIN = 'builtin'
+MERGE_FILE_DEFAULT = MERGE_FILE_GIT
+MERGE_FILES = [MERGE_FILE_GIT, MERGE_FILE_BUILTIN]
+# What is resolved. 'file' prepares the whole theirs before the merge, 'hunks' merges first and prepares only the paths
+# within the lines of the conflicts.
+SCOPE_FILE = 'file'
+SCOPE_HUNKS = 'hunks'
+SCOPE_DEFAULT = SCOPE_FILE
+SCOPES = [SCOPE_FILE, SCOPE_HUNKS]
+# XML-files larger than this number of bytes are streamed instead of parsed into a whole tree.
+STREAMING_THRESHOLD_DEFAULT = 32 * 1024 * 1024
+# The cache of the paths-details in the .git-directory is off by default, see extraction_cache.py.
+EXTRACTION_CACHE_SIZE_DEFAULT = 0
+# The result-memo in the .git-directory is off by default, see result_memo.py. Memo-files not used for a week expire.
+RESULT_MEMO_SIZE_DEFAULT = 0
+RESULT_MEMO_MAX_AGE_DEFAULT = 7 * 24 * 60 * 60
 
 
 def configure_logger(loglevel):
@@ -79,6 +97,58 @@ def init_argument_parser():
                         help="Print the prepared file 'theirs' to stdout.")
     parser.add_argument('-t', '--filetype', choices=FILE_TYPES, default='XML',
                         help=f"The file type to merge, one of {FILE_TYPES}. Defaults to {FILE_TYPE_DEFAULT}.")
+    parser.add_argument('-m', '--merge-file', choices=MERGE_FILES, default=MERGE_FILE_DEFAULT,
+                        help=textwrap.dedent(f"""\
+        How to merge the files after theirs has been prepared, one of {MERGE_FILES}.
+        '{MERGE_FILE_GIT}' calls git merge-file, '{MERGE_FILE_BUILTIN}' merges in-process with the
+        same result. Defaults to {MERGE_FILE_DEFAULT}."""))
+    parser.add_argument('--scope', choices=SCOPES, default=SCOPE_DEFAULT,
+                        help=textwrap.dedent(f"""\
+        What to resolve, one of {SCOPES}. '{SCOPE_FILE}' prepares theirs as a whole before the
+        merge. '{SCOPE_HUNKS}' merges first, and only if there are conflicts it prepares the paths
+        within the conflicting lines, and merges again. With always-ours-paths the lines taken
+        from theirs are prepared as well. Defaults to {SCOPE_DEFAULT}."""))
+    parser.add_argument('--config-cache', action='store_true',
+                        help=textwrap.dedent("""\
+        Load the compiled paths-config from the .git-directory, and store it there.
+        See the README."""))
+    parser.add_argument('--extraction-cache-size', type=int, default=EXTRACTION_CACHE_SIZE_DEFAULT, metavar='BYTES',
+                        help=textwrap.dedent(f"""\
+        The max-size of the cache of the values found in the files, in the .git-directory.
+        The least recently used are removed. 0 switches the cache off. See the README.
+        Defaults to {EXTRACTION_CACHE_SIZE_DEFAULT}."""))
+    parser.add_argument('--result-memo-size', type=int, default=RESULT_MEMO_SIZE_DEFAULT, metavar='BYTES',
+                        help=textwrap.dedent(f"""\
+        The max-size of the memo of the prepared theirs per file-triple, in the
+        .git-directory. A file-triple prepared before goes straight to the merge. 0
+        switches the memo off. See the README. Defaults to {RESULT_MEMO_SIZE_DEFAULT}."""))
+    parser.add_argument('--result-memo-max-age', type=int, default=RESULT_MEMO_MAX_AGE_DEFAULT, metavar='SECONDS',
+                        help=textwrap.dedent(f"""\
+        Memo-files not used for this number of seconds expire. Defaults to
+        {RESULT_MEMO_MAX_AGE_DEFAULT}."""))
+    parser.add_argument('--time-budget', type=float, metavar='SECONDS',
+                        help=textwrap.dedent("""\
+        The wall-clock time the preparation of theirs may take. If exceeded, the
+        preparation is abandoned and the files are merged unprepared. Unlimited by default."""))
+    parser.add_argument('--memory-budget', type=int, metavar='BYTES',
+                        help=textwrap.dedent("""\
+        The memory the preparation of theirs may take in addition to the memory the
+        process had before. If exceeded, the preparation is abandoned and the files are
+        merged unprepared. Unlimited by default."""))
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help=textwrap.dedent("""\
+        Record the time of the call per stage and path, and append it to this JSONL-file,
+        or add it to this Prometheus textfile if it ends in '.prom'. See the README."""))
+    parser.add_argument('--parse-concurrently', action='store_true', default=False,
+                        help=textwrap.dedent("""\
+        Parse base, ours and theirs on a thread each. Pays off for large XML-files, and
+        on free-threaded Python."""))
+    parser.add_argument('--streaming-threshold', type=int, default=STREAMING_THRESHOLD_DEFAULT, metavar='BYTES',
+                        help=textwrap.dedent(f"""\
+        Stream XML-files larger than this number of bytes instead of parsing them
+        into whole trees, to save memory. Only if all paths consist of child-steps, e.g.
+        './dependencies/dependency/version'. A negative value switches streaming off.
+        Defaults to {STREAMING_THRESHOLD_DEFAULT}."""))
     parser.add_argument('-v', '--version', action='version', version=f'%(prog)s {__version__}')
     parser.add_argument('-l', '--loglevel', choices=LOG_LEVELS, default=DEFAULT_LOGLEVEL,
                         help=f"Log-level: {LOG_LEVELS}. Defaults to {DEFAULT_LOGLEVEL}.")
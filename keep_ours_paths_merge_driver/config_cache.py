@@ -0,0 +1,148 @@
+import json
+import logging
+import marshal
+import os
+import sys
+import zlib
+
+from keep_ours_paths_merge_driver import config
+
+logger = logging.getLogger()
+
+#
+# With --config-cache the compiled paths-config is cached in the .git-directory, so the merge-driver calls of a merge
+# load it instead of parsing and compiling it again:
+#
+#   .git/kop-cache/config-<key>.marshal
+#
+# The key is a hash of the raw config: The paths-config as given in -p or KOP_MERGE_DRVIER_PATHSPATTERNS, the
+# separator, the file-type, the version of the merge-driver, and the version of Python. A cache-file holds
+#
+#   {'raw_config': the raw config the key is the hash of,
+#    'paths_and_patterns': the paths-config as returned by config.get_paths_and_patterns(),
+#    'compiled_paths_and_patterns': as dumped by the merge-driver of the file-type}
+#
+# The compiled paths-config is dumped as plain data: lxml's XPath-objects and the regexes are stored as their strings
+# and compiled on load, see xml_paths.dump_compiled_paths_and_patterns(). The analysis of the paths, e.g. of keyed and
+# streamable paths, is loaded as it is.
+#
+# The cache is written and read by marshal. Like the hash by zlib.crc32() it is built into Python, so the cache costs
+# no imports, which would take longer than the compilation saved. The marshal-format depends on the version of
+# Python, which is part of the key. A cache-file whose raw config differs from the requested, e.g. of a hash
+# collision, is ignored.
+#
+# A cache-file is written to a temp-file first and then renamed, so concurrent merge-driver calls read either no
+# cache-file or a complete one. Writing a cache-file removes the cache-files of other versions of the merge-driver or
+# Python. A cache-file that can't be read is ignored, and the paths-config is compiled as if there were none.
+#
+# The .git-directory is that of the current working directory. Git calls the merge-driver from the top-level
+# directory of the worktree. In a linked worktree .git is a file pointing to the .git-directory.
+#
+
+CACHE_DIRNAME = 'kop-cache'
+CACHE_FILENAME_PREFIX = 'config-'
+CACHE_FILENAME_SUFFIX = '.marshal'
+
+
+def get_cache_dir(cwd=None):
+    """
+    :return: The cache-directory, or None if the working directory has no .git-directory.
+    """
+    dotgit_path = os.path.join(cwd or '', '.git')
+    if os.path.isdir(dotgit_path):
+        return os.path.join(dotgit_path, CACHE_DIRNAME)
+    if os.path.isfile(dotgit_path):
+        # "gitdir: <path>", relative to the worktree.
+        try:
+            with open(dotgit_path) as f:
+                line = f.readline()
+        except OSError:
+            return None
+        if line.startswith('gitdir:'):
+            return os.path.join(cwd or '', line[len('gitdir:'):].strip(), CACHE_DIRNAME)
+    return None
+
+
+def get_raw_config(filetype, separator, paths_from_environment_as_str, paths_from_cl_args_as_list) -> str:
+    # The environment variable takes precedence even if empty, see config.get_paths_and_patterns(). So None and ''
+    # are different configs, as are None and [].
+    return json.dumps([config.__version__, sys.version, filetype, separator, paths_from_environment_as_str,
+                       paths_from_cl_args_as_list])
+
+
+def _get_version_prefix():
+    # The versions of the merge-driver and of Python, as the raw config begins.
+    return json.dumps([config.__version__, sys.version])[:-1]
+
+
+def _get_cache_filepath(cache_dir, raw_config):
+    key = f'{zlib.crc32(raw_config.encode()):08x}'
+    return os.path.join(cache_dir, CACHE_FILENAME_PREFIX + key + CACHE_FILENAME_SUFFIX)
+
+
+def read(raw_config, cwd=None):
+    """
+    :param raw_config: As returned by get_raw_config().
+    :return: The cached dict with 'paths_and_patterns' and 'compiled_paths_and_patterns', or None if there is none.
+    """
+    cache_dir = get_cache_dir(cwd)
+    if cache_dir is None:
+        return None
+    cache_filepath = _get_cache_filepath(cache_dir, raw_config)
+    try:
+        # marshal.load() reads a file in small pieces. Reading it at once is much faster.
+        with open(cache_filepath, 'rb') as f:
+            cached = marshal.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, TypeError) as e:
+        logger.debug(f"read(); ignoring {cache_filepath}: {e}")
+        return None
+    if not isinstance(cached, dict) or cached.get('raw_config') != raw_config:
+        logger.debug(f"read(); ignoring {cache_filepath} of another config")
+        return None
+    return cached
+
+
+def write(raw_config, paths_and_patterns, dumped_compiled_paths_and_patterns, cwd=None):
+    """
+    Write the cache-file atomically. Errors are logged, but not raised: The cache is an optimization.
+    """
+    cache_dir = get_cache_dir(cwd)
+    if cache_dir is None:
+        return
+    cached = {'raw_config': raw_config, 'paths_and_patterns': paths_and_patterns,
+              'compiled_paths_and_patterns': dumped_compiled_paths_and_patterns}
+    cache_filepath = _get_cache_filepath(cache_dir, raw_config)
+    temp_filepath = f'{cache_filepath}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _remove_other_versions(cache_dir)
+        try:
+            with open(temp_filepath, 'wb') as f:
+                f.write(marshal.dumps(cached))
+            os.replace(temp_filepath, cache_filepath)
+        except BaseException:
+            if os.path.exists(temp_filepath):
+                os.unlink(temp_filepath)
+            raise
+    except (OSError, ValueError) as e:
+        logger.debug(f"write(); cannot write {cache_filepath}: {e}")
+
+
+def _remove_other_versions(cache_dir):
+    version_prefix = _get_version_prefix()
+    for filename in os.listdir(cache_dir):
+        if not (filename.startswith(CACHE_FILENAME_PREFIX) and filename.endswith(CACHE_FILENAME_SUFFIX)):
+            continue
+        cache_filepath = os.path.join(cache_dir, filename)
+        try:
+            with open(cache_filepath, 'rb') as f:
+                is_current = marshal.loads(f.read())['raw_config'].startswith(version_prefix)
+        except (OSError, EOFError, ValueError, TypeError, KeyError):
+            is_current = False
+        if not is_current:
+            try:
+                os.unlink(cache_filepath)
+            except OSError:
+                pass
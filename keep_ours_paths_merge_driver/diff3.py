@@ -0,0 +1,698 @@
+#
+# A three-way line merge producing the same result as
+#
+#   git merge-file -L ours -L base -L theirs <ours> <base> <theirs>
+#
+# but working on in-memory strings, without starting a git-process.
+#
+# To get the same result as git, this follows the algorithms of git's xdiff-library:
+#
+#   - The diff (xprepare.c, xdiffi.c): Common lines at the begin and end are trimmed. Lines without a match in the
+#       other file are discarded up front. The remaining lines are diffed by Myers' algorithm, including xdiff's
+#       heuristics for expensive diffs. Then each group of changed lines is slid to line up with the changes of the
+#       other file.
+#   - The merge (xmerge.c) with git merge-file's default level "zealous-alnum": Overlapping changes are conflicts,
+#       unless they are identical. Conflicts are refined by diffing Ours' and Theirs' side of the conflict. Conflicts
+#       separated by 3 lines or less, or by lines without letters or digits, are joined.
+#
+# Lines are split at '\n' only, and include the '\n'. The last line may have no '\n'.
+#
+# Not supported are git's whitespace-options, the diff-algorithms patience and histogram, and the conflict-style
+# zdiff3. git merge-file takes the conflict-style from the git-config merge.conflictStyle, this merge takes it as
+# parameter.
+#
+
+CONFLICT_STYLE_MERGE = 'merge'
+CONFLICT_STYLE_DIFF3 = 'diff3'
+CONFLICT_STYLES = [CONFLICT_STYLE_MERGE, CONFLICT_STYLE_DIFF3]
+DEFAULT_MARKER_SIZE = 7
+# git merge-file caps its exit-code, the number of conflicts.
+MAX_EXIT_CODE = 127
+
+# Constants of xdiff.
+_MAX_EQLIMIT = 1024
+_SIMSCAN_WINDOW = 100
+_KPDIS_RUN = 4
+_MAX_COST_MIN = 256
+_HEUR_MIN_COST = 256
+_SNAKE_CNT = 20
+_K_HEUR = 4
+_LINE_MAX = 2 ** 63 - 1
+
+# The modes of a merge-hunk.
+_MODE_CONFLICT = 0
+_MODE_OURS = 1
+_MODE_THEIRS = 2
+# Ours and Theirs made the same change. Set by the refinement of conflicts.
+_MODE_IDENTICAL = 4
+
+
+def split_lines(s: str) -> list:
+    lines = s.split('\n')
+    recs = [line + '\n' for line in lines[:-1]]
+    if lines[-1]:
+        recs.append(lines[-1])
+    return recs
+
+
+def merge(base_str: str, ours_str: str, theirs_str: str, labels=('ours', 'base', 'theirs'),
+          conflict_style=CONFLICT_STYLE_MERGE, marker_size=DEFAULT_MARKER_SIZE) -> tuple:
+    """
+    Merge the changes from Base to Theirs into Ours.
+
+    :param labels: The labels of the conflict-markers of Ours, Base and Theirs, as given by git merge-file's -L.
+    :param conflict_style: One of CONFLICT_STYLES.
+    :return: Tuple of the merged string and the number of conflicts.
+    """
+    base_recs = split_lines(base_str)
+    ours_recs = split_lines(ours_str)
+    theirs_recs = split_lines(theirs_str)
+
+    ours_changes = _diff(base_recs, ours_recs)
+    theirs_changes = _diff(base_recs, theirs_recs)
+    if not ours_changes:
+        return theirs_str, 0
+    if not theirs_changes:
+        return ours_str, 0
+
+    hunks = _get_merge_hunks(base_recs, ours_recs, theirs_recs, ours_changes, theirs_changes,
+                             conflict_style == CONFLICT_STYLE_MERGE)
+    merged_str = _get_merged_str(base_recs, ours_recs, theirs_recs, hunks, labels, conflict_style, marker_size)
+    return merged_str, sum(1 for hunk in hunks if hunk['mode'] == _MODE_CONFLICT)
+
+
+def get_hunks_line_ranges(base_str: str, ours_str: str, theirs_str: str) -> list:
+    """
+    Get the lines of the conflicts of the merge, and of the changes the merge takes from Theirs.
+
+    The conflicts are those of git merge-file's level eager, before they are refined. So their lines cover the lines
+    of the conflicts of merge() in all of Base, Ours and Theirs.
+
+    :return: List of dicts {'is_conflict': True for a conflict, False for a change taken from Theirs,
+        'base': (begin, end), 'ours': (begin, end), 'theirs': (begin, end)}. The lines [begin, end) are 0-based.
+    """
+    base_recs = split_lines(base_str)
+    ours_recs = split_lines(ours_str)
+    theirs_recs = split_lines(theirs_str)
+    hunks = _get_merge_hunks(base_recs, ours_recs, theirs_recs, _diff(base_recs, ours_recs),
+                             _diff(base_recs, theirs_recs), False)
+    return [{'is_conflict': hunk['mode'] == _MODE_CONFLICT,
+             'base': (hunk['i0'], hunk['i0'] + hunk['chg0']),
+             'ours': (hunk['i1'], hunk['i1'] + hunk['chg1']),
+             'theirs': (hunk['i2'], hunk['i2'] + hunk['chg2'])}
+            for hunk in hunks if hunk['mode'] in (_MODE_CONFLICT, _MODE_THEIRS)]
+
+
+#
+# The diff.
+#
+# A change is a tuple (i1, i2, chg1, chg2): The lines [i1, i1 + chg1) of file 1 are replaced by the lines
+# [i2, i2 + chg2) of file 2.
+#
+# rchg marks the changed lines of a file. It has a sentinel at each end, so line i is at rchg[i + 1].
+#
+
+def _diff(recs1, recs2) -> list:
+    classes = {}
+    ha1 = [classes.setdefault(rec, len(classes)) for rec in recs1]
+    ha2 = [classes.setdefault(rec, len(classes)) for rec in recs2]
+    rchg1 = [0] * (len(recs1) + 2)
+    rchg2 = [0] * (len(recs2) + 2)
+
+    _do_diff(ha1, ha2, rchg1, rchg2)
+    _change_compact(ha1, rchg1, ha2, rchg2)
+    _change_compact(ha2, rchg2, ha1, rchg1)
+    return _build_script(rchg1, len(ha1), rchg2, len(ha2))
+
+
+def _bogosqrt(n):
+    i = 1
+    while n > 0:
+        i <<= 1
+        n >>= 2
+    return i
+
+
+def _do_diff(ha1, ha2, rchg1, rchg2):
+    n1 = len(ha1)
+    n2 = len(ha2)
+
+    # Trim the common lines at the begin and the end.
+    lim = min(n1, n2)
+    dstart = 0
+    while dstart < lim and ha1[dstart] == ha2[dstart]:
+        dstart += 1
+    lim -= dstart
+    trailing = 0
+    while trailing < lim and ha1[n1 - 1 - trailing] == ha2[n2 - 1 - trailing]:
+        trailing += 1
+
+    # Discard lines having no match in the other file. They are changed anyway.
+    counts1 = {}
+    for ha in ha1:
+        counts1[ha] = counts1.get(ha, 0) + 1
+    counts2 = {}
+    for ha in ha2:
+        counts2[ha] = counts2.get(ha, 0) + 1
+    rindex1, reduced_ha1 = _cleanup_records(ha1, dstart, n1 - trailing - 1, counts2, rchg1)
+    rindex2, reduced_ha2 = _cleanup_records(ha2, dstart, n2 - trailing - 1, counts1, rchg2)
+
+    nreff1 = len(reduced_ha1)
+    nreff2 = len(reduced_ha2)
+    ndiags = nreff1 + nreff2 + 3
+    # kvdf and kvdb share one list, indexed by diagonal plus offset.
+    kvd = [0] * (2 * ndiags + 2)
+    kvdf_offset = nreff2 + 1
+    kvdb_offset = ndiags + nreff2 + 1
+    mxcost = max(_bogosqrt(ndiags), _MAX_COST_MIN)
+
+    # The recursion of xdiff's xdl_recs_cmp() as loop, with the same order of the sub-boxes.
+    stack = [(0, nreff1, 0, nreff2, False)]
+    while stack:
+        off1, lim1, off2, lim2, need_min = stack.pop()
+        # Shrink the box by walking through each diagonal snake (SW and NE).
+        while off1 < lim1 and off2 < lim2 and reduced_ha1[off1] == reduced_ha2[off2]:
+            off1 += 1
+            off2 += 1
+        while off1 < lim1 and off2 < lim2 and reduced_ha1[lim1 - 1] == reduced_ha2[lim2 - 1]:
+            lim1 -= 1
+            lim2 -= 1
+        # If one dimension is empty, then all records on the other one are changed.
+        if off1 == lim1:
+            for i in range(off2, lim2):
+                rchg2[rindex2[i] + 1] = 1
+        elif off2 == lim2:
+            for i in range(off1, lim1):
+                rchg1[rindex1[i] + 1] = 1
+        else:
+            split_i1, split_i2, min_lo, min_hi = _split(
+                reduced_ha1, off1, lim1, reduced_ha2, off2, lim2, kvd, kvdf_offset, kvdb_offset, need_min, mxcost)
+            stack.append((split_i1, lim1, split_i2, lim2, min_hi))
+            stack.append((off1, split_i1, off2, split_i2, min_lo))
+
+
+def _cleanup_records(ha, dstart, dend, counts_other, rchg):
+    mlim = min(_bogosqrt(len(ha)), _MAX_EQLIMIT)
+    dis = {}
+    for i in range(dstart, dend + 1):
+        nm = counts_other.get(ha[i], 0)
+        dis[i] = 0 if nm == 0 else 2 if nm >= mlim else 1
+    rindex = []
+    reduced_ha = []
+    for i in range(dstart, dend + 1):
+        if dis[i] == 1 or (dis[i] == 2 and not _clean_mmatch(dis, i, dstart, dend)):
+            rindex.append(i)
+            reduced_ha.append(ha[i])
+        else:
+            rchg[i + 1] = 1
+    return rindex, reduced_ha
+
+
+def _clean_mmatch(dis, i, s, e):
+    # Limit the window examined during the scan of similar lines.
+    if i - s > _SIMSCAN_WINDOW:
+        s = i - _SIMSCAN_WINDOW
+    if e - i > _SIMSCAN_WINDOW:
+        e = i + _SIMSCAN_WINDOW
+
+    # Scan the lines before i for a run of lines having no match, or multiple matches. Line i itself is a
+    # multiple-match-line.
+    r = 1
+    rdis0 = 0
+    rpdis0 = 1
+    while i - r >= s:
+        if not dis[i - r]:
+            rdis0 += 1
+        elif dis[i - r] == 2:
+            rpdis0 += 1
+        else:
+            break
+        r += 1
+    # Multiple-match-lines are discarded only in the middle of runs of lines having no match.
+    if rdis0 == 0:
+        return False
+    r = 1
+    rdis1 = 0
+    rpdis1 = 1
+    while i + r <= e:
+        if not dis[i + r]:
+            rdis1 += 1
+        elif dis[i + r] == 2:
+            rpdis1 += 1
+        else:
+            break
+        r += 1
+    if rdis1 == 0:
+        return False
+    rdis1 += rdis0
+    rpdis1 += rpdis0
+    return rpdis1 * _KPDIS_RUN < rpdis1 + rdis1
+
+
+def _split(ha1, off1, lim1, ha2, off2, lim2, kvd, kvdf_offset, kvdb_offset, need_min, mxcost) -> tuple:
+    """
+    Find the middle snake of the box, see xdiff's xdl_split().
+
+    :return: Tuple (i1, i2, min_lo, min_hi) of the split-point and whether the sub-boxes need a minimal diff.
+    """
+    dmin = off1 - lim2
+    dmax = lim1 - off2
+    fmid = off1 - off2
+    bmid = lim1 - lim2
+    odd = (fmid - bmid) & 1
+    fmin = fmax = fmid
+    bmin = bmax = bmid
+    kf = kvdf_offset
+    kb = kvdb_offset
+
+    kvd[kf + fmid] = off1
+    kvd[kb + bmid] = lim1
+
+    ec = 0
+    while True:
+        ec += 1
+        got_snake = False
+
+        # Extend the forward domain by one diagonal, or shrink it at the box boundaries.
+        if fmin > dmin:
+            fmin -= 1
+            kvd[kf + fmin - 1] = -1
+        else:
+            fmin += 1
+        if fmax < dmax:
+            fmax += 1
+            kvd[kf + fmax + 1] = -1
+        else:
+            fmax -= 1
+
+        for d in range(fmax, fmin - 1, -2):
+            if kvd[kf + d - 1] >= kvd[kf + d + 1]:
+                i1 = kvd[kf + d - 1] + 1
+            else:
+                i1 = kvd[kf + d + 1]
+            prev1 = i1
+            i2 = i1 - d
+            while i1 < lim1 and i2 < lim2 and ha1[i1] == ha2[i2]:
+                i1 += 1
+                i2 += 1
+            if i1 - prev1 > _SNAKE_CNT:
+                got_snake = True
+            kvd[kf + d] = i1
+            if odd and bmin <= d <= bmax and kvd[kb + d] <= i1:
+                return i1, i2, True, True
+
+        # Extend the backward domain.
+        if bmin > dmin:
+            bmin -= 1
+            kvd[kb + bmin - 1] = _LINE_MAX
+        else:
+            bmin += 1
+        if bmax < dmax:
+            bmax += 1
+            kvd[kb + bmax + 1] = _LINE_MAX
+        else:
+            bmax -= 1
+
+        for d in range(bmax, bmin - 1, -2):
+            if kvd[kb + d - 1] < kvd[kb + d + 1]:
+                i1 = kvd[kb + d - 1]
+            else:
+                i1 = kvd[kb + d + 1] - 1
+            prev1 = i1
+            i2 = i1 - d
+            while i1 > off1 and i2 > off2 and ha1[i1 - 1] == ha2[i2 - 1]:
+                i1 -= 1
+                i2 -= 1
+            if prev1 - i1 > _SNAKE_CNT:
+                got_snake = True
+            kvd[kb + d] = i1
+            if not odd and fmin <= d <= fmax and i1 <= kvd[kf + d]:
+                return i1, i2, True, True
+
+        if need_min:
+            continue
+
+        # If the edit cost is above the heuristic trigger and there is a good snake, sample the current diagonals
+        # for a path reaching far from the corner of the box.
+        if got_snake and ec > _HEUR_MIN_COST:
+            best = 0
+            best_i1 = best_i2 = 0
+            for d in range(fmax, fmin - 1, -2):
+                dd = d - fmid if d > fmid else fmid - d
+                i1 = kvd[kf + d]
+                i2 = i1 - d
+                v = (i1 - off1) + (i2 - off2) - dd
+                if v > _K_HEUR * ec and v > best and \
+                        off1 + _SNAKE_CNT <= i1 < lim1 and off2 + _SNAKE_CNT <= i2 < lim2:
+                    k = 1
+                    while ha1[i1 - k] == ha2[i2 - k]:
+                        if k == _SNAKE_CNT:
+                            best = v
+                            best_i1 = i1
+                            best_i2 = i2
+                            break
+                        k += 1
+            if best > 0:
+                return best_i1, best_i2, True, False
+
+            best = 0
+            for d in range(bmax, bmin - 1, -2):
+                dd = d - bmid if d > bmid else bmid - d
+                i1 = kvd[kb + d]
+                i2 = i1 - d
+                v = (lim1 - i1) + (lim2 - i2) - dd
+                if v > _K_HEUR * ec and v > best and \
+                        off1 < i1 <= lim1 - _SNAKE_CNT and off2 < i2 <= lim2 - _SNAKE_CNT:
+                    k = 0
+                    while ha1[i1 + k] == ha2[i2 + k]:
+                        if k == _SNAKE_CNT - 1:
+                            best = v
+                            best_i1 = i1
+                            best_i2 = i2
+                            break
+                        k += 1
+            if best > 0:
+                return best_i1, best_i2, False, True
+
+        # Enough is enough. Take the furthest reaching path.
+        if ec >= mxcost:
+            fbest = fbest1 = -1
+            for d in range(fmax, fmin - 1, -2):
+                i1 = min(kvd[kf + d], lim1)
+                i2 = i1 - d
+                if lim2 < i2:
+                    i1 = lim2 + d
+                    i2 = lim2
+                if fbest < i1 + i2:
+                    fbest = i1 + i2
+                    fbest1 = i1
+
+            bbest = bbest1 = _LINE_MAX
+            for d in range(bmax, bmin - 1, -2):
+                i1 = max(off1, kvd[kb + d])
+                i2 = i1 - d
+                if i2 < off2:
+                    i1 = off2 + d
+                    i2 = off2
+                if i1 + i2 < bbest:
+                    bbest = i1 + i2
+                    bbest1 = i1
+
+            if (lim1 + lim2) - bbest < fbest - (off1 + off2):
+                return fbest1, fbest - fbest1, True, False
+            return bbest1, bbest - bbest1, False, True
+
+
+def _change_compact(ha, rchg, ha_other, rchg_other):
+    # Slide each group of changed lines, see xdiff's xdl_change_compact(). A group is a list [start, end) of line
+    # indexes. The group in the other file is kept in sync.
+    nrec = len(ha)
+    nrec_other = len(ha_other)
+
+    def group_init(rchg_):
+        end = 0
+        while rchg_[end + 1]:
+            end += 1
+        return [0, end]
+
+    def group_next(rchg_, nrec_, g):
+        if g[1] == nrec_:
+            return False
+        g[0] = g[1] + 1
+        g[1] = g[0]
+        while rchg_[g[1] + 1]:
+            g[1] += 1
+        return True
+
+    def group_previous(rchg_, g):
+        if g[0] == 0:
+            return False
+        g[1] = g[0] - 1
+        g[0] = g[1]
+        while rchg_[g[0]]:
+            g[0] -= 1
+        return True
+
+    def group_slide_down(g):
+        if g[1] < nrec and ha[g[0]] == ha[g[1]]:
+            rchg[g[0] + 1] = 0
+            rchg[g[1] + 1] = 1
+            g[0] += 1
+            g[1] += 1
+            while rchg[g[1] + 1]:
+                g[1] += 1
+            return True
+        return False
+
+    def group_slide_up(g):
+        if g[0] > 0 and ha[g[0] - 1] == ha[g[1] - 1]:
+            g[0] -= 1
+            g[1] -= 1
+            rchg[g[0] + 1] = 1
+            rchg[g[1] + 1] = 0
+            while rchg[g[0]]:
+                g[0] -= 1
+            return True
+        return False
+
+    g = group_init(rchg)
+    go = group_init(rchg_other)
+    while True:
+        if g[1] != g[0]:
+            # Shift the group up and then down as far as possible. If it bumps into other groups, merge them.
+            while True:
+                groupsize = g[1] - g[0]
+                # The last end aligning the group with a group of changed lines in the other file, or -1.
+                end_matching_other = -1
+                while group_slide_up(g):
+                    group_previous(rchg_other, go)
+                earliest_end = g[1]
+                if go[1] > go[0]:
+                    end_matching_other = g[1]
+                while group_slide_down(g):
+                    group_next(rchg_other, nrec_other, go)
+                    if go[1] > go[0]:
+                        end_matching_other = g[1]
+                if groupsize == g[1] - g[0]:
+                    break
+
+            # The group is shifted down as far as possible. Move it back up to line up with the last group of
+            # changes in the other file it can align with.
+            if g[1] != earliest_end and end_matching_other != -1:
+                while go[1] == go[0]:
+                    group_slide_up(g)
+                    group_previous(rchg_other, go)
+
+        if not group_next(rchg, nrec, g):
+            break
+        group_next(rchg_other, nrec_other, go)
+
+
+def _build_script(rchg1, nrec1, rchg2, nrec2) -> list:
+    changes = []
+    i1 = nrec1
+    i2 = nrec2
+    while i1 >= 0 or i2 >= 0:
+        if rchg1[i1] or rchg2[i2]:
+            l1 = i1
+            while rchg1[i1]:
+                i1 -= 1
+            l2 = i2
+            while rchg2[i2]:
+                i2 -= 1
+            changes.append((i1, i2, l1 - i1, l2 - i2))
+        i1 -= 1
+        i2 -= 1
+    changes.reverse()
+    return changes
+
+
+#
+# The merge.
+#
+# A merge-hunk is a dict of the mode, and the lines [i0, i0 + chg0) of Base, which are replaced by the lines
+# [i1, i1 + chg1) of Ours, and [i2, i2 + chg2) of Theirs.
+#
+
+def _append_hunk(hunks, mode, i0, chg0, i1, chg1, i2, chg2):
+    if hunks and (i1 <= hunks[-1]['i1'] + hunks[-1]['chg1'] or i2 <= hunks[-1]['i2'] + hunks[-1]['chg2']):
+        hunk = hunks[-1]
+        if mode != hunk['mode']:
+            hunk['mode'] = _MODE_CONFLICT
+        hunk['chg0'] = i0 + chg0 - hunk['i0']
+        hunk['chg1'] = i1 + chg1 - hunk['i1']
+        hunk['chg2'] = i2 + chg2 - hunk['i2']
+    else:
+        hunks.append({'mode': mode, 'i0': i0, 'chg0': chg0, 'i1': i1, 'chg1': chg1, 'i2': i2, 'chg2': chg2})
+
+
+def _get_merge_hunks(base_recs, ours_recs, theirs_recs, changes1, changes2, is_zealous) -> list:
+    hunks = []
+    n1 = len(changes1)
+    n2 = len(changes2)
+    c1 = c2 = 0
+    while c1 < n1 and c2 < n2:
+        x1_i1, x1_i2, x1_chg1, x1_chg2 = changes1[c1]
+        x2_i1, x2_i2, x2_chg1, x2_chg2 = changes2[c2]
+        if x1_i1 + x1_chg1 < x2_i1:
+            _append_hunk(hunks, _MODE_OURS, x1_i1, x1_chg1, x1_i2, x1_chg2, x2_i2 - x2_i1 + x1_i1, x1_chg1)
+            c1 += 1
+            continue
+        if x2_i1 + x2_chg1 < x1_i1:
+            _append_hunk(hunks, _MODE_THEIRS, x2_i1, x2_chg1, x1_i2 - x1_i1 + x2_i1, x2_chg1, x2_i2, x2_chg2)
+            c2 += 1
+            continue
+        if x1_i1 != x2_i1 or x1_chg1 != x2_chg1 or x1_chg2 != x2_chg2 or \
+                ours_recs[x1_i2:x1_i2 + x1_chg2] != theirs_recs[x2_i2:x2_i2 + x2_chg2]:
+            # Conflict.
+            off = x1_i1 - x2_i1
+            ffo = off + x1_chg1 - x2_chg1
+            i0 = x1_i1
+            i1 = x1_i2
+            i2 = x2_i2
+            if off > 0:
+                i0 -= off
+                i1 -= off
+            else:
+                i2 += off
+            chg0 = x1_i1 + x1_chg1 - i0
+            chg1 = x1_i2 + x1_chg2 - i1
+            chg2 = x2_i2 + x2_chg2 - i2
+            if ffo < 0:
+                chg0 -= ffo
+                chg1 -= ffo
+            else:
+                chg2 += ffo
+            _append_hunk(hunks, _MODE_CONFLICT, i0, chg0, i1, chg1, i2, chg2)
+
+        end1 = x1_i1 + x1_chg1
+        end2 = x2_i1 + x2_chg1
+        if end1 >= end2:
+            c2 += 1
+        if end2 >= end1:
+            c1 += 1
+    for x1_i1, x1_i2, x1_chg1, x1_chg2 in changes1[c1:]:
+        _append_hunk(hunks, _MODE_OURS, x1_i1, x1_chg1, x1_i2, x1_chg2,
+                     x1_i1 + len(theirs_recs) - len(base_recs), x1_chg1)
+    for x2_i1, x2_i2, x2_chg1, x2_chg2 in changes2[c2:]:
+        _append_hunk(hunks, _MODE_THEIRS, x2_i1, x2_chg1, x2_i1 + len(ours_recs) - len(base_recs), x2_chg1,
+                     x2_i2, x2_chg2)
+
+    # git merge-file's level zealous-alnum. The conflict-style diff3 shows Base, so its level is eager.
+    if is_zealous:
+        hunks = _refine_conflicts(ours_recs, theirs_recs, hunks)
+        _simplify_non_conflicts(ours_recs, hunks)
+    return hunks
+
+
+def _refine_conflicts(ours_recs, theirs_recs, hunks) -> list:
+    # Changes are sometimes not identical, but differ in only a few lines. Show only these lines as conflicting.
+    refined_hunks = []
+    for hunk in hunks:
+        # No sense refining a conflict when one side is empty.
+        if hunk['mode'] != _MODE_CONFLICT or hunk['chg1'] == 0 or hunk['chg2'] == 0:
+            refined_hunks.append(hunk)
+            continue
+        i1 = hunk['i1']
+        i2 = hunk['i2']
+        changes = _diff(ours_recs[i1:i1 + hunk['chg1']], theirs_recs[i2:i2 + hunk['chg2']])
+        if not changes:
+            hunk['mode'] = _MODE_IDENTICAL
+            refined_hunks.append(hunk)
+            continue
+        for x_i1, x_i2, x_chg1, x_chg2 in changes:
+            refined_hunks.append({'mode': _MODE_CONFLICT, 'i0': hunk['i0'], 'chg0': hunk['chg0'],
+                                  'i1': x_i1 + i1, 'chg1': x_chg1, 'i2': x_i2 + i2, 'chg2': x_chg2})
+    return refined_hunks
+
+
+def _lines_contain_alnum(recs, i, chg):
+    # git's isalnum() is ASCII-only.
+    return any(c.isascii() and c.isalnum() for rec in recs[i:i + chg] for c in rec)
+
+
+def _simplify_non_conflicts(ours_recs, hunks):
+    # If there are less than 3 non-conflicting lines between conflicts, or only lines without letters or digits,
+    # it appears simpler to move these lines into the conflicts. Join the conflicts in that case.
+    h = 0
+    while h + 1 < len(hunks):
+        hunk = hunks[h]
+        next_hunk = hunks[h + 1]
+        begin = hunk['i1'] + hunk['chg1']
+        end = next_hunk['i1']
+        if hunk['mode'] != _MODE_CONFLICT or next_hunk['mode'] != _MODE_CONFLICT or \
+                (end - begin > 3 and _lines_contain_alnum(ours_recs, begin, end - begin)):
+            h += 1
+        else:
+            hunk['chg1'] = next_hunk['i1'] + next_hunk['chg1'] - hunk['i1']
+            hunk['chg2'] = next_hunk['i2'] + next_hunk['chg2'] - hunk['i2']
+            del hunks[h + 1]
+
+
+def _copy_recs(recs, i, count, needs_cr, add_nl) -> str:
+    if count < 1:
+        return ''
+    s = ''.join(recs[i:i + count])
+    if add_nl and not s.endswith('\n'):
+        s += '\r\n' if needs_cr else '\n'
+    return s
+
+
+def _is_eol_crlf(recs, i):
+    # 1 if the line ends in CR/LF (if it is the last line and has no EOL, the preceding line, if any), 0 if it ends
+    # in LF-only, and -1 if the EOL can't be determined.
+    nrec = len(recs)
+    if i < nrec - 1:
+        return int(recs[i].endswith('\r\n'))
+    if not nrec:
+        return -1
+    if recs[i].endswith('\n'):
+        return int(recs[i].endswith('\r\n'))
+    if not i:
+        return -1
+    return int(recs[i - 1].endswith('\r\n'))
+
+
+def _is_cr_needed(base_recs, ours_recs, theirs_recs, hunk):
+    # Match the EOL-style of the post-images' preceding, or first, lines.
+    needs_cr = _is_eol_crlf(ours_recs, hunk['i1'] - 1 if hunk['i1'] else 0)
+    if needs_cr:
+        needs_cr = _is_eol_crlf(theirs_recs, hunk['i2'] - 1 if hunk['i2'] else 0)
+    # Look at the pre-image's first line, unless already settled on LF.
+    if needs_cr:
+        needs_cr = _is_eol_crlf(base_recs, 0)
+    # If still undecided, use LF-only.
+    return needs_cr > 0
+
+
+def _get_merged_str(base_recs, ours_recs, theirs_recs, hunks, labels, conflict_style, marker_size) -> str:
+    ours_label, base_label, theirs_label = labels
+    parts = []
+    i = 0
+    for hunk in hunks:
+        mode = hunk['mode']
+        if mode == _MODE_CONFLICT:
+            needs_cr = _is_cr_needed(base_recs, ours_recs, theirs_recs, hunk)
+            eol = '\r\n' if needs_cr else '\n'
+            # Before the conflicting part.
+            parts.append(_copy_recs(ours_recs, i, hunk['i1'] - i, False, False))
+            parts.append('<' * marker_size + (' ' + ours_label if ours_label else '') + eol)
+            parts.append(_copy_recs(ours_recs, hunk['i1'], hunk['chg1'], needs_cr, True))
+            if conflict_style == CONFLICT_STYLE_DIFF3:
+                parts.append('|' * marker_size + (' ' + base_label if base_label else '') + eol)
+                parts.append(_copy_recs(base_recs, hunk['i0'], hunk['chg0'], needs_cr, True))
+            parts.append('=' * marker_size + eol)
+            parts.append(_copy_recs(theirs_recs, hunk['i2'], hunk['chg2'], needs_cr, True))
+            parts.append('>' * marker_size + (' ' + theirs_label if theirs_label else '') + eol)
+        elif mode == _MODE_OURS:
+            parts.append(_copy_recs(ours_recs, i, hunk['i1'] - i, False, False))
+            parts.append(_copy_recs(ours_recs, hunk['i1'], hunk['chg1'], False, False))
+        elif mode == _MODE_THEIRS:
+            parts.append(_copy_recs(ours_recs, i, hunk['i1'] - i, False, False))
+            parts.append(_copy_recs(theirs_recs, hunk['i2'], hunk['chg2'], False, False))
+        else:
+            # Identical changes. Ours' lines are taken with the lines before the next hunk.
+            continue
+        i = hunk['i1'] + hunk['chg1']
+    parts.append(_copy_recs(ours_recs, i, len(ours_recs) - i, False, False))
+    return ''.join(parts)
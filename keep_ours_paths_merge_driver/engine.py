@@ -0,0 +1,107 @@
+from keep_ours_paths_merge_driver import config
+from keep_ours_paths_merge_driver import merge
+
+#
+# The library-API.
+#
+# The merge-drivers keep their paths-config in module-globals set by set_paths_and_patterns(), and the command line
+# entry points configure the root logger. That's fine for one merge per process, but not for merges with different
+# paths-configs running concurrently in one process.
+#
+# An Engine is built once from a paths-config, and compiles it once. It is immutable, keeps no state between calls,
+# and doesn't configure logging. So one engine can be used by many threads concurrently, and engines with different
+# paths-configs can be used side by side:
+#
+#   engine = Engine(['./version', 'always-ours:./properties/revision'])
+#   prepared_theirs, report = engine.prepare_theirs(base, ours, theirs)
+#
+# The report is a dict:
+#   {'prepared': True if theirs has been changed,
+#    'decisions': [{'path': ..., 'merge_strategy': ..., 'base_value': ..., 'ours_value': ..., 'theirs_value': ...,
+#                   'prepare_theirs': True or False}, ...]}
+# The decisions are those on the paths found in all of base, ours and theirs. A decision on a non-leaf path has
+# 'ignored' instead of the values. If any of the files is empty, theirs isn't prepared, and the report has 'skipped'.
+# If the pre-screen proves that nothing is to prepare, there are no decisions, see prescreen.py.
+#
+# The contents are str, or bytes as read from the files. XML-bytes are decoded by the XML-parser as they declare, and
+# the prepared theirs is in the encoding of theirs. JSON-bytes are UTF-8.
+#
+# The engine logs by the root logger as the merge-drivers do.
+#
+# The budgets and the metrics of a call are kept per context, see budget.py and metrics.py. A thread starts in an
+# empty context, so the engine's calls on other threads neither check the budgets nor add to the metrics of a call
+# running on the main thread. The time-budget's timer-signal is started for a call on the main thread only.
+#
+
+
+class Engine:
+    __slots__ = ('_filetype', '_paths_and_patterns', '_merge_driver', '_compiled_paths_and_patterns',
+                 '_parse_concurrently', '_streaming_threshold')
+
+    def __init__(self, paths_and_patterns, filetype=config.FILE_TYPE_DEFAULT,
+                 separator=config.PATHS_TO_PATTERN_SEPARATOR, parse_concurrently=False,
+                 streaming_threshold=config.STREAMING_THRESHOLD_DEFAULT):
+        """
+        :param paths_and_patterns: List of strings "MERGE-STRATEGY:PATH:PATTERN" as given in -p, or of dicts as
+            returned by config.get_paths_and_patterns().
+        :param filetype: One of config.FILE_TYPES.
+        :param separator: The separator in the strings of paths_and_patterns.
+        :param parse_concurrently: Parse base, ours and theirs on a thread each, see --parse-concurrently.
+        :param streaming_threshold: Stream XML-files larger than this number of bytes, see --streaming-threshold.
+        """
+        if filetype not in config.FILE_TYPES:
+            raise ValueError(f"Unknown file type '{filetype}'. Expect one of {config.FILE_TYPES}.")
+        parsed_paths_and_patterns = []
+        for path_and_pattern in paths_and_patterns:
+            if isinstance(path_and_pattern, str):
+                merge_strategy, path, pattern = config.split_into_path_and_pattern(path_and_pattern, separator)
+                path_and_pattern = {'merge_strategy': merge_strategy, 'path': path, 'pattern': pattern}
+            parsed_paths_and_patterns.append(dict(path_and_pattern))
+        merge_driver = merge.get_merge_driver(filetype)
+        object.__setattr__(self, '_filetype', filetype)
+        object.__setattr__(self, '_paths_and_patterns', tuple(parsed_paths_and_patterns))
+        object.__setattr__(self, '_merge_driver', merge_driver)
+        object.__setattr__(self, '_compiled_paths_and_patterns',
+                           merge_driver.compile_paths_and_patterns(parsed_paths_and_patterns))
+        object.__setattr__(self, '_parse_concurrently', parse_concurrently)
+        object.__setattr__(self, '_streaming_threshold', streaming_threshold)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self):
+        return f"{type(self).__name__}({[dict(p) for p in self._paths_and_patterns]}, filetype='{self._filetype}')"
+
+    @property
+    def filetype(self):
+        return self._filetype
+
+    @property
+    def paths_and_patterns(self):
+        """
+        :return: Copies of the parsed paths-config.
+        """
+        return [dict(path_and_pattern) for path_and_pattern in self._paths_and_patterns]
+
+    def prepare_theirs(self, base, ours, theirs):
+        """
+        Prepare theirs by Ours' values of the configured paths.
+
+        :param base, ours, theirs: The contents of the files, all str or all bytes.
+        :return: Tuple of the prepared theirs, of the same type as theirs, and the report.
+        """
+        if isinstance(theirs, bytes):
+            get_prepared_theirs = self._merge_driver.get_prepared_theirs_bytes
+        else:
+            get_prepared_theirs = self._merge_driver.get_prepared_theirs_str
+        report = {'prepared': False, 'decisions': []}
+        # As in merge.prepare_theirs(), prepare theirs only if all three files have content.
+        if not (base and ours and theirs):
+            report['skipped'] = 'empty file'
+            prepared_theirs = theirs
+        else:
+            prepared_theirs = get_prepared_theirs(
+                base, ours, theirs, self._compiled_paths_and_patterns, report['decisions'], self._parse_concurrently,
+                self._streaming_threshold)
+            report['prepared'] = prepared_theirs != theirs
+        return prepared_theirs, report
@@ -0,0 +1,177 @@
+import logging
+import marshal
+import os
+import threading
+import time
+
+try:
+    # hashlib imports OpenSSL, which takes longer than most extractions the cache saves. blake2b is built into Python.
+    from _blake2 import blake2b
+except ImportError:
+    from hashlib import blake2b
+
+logger = logging.getLogger()
+
+#
+# The extraction-cache keeps the paths-details of documents, so a document merged again, e.g. the same base and ours
+# in the steps of a rebase or in merges of one branch into many, isn't parsed again. It is content-addressed:
+#
+#   .git/kop-cache/details/<2 hex-digits>/<38 hex-digits>.marshal
+#
+# The key is a hash of the raw config (see config_cache.get_raw_config(), which includes the versions of the
+# merge-driver and of Python), the extraction-mode, and the content of the document. The cache-file holds the
+# paths-details as returned by xml_merge_driver._get_paths_details() without the 'tag_object', or by
+# xml_streaming.get_paths_details(). These are plain data, written and read by marshal as the config-cache is.
+#
+# A cache-file is written to a temp-file first and then renamed, so concurrent merge-driver calls read either no
+# cache-file or a complete one. Two calls writing the same key write the same content.
+#
+# The size of the cache is bounded. The mtime of a cache-file is its last use, it is set on each hit. After about every
+# EVICTION_INTERVAL-th write, the least recently used cache-files are removed until the cache is below
+# EVICTION_TARGET_RATIO of its max-size. The writes are sampled by their keys, so no counter has to be shared by the
+# processes. With a max-age, also the cache-files not used for that number of seconds are removed. A cache-file
+# removed by a concurrent call is a miss.
+#
+# The extraction-cache is a dict as returned by get_extraction_cache(). The functions reading, writing and evicting
+# cache-files take any dict with 'entries_dir' and 'max_size', and optionally 'max_age', see result_memo.py.
+#
+
+DETAILS_DIRNAME = 'details'
+CACHE_FILENAME_SUFFIX = '.marshal'
+EVICTION_INTERVAL = 16
+EVICTION_TARGET_RATIO = 0.8
+
+
+def get_extraction_cache(cache_dir, raw_config, max_size):
+    """
+    :param cache_dir: The cache-directory, see config_cache.get_cache_dir().
+    :param raw_config: As returned by config_cache.get_raw_config().
+    :param max_size: The max-size of the cache in bytes.
+    :return: The extraction-cache, or None if there is no cache-directory or max_size isn't positive.
+    """
+    if cache_dir is None or max_size <= 0:
+        return None
+    return {'entries_dir': os.path.join(cache_dir, DETAILS_DIRNAME), 'raw_config': raw_config, 'max_size': max_size}
+
+
+def get_key(extraction_cache, mode, content: bytes) -> str:
+    h = blake2b(digest_size=20)
+    h.update(extraction_cache['raw_config'].encode())
+    h.update(b'\0' + mode.encode() + b'\0')
+    h.update(content)
+    return h.hexdigest()
+
+
+def _get_cache_filepath(cache, key):
+    return os.path.join(cache['entries_dir'], key[:2], key[2:] + CACHE_FILENAME_SUFFIX)
+
+
+def read(cache, key):
+    """
+    :return: The cached value, e.g. the paths-details, or None if there is none.
+    """
+    cache_filepath = _get_cache_filepath(cache, key)
+    try:
+        with open(cache_filepath, 'rb') as f:
+            value = marshal.loads(f.read())
+        # Mark as recently used.
+        os.utime(cache_filepath)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, TypeError) as e:
+        logger.debug(f"read(); ignoring {cache_filepath}: {e}")
+        return None
+    if not isinstance(value, dict):
+        return None
+    return value
+
+
+def write(cache, key, value):
+    """
+    Write the cache-file atomically. Errors are logged, but not raised: The cache is an optimization.
+    """
+    cache_filepath = _get_cache_filepath(cache, key)
+    # Per thread, as the base-, ours- and theirs-files are parsed concurrently with --parse-concurrently.
+    temp_filepath = f'{cache_filepath}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(cache_filepath), exist_ok=True)
+        try:
+            with open(temp_filepath, 'wb') as f:
+                f.write(marshal.dumps(value))
+            os.replace(temp_filepath, cache_filepath)
+        except BaseException:
+            if os.path.exists(temp_filepath):
+                os.unlink(temp_filepath)
+            raise
+    except (OSError, ValueError) as e:
+        logger.debug(f"write(); cannot write {cache_filepath}: {e}")
+        return
+    if int(key[-2:], 16) % EVICTION_INTERVAL == 0:
+        evict(cache)
+
+
+def get_entries(entries_dir):
+    """
+    :return: List of tuples (last use, size, path) of the cache-files, sorted by their last use.
+    """
+    entries = []
+    try:
+        for shard in os.scandir(entries_dir):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith(CACHE_FILENAME_SUFFIX):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        pass
+    return sorted(entries)
+
+
+def evict(cache, target_size=None):
+    """
+    Remove the cache-files not used for 'max_age' seconds, if given, and the least recently used cache-files until
+    the cache is not larger than target_size.
+
+    :param cache: A dict with 'entries_dir', 'max_size', and optionally 'max_age'.
+    :param target_size: Defaults to EVICTION_TARGET_RATIO of the max-size if the cache exceeds the max-size.
+    :return: The number of cache-files removed.
+    """
+    try:
+        entries = get_entries(cache['entries_dir'])
+    except OSError as e:
+        logger.debug(f"evict(); {e}")
+        return 0
+    size = sum(entry_size for _, entry_size, _ in entries)
+    if target_size is None:
+        target_size = size if size <= cache['max_size'] else cache['max_size'] * EVICTION_TARGET_RATIO
+    expiry_time = time.time() - cache['max_age'] if cache.get('max_age') else None
+    removed_count = 0
+    for last_use, entry_size, path in entries:
+        if size <= target_size and (expiry_time is None or last_use >= expiry_time):
+            break
+        try:
+            os.unlink(path)
+            removed_count += 1
+        except OSError:
+            pass
+        size -= entry_size
+    if removed_count:
+        logger.debug(f"evict(); removed {removed_count} cache-files; size: {size}")
+    return removed_count
+
+
+def get_paths_details(extraction_cache, mode, content: bytes, get_paths_details_function):
+    """
+    Get the paths-details of the document from the cache, or by get_paths_details_function() and cache them.
+
+    :param mode: The extraction-mode, e.g. 'streaming'. Part of the key, as the paths-details differ per mode.
+    :param get_paths_details_function: Returns the paths-details of the document as plain data.
+    """
+    key = get_key(extraction_cache, mode, content)
+    paths_details = read(extraction_cache, key)
+    if paths_details is not None:
+        logger.debug(f"get_paths_details(); {mode}-paths-details loaded from the extraction-cache")
+        return paths_details
+    paths_details = get_paths_details_function()
+    write(extraction_cache, key, paths_details)
+    return paths_details
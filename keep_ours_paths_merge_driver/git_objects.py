@@ -0,0 +1,139 @@
+import subprocess
+
+#
+# Access to the objects of a Git-repository by plumbing-commands. Used by the merge-strategy (strategy.py) and the
+# merge-tree-mode (merge_tree.py). Both work without worktree-files.
+#
+# The blobs are read through one long-running "git cat-file --batch" process, see open_cat_file() and read_blob(),
+# instead of one process per blob. They are written by one "git fast-import" process, and the trees by "git mktree"
+# per directory. No temporary files nor index are written.
+#
+
+
+def git(args, input_bytes=None, env=None, cwd=None) -> bytes:
+    """
+    :return: The stdout of the git-command. Raises subprocess.CalledProcessError on a non-zero exit code.
+    """
+    return subprocess.run(['git'] + args, input=input_bytes, env=env, cwd=cwd, stdout=subprocess.PIPE,
+                          check=True).stdout
+
+
+def diff_raw(from_treeish, to_treeish, cwd=None) -> dict:
+    """
+    :return: Dict of the changed paths to tuples of (status, from-mode, to-mode, from-object-id, to-object-id).
+        Renames aren't detected.
+    """
+    out = git(['diff', '--raw', '-z', '--no-renames', '--no-abbrev', from_treeish, to_treeish], cwd=cwd)
+    # The records are ":<from-mode> <to-mode> <from-oid> <to-oid> <status>\0<path>\0".
+    fields = out.decode().split('\0')
+    changes = {}
+    for header, path in zip(fields[0::2], fields[1::2]):
+        from_mode, to_mode, from_oid, to_oid, status = header.lstrip(':').split(' ')
+        changes[path] = (status, from_mode, to_mode, from_oid, to_oid)
+    return changes
+
+
+def get_merge_attributes(paths, cwd=None) -> dict:
+    """
+    :return: Dict of the paths to the values of their merge-attribute, e.g. the name of a merge-driver, or
+        'unspecified'.
+    """
+    if not paths:
+        return {}
+    out = git(['check-attr', '-z', '--stdin', 'merge'], input_bytes='\0'.join(paths).encode() + b'\0', cwd=cwd)
+    # The records are "<path>\0merge\0<value>\0".
+    fields = out.decode().split('\0')
+    return {path: value for path, value in zip(fields[0::3], fields[2::3])}
+
+
+def ls_tree(treeish, paths, cwd=None) -> dict:
+    """
+    :return: Dict of the paths found in the tree to tuples of (mode, object-id).
+    """
+    out = git(['ls-tree', '-r', '-z', '--full-tree', treeish, '--'] + list(paths), cwd=cwd)
+    # The records are "<mode> <type> <oid>\t<path>\0".
+    entries = {}
+    for record in out.decode().split('\0'):
+        if record:
+            header, _, path = record.partition('\t')
+            mode, _, oid = header.split(' ')
+            entries[path] = (mode, oid)
+    return entries
+
+
+def open_cat_file(cwd=None):
+    return subprocess.Popen(['git', 'cat-file', '--batch'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=cwd)
+
+
+def read_blob(cat_file_process, object_name):
+    """
+    :param cat_file_process: As returned by open_cat_file().
+    :param object_name: An object-id, or e.g. "<commit>:<path>".
+    :return: The content as bytes, or None if the object is missing.
+    """
+    cat_file_process.stdin.write(object_name.encode() + b'\n')
+    cat_file_process.stdin.flush()
+    # The header is "<oid> <type> <size>\n", or "<object_name> missing\n".
+    header = cat_file_process.stdout.readline().decode().split()
+    if len(header) != 3:
+        return None
+    content = cat_file_process.stdout.read(int(header[2]))
+    # The content is terminated by a newline.
+    cat_file_process.stdout.read(1)
+    return content
+
+
+def close_cat_file(cat_file_process):
+    cat_file_process.stdin.close()
+    cat_file_process.wait()
+
+
+def write_blobs(contents, cwd=None) -> list:
+    """
+    Write the contents as blobs to the object-database by one "git fast-import" process. The contents are streamed
+    through its stdin, and the object-ids are read from its stdout by "get-mark".
+
+    :param contents: List of bytes.
+    :return: The object-ids of the blobs, in the order of the contents.
+    """
+    if not contents:
+        return []
+    commands = [b'feature get-mark\n']
+    for mark, content in enumerate(contents, 1):
+        commands.append(b'blob\nmark :%d\ndata %d\n%s\nget-mark :%d\n' % (mark, len(content), content, mark))
+    # A few blobs are written as loose objects, see fastimport.unpackLimit.
+    out = git(['fast-import', '--quiet'], input_bytes=b''.join(commands), cwd=cwd)
+    return out.decode().split()
+
+
+def write_tree(treeish, entries, cwd=None) -> str:
+    """
+    Write a tree as the given tree with replaced blobs. The trees of the directories of the entries and of their
+    parent-directories are rewritten by "git mktree", from the deepest up to the root. No index is used.
+
+    :param entries: Dict of paths to tuples of (mode, object-id).
+    :return: The object-id of the tree.
+    """
+    # Per directory the records replaced, by name. '' is the root. A subdirectory is replaced by its rewritten tree.
+    replaced = {'': {}}
+    for path, (mode, oid) in entries.items():
+        directory, _, name = path.rpartition('/')
+        replaced.setdefault(directory, {})[name] = f'{mode} blob {oid}'
+        while directory:
+            parent_directory, _, name = directory.rpartition('/')
+            replaced.setdefault(parent_directory, {})[name] = None
+            directory = parent_directory
+    trees = {}
+    for directory in sorted(replaced, key=lambda directory: directory.count('/') + bool(directory), reverse=True):
+        out = git(['ls-tree', '-z', f'{treeish}:{directory}' if directory else treeish], cwd=cwd)
+        # The records are "<mode> <type> <oid>\t<name>\0", as "git mktree -z" takes them.
+        records = []
+        for record in out.decode().split('\0'):
+            if record:
+                header, _, name = record.partition('\t')
+                if name in replaced[directory]:
+                    header = replaced[directory][name] or \
+                        f"{header.split(' ')[0]} tree {trees[f'{directory}/{name}' if directory else name]}"
+                records.append(f'{header}\t{name}\0')
+        trees[directory] = git(['mktree', '-z'], input_bytes=''.join(records).encode(), cwd=cwd).decode().strip()
+    return trees['']
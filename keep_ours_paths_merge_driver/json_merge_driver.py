@@ -1,11 +1,15 @@
+import bisect
 import json
 import logging
 import re
 
-# I chose jsonpath-ng because it generates full_path per path-match. This eases generating the control-doc a lot.
-import jsonpath_ng as jp
-
+from keep_ours_paths_merge_driver import budget
 from keep_ours_paths_merge_driver import config
+from keep_ours_paths_merge_driver import extraction_cache
+from keep_ours_paths_merge_driver import metrics
+from keep_ours_paths_merge_driver import json_paths
+from keep_ours_paths_merge_driver import json_scanner
+from keep_ours_paths_merge_driver import prescreen
 from keep_ours_paths_merge_driver import utils
 
 logger = logging.getLogger()
@@ -13,33 +17,107 @@ logger = logging.getLogger()
 # The format is:
 #   <optional merge-strategy>:<mandatory the-jsonpath>:<optional some-regex>
 g_paths_and_patterns = {}
+# The paths and patterns compiled once, see json_paths.compile_paths_and_patterns().
+g_compiled_paths_and_patterns = json_paths.compile_paths_and_patterns([])
 
 
 def set_paths_and_patterns(path_and_patterns):
     global g_paths_and_patterns
-    if path_and_patterns is not None:
+    global g_compiled_paths_and_patterns
+    # The server calls this for each request. Compile only if the config has changed.
+    if path_and_patterns is not None and path_and_patterns != g_paths_and_patterns:
         g_paths_and_patterns = path_and_patterns
+        g_compiled_paths_and_patterns = compile_paths_and_patterns(path_and_patterns)
+
+
+def compile_paths_and_patterns(path_and_patterns):
+    return json_paths.compile_paths_and_patterns(path_and_patterns)
+
+
+def dump_compiled_paths_and_patterns(compiled_paths_and_patterns):
+    return json_paths.dump_compiled_paths_and_patterns(compiled_paths_and_patterns)
+
+
+def load_compiled_paths_and_patterns(dumped):
+    return json_paths.load_compiled_paths_and_patterns(dumped)
 
 
 def get_paths_and_patterns():
     return g_paths_and_patterns
 
 
-def get_prepared_theirs_str(base_json_str: str, ours_json_str: str, theirs_json_str: str) -> str:
-    base_json_dict = json.loads(base_json_str)
-    ours_json_dict = json.loads(ours_json_str)
-    theirs_json_dict = json.loads(theirs_json_str)
+def get_prepared_theirs_bytes(base_json_bytes: bytes, ours_json_bytes: bytes, theirs_json_bytes: bytes,
+                              compiled_paths_and_patterns=None, decisions=None, parse_concurrently=False,
+                              streaming_threshold=None, line_ranges=None, paths_details_cache=None) -> bytes:
+    """
+    As get_prepared_theirs_str(), for the files as they are. JSON-files are encoded in UTF-8, see RFC 8259.
+    """
+    return get_prepared_theirs_str(
+        base_json_bytes.decode(), ours_json_bytes.decode(), theirs_json_bytes.decode(), compiled_paths_and_patterns,
+        decisions, parse_concurrently, streaming_threshold, line_ranges, paths_details_cache).encode()
 
-    logger.debug("Getting details for base_json_dict")
-    base_paths_details = _get_paths_details(base_json_dict)
-    logger.debug("Getting details for ours_json_dict")
-    ours_paths_details = _get_paths_details(ours_json_dict)
-    logger.debug("Getting details for theirs_json_dict")
-    theirs_paths_details = _get_paths_details(theirs_json_dict)
 
-    logger.debug(f"base_paths_details: {base_paths_details}")
-    logger.debug(f"ours_paths_details: {ours_paths_details}")
-    logger.debug(f"theirs_paths_details: {theirs_paths_details}")
+def get_prepared_theirs_str(base_json_str: str, ours_json_str: str, theirs_json_str: str,
+                            compiled_paths_and_patterns=None, decisions=None, parse_concurrently=False,
+                            streaming_threshold=None, line_ranges=None, paths_details_cache=None) -> str:
+    """
+    :param compiled_paths_and_patterns: Defaults to the ones set by set_paths_and_patterns(). See engine.py.
+    :param decisions: If given, a list the decision per common path is appended to. See engine.py.
+    :param parse_concurrently: Parse base, ours and theirs and get their paths-details on a thread each.
+    :param streaming_threshold: Not used. JSON-documents are always loaded whole.
+    :param line_ranges: If given, only the values within these lines are considered. Tuple of the line-ranges of
+        base, ours and theirs as returned by merge.get_line_ranges().
+    :param paths_details_cache: If given, the paths-details of base and ours are taken from and stored in this
+        extraction-cache, see extraction_cache.py.
+    """
+    if compiled_paths_and_patterns is None:
+        compiled_paths_and_patterns = g_compiled_paths_and_patterns
+    budget.check('pre-screen')
+    metrics.enter('pre-screen')
+    shortcut = prescreen.get_shortcut(
+        base_json_str, ours_json_str, theirs_json_str,
+        {path_and_pattern['merge_strategy'] for path_and_pattern in compiled_paths_and_patterns['paths_and_patterns']})
+    if shortcut is not None:
+        logger.info(f"Pre-screen: {shortcut}. Nothing to prepare.")
+        return theirs_json_str
+    # The json-module holds the GIL, so parse_concurrently pays off on free-threaded CPython only.
+    # Theirs' json_dict is the control-dict. So only the paths-details of base and ours are taken from the
+    # extraction-cache. On a hit of the extraction-cache, the stage 'parse <name>' is the read of the cache-file.
+    def parse(name, json_str):
+        json_dict = json.loads(json_str)
+        budget.check(f'find paths in {name}')
+        metrics.enter(f'find paths in {name}')
+        return json_dict
+
+    def parse_and_get_paths_details(name_and_json_str_and_line_ranges):
+        name, json_str, file_line_ranges = name_and_json_str_and_line_ranges
+        budget.check(f'parse {name}')
+        metrics.enter(f'parse {name}')
+        if paths_details_cache is not None and file_line_ranges is None and name != 'theirs':
+            logger.debug(f"Getting details for {name}_json_dict")
+            return None, extraction_cache.get_paths_details(
+                paths_details_cache, 'json', json_str.encode(),
+                lambda: _get_paths_details(parse(name, json_str), compiled_paths_and_patterns))
+        json_dict = parse(name, json_str)
+        logger.debug(f"Getting details for {name}_json_dict")
+        paths_details = _get_paths_details(json_dict, compiled_paths_and_patterns)
+        if file_line_ranges is not None:
+            paths_details = _get_paths_details_in_line_ranges(json_str, paths_details, file_line_ranges)
+        return json_dict, paths_details
+
+    base_line_ranges, ours_line_ranges, theirs_line_ranges = line_ranges or (None, None, None)
+    parsed = utils.map_concurrently(parse_and_get_paths_details,
+                                    [('base', base_json_str, base_line_ranges),
+                                     ('ours', ours_json_str, ours_line_ranges),
+                                     ('theirs', theirs_json_str, theirs_line_ranges)],
+                                    parse_concurrently)
+    (_, base_paths_details), (_, ours_paths_details), (theirs_json_dict, theirs_paths_details) = parsed
+
+    # Formatting the paths-details of large files takes its time, even if not logged.
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"base_paths_details: {base_paths_details}")
+        logger.debug(f"ours_paths_details: {ours_paths_details}")
+        logger.debug(f"theirs_paths_details: {theirs_paths_details}")
 
     #
     # Detect conflicts.
@@ -56,8 +134,13 @@ def get_prepared_theirs_str(base_json_str: str, ours_json_str: str, theirs_json_
 
     common_paths = set.intersection(
         set(base_paths_details.keys()), set(ours_paths_details.keys()), set(theirs_paths_details.keys()))
-    logger.debug(f"common_paths to base/ours/theirs: {common_paths}")
-    for common_path in common_paths:
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"common_paths to base/ours/theirs: {common_paths}")
+
+    paths_to_prepare = []
+    for common_path in sorted(common_paths):
+        budget.check('detect', common_path)
+        metrics.enter('detect', common_path, ours_paths_details[common_path].get('configured_path'))
         leaf_warning = []
         if not base_paths_details[common_path]['is_leaf']:
             leaf_warning.append('Base')
@@ -68,6 +151,10 @@ def get_prepared_theirs_str(base_json_str: str, ours_json_str: str, theirs_json_
         if leaf_warning:
             logger.warning(f"{'/'.join(leaf_warning)} file's XPath '{common_path}' is not a leaf-node."
                            + " The merge driver works only on leaf-nodes. This path is ignored.")
+            if decisions is not None:
+                decisions.append({'path': common_path,
+                                  'merge_strategy': ours_paths_details[common_path]['merge_strategy'],
+                                  'prepare_theirs': False, 'ignored': 'not a leaf-node'})
             continue
 
         base_value = base_paths_details[common_path]['value']
@@ -90,86 +177,132 @@ def get_prepared_theirs_str(base_json_str: str, ours_json_str: str, theirs_json_
                 f"common_path: {common_path}; merge_strategy: {merge_strategy}; prepare_theirs: {prepare_theirs}" +
                 f"; num_distinct_values: {num_distinct_values}")
 
+        if decisions is not None:
+            decisions.append({'path': common_path, 'merge_strategy': merge_strategy, 'base_value': base_value,
+                              'ours_value': ours_value, 'theirs_value': theirs_value,
+                              'prepare_theirs': prepare_theirs})
         if prepare_theirs:
-            theirs_value_to_search = theirs_value
-            ours_value_replacement = ours_value
-            logger.debug(f"theirs_value_to_search: {theirs_value_to_search}"
-                         + f"; ours_value_replacement: {ours_value_replacement}")
-
-            #
-            # Using some special chars in jpath like slash '/', the following error occurs:
-            #
-            #       sonpath_ng.exceptions.JsonPathLexerError: Error on line 1, col 23: Unexpected character: /
-            #
-            # Example:
-            #   jpath = '$.dependencies.@mycompany/app1-version'
-            #
-            # To work around this, the path-part containing this char have to be quoted:
-            #   jpath = '$.dependencies."@mycompany/app1-version"'
-            #
-            # Quoting the whole path doesn't work. The part in question has to be quoted, or all parts of its own:
-            #   jpath = '$."dependencies"."@mycompany/app1-version"'
-            #
-            # But only the string-values, not the indexes!
-            # If a path contains an index, that index must not be quoted:
-            #   jpath = '$."dependencies".[1]'
-            #
-            # See also:
-            #   h2non/jsonpath-ng, https://github.com/h2non/jsonpath-ng/issues/127, issue #127:
-            #       json-path with slash results in: jsonpath_ng.exceptions.JsonPathLexerError: Error on line 1,
-            #       col 10: Unexpected character: / #127
-            #
-            def quote_jpath(jpath: str):
-                path_parts = jpath.split('.')
-                quoted_path_parts = []
-                for path_part in path_parts:
-                    if path_part.startswith('['):
-                        quoted_path_parts.append(path_part)
-                    else:
-                        quoted_path_parts.append('"' + path_part + '"')
-                return '.'.join(quoted_path_parts)
-
-            # Set Ours value to Theirs.
-            quoted_common_path = quote_jpath(common_path)
-            jsonpath_expr = jp.parse(quoted_common_path)
-            theirs_json_control_dict = jsonpath_expr.update(theirs_json_dict, ours_value)
-
-            neutral_formatted_theirs_json_str = json.dumps(theirs_json_control_dict)
-
-            def check_if_modified_json_str_is_equal_to_theirs_json_control_dict(json_str: str) -> bool:
-                return neutral_formatted_theirs_json_str == json.dumps(json.loads(json_str))
-
-            theirs_json_str = utils.replace_token(theirs_json_str, theirs_value_to_search,
-                                                  ours_value_replacement,
-                                                  check_if_modified_json_str_is_equal_to_theirs_json_control_dict)
+            logger.debug(f"theirs_value_to_search: {theirs_value}"
+                         + f"; ours_value_replacement: {ours_value}")
+            paths_to_prepare.append(common_path)
+
+    if not paths_to_prepare:
+        return theirs_json_str
+
+    #
+    # The values are replaced in Theirs at the spans of the values' tokens.
+    #
+    # First all replacements are collected in an edit-plan, applied in one pass, and the result is validated once
+    # against the control-dict containing all replacements. Only if that fails, or if a path has no span, the paths
+    # are replaced one by one.
+    #
+    budget.check('replace')
+    # The replacement in one pass is shared by the paths, see metrics.py.
+    metrics.enter('replace', paths_to_prepare)
+    theirs_key_paths = {path: theirs_paths_details[path]['key_path'] for path in paths_to_prepare}
+    ours_key_paths = {path: ours_paths_details[path]['key_path'] for path in paths_to_prepare}
+    theirs_spans = json_scanner.get_scalar_spans(theirs_json_str, theirs_key_paths.values())
+    ours_spans = json_scanner.get_scalar_spans(ours_json_str, ours_key_paths.values())
+
+    # Take Ours' tokens as they are in the file, including their escapes, if any.
+    ours_tokens = {common_path: ours_json_str[slice(*ours_spans[ours_key_paths[common_path]])]
+                   for common_path in paths_to_prepare if ours_key_paths[common_path] in ours_spans}
+    edits = [theirs_spans[theirs_key_paths[common_path]] + (ours_tokens[common_path],)
+             for common_path in paths_to_prepare
+             if theirs_key_paths[common_path] in theirs_spans and common_path in ours_tokens]
+
+    if len(edits) == len(paths_to_prepare):
+        for common_path in paths_to_prepare:
+            json_paths.set_value(theirs_json_dict, theirs_key_paths[common_path],
+                                 ours_paths_details[common_path]['value'])
+        prepared_json_str = utils.apply_edits(theirs_json_str, edits)
+        if json.dumps(theirs_json_dict) == json.dumps(json.loads(prepared_json_str)):
+            logger.debug(f"Replaced {len(edits)} path(s) in one pass.")
+            return prepared_json_str
+        logger.debug("The result of the replacements in one pass differs from the control-dict."
+                     + " Falling back to replacing path by path.")
+        for common_path in paths_to_prepare:
+            json_paths.set_value(theirs_json_dict, theirs_key_paths[common_path],
+                                 theirs_paths_details[common_path]['value'])
+
+    # 'splices' records the (start, delta) of the replacements done so far. A replacement changes the length of
+    # the document, so the spans behind a replacement have to be shifted by its delta.
+    splices = []
+    for common_path in paths_to_prepare:
+        budget.check('replace path by path', common_path)
+        metrics.enter('replace path by path', common_path)
+        theirs_value_to_search = theirs_paths_details[common_path]['value']
+        ours_value_replacement = ours_paths_details[common_path]['value']
+
+        # Set Ours value to Theirs.
+        json_paths.set_value(theirs_json_dict, theirs_key_paths[common_path], ours_value_replacement)
+
+        neutral_formatted_theirs_json_str = json.dumps(theirs_json_dict)
+
+        def check_if_modified_json_str_is_equal_to_theirs_json_control_dict(json_str: str) -> bool:
+            return neutral_formatted_theirs_json_str == json.dumps(json.loads(json_str))
+
+        if theirs_spans is None:
+            theirs_spans = json_scanner.get_scalar_spans(theirs_json_str, theirs_key_paths.values())
+            splices = []
+        theirs_span = theirs_spans.get(theirs_key_paths[common_path])
+        if theirs_span is not None and common_path in ours_tokens:
+            start, end = theirs_span
+            ours_token = ours_tokens[common_path]
+            shift = sum(delta for splice_start, delta in splices if splice_start < start)
+            spliced_json_str = theirs_json_str[:start + shift] + ours_token + theirs_json_str[end + shift:]
+            if check_if_modified_json_str_is_equal_to_theirs_json_control_dict(spliced_json_str):
+                logger.debug(f"common_path: {common_path}; replaced at span {theirs_span}")
+                theirs_json_str = spliced_json_str
+                splices.append((start, len(ours_token) - (end - start)))
+                continue
+
+        logger.debug(f"common_path: {common_path}; no valid span, falling back to replace_token()")
+        theirs_json_str = utils.replace_token(theirs_json_str, theirs_value_to_search,
+                                              ours_value_replacement,
+                                              check_if_modified_json_str_is_equal_to_theirs_json_control_dict)
+        # The positions of the replacement is unknown. So the spans are outdated.
+        theirs_spans = None
 
     return theirs_json_str
 
 
-def _get_paths_details(json_dict):
+def _get_paths_details(json_dict, compiled_paths_and_patterns):
     paths_info = {}
-    for path_and_pattern in g_paths_and_patterns:
-        merge_strategy = path_and_pattern['merge_strategy']
-        jpath = path_and_pattern['path']
-        attribute_pattern = path_and_pattern['pattern']
-        jsonpath_expr = jp.parse(jpath)
-        jp_matches = jsonpath_expr.find(json_dict)
-        logger.debug(f"_get_paths_details(); jpath: {jpath}; matching attributes count: {len(jp_matches)}")
-
-        if len(jp_matches) == 1 and type(jp_matches[0].value) == str and attribute_pattern:
+    all_matches = json_paths.find_matches(compiled_paths_and_patterns, json_dict)
+    for compiled_path_and_pattern, matches in zip(compiled_paths_and_patterns['paths_and_patterns'], all_matches):
+        merge_strategy = compiled_path_and_pattern['merge_strategy']
+        jpath = compiled_path_and_pattern['path']
+        attribute_regex = compiled_path_and_pattern['attribute_regex']
+        logger.debug(f"_get_paths_details(); jpath: {jpath}; matching attributes count: {len(matches)}")
+
+        if len(matches) == 1 and type(matches[0][1]) == str and attribute_regex:
             logger.warning(f"Path '{jpath}' is a non-wildcard path, and a pattern is given."
                            + " Patterns should only used on wildcard-paths"
                            + " like '$.some-object.*' and '$.some-list[*]'.")
 
-        for jp_match in jp_matches:
-            # Type of jp_match.path is <class 'jsonpath_ng.jsonpath.Fields'>.
-            attribute_name = str(jp_match.path)
-            if not attribute_pattern or re.match(attribute_pattern, attribute_name):
-                # Type of jp_match.full_path is  <class 'jsonpath_ng.jsonpath.Child'>.
-                full_path = str(jp_match.full_path)
-                value = jp_match.value
-                is_leaf = type(jp_match.value) not in [dict, list]
+        for key_path, value in matches:
+            attribute_name = json_paths.get_attribute_name(key_path)
+            if not attribute_regex or attribute_regex.match(attribute_name):
+                full_path = json_paths.format_key_path(key_path)
+                is_leaf = type(value) not in [dict, list]
                 paths_info.update({full_path: {
                     'merge_strategy': merge_strategy, 'attribute_name': attribute_name,
-                    'value': value, 'jsonpath_object': jp_match, 'is_leaf': is_leaf}})
+                    'value': value, 'key_path': key_path, 'is_leaf': is_leaf, 'configured_path': jpath}})
     return paths_info
+
+
+def _get_paths_details_in_line_ranges(json_str, paths_details, line_ranges):
+    # The JSON-dict has no line-numbers. Get them from the spans of the values' tokens. A token has no newline, so it
+    # is in one line. Objects and lists have no span, they aren't leafs anyway.
+    spans = json_scanner.get_scalar_spans(json_str, [details['key_path'] for details in paths_details.values()])
+    newline_offsets = [match.start() for match in re.finditer('\n', json_str)]
+    paths_details_in_line_ranges = {}
+    for path, details in paths_details.items():
+        span = spans.get(details['key_path'])
+        if span is None:
+            continue
+        line = bisect.bisect_left(newline_offsets, span[0]) + 1
+        if utils.is_in_line_ranges(line, line, line_ranges):
+            paths_details_in_line_ranges[path] = details
+    return paths_details_in_line_ranges
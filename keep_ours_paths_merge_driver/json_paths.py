@@ -0,0 +1,260 @@
+import logging
+import re
+
+logger = logging.getLogger()
+
+#
+# A small compiler for the subset of JSONPath the merge-driver supports:
+#
+#   - An optional root '$', e.g. '$.version' or 'version'.
+#   - Dotted fields, e.g. 'dependencies.some-lib'.
+#   - Quoted fields, e.g. 'dependencies."@mycompany/app1-version"', "dependencies.'zone.js'", or
+#       'dependencies["@mycompany/app1-version"]'.
+#   - The field-wildcard '*', matching all values of an object, e.g. 'dependencies.*'.
+#   - List-indexes '[n]' (0-based) and the index-wildcard '[*]', matching all items of a list, e.g. 'files[0]' or
+#       'files[*].name'.
+#
+# A path is compiled into a tuple of segments. A segment is either a field-name (str), a list-index (int), or one of
+# the wildcards ANY_FIELD and ANY_INDEX. All configured paths are merged into a trie, which is matched in one walk
+# of a JSON-document. Only the objects and lists reachable by a configured path are visited.
+#
+# Any other JSONPath-expression, e.g. filters, slices or recursive descent, is evaluated by jsonpath-ng. jsonpath-ng
+# is imported only in case such an expression is configured.
+#
+# The matches are given as key-paths, see json_scanner. E.g. the path 'dependencies.*' matches the key-path
+# ('dependencies', '@mycompany/app1').
+#
+
+# The wildcards are tuples to distinguish them from field-names like "*" given quoted.
+ANY_FIELD = ('*',)
+ANY_INDEX = ('[*]',)
+
+
+class UnsupportedJsonPathError(ValueError):
+    pass
+
+
+# Unquoted field-names containing one of these chars are JSONPath-expressions beyond the supported subset.
+_UNSUPPORTED_CHARS = '*()$,:|&~`?= '
+_INDEX_PATTERN = re.compile(r'\[\s*(\d+|\*|"[^"]*"|\'[^\']*\')\s*]')
+_UNQUOTED_FIELD_PATTERN = re.compile(r'[^.\[\]"\']+')
+
+
+def compile_path(jpath: str) -> tuple:
+    """
+    Compile the path into a tuple of segments.
+
+    :raises UnsupportedJsonPathError: If the path is not in the supported subset.
+    """
+    unsupported_error = UnsupportedJsonPathError(f"Unsupported JSON-path '{jpath}'")
+    s = jpath.strip()
+    if s.startswith('$'):
+        s = s[1:]
+        if s.startswith('.') and not s.startswith('..'):
+            s = s[1:]
+    segments = []
+    i = 0
+    # True if the previous segment is complete, and a '.' or '[' is expected.
+    expect_separator = False
+    while i < len(s):
+        c = s[i]
+        if c == '.':
+            # Reject a leading or trailing dot, and the recursive descent '..'.
+            if not expect_separator or s[i + 1:i + 2] in ('.', ''):
+                raise unsupported_error
+            expect_separator = False
+            i += 1
+        elif c == '[':
+            # Both 'files[0]' and 'files.[0]' are accepted.
+            m = _INDEX_PATTERN.match(s, i)
+            if not m:
+                raise unsupported_error
+            token = m.group(1)
+            if token == '*':
+                segments.append(ANY_INDEX)
+            elif token[0] in '"\'':
+                segments.append(token[1:-1])
+            else:
+                segments.append(int(token))
+            expect_separator = True
+            i = m.end()
+        elif expect_separator:
+            raise unsupported_error
+        elif c in '"\'':
+            end = s.find(c, i + 1)
+            if end == -1:
+                raise unsupported_error
+            segments.append(s[i + 1:end])
+            expect_separator = True
+            i = end + 1
+        elif c == '*':
+            segments.append(ANY_FIELD)
+            expect_separator = True
+            i += 1
+        else:
+            field = _UNQUOTED_FIELD_PATTERN.match(s, i).group(0)
+            if any(c in field for c in _UNSUPPORTED_CHARS):
+                raise unsupported_error
+            segments.append(field)
+            expect_separator = True
+            i += len(field)
+    return tuple(segments)
+
+
+def _new_trie_node():
+    return {'fields': {}, 'indexes': {}, 'any_field': None, 'any_index': None, 'terminals': []}
+
+
+def compile_paths_and_patterns(paths_and_patterns):
+    """
+    Compile the paths and patterns as given by config.get_paths_and_patterns().
+
+    :return: A dict with the keys 'paths_and_patterns' and 'trie'. 'paths_and_patterns' is a list of dicts with the
+        keys of paths_and_patterns, and in addition 'segments' (the compiled path, or None if the path has to be
+        evaluated by jsonpath-ng) and 'attribute_regex' (the compiled pattern, or None if no pattern is given).
+    """
+    compiled_paths_and_patterns = []
+    trie = _new_trie_node()
+    for index, path_and_pattern in enumerate(paths_and_patterns or []):
+        path = path_and_pattern['path']
+        pattern = path_and_pattern['pattern']
+        try:
+            segments = compile_path(path)
+        except UnsupportedJsonPathError:
+            logger.debug(f"compile_paths_and_patterns(); path '{path}' is evaluated by jsonpath-ng.")
+            segments = None
+        else:
+            node = trie
+            for segment in segments:
+                if segment == ANY_FIELD:
+                    node['any_field'] = node['any_field'] or _new_trie_node()
+                    node = node['any_field']
+                elif segment == ANY_INDEX:
+                    node['any_index'] = node['any_index'] or _new_trie_node()
+                    node = node['any_index']
+                elif isinstance(segment, int):
+                    node = node['indexes'].setdefault(segment, _new_trie_node())
+                else:
+                    node = node['fields'].setdefault(segment, _new_trie_node())
+            node['terminals'].append(index)
+        compiled_paths_and_patterns.append({
+            'merge_strategy': path_and_pattern['merge_strategy'], 'path': path, 'pattern': pattern,
+            'segments': segments, 'attribute_regex': re.compile(pattern) if pattern else None})
+    return {'paths_and_patterns': compiled_paths_and_patterns, 'trie': trie}
+
+
+def dump_compiled_paths_and_patterns(compiled) -> dict:
+    """
+    :return: The compiled paths and patterns as plain data, see config_cache. The attribute_regex is replaced by its
+        pattern.
+    """
+    return dict(compiled, paths_and_patterns=[
+        dict(compiled_path_and_pattern, attribute_regex=compiled_path_and_pattern['pattern'] or None)
+        for compiled_path_and_pattern in compiled['paths_and_patterns']])
+
+
+def load_compiled_paths_and_patterns(dumped) -> dict:
+    """
+    :param dumped: As returned by dump_compiled_paths_and_patterns().
+    :return: The compiled paths and patterns as returned by compile_paths_and_patterns().
+    """
+    return dict(dumped, paths_and_patterns=[
+        dict(compiled_path_and_pattern, attribute_regex=re.compile(compiled_path_and_pattern['attribute_regex'])
+             if compiled_path_and_pattern['attribute_regex'] else None)
+        for compiled_path_and_pattern in dumped['paths_and_patterns']])
+
+
+def find_matches(compiled, json_doc):
+    """
+    Match all compiled paths against the JSON-document.
+
+    :param compiled: The result of compile_paths_and_patterns().
+    :param json_doc: The JSON-document as given by json.loads().
+    :return: A list with an entry per compiled path. Each entry is a list of (key-path, value) tuples.
+    """
+    compiled_paths_and_patterns = compiled['paths_and_patterns']
+    matches = [[] for _ in compiled_paths_and_patterns]
+
+    def walk(value, key_path, nodes):
+        for node in nodes:
+            for terminal in node['terminals']:
+                matches[terminal].append((key_path, value))
+        if isinstance(value, dict):
+            any_field_nodes = [node['any_field'] for node in nodes if node['any_field']]
+            if any_field_nodes:
+                keys = value.keys()
+            else:
+                keys = [key for node in nodes for key in node['fields'] if key in value]
+            for key in dict.fromkeys(keys):
+                child_nodes = [node['fields'][key] for node in nodes if key in node['fields']] + any_field_nodes
+                walk(value[key], key_path + (key,), child_nodes)
+        elif isinstance(value, list):
+            any_index_nodes = [node['any_index'] for node in nodes if node['any_index']]
+            if any_index_nodes:
+                indexes = range(len(value))
+            else:
+                indexes = sorted({index for node in nodes for index in node['indexes'] if index < len(value)})
+            for index in indexes:
+                child_nodes = [node['indexes'][index] for node in nodes if index in node['indexes']] + any_index_nodes
+                walk(value[index], key_path + (index,), child_nodes)
+
+    walk(json_doc, (), [compiled['trie']])
+
+    for index, compiled_path_and_pattern in enumerate(compiled_paths_and_patterns):
+        if compiled_path_and_pattern['segments'] is None:
+            matches[index] = _find_matches_by_jsonpath_ng(compiled_path_and_pattern['path'], json_doc)
+
+    return matches
+
+
+def _find_matches_by_jsonpath_ng(jpath, json_doc):
+    import jsonpath_ng as jp
+
+    def get_key_path(jsonpath):
+        # Convert jsonpath-ng's full_path, e.g. Child(Child(Fields('files'), Index(0)), Fields('name')), into the
+        # key-path ('files', 0, 'name').
+        if isinstance(jsonpath, jp.Child):
+            return get_key_path(jsonpath.left) + get_key_path(jsonpath.right)
+        if isinstance(jsonpath, jp.Fields):
+            return tuple(jsonpath.fields)
+        if isinstance(jsonpath, jp.Index):
+            return (jsonpath.index,)
+        # Root and This.
+        return ()
+
+    return [(get_key_path(jp_match.full_path), jp_match.value) for jp_match in jp.parse(jpath).find(json_doc)]
+
+
+def format_key_path(key_path) -> str:
+    """
+    Format the key-path the way jsonpath-ng formats a full_path, e.g. "dependencies.'zone.js'" or 'files.[0].name'.
+    """
+    if not key_path:
+        return '$'
+    return '.'.join(_format_key(key) for key in key_path)
+
+
+def get_attribute_name(key_path) -> str:
+    """
+    Get the name the patterns are matched against: The last key of the key-path, e.g. '@mycompany/app1', or '[0]'
+    for a list-item.
+    """
+    if not key_path:
+        return '$'
+    key = key_path[-1]
+    return f'[{key}]' if isinstance(key, int) else key
+
+
+def _format_key(key):
+    if isinstance(key, int):
+        return f'[{key}]'
+    if any(literal in key for literal in '*.[]()$,:|&~'):
+        return f"'{key}'"
+    return key
+
+
+def set_value(json_doc, key_path, value):
+    container = json_doc
+    for key in key_path[:-1]:
+        container = container[key]
+    container[key_path[-1]] = value
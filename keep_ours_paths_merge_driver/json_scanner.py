@@ -0,0 +1,84 @@
+import json
+import re
+
+#
+# The JSON-scanner gets the spans of scalar values in a JSON-document.
+#
+# A span is a tuple (start, end) of character-offsets into the JSON-string. It covers the value's token as it is
+# written in the document, e.g. for '"version": "1.0.0"' the span covers '"1.0.0"' including the quotes.
+#
+# The values are addressed by key-paths. A key-path is a tuple of the object-keys (str) and list-indexes (int) from
+# the root to the value, e.g. ('dependencies', '@mycompany/app1') or ('files', 0).
+#
+# Only objects and lists on the way to a requested key-path are scanned. All other values are skipped by the
+# C-accelerated JSONDecoder.raw_decode().
+#
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+_scanstring = json.decoder.scanstring
+
+
+def get_scalar_spans(json_str: str, key_paths) -> dict:
+    """
+    Get the spans of the scalar values at the given key-paths.
+
+    :param json_str: The JSON-document.
+    :param key_paths: Iterable of key-paths.
+    :return: A dict of key-path to span (start, end). Key-paths not present in the document or pointing to objects
+        or lists are not in the dict.
+    """
+    targets = set(key_paths)
+    # The key-paths of all objects and lists which have to be scanned to reach the targets.
+    prefixes = {key_path[:i] for key_path in targets for i in range(len(key_path))}
+    spans = {}
+
+    def skip_whitespace(idx):
+        return _WHITESPACE.match(json_str, idx).end()
+
+    def scan_value(idx, key_path):
+        if key_path not in prefixes:
+            end = _decoder.raw_decode(json_str, idx)[1]
+            if key_path in targets and json_str[idx] not in '{[':
+                spans[key_path] = (idx, end)
+            return end
+
+        c = json_str[idx]
+        if c == '{':
+            idx = skip_whitespace(idx + 1)
+            if json_str[idx] == '}':
+                return idx + 1
+            while True:
+                # json_str[idx] is the '"' starting the key.
+                key, idx = _scanstring(json_str, idx + 1)
+                idx = skip_whitespace(idx)
+                if json_str[idx] != ':':
+                    raise ValueError(f"Expecting ':' delimiter at char {idx}")
+                idx = scan_value(skip_whitespace(idx + 1), key_path + (key,))
+                idx = skip_whitespace(idx)
+                if json_str[idx] == '}':
+                    return idx + 1
+                if json_str[idx] != ',':
+                    raise ValueError(f"Expecting ',' delimiter at char {idx}")
+                idx = skip_whitespace(idx + 1)
+        elif c == '[':
+            idx = skip_whitespace(idx + 1)
+            if json_str[idx] == ']':
+                return idx + 1
+            index = 0
+            while True:
+                idx = scan_value(idx, key_path + (index,))
+                idx = skip_whitespace(idx)
+                if json_str[idx] == ']':
+                    return idx + 1
+                if json_str[idx] != ',':
+                    raise ValueError(f"Expecting ',' delimiter at char {idx}")
+                idx = skip_whitespace(idx + 1)
+                index += 1
+        else:
+            # A scalar where an object or list is expected on the way to a target. Nothing to find below it.
+            return _decoder.raw_decode(json_str, idx)[1]
+
+    if targets:
+        scan_value(skip_whitespace(0), ())
+    return spans
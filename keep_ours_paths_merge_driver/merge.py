@@ -0,0 +1,402 @@
+import logging
+import os
+
+from keep_ours_paths_merge_driver import budget
+from keep_ours_paths_merge_driver import config
+from keep_ours_paths_merge_driver import metrics
+
+logger = logging.getLogger()
+
+#
+# The steps of a merge-driver call, shared by the command line entry point and the server:
+#
+#   1. read_files(): Read base, ours and theirs.
+#   2. prepare_theirs(): Prepare theirs by Ours' values of the configured paths, see get_paths_and_patterns().
+#   3. merge_file(): Write the prepared theirs to the theirs-file and call git merge-file on the three files.
+#       Or merge_file_builtin(): Merge the three files in-process, see diff3.py.
+#
+# With --scope hunks the files are merged first, and prepare_theirs() prepares only the paths within the lines of the
+# conflicts, see get_line_ranges(). If the merge has no conflicts, step 2 is skipped. This is not the case if there
+# are always-ours-paths, because a merge without conflicts may take their values from theirs.
+#
+# With --result-memo-size the prepared theirs is memoized per file-triple and config, and step 2 takes it from there
+# if the file-triple has been prepared before. See result_memo.py.
+#
+# With --time-budget or --memory-budget, step 2 is abandoned if it exceeds a budget, and the files are merged
+# unprepared. See budget.py.
+#
+# prepare_theirs_file() does the steps 1 and 2, and writes the prepared theirs to the theirs-file.
+# merge_strs_builtin() and merge_strs_git() do step 3 on strings and return the merge-result. See batch.py.
+#
+# The files are read and written as bytes. The merge-drivers decode them: The XML-parser as the files declare, e.g.
+# '<?xml version="1.0" encoding="ISO-8859-1"?>', and the JSON-merge-driver as UTF-8. The prepared theirs is written
+# in the encoding of theirs.
+#
+# In the following we're using the following terms for the XML-representations:
+#
+#   - filepath: The filename as it is given by the Merge-Driver parameters %O, %A, %B.
+#               These filenames are temp-files and aren't named as the original ones.
+#   - doc:      The file as xml.etree.ElementTree, a "XML-document".
+#   - str:      The file as string.
+#   - content:  The file as bytes, or as string.
+#
+
+# The compiled paths-configs of this process by their raw configs, see get_compiled_paths_and_patterns().
+_compiled_paths_and_patterns_by_raw_config = {}
+_COMPILED_PATHS_AND_PATTERNS_MAX_COUNT = 64
+
+
+def get_paths_and_patterns(cl_args, paths_from_environment_as_str):
+    paths_from_cl_args_as_list = getattr(cl_args, 'pathspatterns', None)
+    logger.debug(f"-p: {paths_from_cl_args_as_list}")
+    logger.debug(f"KOP_MERGE_DRVIER_PATHSPATTERNS: {paths_from_environment_as_str}")
+    # Get path_and_patterns either from environment variable or command-line parameter. Environment variable takes
+    # precedence.
+    return config.get_paths_and_patterns(paths_from_environment_as_str, paths_from_cl_args_as_list, cl_args.separator)
+
+
+def get_merge_driver(filetype):
+    # This is the tiny merge-driver-factory.
+    # The choices are limited to 'XML' and 'JSON'. So there is no need to check any alternative to 'XML'.
+    # If not 'XML' it is 'JSON'. 'XML' is the default.
+    # Only the merge-driver of the given file-type is imported. The XML-merge-driver imports lxml, the
+    # JSON-merge-driver doesn't.
+    if filetype == 'XML':
+        from keep_ours_paths_merge_driver import xml_merge_driver as merge_driver
+    else:
+        from keep_ours_paths_merge_driver import json_merge_driver as merge_driver
+    return merge_driver
+
+
+def read_file(filepath, cwd=None):
+    # The line-endings are kept as they are.
+    with open(os.path.join(cwd or '', filepath), newline='') as f:
+        return f.read()
+
+
+def read_file_bytes(filepath, cwd=None):
+    with open(os.path.join(cwd or '', filepath), mode='rb') as f:
+        return f.read()
+
+
+def read_files(cl_args, cwd=None) -> tuple:
+    """
+    :return: Tuple of the contents of the base-, ours- and theirs-file as bytes.
+    """
+    # %O, %A, %B
+    return tuple(read_file_bytes(filepath, cwd) for filepath in [cl_args.base, cl_args.ours, cl_args.theirs])
+
+
+def write_file(filepath, content, cwd=None):
+    """
+    :param content: bytes, or str. A str is written with the line-endings it has.
+    """
+    if isinstance(content, bytes):
+        with open(os.path.join(cwd or '', filepath), mode='wb') as f:
+            f.write(content)
+        return
+    with open(os.path.join(cwd or '', filepath), mode='w', newline='') as f:
+        f.write(content)
+
+
+def prepare_theirs(cl_args, paths_from_environment_as_str, base_file_content, ours_file_content, theirs_file_content,
+                   cwd=None):
+    """
+    Prepare theirs by Ours' values of the configured paths.
+
+    :param cl_args: The parsed command line arguments, see config.init_argument_parser().
+    :param paths_from_environment_as_str: The value of the environment variable KOP_MERGE_DRVIER_PATHSPATTERNS.
+    :param base_file_content, ours_file_content, theirs_file_content: The contents as bytes, see read_files().
+    :param cwd: The working directory of the merge-driver call, whose .git-directory holds the config-cache, the
+        extraction-cache and the result-memo.
+    :return: The prepared theirs as bytes, or None if theirs has not been prepared.
+    """
+    # The merge-driver makes only sense if all three files have content.
+    # If the file has been added to ours-branch and theirs-branch, but was not present before in base, the base-file
+    # is empty.
+    if not (base_file_content and ours_file_content and theirs_file_content):
+        return None
+
+    metrics.enter('config')
+    paths_and_patterns, compiled_paths_and_patterns = get_compiled_paths_and_patterns(
+        cl_args, paths_from_environment_as_str, cwd)
+    logger.info(f"paths_and_patterns: {paths_and_patterns}")
+    if not paths_and_patterns:
+        logger.info("paths_and_patterns-config is empty."
+                    + " Nothing has been set in command-line-parameter -p"
+                    + " nor in environment-variable KOP_MERGE_DRVIER_PATHSPATTERNS."
+                    + " This means no preparation of theirs-file take place.")
+        return None
+
+    memo = get_result_memo(cl_args, paths_from_environment_as_str, cwd)
+    if memo is not None:
+        from keep_ours_paths_merge_driver import result_memo
+        metrics.enter('result-memo')
+        memo_key = result_memo.get_key(memo, cl_args.scope, base_file_content, ours_file_content, theirs_file_content)
+        memoized = result_memo.read(memo, memo_key, theirs_file_content)
+        if memoized is not None:
+            logger.info("Taking the prepared theirs from the result-memo.")
+            return memoized['prepared_theirs']
+    try:
+        # The timer-signal of the time-budget may fire as soon as it is started, and while the budgets are stopped.
+        try:
+            budget.start(cl_args.time_budget, cl_args.memory_budget)
+            prepared_theirs = _prepare_theirs(cl_args, paths_from_environment_as_str, base_file_content,
+                                              ours_file_content, theirs_file_content, paths_and_patterns,
+                                              compiled_paths_and_patterns, cwd)
+        finally:
+            budget.stop()
+    except (budget.BudgetExceeded, MemoryError) as e:
+        # Not memoized, the next time the budget may suffice.
+        logger.warning(f"{type(e).__name__}: {e}. Abandoning the preparation, merging unprepared.")
+        return None
+    if memo is not None:
+        metrics.enter('result-memo')
+        result_memo.write(memo, memo_key, prepared_theirs, theirs_file_content)
+    return prepared_theirs
+
+
+def _prepare_theirs(cl_args, paths_from_environment_as_str, base_file_content, ours_file_content, theirs_file_content,
+                    paths_and_patterns, compiled_paths_and_patterns, cwd):
+    # The steps of prepare_theirs() memoized by the result-memo.
+    line_ranges = None
+    if cl_args.scope == config.SCOPE_HUNKS:
+        line_ranges = get_line_ranges(base_file_content, ours_file_content, theirs_file_content,
+                                      has_always_ours_paths(paths_and_patterns))
+        # A path to prepare has lines in all of base, ours and theirs.
+        if not all(line_ranges):
+            logger.info("The merge has no conflicts with lines in all of base, ours and theirs. Nothing to prepare.")
+            return None
+        logger.info(f"Preparing the paths within the lines {line_ranges[2]} of theirs.")
+
+    merge_driver = get_merge_driver(cl_args.filetype)
+    return merge_driver.get_prepared_theirs_bytes(base_file_content, ours_file_content, theirs_file_content,
+                                                  compiled_paths_and_patterns,
+                                                  parse_concurrently=cl_args.parse_concurrently,
+                                                  streaming_threshold=cl_args.streaming_threshold,
+                                                  line_ranges=line_ranges,
+                                                  paths_details_cache=get_paths_details_cache(
+                                                      cl_args, paths_from_environment_as_str, cwd))
+
+
+def get_compiled_paths_and_patterns(cl_args, paths_from_environment_as_str, cwd=None) -> tuple:
+    """
+    Get the paths-config and compile it by the merge-driver of the file-type. Both are kept in-memory for further calls
+    of the process, e.g. by the server, and with --config-cache loaded from the config-cache, see config_cache.py.
+
+    :return: Tuple of the paths-config as returned by get_paths_and_patterns(), and the compiled paths-config, which
+        is None if the paths-config is empty.
+    """
+    from keep_ours_paths_merge_driver import config_cache
+    raw_config = get_raw_config(cl_args, paths_from_environment_as_str)
+    # One lookup, as the server's threads may clear the dict in between, see server.py.
+    compiled = _compiled_paths_and_patterns_by_raw_config.get(raw_config)
+    if compiled is not None:
+        return compiled
+
+    cached = config_cache.read(raw_config, cwd) if cl_args.config_cache else None
+    if cached is not None:
+        logger.debug("get_compiled_paths_and_patterns(); loaded from the config-cache")
+        paths_and_patterns = cached['paths_and_patterns']
+        compiled_paths_and_patterns = None
+        if paths_and_patterns:
+            compiled_paths_and_patterns = get_merge_driver(cl_args.filetype).load_compiled_paths_and_patterns(
+                cached['compiled_paths_and_patterns'])
+    else:
+        paths_and_patterns = get_paths_and_patterns(cl_args, paths_from_environment_as_str)
+        compiled_paths_and_patterns = dumped_compiled_paths_and_patterns = None
+        if paths_and_patterns:
+            merge_driver = get_merge_driver(cl_args.filetype)
+            compiled_paths_and_patterns = merge_driver.compile_paths_and_patterns(paths_and_patterns)
+            dumped_compiled_paths_and_patterns = merge_driver.dump_compiled_paths_and_patterns(
+                compiled_paths_and_patterns)
+        if cl_args.config_cache:
+            config_cache.write(raw_config, paths_and_patterns, dumped_compiled_paths_and_patterns, cwd)
+
+    if len(_compiled_paths_and_patterns_by_raw_config) >= _COMPILED_PATHS_AND_PATTERNS_MAX_COUNT:
+        _compiled_paths_and_patterns_by_raw_config.clear()
+    _compiled_paths_and_patterns_by_raw_config[raw_config] = paths_and_patterns, compiled_paths_and_patterns
+    return paths_and_patterns, compiled_paths_and_patterns
+
+
+def get_raw_config(cl_args, paths_from_environment_as_str) -> str:
+    from keep_ours_paths_merge_driver import config_cache
+    return config_cache.get_raw_config(cl_args.filetype, cl_args.separator, paths_from_environment_as_str,
+                                       getattr(cl_args, 'pathspatterns', None))
+
+
+def get_paths_details_cache(cl_args, paths_from_environment_as_str, cwd=None):
+    """
+    :return: The extraction-cache in the .git-directory, see extraction_cache.py, or None if switched off by
+        --extraction-cache-size 0 or if there is no .git-directory.
+    """
+    if cl_args.extraction_cache_size <= 0:
+        return None
+    from keep_ours_paths_merge_driver import config_cache
+    from keep_ours_paths_merge_driver import extraction_cache
+    return extraction_cache.get_extraction_cache(config_cache.get_cache_dir(cwd),
+                                                 get_raw_config(cl_args, paths_from_environment_as_str),
+                                                 cl_args.extraction_cache_size)
+
+
+def get_result_memo(cl_args, paths_from_environment_as_str, cwd=None):
+    """
+    :return: The result-memo in the .git-directory, see result_memo.py, or None if switched off by
+        --result-memo-size 0 or if there is no .git-directory.
+    """
+    if cl_args.result_memo_size <= 0:
+        return None
+    from keep_ours_paths_merge_driver import config_cache
+    from keep_ours_paths_merge_driver import result_memo
+    return result_memo.get_result_memo(config_cache.get_cache_dir(cwd),
+                                       get_raw_config(cl_args, paths_from_environment_as_str),
+                                       cl_args.result_memo_size, cl_args.result_memo_max_age)
+
+
+def has_always_ours_paths(paths_and_patterns) -> bool:
+    return any(path_and_pattern['merge_strategy'] == config.MERGE_STRATEGY_ALWAYS_OURS
+               for path_and_pattern in paths_and_patterns or [])
+
+
+def get_line_ranges(base_file_content, ours_file_content, theirs_file_content, with_changes_from_theirs) -> tuple:
+    """
+    Get the lines of the conflicts of the merge, see diff3.get_hunks_line_ranges().
+
+    :param base_file_content, ours_file_content, theirs_file_content: All str, or all bytes.
+    :param with_changes_from_theirs: Get the lines of the changes the merge takes from theirs as well.
+    :return: Tuple of the lists of the line-ranges of base, ours and theirs. A line-range is a tuple (begin, end) of
+        the lines [begin, end), 1-based as lxml's sourceline. The lists are sorted, and the line-ranges don't
+        overlap. Empty line-ranges are left out.
+    """
+    from keep_ours_paths_merge_driver import diff3
+    if isinstance(theirs_file_content, bytes):
+        # See merge_strs_builtin().
+        base_file_content, ours_file_content, theirs_file_content = (
+            file_content.decode('latin-1') for file_content in [base_file_content, ours_file_content,
+                                                                 theirs_file_content])
+    hunks = [hunk for hunk in diff3.get_hunks_line_ranges(base_file_content, ours_file_content, theirs_file_content)
+             if hunk['is_conflict'] or with_changes_from_theirs]
+    line_ranges = ([], [], [])
+    for hunk in hunks:
+        for file_line_ranges, name in zip(line_ranges, ['base', 'ours', 'theirs']):
+            begin, end = hunk[name]
+            if begin == end:
+                continue
+            if file_line_ranges and file_line_ranges[-1][1] >= begin + 1:
+                # Join adjacent and overlapping line-ranges.
+                file_line_ranges[-1] = (file_line_ranges[-1][0], max(file_line_ranges[-1][1], end + 1))
+            else:
+                file_line_ranges.append((begin + 1, end + 1))
+    return line_ranges
+
+
+def prepare_theirs_file(cl_args, paths_from_environment_as_str, cwd=None):
+    """
+    Write Ours' values of the configured paths to the theirs-file.
+
+    :param cwd: The directory the file-paths in cl_args are relative to. Defaults to the current working directory.
+    :return: The prepared theirs as bytes, or None if theirs has not been prepared.
+    """
+    base_file_content, ours_file_content, theirs_file_content = read_files(cl_args, cwd)
+    prepared_theirs = prepare_theirs(
+        cl_args, paths_from_environment_as_str, base_file_content, ours_file_content, theirs_file_content, cwd)
+    if prepared_theirs is not None:
+        write_file(cl_args.theirs, prepared_theirs, cwd)
+    return prepared_theirs
+
+
+def merge_file(ours_filepath, base_filepath, theirs_filepath):
+    """
+    :return: The exit code of git merge-file, which is the number of conflicts, or negative on error.
+    """
+    # From the docs https://git-scm.com/docs/git-merge-file:
+    #   "git merge-file incorporates all changes that lead from the <base-file> to <other-file> into
+    #   <current-file>. The result ordinarily goes into <current-file>.".
+    # Despite ours_a_filename is a temp-file, Git notices the merge-result and will write it to
+    # the regular file in the workspace.
+    import subprocess
+    return subprocess.call(get_merge_file_cmd(ours_filepath, base_filepath, theirs_filepath))
+
+
+def get_merge_file_cmd(ours_filepath, base_filepath, theirs_filepath) -> list:
+    """
+    :return: The git merge-file command of merge_file(). The server responds with it, see server.py.
+    """
+    import shlex
+    cmd = "git merge-file -L ours -L base -L theirs " + ours_filepath + " " + base_filepath + " " + theirs_filepath
+    return shlex.split(cmd)
+
+
+def merge_file_builtin(ours_filepath, base_file_content, ours_file_content, theirs_file_content):
+    """
+    Merge the files in-process with the same result as merge_file(), and write the result to the ours-file.
+
+    :return: The number of conflicts, like the exit code of git merge-file.
+    """
+    merged_content, returncode = merge_strs_builtin(base_file_content, ours_file_content, theirs_file_content)
+    if merged_content is not None:
+        write_file(ours_filepath, merged_content)
+    return returncode
+
+
+def merge_strs_builtin(base_file_str, ours_file_str, theirs_file_str):
+    """
+    :param base_file_str, ours_file_str, theirs_file_str: All str, or all bytes.
+    :return: Tuple of the merge-result of the same type, or None on error, and the number of conflicts like the exit
+        code of git merge-file.
+    """
+    if isinstance(theirs_file_str, bytes):
+        # git merge-file merges bytes. ISO-8859-1 maps each byte to one character and back, so merging the decoded
+        # strings gives the same bytes in any encoding, and the conflict-markers in ASCII.
+        merged_str, returncode = merge_strs_builtin(
+            *(file_content.decode('latin-1') for file_content in [base_file_str, ours_file_str, theirs_file_str]))
+        return (merged_str.encode('latin-1') if merged_str is not None else None), returncode
+    from keep_ours_paths_merge_driver import diff3
+    # git merge-file refuses to merge binary files.
+    for file_str in [base_file_str, ours_file_str, theirs_file_str]:
+        if '\0' in file_str[:8000]:
+            logger.error("Cannot merge binary files")
+            return None, -1
+    merged_str, conflicts_count = diff3.merge(base_file_str, ours_file_str, theirs_file_str)
+    return merged_str, min(conflicts_count, diff3.MAX_EXIT_CODE)
+
+
+def merge_strs_git(base_file_str, ours_file_str, theirs_file_str):
+    """
+    Like merge_strs_builtin(), but by git merge-file on temp-files.
+    """
+    import tempfile
+    with tempfile.TemporaryDirectory() as temp_dir:
+        filepaths = []
+        for name, file_str in [('ours', ours_file_str), ('base', base_file_str), ('theirs', theirs_file_str)]:
+            write_file(os.path.join(temp_dir, name), file_str)
+            filepaths.append(os.path.join(temp_dir, name))
+        merged_content, returncode = _merge_filepaths_git(*filepaths)
+    if merged_content is None or isinstance(theirs_file_str, bytes):
+        return merged_content, returncode
+    return merged_content.decode(), returncode
+
+
+def merge_files(cl_args):
+    """
+    Merge the files as they are without writing the result. With --scope hunks the files are merged before theirs is
+    prepared.
+
+    :return: Tuple of the merge-result as bytes, or None on error, and the number of conflicts like the exit code of
+        git merge-file.
+    """
+    if cl_args.merge_file == config.MERGE_FILE_BUILTIN:
+        return merge_strs_builtin(*read_files(cl_args))
+    return _merge_filepaths_git(cl_args.ours, cl_args.base, cl_args.theirs)
+
+
+def _merge_filepaths_git(ours_filepath, base_filepath, theirs_filepath):
+    import subprocess
+    completed_process = subprocess.run(
+        ['git', 'merge-file', '-p', '-L', 'ours', '-L', 'base', '-L', 'theirs', ours_filepath, base_filepath,
+         theirs_filepath],
+        stdout=subprocess.PIPE)
+    # git merge-file exits with at most 127 conflicts, and with 255 (-1) on error.
+    if not 0 <= completed_process.returncode <= 127:
+        return None, -1
+    return completed_process.stdout, completed_process.returncode
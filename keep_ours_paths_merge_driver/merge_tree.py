@@ -0,0 +1,124 @@
+import logging
+import os
+import subprocess
+import sys
+
+from keep_ours_paths_merge_driver import batch
+from keep_ours_paths_merge_driver import config
+from keep_ours_paths_merge_driver import git_objects
+from keep_ours_paths_merge_driver import merge
+
+logger = logging.getLogger()
+
+#
+# The merge-tree-mode prepares theirs in a repository without worktree, e.g. a bare repository of a merge-service:
+#
+#   keep_ours_paths_merge_driver merge-tree [-C REPO] [-t XML|JSON] [--write-tree] BASE OURS THEIRS PATH... -p ...
+#
+# (-p takes all following arguments, so it is given last, or ends with "--".)
+#
+# BASE, OURS and THEIRS are commit-ishs. The blobs of the PATHs are read through one "git cat-file --batch" process,
+# theirs is prepared in-memory, and the prepared theirs are written to the object-database by one "git fast-import"
+# process. For each prepared path "<object-id>\t<path>" is printed to stdout. Paths not present in all of base, ours
+# and theirs are skipped, as by the merge-driver. No temporary files are written, see git_objects.py.
+#
+# With --write-tree the merge is done as well: The prepared blobs are written into a tree as theirs' tree, and a
+# commit of this tree with THEIRS as parent is passed to "git merge-tree --write-tree OURS <commit>". So the
+# merge-base is the same as for OURS and THEIRS. Its output and exit code (0 for a clean merge, 1 on conflicts) are
+# those of git merge-tree. The conflict-markers are labeled with OURS and the commit's object-id.
+#
+
+# The commit of the prepared tree is no part of any history. It gets a fixed identity.
+COMMIT_IDENTITY_ENV = {
+    'GIT_AUTHOR_NAME': config.SCRIPT_NAME,
+    'GIT_AUTHOR_EMAIL': f'{config.SCRIPT_NAME}@localhost',
+    'GIT_COMMITTER_NAME': config.SCRIPT_NAME,
+    'GIT_COMMITTER_EMAIL': f'{config.SCRIPT_NAME}@localhost',
+}
+
+
+def prepare_theirs_blobs(base, ours, theirs, paths, filetype, paths_and_patterns, cwd=None) -> dict:
+    """
+    :return: Dict of the paths whose theirs has been changed by the preparation to the object-ids of the prepared
+        blobs.
+    """
+    prepared_paths = []
+    triples = []
+    cat_file_process = git_objects.open_cat_file(cwd)
+    try:
+        for path in paths:
+            blobs = [git_objects.read_blob(cat_file_process, f'{commit}:{path}') for commit in [base, ours, theirs]]
+            if None in blobs:
+                logger.info(f"{path} is not present in all of base, ours and theirs. Skipped.")
+                continue
+            prepared_paths.append(path)
+            triples.append(tuple(blobs))
+    finally:
+        git_objects.close_cat_file(cat_file_process)
+    if not triples or not paths_and_patterns:
+        return {}
+
+    prepared_theirs_contents = batch.prepare_theirs_contents(
+        triples, filetype, paths_and_patterns, workers=min(batch.available_cpu_count(), len(triples)),
+        loglevel=logging.getLevelName(logger.level))
+    changed = [(path, prepared_theirs) for path, triple, prepared_theirs
+               in zip(prepared_paths, triples, prepared_theirs_contents)
+               if prepared_theirs is not None and prepared_theirs != triple[2]]
+    oids = git_objects.write_blobs([prepared_theirs for _, prepared_theirs in changed], cwd)
+    return {path: oid for (path, _), oid in zip(changed, oids)}
+
+
+def merge_tree(ours, theirs, prepared_blobs, cwd=None):
+    """
+    :param prepared_blobs: As returned by prepare_theirs_blobs().
+    :return: Tuple of the output and the exit code of git merge-tree --write-tree.
+    """
+    if prepared_blobs:
+        modes = git_objects.ls_tree(theirs, prepared_blobs, cwd)
+        tree = git_objects.write_tree(theirs, {path: (modes[path][0], oid) for path, oid in prepared_blobs.items()},
+                                      cwd)
+        theirs = git_objects.git(['commit-tree', tree, '-p', theirs, '-m', 'Prepared theirs'],
+                                 env=dict(os.environ, **COMMIT_IDENTITY_ENV), cwd=cwd).decode().strip()
+    completed_process = subprocess.run(['git', 'merge-tree', '--write-tree', ours, theirs], cwd=cwd,
+                                       stdout=subprocess.PIPE)
+    return completed_process.stdout.decode(), completed_process.returncode
+
+
+def init_argument_parser():
+    import argparse
+    parser = argparse.ArgumentParser(prog=f'{config.SCRIPT_NAME} merge-tree',
+                                     description='Prepare theirs of paths in commits, without worktree.')
+    parser.add_argument('base', help='The base commit-ish.')
+    parser.add_argument('ours', help='The ours commit-ish.')
+    parser.add_argument('theirs', help='The theirs commit-ish.')
+    parser.add_argument('paths', nargs='+', metavar='path', help='The paths of the files to prepare.')
+    parser.add_argument('-C', dest='repository', help='The repository. Defaults to the current working directory.')
+    parser.add_argument('--write-tree', action='store_true', default=False,
+                        help='Merge ours and the prepared theirs by git merge-tree --write-tree.')
+    parser.add_argument('-p', '--pathspatterns', nargs='+', metavar='MERGE-STRATEGY:PATH:PATTERN',
+                        help="As in the merge-driver.")
+    parser.add_argument('-s', '--separator', default=config.PATHS_TO_PATTERN_SEPARATOR,
+                        help="As in the merge-driver.")
+    parser.add_argument('-t', '--filetype', choices=config.FILE_TYPES, default=config.FILE_TYPE_DEFAULT,
+                        help="As in the merge-driver.")
+    parser.add_argument('-l', '--loglevel', choices=config.LOG_LEVELS, default=config.DEFAULT_LOGLEVEL,
+                        help="As in the merge-driver.")
+    return parser
+
+
+def main(argv):
+    cl_args = init_argument_parser().parse_args(argv)
+    config.configure_logger(cl_args.loglevel)
+
+    paths_and_patterns = merge.get_paths_and_patterns(cl_args, os.getenv('KOP_MERGE_DRVIER_PATHSPATTERNS'))
+    logger.info(f"paths_and_patterns: {paths_and_patterns}")
+    prepared_blobs = prepare_theirs_blobs(cl_args.base, cl_args.ours, cl_args.theirs, cl_args.paths,
+                                          cl_args.filetype, paths_and_patterns, cl_args.repository)
+    if not cl_args.write_tree:
+        for path, oid in prepared_blobs.items():
+            print(f'{oid}\t{path}')
+        return 0
+
+    output, returncode = merge_tree(cl_args.ours, cl_args.theirs, prepared_blobs, cl_args.repository)
+    sys.stdout.write(output)
+    return returncode
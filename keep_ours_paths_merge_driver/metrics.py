@@ -0,0 +1,370 @@
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+
+from keep_ours_paths_merge_driver import config
+
+logger = logging.getLogger()
+
+#
+# The metrics of merge-driver calls. With --metrics-file each call records where its time went, and appends the
+# record to the metrics-file. A record is a dict:
+#
+#   {'time': the start of the call in seconds since the epoch,
+#    'repository': the working directory of the call, the top-level directory of the worktree,
+#    'path': the pathname given in -P, 'filetype': ..., 'configured_paths': the paths of the paths-config,
+#    'returncode': the exit code of the call, 'seconds': the duration of the call,
+#    'stages': {stage: seconds},
+#    'paths': {path: {stage: seconds, 'replace_token attempts': count}},
+#    'matched_paths': {matched path: the configured path it has been matched by}}
+#
+# The stages are the checkpoints of the merge-driver, see also budget.py: 'read', 'config', 'result-memo', 'server',
+# 'pre-screen', 'parse <document>', 'find paths in <document>', 'detect', 'replace', 'replace path by path', 'write',
+# and 'merge-file'. A stage lasts until the next stage is entered on the same thread, or until the thread leaves it.
+# So the stages of the documents parsed concurrently are timed each, see utils.map_concurrently(). Their times overlap,
+# and the time the main thread waits for them isn't part of a stage. In the streaming-mode 'parse <document>' includes
+# the search of the paths, and on a hit of the extraction-cache it is the read of the cache-file.
+#
+# The time of a stage entered for a path is attributed to that path as well. The detection and the replacement are
+# attributed to the matched paths, e.g. '/project/version'. The replacement in one pass is shared by the matched paths
+# it replaces. The detection records the configured path a matched path has been matched by, e.g. './version', and
+# aggregate() rolls the matched paths up to their configured paths. The search of the paths in a parsed XML-document
+# is attributed to the configured paths directly. The JSON-paths are searched all at once, and the streaming
+# XML-paths as well.
+#
+# The metrics-file is one of:
+#
+#   - A JSONL-file: Each call appends its record as one line. The lines are written by one write() each, so the
+#     records of concurrent calls don't interleave. Aggregated by the 'stats' command, see main().
+#   - A Prometheus textfile (ending in PROMETHEUS_SUFFIX), e.g. for the textfile-collector of the node-exporter: The
+#     counters of the file are updated by each call, locked against concurrent calls.
+#
+# Without --metrics-file nothing is recorded, and the checkpoints return at once.
+#
+
+PROMETHEUS_SUFFIX = '.prom'
+METRIC_PREFIX = 'kop_merge_driver_'
+REPLACE_TOKEN_ATTEMPTS = 'replace_token attempts'
+LIMIT_DEFAULT = 20
+
+# The call recording in the current context, set by start(). A dict of the record, per thread-ident a list [stage,
+# path, start of the stage], and the lock of both. The threads parsing concurrently run in copies of the context, see
+# utils.map_concurrently(), and add to the same record. Concurrent calls, e.g. of the server, record each their own.
+_call = contextvars.ContextVar('metrics_call', default=None)
+
+
+def start(repository, path=None, filetype=None, configured_paths=None):
+    record = {'time': time.time(), 'repository': repository, 'path': path, 'filetype': filetype,
+              'configured_paths': configured_paths or [], 'stages': {}, 'paths': {}, 'matched_paths': {}}
+    _call.set({'record': record, 'current_stages': {}, 'lock': threading.Lock(), 'started': time.perf_counter()})
+
+
+def enter(stage, path=None, configured_path=None):
+    """
+    A checkpoint. End the stage of the current thread, and enter the given one.
+
+    :param stage: The stage to enter, e.g. 'parse base'.
+    :param path: The path the stage is working on, if any. A list of paths shares the time of the stage.
+    :param configured_path: The configured path the matched path has been matched by, if known.
+    """
+    call = _call.get()
+    if call is None:
+        return
+    now = time.perf_counter()
+    ident = threading.get_ident()
+    _add_time(call, call['current_stages'].get(ident), now)
+    call['current_stages'][ident] = [stage, path, now]
+    if configured_path is not None:
+        with call['lock']:
+            call['record']['matched_paths'][path] = configured_path
+
+
+def set_path(path):
+    """
+    Continue the stage of the current thread for another path.
+    """
+    call = _call.get()
+    if call is None:
+        return
+    current_stage = call['current_stages'].get(threading.get_ident())
+    if current_stage is not None:
+        enter(current_stage[0], path)
+
+
+def leave():
+    """
+    End the stage of the current thread, e.g. at the end of an item of a worker-thread.
+    """
+    call = _call.get()
+    if call is None:
+        return
+    _add_time(call, call['current_stages'].pop(threading.get_ident(), None), time.perf_counter())
+
+
+def count(name):
+    """
+    Count an event of the path of the current thread's stage, e.g. a trial of utils.replace_token().
+    """
+    call = _call.get()
+    if call is None:
+        return
+    current_stage = call['current_stages'].get(threading.get_ident())
+    if current_stage is not None and isinstance(current_stage[1], str):
+        with call['lock']:
+            path_metrics = call['record']['paths'].setdefault(current_stage[1], {})
+            path_metrics[name] = path_metrics.get(name, 0) + 1
+
+
+def _add_time(call, current_stage, now):
+    if current_stage is None:
+        return
+    stage, path, stage_start = current_stage
+    paths = [] if path is None else [path] if isinstance(path, str) else path
+    with call['lock']:
+        stages = call['record']['stages']
+        stages[stage] = stages.get(stage, 0.0) + now - stage_start
+        for shared_path in paths:
+            path_metrics = call['record']['paths'].setdefault(shared_path, {})
+            path_metrics[stage] = path_metrics.get(stage, 0.0) + (now - stage_start) / len(paths)
+
+
+def stop(returncode=None) -> dict:
+    """
+    End the stages of all threads, and stop recording in the current context.
+
+    :return: The record of the call, or None if nothing has been recorded.
+    """
+    call = _call.get()
+    if call is None:
+        return None
+    _call.set(None)
+    now = time.perf_counter()
+    for current_stage in list(call['current_stages'].values()):
+        _add_time(call, current_stage, now)
+    record = call['record']
+    record['seconds'] = now - call['started']
+    record['returncode'] = returncode
+    return record
+
+
+def write(record, metrics_filepath):
+    """
+    Write the record to the metrics-file. Errors are logged, but not raised: The merge counts, not its metrics.
+    """
+    try:
+        if metrics_filepath.endswith(PROMETHEUS_SUFFIX):
+            _update_prometheus_textfile(record, metrics_filepath)
+        else:
+            import json
+            line = json.dumps(record, separators=(',', ':')) + '\n'
+            fd = os.open(metrics_filepath, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, line.encode())
+            finally:
+                os.close(fd)
+    except OSError as e:
+        logger.warning(f"Cannot write the metrics to {metrics_filepath}: {e}")
+
+
+#
+# Prometheus textfile.
+#
+
+_PROMETHEUS_HELPS = {
+    'calls_total': 'The number of merge-driver calls.',
+    'seconds_total': 'The time of the merge-driver calls.',
+    'stage_seconds_total': 'The time of the merge-driver calls per stage.',
+    'path_seconds_total': 'The time of the merge-driver calls per path and stage.',
+    'replace_token_attempts_total': 'The trials of replacing a value searched in the whole document, per path.',
+}
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _get_sample_name(name, **labels) -> str:
+    formatted_labels = ','.join(f'{label}="{_escape_label_value(value)}"' for label, value in sorted(labels.items()))
+    return f'{METRIC_PREFIX}{name}{{{formatted_labels}}}'
+
+
+def get_prometheus_samples(record) -> dict:
+    """
+    :return: Dict of the sample-names, e.g. 'kop_merge_driver_calls_total{repository="/repo"}', and the values the
+        record adds to their counters.
+    """
+    repository = record['repository']
+    samples = {_get_sample_name('calls_total', repository=repository): 1,
+               _get_sample_name('seconds_total', repository=repository): record['seconds']}
+    for stage, seconds in record['stages'].items():
+        samples[_get_sample_name('stage_seconds_total', repository=repository, stage=stage)] = seconds
+    for path, path_metrics in record['paths'].items():
+        for stage, value in path_metrics.items():
+            if stage == REPLACE_TOKEN_ATTEMPTS:
+                samples[_get_sample_name('replace_token_attempts_total', repository=repository, path=path)] = value
+            else:
+                samples[_get_sample_name('path_seconds_total', repository=repository, path=path, stage=stage)] = value
+    return samples
+
+
+def read_prometheus_samples(lines) -> dict:
+    samples = {}
+    for line in lines:
+        if line.startswith(METRIC_PREFIX):
+            sample_name, _, value = line.rstrip('\n').rpartition(' ')
+            try:
+                samples[sample_name] = float(value)
+            except ValueError:
+                pass
+    return samples
+
+
+def format_prometheus_samples(samples) -> str:
+    lines = []
+    for name, help_text in _PROMETHEUS_HELPS.items():
+        prefix = f'{METRIC_PREFIX}{name}{{'
+        names = sorted(sample_name for sample_name in samples if sample_name.startswith(prefix))
+        if names:
+            lines.append(f'# HELP {METRIC_PREFIX}{name} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}{name} counter')
+            lines.extend(f'{sample_name} {samples[sample_name]}' for sample_name in names)
+    return ''.join(line + '\n' for line in lines)
+
+
+def _update_prometheus_textfile(record, metrics_filepath):
+    # The textfile-collector reads the file at any time. So it is written to a temp-file and renamed. The lock-file
+    # serializes the read-modify-write of concurrent calls.
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    with open(metrics_filepath + '.lock', 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            with open(metrics_filepath, encoding='utf-8') as f:
+                samples = read_prometheus_samples(f)
+        except FileNotFoundError:
+            samples = {}
+        for sample_name, value in get_prometheus_samples(record).items():
+            samples[sample_name] = samples.get(sample_name, 0) + value
+        temp_filepath = f'{metrics_filepath}.{os.getpid()}.tmp'
+        with open(temp_filepath, 'w', encoding='utf-8') as f:
+            f.write(format_prometheus_samples(samples))
+        os.replace(temp_filepath, metrics_filepath)
+
+
+#
+# The stats-command.
+#
+
+def read_records(metrics_filepaths) -> list:
+    import json
+    records = []
+    for metrics_filepath in metrics_filepaths:
+        with open(metrics_filepath, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # E.g. a line cut by a full disk.
+                    logger.warning(f"{metrics_filepath}:{line_number}: Ignoring a line not being a record.")
+    return records
+
+
+def aggregate(records) -> dict:
+    """
+    :return: Dict with the aggregates 'repositories', 'stages' and 'paths'. Each is a dict of the keys and their
+        dicts with 'calls' (the number of calls with the key) and 'seconds'. The paths have 'replace_token attempts'
+        and 'configured' (if the path is a configured path) in addition. A configured path includes the matched
+        paths it has matched.
+    """
+    repositories = {}
+    stages = {}
+    paths = {}
+    for record in records:
+        repository = repositories.setdefault(record.get('repository'), {'calls': 0, 'seconds': 0.0})
+        repository['calls'] += 1
+        repository['seconds'] += record.get('seconds') or 0.0
+        for stage_name, seconds in record.get('stages', {}).items():
+            stage = stages.setdefault(stage_name, {'calls': 0, 'seconds': 0.0})
+            stage['calls'] += 1
+            stage['seconds'] += seconds
+        configured_paths = record.get('configured_paths') or []
+        matched_paths = record.get('matched_paths') or {}
+        # Per path the metrics of the path, and of the matched paths rolled up to it.
+        record_paths = {}
+        for path_name, path_metrics in record.get('paths', {}).items():
+            record_paths.setdefault(path_name, []).append(path_metrics)
+            configured_path = matched_paths.get(path_name)
+            if configured_path is not None and configured_path != path_name:
+                record_paths.setdefault(configured_path, []).append(path_metrics)
+        for path_name, all_path_metrics in record_paths.items():
+            path = paths.setdefault(path_name, {'calls': 0, 'seconds': 0.0, REPLACE_TOKEN_ATTEMPTS: 0,
+                                                'configured': False})
+            path['calls'] += 1
+            path['configured'] = path['configured'] or path_name in configured_paths
+            for path_metrics in all_path_metrics:
+                for stage_name, value in path_metrics.items():
+                    if stage_name == REPLACE_TOKEN_ATTEMPTS:
+                        path[REPLACE_TOKEN_ATTEMPTS] += value
+                    else:
+                        path['seconds'] += value
+    return {'repositories': repositories, 'stages': stages, 'paths': paths}
+
+
+def print_stats(aggregates, limit=LIMIT_DEFAULT, stream=None):
+    stream = stream or sys.stdout
+    total_seconds = sum(repository['seconds'] for repository in aggregates['repositories'].values())
+    calls = sum(repository['calls'] for repository in aggregates['repositories'].values())
+    print(f"Calls: {calls}; seconds: {total_seconds:.3f}", file=stream)
+
+    def print_table(title, rows, extra_columns=()):
+        print(f"\n{title}:", file=stream)
+        print(f"{'seconds':>10} {'share':>6} {'calls':>7} {'ms/call':>9}"
+              + ''.join(f' {column_title:>{width}}' for column_title, width, _ in extra_columns) + '  name',
+              file=stream)
+        for name, row in sorted(rows.items(), key=lambda item: (-item[1]['seconds'], str(item[0])))[:limit]:
+            share = 100 * row['seconds'] / total_seconds if total_seconds else 0.0
+            milliseconds_per_call = 1000 * row['seconds'] / row['calls']
+            print(f"{row['seconds']:>10.3f} {share:>5.1f}% {row['calls']:>7} {milliseconds_per_call:>9.1f}"
+                  + ''.join(f' {format_value(row):>{width}}' for _, width, format_value in extra_columns) + f'  {name}',
+                  file=stream)
+
+    print_table('Repositories', aggregates['repositories'])
+    print_table('Stages', aggregates['stages'])
+    print_table('Paths', aggregates['paths'],
+                [('attempts', 9, lambda row: row[REPLACE_TOKEN_ATTEMPTS]),
+                 ('kind', 10, lambda row: 'configured' if row['configured'] else 'matched')])
+
+
+def init_argument_parser():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog=f'{config.SCRIPT_NAME} stats',
+        description='Aggregate the JSONL-metrics-files written with --metrics-file: The time per repository, per'
+                    + ' stage, and per path.')
+    parser.add_argument('metrics_files', nargs='+', metavar='METRICS-FILE', help='The JSONL-metrics-files.')
+    parser.add_argument('--repository', help='Only the calls in this repository.')
+    parser.add_argument('--limit', type=int, default=LIMIT_DEFAULT,
+                        help=f"The number of rows per table. Defaults to {LIMIT_DEFAULT}.")
+    return parser
+
+
+def main(argv):
+    cl_args = init_argument_parser().parse_args(argv)
+    try:
+        records = read_records(cl_args.metrics_files)
+    except OSError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if cl_args.repository:
+        repository = os.path.abspath(cl_args.repository)
+        records = [record for record in records if record.get('repository') == repository]
+    print_stats(aggregate(records), cl_args.limit)
+    return 0
@@ -0,0 +1,281 @@
+import codecs
+import re
+
+from keep_ours_paths_merge_driver import config
+
+#
+# The pre-screen proves cheaply, before parsing, that preparing theirs can't change the merge-result. Then the
+# merge-driver skips parsing, and the files go straight to the merge.
+#
+# Shortcuts on the contents as a whole, see get_shortcut():
+#
+#   - 'theirs equals ours':   The merge-result is ours, whatever is prepared.
+#   - 'theirs equals base':   The merge-result is ours. Preparing theirs by ours' values would only add changes on both
+#                             sides, and these may even conflict with ours' changes of neighbouring lines.
+#   - 'ours equals base':     The merge-result is theirs. No value is conflicted, so the onconflict-ours paths prepare
+#                             nothing. Not for always-ours paths, these revert theirs' values to ours'.
+#
+# The shortcuts for XML-files, see get_xml_shortcut():
+#
+#   - "theirs' values equal ours'", "theirs' values equal base's", "ours' values equal base's":
+#                             As the shortcuts above, if the two files differ in one place only, and this change can't
+#                             change any value. See below.
+#   - "values can't differ":  A path prepares theirs only where the values differ. Onconflict-ours needs three distinct
+#                             values of base, ours and theirs, always-ours a value of ours differing from theirs'. The
+#                             elements a path matches at the same location in the three files have the same tag, and
+#                             elements with children are ignored. So nothing is to prepare if per tag-name there are at
+#                             most two distinct texts of leaf-elements in the three files, and for the tags of
+#                             always-ours paths at most one in ours and theirs.
+#
+# The one change of two files is found by their common prefix and suffix, compared by memcmp. It can't change any value
+# if it is within one text or tag, and it isn't the text of an element of the tag-names of the paths (the last step of a
+# path) or of the key-children of keyed paths, nor the tag-name or a namespace-declaration. This holds for streamable
+# paths (see xml_paths), which match by the tag-names and the texts of the key-children only, and files in the same
+# encoding. A change of a comment, a processing-instruction or CDATA isn't taken.
+#
+# The texts per tag-name are collected by one regular expression for the tag-names of all paths, e.g.
+# '<version>1.0</version>'. This doesn't depend on the structure of the files, and elements at other locations only add
+# texts. Elements with child-elements, comments or processing-instructions are skipped. The texts are compared as they
+# are written, so the same value written differently, e.g. by a character-reference, counts as distinct. The scan gives
+# up, and the files are parsed, if the tag-name of a path is unknown (e.g. for './a/.', './@attr' or a function call),
+# or if an element of a scanned tag starts its text with CDATA. A union, e.g. './version|./name', has the tag-names of
+# all of its branches.
+#
+# Both give up if a file declares entities, or for encodings in which '<' isn't the ASCII-byte, e.g. UTF-16.
+#
+
+# The last step of a path, e.g. 'version' in './dependencies/dependency[2]/version', or '*'.
+_LAST_STEP_PATTERN = re.compile(r'(?:^|/)([^\W\d][\w\-.]*|\*)(?:\[[^\[\]]*])*$')
+# The parts of a path between the '|' of a union, and the predicates and string-literals the '|' may be within.
+_UNION_PART_PATTERN = re.compile(r'(?:[^|\[\]"\']|\[[^\[\]]*]|"[^"]*"|\'[^\']*\')*')
+# Tag-names and prefixes in the regular expressions of the scan.
+_ANY_NAME = rb'[^\s/>!?:]+'
+_PREFIX = rb'(?:[^\s/>!?:]+:)?'
+_DEFAULT_NAMESPACE_DECLARATION_PATTERN = re.compile(rb'\sxmlns\s*=')
+# Attributes, with '>' and '/' allowed in quoted values.
+_ATTRIBUTES = rb'(?:\s[^<>"\'/]*(?:(?:"[^"]*"|\'[^\']*\')[^<>"\'/]*)*)?'
+# A tag, and a start-tag up to the end of its name.
+_TAG_PATTERN = re.compile(rb'(</?)' + _PREFIX + b'(' + _ANY_NAME + rb')' + _ATTRIBUTES + rb'\s*(/?)>')
+_TAG_NAME_PATTERN = re.compile(rb'<' + _PREFIX + b'(' + _ANY_NAME + rb')(?=[\s/>])')
+_NAME_TERMINATORS = (b' ', b'\t', b'\r', b'\n', b'/', b'>')
+
+
+def get_shortcut(base_content, ours_content, theirs_content, merge_strategies):
+    """
+    :param base_content, ours_content, theirs_content: The files, all bytes or all str.
+    :param merge_strategies: The merge-strategies of the paths.
+    :return: The name of the shortcut, see the module's header, or None.
+    """
+    if theirs_content == ours_content:
+        return 'theirs equals ours'
+    if theirs_content == base_content:
+        return 'theirs equals base'
+    if ours_content == base_content and config.MERGE_STRATEGY_ALWAYS_OURS not in merge_strategies:
+        return 'ours equals base'
+    return None
+
+
+def get_xml_shortcut(base_xml_bytes, ours_xml_bytes, theirs_xml_bytes, compiled_paths_and_patterns, encodings):
+    """
+    :param compiled_paths_and_patterns: As returned by xml_paths.compile_paths_and_patterns().
+    :param encodings: The encodings of base, ours and theirs, see xml_text_spans.get_encoding().
+    :return: The name of the shortcut, see the module's header, or None.
+    """
+    merge_strategies = {compiled_path_and_pattern['merge_strategy']
+                        for compiled_path_and_pattern in compiled_paths_and_patterns}
+    shortcut = get_shortcut(base_xml_bytes, ours_xml_bytes, theirs_xml_bytes, merge_strategies)
+    if shortcut is not None:
+        return shortcut
+    if not all(_is_scannable(xml_bytes, encoding)
+               for xml_bytes, encoding in zip([base_xml_bytes, ours_xml_bytes, theirs_xml_bytes], encodings)):
+        return None
+    shortcut = _get_one_change_shortcut(base_xml_bytes, ours_xml_bytes, theirs_xml_bytes, compiled_paths_and_patterns,
+                                        encodings, merge_strategies)
+    if shortcut is not None:
+        return shortcut
+
+    # The tag-names of the paths, '*' for any.
+    names_per_path = []
+    for compiled_path_and_pattern in compiled_paths_and_patterns:
+        names_per_path.append(_get_last_step_names(compiled_path_and_pattern['path']))
+        if names_per_path[-1] is None:
+            return None
+    names = [name for path_names in names_per_path for name in path_names]
+
+    texts_by_name = []
+    namespaced_names = set()
+    for xml_bytes, encoding in zip([base_xml_bytes, ours_xml_bytes, theirs_xml_bytes], encodings):
+        texts_by_name.append(_get_texts_by_name(xml_bytes, encoding, names, namespaced_names))
+        if texts_by_name[-1] is None:
+            return None
+    base_texts_by_name, ours_texts_by_name, theirs_texts_by_name = texts_by_name
+
+    for name in set(base_texts_by_name) | set(ours_texts_by_name) | set(theirs_texts_by_name):
+        merge_strategies = {compiled_path_and_pattern['merge_strategy'] for compiled_path_and_pattern, path_names
+                            in zip(compiled_paths_and_patterns, names_per_path)
+                            if name in path_names
+                            or '*' in path_names and _matches_pattern(name, name in namespaced_names,
+                                                                      compiled_path_and_pattern['tag_regex'])}
+        ours_and_theirs_texts = ours_texts_by_name.get(name, set()) | theirs_texts_by_name.get(name, set())
+        if config.MERGE_STRATEGY_ALWAYS_OURS in merge_strategies and len(ours_and_theirs_texts) > 1:
+            return None
+        if config.MERGE_STRATEGY_ON_CONFLICT_OURS in merge_strategies \
+                and len(ours_and_theirs_texts | base_texts_by_name.get(name, set())) > 2:
+            return None
+    return "values can't differ"
+
+
+def _get_last_step_names(path):
+    # :return: The tag-names of the last steps of the branches of the path, or None if one is unknown.
+    names = []
+    position = 0
+    while True:
+        part_match = _UNION_PART_PATTERN.match(path, position)
+        part = part_match.group().strip()
+        match = _LAST_STEP_PATTERN.search(part + '*' if part.endswith('/') else part)
+        if match is None:
+            return None
+        names.append(match.group(1))
+        position = part_match.end()
+        if position == len(path):
+            return names
+        if path[position] != '|':
+            # An unbalanced bracket or quote.
+            return None
+        position += 1
+
+
+def _is_scannable(xml_bytes, encoding):
+    if b'<!ENTITY' in xml_bytes:
+        return False
+    try:
+        return '<a b="c"/>'.encode(encoding) == b'<a b="c"/>' and not codecs.lookup(encoding).name.startswith('utf-16')
+    except (LookupError, UnicodeError):
+        return False
+
+
+def _get_one_change_shortcut(base_xml_bytes, ours_xml_bytes, theirs_xml_bytes, compiled_paths_and_patterns, encodings,
+                             merge_strategies):
+    if len({codecs.lookup(encoding).name for encoding in encodings}) > 1 \
+            or any(compiled_path_and_pattern['streaming'] is None
+                   for compiled_path_and_pattern in compiled_paths_and_patterns):
+        return None
+    # The tag-names of the paths, None for any, and of the key-children.
+    names = set()
+    key_names = set()
+    for compiled_path_and_pattern in compiled_paths_and_patterns:
+        steps = compiled_path_and_pattern['streaming']['steps']
+        names.add(steps[-1] if steps else '*')
+        if compiled_path_and_pattern['keyed'] is not None:
+            key_names.update(compiled_path_and_pattern['keyed']['key_names'])
+    try:
+        key_names = {name.encode(encodings[0]) for name in key_names}
+        names = None if '*' in names else {name.encode(encodings[0]) for name in names} | key_names
+    except UnicodeError:
+        return None
+
+    if _is_one_change_without_values(theirs_xml_bytes, ours_xml_bytes, names, key_names):
+        return "theirs' values equal ours'"
+    if config.MERGE_STRATEGY_ALWAYS_OURS in merge_strategies:
+        return None
+    if _is_one_change_without_values(base_xml_bytes, theirs_xml_bytes, names, key_names):
+        return "theirs' values equal base's"
+    if _is_one_change_without_values(base_xml_bytes, ours_xml_bytes, names, key_names):
+        return "ours' values equal base's"
+    return None
+
+
+def _get_common_prefix_length(a, b):
+    # Binary search, the slices are compared by memcmp.
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _is_one_change_without_values(a, b, names, key_names):
+    # :param names: The tag-names as bytes whose texts are values or keys, None for any.
+    # :param key_names: The tag-names as bytes of the key-children.
+    if b'<![CDATA[' in a or b'<![CDATA[' in b:
+        return False
+    start = _get_common_prefix_length(a, b)
+    suffix_length = _get_common_prefix_length(a[start:][::-1], b[start:][::-1])
+    changes = [a[start:len(a) - suffix_length], b[start:len(b) - suffix_length]]
+    if any(b'<' in change or b'>' in change for change in changes):
+        return False
+    # The markup before the change. The change is in a text, or within that tag if it isn't closed before the change.
+    markup_start = a.rfind(b'<', 0, start)
+    if markup_start == -1 or a[markup_start + 1:markup_start + 2] in (b'!', b'?'):
+        return False
+    markup_end = a.rfind(b'>', 0, start)
+    if markup_end > markup_start:
+        # The text of the element of a start-tag, or a tail.
+        tag_match = _TAG_PATTERN.fullmatch(a, markup_start, markup_end + 1)
+        if tag_match is None:
+            return False
+        is_start_tag = tag_match.group(1) == b'<' and not tag_match.group(3)
+        if is_start_tag and (names is None or tag_match.group(2) in names):
+            return False
+    else:
+        # Within a start-tag, after its name.
+        tag_name_match = _TAG_NAME_PATTERN.match(a, markup_start)
+        if tag_name_match is None or tag_name_match.end() > start \
+                or tag_name_match.end() == start and b[start:start + 1] not in _NAME_TERMINATORS \
+                or b'xmlns' in a[markup_start:start] \
+                or any(b'/' in change or b'xmlns' in change for change in changes):
+            return False
+    # Not within a key-child, its text is the text of all of its descendants.
+    for name in key_names:
+        if a.rfind(b'<' + name, 0, start) > a.rfind(b'</' + name, 0, start) or b':' + name in a:
+            return False
+    return True
+
+
+def _matches_pattern(name, is_namespaced, tag_regex):
+    # The name is the local name of the scanned elements, their namespaces are unknown. The pattern is matched against
+    # the tag of an element in another namespace than the default namespace of the root-element with that namespace,
+    # see xml_paths.get_tag_name(). So a name maybe in another namespace is taken as matched.
+    return tag_regex is None or is_namespaced or tag_regex.match(name) is not None
+
+
+def _get_texts_by_name(xml_bytes, encoding, names, namespaced_names):
+    # :param namespaced_names: A set the local names maybe in another namespace than the default namespace of the
+    #   root-element are added to: Those found with a prefix, and all if a default namespace is declared more than once.
+    # :return: Dict of the local names of the elements of the names to the sets of their texts, or None if the scan
+    #   gives up.
+    try:
+        if '*' in names:
+            name_pattern = _ANY_NAME
+        else:
+            name_pattern = b'|'.join(re.escape(name.encode(encoding)) for name in sorted(set(names)))
+    except UnicodeError:
+        return None
+    # All start-tags and empty-element-tags. And the same once more with what follows: The end-tag of an element with
+    # simple text or no text, CDATA, or else the first child of an element with children. The latter are found at
+    # start-tags only, so if there are as many, all have been found.
+    start_tags_pattern = re.compile(rb'<' + _PREFIX + rb'(?:' + name_pattern + rb')(?=[\s/>])')
+    elements_pattern = re.compile(
+        rb'<(' + _PREFIX + rb')(' + name_pattern + rb')' + _ATTRIBUTES
+        + rb'\s*(?:(/)>|>([^<]*)(?:(</)\1\2\s*>|(<!\[CDATA\[))?)')
+    elements = elements_pattern.findall(xml_bytes)
+    if len(start_tags_pattern.findall(xml_bytes)) != len(elements):
+        return None
+    has_nested_default_namespaces = '*' in names and len(_DEFAULT_NAMESPACE_DECLARATION_PATTERN.findall(xml_bytes)) > 1
+    texts_by_name = {}
+    for prefix, name, empty, text, end, cdata in elements:
+        if cdata:
+            return None
+        if empty or end:
+            texts_by_name.setdefault(name, set()).add(text)
+            if prefix or has_nested_default_namespaces:
+                namespaced_names.add(name.decode(encoding, 'replace'))
+    # Decoded, because the files may have different encodings.
+    try:
+        return {name.decode(encoding): {text.decode(encoding) for text in texts}
+                for name, texts in texts_by_name.items()}
+    except UnicodeError:
+        return None
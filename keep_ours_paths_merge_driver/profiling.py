@@ -0,0 +1,307 @@
+import logging
+import os
+import re
+import sys
+import time
+
+from keep_ours_paths_merge_driver import config
+
+logger = logging.getLogger()
+
+#
+# Profiling of merge-driver calls without changing the installation, e.g. the zipapp. If the environment variable
+# KOP_PROFILE_DIR is set, each call is run by a profiler, and writes a dump into that directory:
+#
+#   <KOP_PROFILE_DIR>/<timestamp>-<pid>-<path>.pstats     (KOP_PROFILE_MODE=cprofile, the default)
+#   <KOP_PROFILE_DIR>/<timestamp>-<pid>-<path>.stacks     (KOP_PROFILE_MODE=sampling)
+#
+# The path is the pathname given in -P, or the command, e.g. 'batch'. Characters other than letters, digits, '.'
+# and '-' are replaced by '_'.
+#
+#   - cprofile: cProfile traces each function-call. The dump is as written by cProfile.Profile.dump_stats(), and is
+#     read by pstats. The overhead is up to about twice the time of the call.
+#   - sampling: A timer-signal samples the stack of the main thread each KOP_PROFILE_INTERVAL seconds of CPU-time
+#     (defaults to SAMPLING_INTERVAL_DEFAULT). The dump holds the collapsed stacks, one per line with the number of
+#     samples, as read by flamegraph.pl or speedscope. The overhead is a few percent. The time waiting for
+#     git merge-file isn't CPU-time of the call, and isn't sampled.
+#
+# The dumps of many calls, e.g. of all merge-driver calls of a merge, are merged into one report by
+#
+#   keep_ours_paths_merge_driver profile [--format report|collapsed] [DUMP-OR-DIRECTORY ...]
+#
+# The profilers are imported only if profiling is on. The worker-processes of the batch-mode and the merge-strategy
+# aren't profiled.
+#
+
+PROFILE_DIR_ENV_VAR = 'KOP_PROFILE_DIR'
+PROFILE_MODE_ENV_VAR = 'KOP_PROFILE_MODE'
+PROFILE_INTERVAL_ENV_VAR = 'KOP_PROFILE_INTERVAL'
+MODE_CPROFILE = 'cprofile'
+MODE_SAMPLING = 'sampling'
+MODES = [MODE_CPROFILE, MODE_SAMPLING]
+SAMPLING_INTERVAL_DEFAULT = 0.005
+PSTATS_SUFFIX = '.pstats'
+STACKS_SUFFIX = '.stacks'
+FORMAT_REPORT = 'report'
+FORMAT_COLLAPSED = 'collapsed'
+FORMATS = [FORMAT_REPORT, FORMAT_COLLAPSED]
+SORT_CUMULATIVE = 'cumulative'
+SORT_TOTTIME = 'tottime'
+SORTS = [SORT_CUMULATIVE, SORT_TOTTIME]
+LIMIT_DEFAULT = 40
+
+
+def get_dump_name(argv) -> str:
+    """
+    :param argv: The command-line arguments without the program.
+    :return: The name of the dump without suffix, '<timestamp>-<pid>-<path>'.
+    """
+    path = None
+    for i, arg in enumerate(argv):
+        if arg in ['-P', '--path']:
+            path = argv[i + 1] if i + 1 < len(argv) else None
+        elif arg.startswith('--path='):
+            path = arg[len('--path='):]
+        elif arg.startswith('-P') and len(arg) > 2:
+            path = arg[2:]
+    if not path:
+        # The command, e.g. 'batch', or the merge-driver called without -P.
+        path = argv[0] if argv and not argv[0].startswith('-') else 'merge'
+    now = time.time()
+    timestamp = time.strftime('%Y%m%dT%H%M%S', time.localtime(now)) + f'.{int(now % 1 * 1000):03d}'
+    return f"{timestamp}-{os.getpid()}-{re.sub(r'[^A-Za-z0-9.-]+', '_', path)}"
+
+
+def get_interval(env) -> float:
+    interval = env.get(PROFILE_INTERVAL_ENV_VAR)
+    if not interval:
+        return SAMPLING_INTERVAL_DEFAULT
+    try:
+        interval = float(interval)
+    except ValueError:
+        interval = 0
+    if interval <= 0:
+        logger.warning(f"Ignoring {PROFILE_INTERVAL_ENV_VAR}={env[PROFILE_INTERVAL_ENV_VAR]}, not a positive number of"
+                       + f" seconds. Sampling each {SAMPLING_INTERVAL_DEFAULT}s.")
+        return SAMPLING_INTERVAL_DEFAULT
+    return interval
+
+
+def run(function, env, argv=None):
+    """
+    Run the function by the profiler configured in env, and write the dump into the profile-directory.
+
+    :param function: The function to profile, called without arguments. May exit by SystemExit.
+    :param env: The environment with KOP_PROFILE_DIR, and optionally KOP_PROFILE_MODE and KOP_PROFILE_INTERVAL.
+    :param argv: The command-line arguments the dump is named after. Defaults to sys.argv[1:].
+    :return: The return value of the function.
+    """
+    profile_dir = env[PROFILE_DIR_ENV_VAR]
+    mode = env.get(PROFILE_MODE_ENV_VAR) or MODE_CPROFILE
+    if mode not in MODES:
+        logger.warning(f"Ignoring {PROFILE_MODE_ENV_VAR}={mode}, not one of {MODES}. Profiling by {MODE_CPROFILE}.")
+        mode = MODE_CPROFILE
+    if mode == MODE_SAMPLING and not _can_sample():
+        logger.warning(f"Sampling needs setitimer() and the main thread. Profiling by {MODE_CPROFILE}.")
+        mode = MODE_CPROFILE
+    dump_filepath = os.path.join(profile_dir, get_dump_name(sys.argv[1:] if argv is None else argv)
+                                 + (STACKS_SUFFIX if mode == MODE_SAMPLING else PSTATS_SUFFIX))
+    if mode == MODE_SAMPLING:
+        sampler = _start_sampling(get_interval(env))
+        try:
+            return function()
+        finally:
+            _stop_sampling(sampler)
+            _write_dump(dump_filepath, lambda filepath: _write_collapsed(filepath, sampler['stacks']))
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return function()
+        finally:
+            profiler.disable()
+            _write_dump(dump_filepath, profiler.dump_stats)
+
+
+def _write_dump(dump_filepath, write_function):
+    # Atomically, so a report run concurrently doesn't read a partial dump. Errors are logged, but not raised: The
+    # result of the call counts, not its profile.
+    temp_filepath = f'{dump_filepath}.tmp'
+    try:
+        os.makedirs(os.path.dirname(dump_filepath) or '.', exist_ok=True)
+        write_function(temp_filepath)
+        os.replace(temp_filepath, dump_filepath)
+    except OSError as e:
+        logger.warning(f"Cannot write the profile {dump_filepath}: {e}")
+        return
+    logger.debug(f"Profile written to {dump_filepath}")
+
+
+def _can_sample():
+    import signal
+    import threading
+    return hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+
+
+def get_frame_name(frame) -> str:
+    code = frame.f_code
+    # The first line of the function, not the line sampled, so the samples of a function add up.
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def get_stack(frame) -> str:
+    """
+    :return: The collapsed stack of the frame, the names of the frames from the outermost to the frame, separated by
+        ';'.
+    """
+    names = []
+    while frame is not None:
+        names.append(get_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _start_sampling(interval):
+    import signal
+    sampler = {'stacks': {}}
+
+    def on_timer(signum, frame):
+        stack = get_stack(frame)
+        sampler['stacks'][stack] = sampler['stacks'].get(stack, 0) + 1
+
+    # ITIMER_PROF and SIGPROF, as SIGALRM is the time-budget's. See budget.py.
+    sampler['previous_handler'] = signal.signal(signal.SIGPROF, on_timer)
+    signal.setitimer(signal.ITIMER_PROF, interval, interval)
+    return sampler
+
+
+def _stop_sampling(sampler):
+    import signal
+    signal.setitimer(signal.ITIMER_PROF, 0)
+    signal.signal(signal.SIGPROF, sampler['previous_handler'])
+
+
+def format_collapsed(stacks) -> str:
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+
+
+def _write_collapsed(filepath, stacks):
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write(format_collapsed(stacks))
+
+
+def read_collapsed(filepath) -> dict:
+    stacks = {}
+    with open(filepath, encoding='utf-8') as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack and count.isdigit():
+                stacks[stack] = stacks.get(stack, 0) + int(count)
+    return stacks
+
+
+def find_dumps(paths) -> tuple:
+    """
+    :param paths: Dump-files, or directories with dump-files.
+    :return: Tuple of the sorted lists of the pstats-dumps and the stacks-dumps.
+    """
+    filepaths = []
+    for path in paths:
+        if os.path.isdir(path):
+            filepaths.extend(os.path.join(path, filename) for filename in os.listdir(path))
+        else:
+            filepaths.append(path)
+    return (sorted(p for p in filepaths if p.endswith(PSTATS_SUFFIX)),
+            sorted(p for p in filepaths if p.endswith(STACKS_SUFFIX)))
+
+
+def merge_collapsed(stacks_filepaths) -> dict:
+    merged_stacks = {}
+    for filepath in stacks_filepaths:
+        for stack, count in read_collapsed(filepath).items():
+            merged_stacks[stack] = merged_stacks.get(stack, 0) + count
+    return merged_stacks
+
+
+def get_function_samples(stacks) -> dict:
+    """
+    :return: Dict of the frame-names and their lists [total samples, own samples]. A function recursing is counted
+        once per sample in its total.
+    """
+    function_samples = {}
+    for stack, count in stacks.items():
+        names = stack.split(';')
+        for name in set(names):
+            function_samples.setdefault(name, [0, 0])[0] += count
+        function_samples[names[-1]][1] += count
+    return function_samples
+
+
+def print_pstats_report(pstats_filepaths, sort, limit, stream):
+    import pstats
+    stats = pstats.Stats(*pstats_filepaths, stream=stream)
+    print(f"cProfile-dumps: {len(pstats_filepaths)}", file=stream)
+    stats.sort_stats(sort).print_stats(limit)
+
+
+def print_samples_report(stacks_filepaths, sort, limit, stream):
+    stacks = merge_collapsed(stacks_filepaths)
+    samples_count = sum(stacks.values())
+    print(f"Sampling-dumps: {len(stacks_filepaths)}; samples: {samples_count}", file=stream)
+    print(f"\n{'total':>8} {'total%':>7} {'own':>8} {'own%':>7}  function", file=stream)
+    index = 0 if sort == SORT_CUMULATIVE else 1
+    function_samples = sorted(get_function_samples(stacks).items(), key=lambda item: (-item[1][index], item[0]))
+    for name, (total, own) in function_samples[:limit]:
+        print(f"{total:>8} {100 * total / samples_count:>6.1f}% {own:>8} {100 * own / samples_count:>6.1f}%  {name}",
+              file=stream)
+
+
+def init_argument_parser():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog=f'{config.SCRIPT_NAME} profile',
+        description=f'Merge the profile-dumps written with {PROFILE_DIR_ENV_VAR} into one report.')
+    parser.add_argument('paths', nargs='*', metavar='DUMP-OR-DIRECTORY',
+                        help=f"Dump-files ({PSTATS_SUFFIX}, {STACKS_SUFFIX}), or directories with dump-files."
+                             + f" Defaults to {PROFILE_DIR_ENV_VAR}.")
+    parser.add_argument('--format', choices=FORMATS, default=FORMAT_REPORT,
+                        help=f"'{FORMAT_REPORT}' prints the functions taking the most time. '{FORMAT_COLLAPSED}'"
+                             + " prints the merged collapsed stacks of the sampling-dumps, e.g. for flamegraph.pl."
+                             + f" Defaults to {FORMAT_REPORT}.")
+    parser.add_argument('--sort', choices=SORTS, default=SORT_CUMULATIVE,
+                        help=f"Sort the report by the time including the callees ('{SORT_CUMULATIVE}'), or by the"
+                             + f" function's own time ('{SORT_TOTTIME}'). Defaults to {SORT_CUMULATIVE}.")
+    parser.add_argument('--limit', type=int, default=LIMIT_DEFAULT,
+                        help=f"The number of functions in the report. Defaults to {LIMIT_DEFAULT}.")
+    parser.add_argument('-o', '--output', help='The file to write to. Defaults to stdout.')
+    return parser
+
+
+def main(argv):
+    cl_args = init_argument_parser().parse_args(argv)
+    paths = cl_args.paths or ([os.environ[PROFILE_DIR_ENV_VAR]] if os.getenv(PROFILE_DIR_ENV_VAR) else [])
+    if not paths:
+        print(f"No dumps given, and {PROFILE_DIR_ENV_VAR} isn't set.", file=sys.stderr)
+        return 2
+    pstats_filepaths, stacks_filepaths = find_dumps(paths)
+    if cl_args.format == FORMAT_COLLAPSED and not stacks_filepaths:
+        print(f"No sampling-dumps ({STACKS_SUFFIX}) in {paths}. Collapsed stacks need {PROFILE_MODE_ENV_VAR}"
+              + f"={MODE_SAMPLING}.", file=sys.stderr)
+        return 2
+    if not pstats_filepaths and not stacks_filepaths:
+        print(f"No dumps in {paths}.", file=sys.stderr)
+        return 2
+    stream = open(cl_args.output, 'w', encoding='utf-8') if cl_args.output else sys.stdout
+    try:
+        if cl_args.format == FORMAT_COLLAPSED:
+            stream.write(format_collapsed(merge_collapsed(stacks_filepaths)))
+        else:
+            if pstats_filepaths:
+                print_pstats_report(pstats_filepaths, cl_args.sort, cl_args.limit, stream)
+            if stacks_filepaths:
+                print_samples_report(stacks_filepaths, cl_args.sort, cl_args.limit, stream)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    return 0
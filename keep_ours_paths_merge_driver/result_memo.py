@@ -0,0 +1,130 @@
+import logging
+import os
+import time
+
+from keep_ours_paths_merge_driver import config
+from keep_ours_paths_merge_driver import extraction_cache
+
+logger = logging.getLogger()
+
+#
+# The result-memo keeps the prepared theirs per file-triple and config. Merge-queues retrying a merge, or
+# "git rebase --rebase-merges" replaying merges, prepare the same file-triples again. With the result-memo they skip
+# the parsing, the detection of the paths to prepare, and the replacements, and go straight to the merge:
+#
+#   .git/kop-cache/results/<2 hex-digits>/<38 hex-digits>.marshal
+#
+# The key is a hash of the raw config (see config_cache.get_raw_config(), which includes the versions of the
+# merge-driver and of Python), the scope, and the contents of base, ours and theirs. A memo-file holds
+#
+#   {'prepared_theirs': the prepared theirs as bytes, or None if theirs has not been prepared,
+#    'is_theirs': True if the prepared theirs is theirs unchanged, which isn't stored again}
+#
+# The memo-files are written, read and evicted as the cache-files of the extraction-cache, see extraction_cache.py.
+# They expire after they haven't been used for the max-age, or if the memo exceeds its max-size.
+#
+# The result-memo is optional, see --result-memo-size. It is inspected and cleared by
+#
+#   keep_ours_paths_merge_driver memo [show|clear] [-C DIRECTORY]
+#
+
+RESULTS_DIRNAME = 'results'
+ACTION_SHOW = 'show'
+ACTION_CLEAR = 'clear'
+ACTIONS = [ACTION_SHOW, ACTION_CLEAR]
+
+
+def get_result_memo(cache_dir, raw_config, max_size, max_age=config.RESULT_MEMO_MAX_AGE_DEFAULT):
+    """
+    :param cache_dir: The cache-directory, see config_cache.get_cache_dir().
+    :param raw_config: As returned by config_cache.get_raw_config().
+    :param max_size: The max-size of the memo in bytes.
+    :param max_age: The number of seconds a memo-file is kept after its last use.
+    :return: The result-memo, or None if there is no cache-directory or max_size isn't positive.
+    """
+    if cache_dir is None or max_size <= 0:
+        return None
+    return {'entries_dir': os.path.join(cache_dir, RESULTS_DIRNAME), 'raw_config': raw_config, 'max_size': max_size,
+            'max_age': max_age}
+
+
+def get_key(result_memo, scope, base_file_content: bytes, ours_file_content: bytes, theirs_file_content: bytes):
+    h = extraction_cache.blake2b(digest_size=20)
+    h.update(result_memo['raw_config'].encode())
+    h.update(b'\0' + scope.encode() + b'\0')
+    for content in [base_file_content, ours_file_content, theirs_file_content]:
+        # The lengths separate the contents.
+        h.update(f'{len(content)}\0'.encode())
+        h.update(content)
+    return h.hexdigest()
+
+
+def read(result_memo, key, theirs_file_content: bytes):
+    """
+    :return: Dict with the memoized 'prepared_theirs', or None if there is none.
+    """
+    memo = extraction_cache.read(result_memo, key)
+    if memo is None or 'prepared_theirs' not in memo:
+        return None
+    if memo.get('is_theirs'):
+        return {'prepared_theirs': theirs_file_content}
+    return memo
+
+
+def write(result_memo, key, prepared_theirs, theirs_file_content: bytes):
+    if prepared_theirs is not None and prepared_theirs == theirs_file_content:
+        extraction_cache.write(result_memo, key, {'prepared_theirs': None, 'is_theirs': True})
+    else:
+        extraction_cache.write(result_memo, key, {'prepared_theirs': prepared_theirs})
+
+
+def show(entries_dir):
+    entries = extraction_cache.get_entries(entries_dir)
+    print(f"Result-memo: {entries_dir}")
+    for last_use, size, path in entries:
+        # The key is split into the shard-directory and the filename.
+        shard, filename = os.path.split(path)
+        key = os.path.basename(shard) + filename[:-len(extraction_cache.CACHE_FILENAME_SUFFIX)]
+        print(f"{key}  {size:>10}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(last_use))}")
+    print(f"Entries: {len(entries)}; size: {sum(size for _, size, _ in entries)} bytes")
+
+
+def clear(entries_dir):
+    """
+    :return: The number of memo-files removed.
+    """
+    removed_count = 0
+    for _, _, path in extraction_cache.get_entries(entries_dir):
+        try:
+            os.unlink(path)
+            removed_count += 1
+        except OSError:
+            pass
+    return removed_count
+
+
+def init_argument_parser():
+    import argparse
+    parser = argparse.ArgumentParser(prog=f'{config.SCRIPT_NAME} memo',
+                                     description='Inspect or clear the result-memo of a repository.')
+    parser.add_argument('action', nargs='?', choices=ACTIONS, default=ACTION_SHOW,
+                        help=f"'{ACTION_SHOW}' lists the memo-files with their sizes and last uses, '{ACTION_CLEAR}'"
+                             + f" removes them. Defaults to {ACTION_SHOW}.")
+    parser.add_argument('-C', dest='directory',
+                        help='The top-level directory of the worktree. Defaults to the current working directory.')
+    return parser
+
+
+def main(argv):
+    from keep_ours_paths_merge_driver import config_cache
+    cl_args = init_argument_parser().parse_args(argv)
+    cache_dir = config_cache.get_cache_dir(cl_args.directory)
+    if cache_dir is None:
+        print(f"No .git-directory in {cl_args.directory or os.getcwd()}.")
+        return 2
+    entries_dir = os.path.join(cache_dir, RESULTS_DIRNAME)
+    if cl_args.action == ACTION_CLEAR:
+        print(f"Removed {clear(entries_dir)} memo-files from {entries_dir}.")
+    else:
+        show(entries_dir)
+    return 0
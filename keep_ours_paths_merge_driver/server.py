@@ -0,0 +1,205 @@
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+
+from keep_ours_paths_merge_driver import client
+from keep_ours_paths_merge_driver import config
+
+logger = logging.getLogger()
+
+#
+# The server-mode is opt-in. A long-lived server started by
+#
+#   keep_ours_paths_merge_driver serve [--socket PATH] [--idle-timeout SECONDS]
+#
+# listens on a Unix domain socket and prepares the theirs-files on behalf of the merge-driver calls. It keeps the
+# merge-drivers imported and their compiled paths-config in memory, so a call doesn't pay lxml's import and the
+# compilation of the paths again.
+#
+# A merge-driver call looks for the socket before it imports the merge-driver's modules, see client.py. If there is
+# one, it forwards its command line to the server and calls git merge-file itself as usual. If there is no socket, or
+# the server is not reachable or fails, the call prepares the theirs-file in-process.
+#
+# The socket is (first match):
+#   - The path in the environment variable KOP_MERGE_DRIVER_SOCKET.
+#   - keep_ours_paths_merge_driver.sock in $XDG_RUNTIME_DIR.
+#   - keep_ours_paths_merge_driver.sock in the .git-directory of the current working directory. Git calls the
+#       merge-driver from the top-level directory of the worktree.
+#
+# The protocol is one JSON-object per line. The request is
+#   {"argv": [the command line], "cwd": "the client's working directory",
+#    "paths_from_environment": the value of KOP_MERGE_DRVIER_PATHSPATTERNS or null,
+#    "call": true if the server is asked for the whole call, see client.py}
+# The response is
+#   {"prepared": true if the theirs-file has been prepared, "log": [the formatted log-records],
+#    "merge_file_cmd": [the git merge-file command], if "call" has been requested}
+# or
+#   {"declined": "the reason", "log": []}, if "call" has been requested but the client has to do more than merging
+# or
+#   {"error": "the error message"}
+#
+# The server handles each connection on a thread of its own. The budgets and the metrics of a request are kept per
+# thread, see budget.py and metrics.py. The time-budget is checked at the checkpoints only, as the timer-signal is
+# handled by the main thread. The log-records of a request are those of its thread. The server exits if it has got no
+# request within the idle-timeout, and no request is being handled.
+#
+
+DEFAULT_IDLE_TIMEOUT = 600
+
+# The log-levels of the requests being handled per thread, and the root logger's level before. The root logger's level
+# is the lowest of them, see _set_request_level().
+_request_levels = {}
+_root_level = {}
+_request_levels_lock = threading.Lock()
+
+
+class _ListHandler(logging.Handler):
+    # Collects the log-records of the thread it has been created on.
+
+    def __init__(self, level):
+        super().__init__(level)
+        self.lines = []
+        self.thread_ident = threading.get_ident()
+        self.setFormatter(logging.Formatter(f'%(asctime)s:{config.SCRIPT_NAME}:%(levelname)s: %(message)s'))
+
+    def filter(self, record):
+        return record.thread == self.thread_ident and super().filter(record)
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def _set_request_level(level):
+    # Set the log-level of the current thread's request, or remove it if None. The records of the other threads at the
+    # lowered level are filtered by their handlers.
+    root_logger = logging.getLogger()
+    with _request_levels_lock:
+        if level is None:
+            _request_levels.pop(threading.get_ident(), None)
+        else:
+            if not _request_levels:
+                _root_level['level'] = root_logger.level
+            _request_levels[threading.get_ident()] = level
+        if _request_levels:
+            root_logger.setLevel(min(_root_level['level'], *_request_levels.values()))
+        elif _root_level:
+            root_logger.setLevel(_root_level.pop('level'))
+
+
+def handle_request(request):
+    # Imported here to keep the client's imports small.
+    from keep_ours_paths_merge_driver import merge
+
+    list_handler = None
+    root_logger = logging.getLogger()
+    try:
+        cl_args = config.init_argument_parser().parse_args(request['argv'])
+        # The log-records of the request are returned to the client, which writes them to its stderr.
+        list_handler = _ListHandler(cl_args.loglevel)
+        root_logger.addHandler(list_handler)
+        _set_request_level(list_handler.level)
+        if request.get('call'):
+            # The client runs git merge-file only.
+            declined = [option for option, is_given in [('--stdout', cl_args.stdout),
+                                                        ('--merge-file builtin',
+                                                         cl_args.merge_file == config.MERGE_FILE_BUILTIN),
+                                                        ('--metrics-file', cl_args.metrics_file)] if is_given]
+            if declined:
+                return {'declined': f"The client handles {', '.join(declined)}", 'log': []}
+            for_path = f' for {cl_args.path}' if cl_args.path else ''
+            logger.info(f'Merge-driver triggered{for_path}')
+        prepared_theirs = merge.prepare_theirs_file(cl_args, request['paths_from_environment'], request['cwd'])
+        response = {'prepared': prepared_theirs is not None, 'log': list_handler.lines}
+        if request.get('call'):
+            response['merge_file_cmd'] = merge.get_merge_file_cmd(cl_args.ours, cl_args.base, cl_args.theirs)
+        return response
+    except (Exception, SystemExit) as e:
+        # SystemExit e.g. by the argument-parser on an invalid command line.
+        logger.exception(f"handle_request(); request: {request}")
+        return {'error': f'{type(e).__name__}: {e}', 'log': list_handler.lines if list_handler else []}
+    finally:
+        if list_handler is not None:
+            root_logger.removeHandler(list_handler)
+            _set_request_level(None)
+
+
+def _handle_connection(connection):
+    with connection:
+        connection.settimeout(client.CLIENT_TIMEOUT)
+        try:
+            request = json.loads(client.receive_line(connection))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Invalid request: {e}")
+            return
+        response = handle_request(request)
+        try:
+            connection.sendall(json.dumps(response).encode() + b'\n')
+        except OSError as e:
+            logger.warning(f"Sending the response failed: {e}")
+
+
+def init_argument_parser():
+    import argparse
+    parser = argparse.ArgumentParser(prog=f'{config.SCRIPT_NAME} serve',
+                                     description='Serve the merge-driver calls on a Unix domain socket.')
+    parser.add_argument('--socket', help='The socket path. Defaults to the socket a merge-driver call looks for.')
+    parser.add_argument('--idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT,
+                        help=f'Exit after this many seconds without a request. Defaults to {DEFAULT_IDLE_TIMEOUT}.')
+    parser.add_argument('-l', '--loglevel', choices=config.LOG_LEVELS, default=config.DEFAULT_LOGLEVEL,
+                        help=f"Log-level of the server: {config.LOG_LEVELS}. Defaults to {config.DEFAULT_LOGLEVEL}.")
+    return parser
+
+
+def serve(argv):
+    cl_args = init_argument_parser().parse_args(argv)
+    config.configure_logger(cl_args.loglevel)
+    # The root logger's level is lowered per request to the request's log-level. Keep the server's own output at the
+    # server's log-level.
+    logging.getLogger().handlers[0].setLevel(cl_args.loglevel)
+    socket_path = cl_args.socket or client.get_socket_path()
+    if not socket_path:
+        sys.exit("No socket path. Set --socket, KOP_MERGE_DRIVER_SOCKET or XDG_RUNTIME_DIR,"
+                 + " or start the server in the top-level directory of a Git worktree.")
+
+    if os.path.exists(socket_path):
+        # Another server is running, or a server has been killed and left its socket.
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe_socket:
+            try:
+                probe_socket.connect(socket_path)
+                sys.exit(f"A server is already listening on {socket_path}")
+            except OSError:
+                logger.info(f"Removing stale socket {socket_path}")
+                os.unlink(socket_path)
+
+    # Import the merge-drivers once.
+    from keep_ours_paths_merge_driver import merge
+    for filetype in config.FILE_TYPES:
+        merge.get_merge_driver(filetype)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server_socket:
+        server_socket.bind(socket_path)
+        os.chmod(socket_path, 0o600)
+        server_socket.listen()
+        server_socket.settimeout(cl_args.idle_timeout)
+        logger.info(f"Serving on {socket_path}; idle-timeout: {cl_args.idle_timeout}s")
+        threads = []
+        try:
+            while True:
+                try:
+                    connection, _ = server_socket.accept()
+                except socket.timeout:
+                    threads = [thread for thread in threads if thread.is_alive()]
+                    if threads:
+                        continue
+                    logger.info(f"No request within {cl_args.idle_timeout}s. Exiting.")
+                    break
+                thread = threading.Thread(target=_handle_connection, args=(connection,), daemon=True)
+                thread.start()
+                threads = [thread for thread in threads if thread.is_alive()] + [thread]
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
@@ -0,0 +1,173 @@
+import logging
+import os
+import shlex
+import subprocess
+import sys
+
+from keep_ours_paths_merge_driver import batch
+from keep_ours_paths_merge_driver import config
+from keep_ours_paths_merge_driver import git_objects
+from keep_ours_paths_merge_driver import merge
+
+logger = logging.getLogger()
+
+#
+# The merge-strategy "kop":
+#
+#   git merge -s kop [-X loglevel=DEBUG] [-X workers=N] [-X executor=thread] <commit>
+#
+# Git calls a merge-driver once per file, in a new process each. A merge-strategy is called once per merge. Git calls
+# the executable git-merge-kop in the PATH as
+#
+#   git-merge-kop [--<strategy-option>...] <base> -- <head> <remote>
+#
+# The strategy:
+#
+#   1. Finds the paths changed in both, head and remote, whose merge-attribute names a merge-driver defined with this
+#       merge-driver's executable. The merge-driver's definition, e.g. "merge.<name>.driver", gives the paths-config.
+#   2. Reads the blobs of these paths by one "git cat-file --batch" process.
+#   3. Prepares theirs of all the paths in one interpreter. The paths-config is compiled once per worker, and the
+#       paths are spread over the workers, see batch.prepare_theirs_contents().
+#   4. Writes the prepared theirs as blobs, and a tree as remote's tree with the prepared blobs.
+#   5. Calls "git merge-recursive <base> -- <head> <tree>", which does the usual merge and updates the index and the
+#       worktree. The merge-drivers are replaced by plain git merge-file for this call, because theirs is prepared.
+#
+# The exit code is 0 for a clean merge, 1 on conflicts, and 2 if the strategy can't handle the merge. E.g. an octopus
+# merge is left to other strategies. With more than one merge-base, the merge is passed to git merge-recursive as it
+# is, so the merge-driver is called per file as usual.
+#
+# To use the strategy from the zipapp, put an executable git-merge-kop in the PATH calling
+#
+#   keep_ours_paths_merge_driver.pyz strategy "$@"
+#
+
+# Replaces the merge-drivers during the tree-merge. The merge-driver calls git merge-file with these labels as well.
+PLAIN_MERGE_DRIVER = 'git merge-file -L ours -L base -L theirs %A %O %B'
+
+
+def get_merge_drivers(cwd=None) -> dict:
+    """
+    :return: Dict of the names of the merge-drivers defined with this merge-driver's executable to their parsed
+        command lines.
+    """
+    try:
+        out = git_objects.git(['config', '-z', '--get-regexp', r'^merge\..*\.driver$'], cwd=cwd)
+    except subprocess.CalledProcessError:
+        # No merge-driver defined.
+        return {}
+    merge_drivers = {}
+    # The records are "<key>\n<value>\0".
+    for record in out.decode().split('\0'):
+        key, _, command = record.partition('\n')
+        if not command:
+            continue
+        name = key[len('merge.'):-len('.driver')]
+        args = shlex.split(command)
+        executable_indexes = [i for i, arg in enumerate(args) if config.SCRIPT_NAME in arg]
+        if not executable_indexes:
+            continue
+        try:
+            cl_args, _ = config.init_argument_parser().parse_known_args(args[executable_indexes[0] + 1:])
+        except SystemExit:
+            logger.warning(f"Ignoring merge-driver {name}; can't parse its command line: {command}")
+            continue
+        merge_drivers[name] = cl_args
+    return merge_drivers
+
+
+def init_argument_parser():
+    import argparse
+    # The strategy-options given to git merge as -X <option>=<value> are passed as --<option>=<value>.
+    parser = argparse.ArgumentParser(prog='git-merge-kop', description='The merge-strategy kop.')
+    parser.add_argument('--loglevel', choices=config.LOG_LEVELS, default=config.DEFAULT_LOGLEVEL)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--executor', choices=batch.EXECUTORS, default=batch.EXECUTOR_PROCESS)
+    return parser
+
+
+def prepare_remote_tree(base, head, remote, merge_drivers, cl_args):
+    """
+    :return: The object-id of remote's tree with prepared theirs-blobs, or remote if nothing has been prepared.
+    """
+    ours_changes = git_objects.diff_raw(base, head)
+    theirs_changes = git_objects.diff_raw(base, remote)
+    # Modified in both, but not the same way. Added or deleted files aren't prepared by the merge-driver either.
+    paths = [path for path, change in theirs_changes.items()
+             if change[0] == 'M' and path in ours_changes and ours_changes[path][0] == 'M'
+             and ours_changes[path][4] != change[4]]
+    merge_attributes = git_objects.get_merge_attributes(paths)
+    paths_by_driver = {}
+    for path in paths:
+        if merge_attributes.get(path) in merge_drivers:
+            paths_by_driver.setdefault(merge_attributes[path], []).append(path)
+
+    prepared_paths = []
+    prepared_contents = []
+    cat_file_process = git_objects.open_cat_file()
+    try:
+        for name, driver_paths in paths_by_driver.items():
+            driver_cl_args = merge_drivers[name]
+            paths_and_patterns = merge.get_paths_and_patterns(
+                driver_cl_args, os.getenv('KOP_MERGE_DRVIER_PATHSPATTERNS'))
+            logger.info(f"Merge-driver {name}: paths_and_patterns: {paths_and_patterns}; paths: {driver_paths}")
+            if not paths_and_patterns:
+                continue
+            triples = []
+            for path in driver_paths:
+                _, _, _, base_oid, theirs_oid = theirs_changes[path]
+                ours_oid = ours_changes[path][4]
+                triples.append(tuple(git_objects.read_blob(cat_file_process, oid)
+                                     for oid in [base_oid, ours_oid, theirs_oid]))
+            workers = min(cl_args.workers or batch.available_cpu_count(), len(triples))
+            prepared_theirs_contents = batch.prepare_theirs_contents(
+                triples, driver_cl_args.filetype, paths_and_patterns, cl_args.executor, workers, cl_args.loglevel)
+            for path, triple, prepared_theirs in zip(driver_paths, triples, prepared_theirs_contents):
+                if prepared_theirs is not None and prepared_theirs != triple[2]:
+                    prepared_paths.append(path)
+                    prepared_contents.append(prepared_theirs)
+    finally:
+        git_objects.close_cat_file(cat_file_process)
+
+    if not prepared_paths:
+        return remote
+    oids = git_objects.write_blobs(prepared_contents)
+    return git_objects.write_tree(remote, {path: (theirs_changes[path][2], oid)
+                                           for path, oid in zip(prepared_paths, oids)})
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if '--' not in argv:
+        print("usage: git-merge-kop [--<option>...] <base>... -- <head> <remote>", file=sys.stderr)
+        return 2
+    separator_index = argv.index('--')
+    cl_args, unknown_args = init_argument_parser().parse_known_args(argv[:separator_index])
+    # Ignore unknown strategy-options.
+    bases = [arg for arg in unknown_args if not arg.startswith('--')]
+    head, remotes = argv[separator_index + 1], argv[separator_index + 2:]
+    config.configure_logger(cl_args.loglevel)
+    logger.debug(f"bases: {bases}; head: {head}; remotes: {remotes}")
+
+    if len(remotes) != 1:
+        logger.info("The merge-strategy kop doesn't merge more than two heads.")
+        return 2
+    remote = remotes[0]
+    if len(bases) != 1:
+        logger.info("More than one merge-base; leaving the merge to git merge-recursive and the merge-drivers.")
+        return subprocess.call(['git', 'merge-recursive'] + bases + ['--', head, remote])
+
+    try:
+        merge_drivers = get_merge_drivers()
+        tree = prepare_remote_tree(bases[0], head, remote, merge_drivers, cl_args)
+    except Exception:
+        logger.exception("Preparing theirs failed")
+        return 2
+
+    # The label of the tree in the conflict-markers and messages is remote's label.
+    env = dict(os.environ)
+    env[f'GITHEAD_{tree}'] = os.environ.get(f'GITHEAD_{remote}', remote)
+    driver_overrides = []
+    for name in merge_drivers:
+        driver_overrides += ['-c', f'merge.{name}.driver={PLAIN_MERGE_DRIVER}']
+    return subprocess.call(['git'] + driver_overrides + ['merge-recursive', bases[0], '--', head, tree], env=env)
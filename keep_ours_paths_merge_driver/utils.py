@@ -1,5 +1,9 @@
+import bisect
 import logging
 
+from keep_ours_paths_merge_driver import budget
+from keep_ours_paths_merge_driver import metrics
+
 logger = logging.getLogger()
 
 
@@ -19,6 +23,9 @@ def replace_nth(s, search_token, replacement_token, position):
 def replace_token(s, search_token, replacement_token, compare_to_reference):
     n = 1
     while True:
+        # Each trial parses the whole document. A value repeated thousands of times takes as many trials.
+        budget.check()
+        metrics.count(metrics.REPLACE_TOKEN_ATTEMPTS)
         # replace_nth() returns an empty string in case there is no searchToken at n.
         str_replaced_at_n = replace_nth(s, search_token, replacement_token, n)
         if not str_replaced_at_n:
@@ -32,3 +39,76 @@ def replace_token(s, search_token, replacement_token, compare_to_reference):
         n += 1
 
     return s
+
+
+def apply_edits(s, edits):
+    """
+    Apply edits in one pass.
+
+    :param s: The str or bytes to edit.
+    :param edits: Iterable of (start, end, replacement). The offsets refer to the unedited s. The edits must not
+        overlap.
+    :return: The edited str or bytes.
+    """
+    # Apply the edits in reverse order, so the offsets of the edits not yet applied stay valid. Collect the pieces
+    # instead of building intermediate strings, and join them once.
+    pieces = []
+    end_of_previous_edit = len(s)
+    for start, end, replacement in sorted(edits, key=lambda edit: edit[0], reverse=True):
+        if end > end_of_previous_edit:
+            raise ValueError(f"Overlapping edits at {start}:{end}")
+        pieces.append(s[end:end_of_previous_edit])
+        pieces.append(replacement)
+        end_of_previous_edit = start
+    pieces.append(s[0:end_of_previous_edit])
+    return s[0:0].join(reversed(pieces))
+
+
+def map_concurrently(function, items, concurrently=True):
+    """
+    Like list(map(function, items)), but with concurrently=True each item on a thread of its own. The function must
+    not share mutable state between the items.
+    """
+    if not concurrently or len(items) < 2:
+        return [function(item) for item in items]
+
+    def run(item):
+        try:
+            return function(item)
+        finally:
+            # The stage entered by the function ends with the item, not with the next stage of the thread.
+            metrics.leave()
+
+    # The calling thread waits for the stages of the items.
+    metrics.leave()
+    # Imported here to keep the import-time of the merge-driver small.
+    import concurrent.futures
+    import contextvars
+    executor = concurrent.futures.ThreadPoolExecutor(len(items))
+    try:
+        # Each item runs in a copy of the caller's context, so it sees the budgets and the metrics of the call. See
+        # budget.py and metrics.py. A context can't be entered by two threads at once.
+        futures = [executor.submit(contextvars.copy_context().run, run, item) for item in items]
+        done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+        for future in done:
+            if future.exception() is not None:
+                raise future.exception()
+        results = [future.result() for future in futures]
+    except BaseException:
+        # E.g. budget.BudgetExceeded. Don't wait for the other items, their results are of no use.
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return results
+
+
+def is_in_line_ranges(first_line, last_line, line_ranges) -> bool:
+    """
+    :param first_line, last_line: The lines of an element, both included.
+    :param line_ranges: Sorted list of non-overlapping tuples (begin, end) of the lines [begin, end).
+    :return: True if any of the lines of the element is in any of the line-ranges.
+    """
+    # The last line-range beginning at or before the element's last line is the only one that may contain a line of
+    # the element without containing the element's last line. The line-ranges before it end before it begins.
+    i = bisect.bisect_right(line_ranges, (last_line, float('inf'))) - 1
+    return i >= 0 and line_ranges[i][1] > first_line
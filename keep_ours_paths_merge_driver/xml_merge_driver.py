@@ -1,56 +1,164 @@
 import logging
-import re
+import xml.parsers.expat
 
 from lxml import etree
 
+from keep_ours_paths_merge_driver import budget
 from keep_ours_paths_merge_driver import config
+from keep_ours_paths_merge_driver import extraction_cache
+from keep_ours_paths_merge_driver import metrics
+from keep_ours_paths_merge_driver import prescreen
 from keep_ours_paths_merge_driver import utils
+from keep_ours_paths_merge_driver import xml_paths
+from keep_ours_paths_merge_driver import xml_streaming
+from keep_ours_paths_merge_driver import xml_text_spans
 
 logger = logging.getLogger()
 
 # The format is:
 #   <optional merge-strategy>:<mandatory the-jsonpath>:<optional some-regex>
 g_paths_and_patterns = {}
+# The paths and patterns compiled once, see xml_paths.compile_paths_and_patterns().
+g_compiled_paths_and_patterns = []
 
 
 def set_paths_and_patterns(path_and_patterns):
     global g_paths_and_patterns
-    if path_and_patterns is not None:
+    global g_compiled_paths_and_patterns
+    # The server calls this for each request. Compile only if the config has changed.
+    if path_and_patterns is not None and path_and_patterns != g_paths_and_patterns:
         g_paths_and_patterns = path_and_patterns
+        g_compiled_paths_and_patterns = compile_paths_and_patterns(path_and_patterns)
+
+
+def compile_paths_and_patterns(path_and_patterns):
+    return xml_paths.compile_paths_and_patterns(path_and_patterns)
+
+
+def dump_compiled_paths_and_patterns(compiled_paths_and_patterns):
+    return xml_paths.dump_compiled_paths_and_patterns(compiled_paths_and_patterns)
+
+
+def load_compiled_paths_and_patterns(dumped):
+    return xml_paths.load_compiled_paths_and_patterns(dumped)
 
 
 def get_paths_and_patterns():
     return g_paths_and_patterns
 
 
-def remove_xmlns_from_xml_string(xml_str):
-    return re.sub(' xmlns="[^"]+"', '', xml_str, count=1)
+def _encode(xml_str: str) -> bytes:
+    # The string as it would be in a file, in the encoding its encoding-declaration declares.
+    encoding = xml_text_spans.get_encoding(xml_str[:xml_text_spans.ENCODING_DECLARATION_MAX_LENGTH].encode())
+    if encoding == 'utf-16':
+        # Without byte-order-mark, as the string has none. lxml detects UTF-16 by the leading '<'.
+        encoding = 'utf-16-le'
+    return xml_str.encode(encoding, 'xmlcharrefreplace')
+
+
+def get_prepared_theirs_str(base_xml_str: str, ours_xml_str: str, theirs_xml_str: str,
+                            compiled_paths_and_patterns=None, decisions=None, parse_concurrently=False,
+                            streaming_threshold=config.STREAMING_THRESHOLD_DEFAULT, line_ranges=None,
+                            paths_details_cache=None) -> str:
+    """
+    As get_prepared_theirs_bytes(), for files already decoded.
+    """
+    prepared_xml_bytes = get_prepared_theirs_bytes(
+        _encode(base_xml_str), _encode(ours_xml_str), _encode(theirs_xml_str), compiled_paths_and_patterns, decisions,
+        parse_concurrently, streaming_threshold, line_ranges, paths_details_cache)
+    return prepared_xml_bytes.decode(xml_text_spans.get_encoding(prepared_xml_bytes))
 
 
-def get_prepared_theirs_str(base_xml_str: str, ours_xml_str: str, theirs_xml_str: str) -> str:
+def get_prepared_theirs_bytes(base_xml_bytes: bytes, ours_xml_bytes: bytes, theirs_xml_bytes: bytes,
+                              compiled_paths_and_patterns=None, decisions=None, parse_concurrently=False,
+                              streaming_threshold=config.STREAMING_THRESHOLD_DEFAULT, line_ranges=None,
+                              paths_details_cache=None) -> bytes:
+    """
+    :param base_xml_bytes, ours_xml_bytes, theirs_xml_bytes: The files as they are, in the encodings they declare.
+    :param compiled_paths_and_patterns: Defaults to the ones set by set_paths_and_patterns(). See engine.py.
+    :param decisions: If given, a list the decision per common path is appended to. See engine.py.
+    :param parse_concurrently: Parse base, ours and theirs and get their paths-details on a thread each.
+    :param streaming_threshold: Use the streaming-mode if a file is larger than this number of bytes, and all
+        paths are streamable. A negative value switches the streaming-mode off. See xml_streaming.
+    :param line_ranges: If given, only the elements within these lines are considered. Tuple of the line-ranges of
+        base, ours and theirs as returned by merge.get_line_ranges().
+    :param paths_details_cache: If given, the paths-details of base and ours, and of theirs in the streaming-mode,
+        are taken from and stored in this extraction-cache, see extraction_cache.py.
+    :return: The prepared theirs in theirs' encoding, or theirs_xml_bytes itself if nothing has been prepared.
+    """
+    if compiled_paths_and_patterns is None:
+        compiled_paths_and_patterns = g_compiled_paths_and_patterns
+    budget.check('pre-screen')
+    metrics.enter('pre-screen')
+    shortcut = prescreen.get_xml_shortcut(
+        base_xml_bytes, ours_xml_bytes, theirs_xml_bytes, compiled_paths_and_patterns,
+        [xml_text_spans.get_encoding(xml_bytes) for xml_bytes in [base_xml_bytes, ours_xml_bytes, theirs_xml_bytes]])
+    if shortcut is not None:
+        logger.info(f"Pre-screen: {shortcut}. Nothing to prepare.")
+        return theirs_xml_bytes
+    streaming = 0 <= streaming_threshold < max(len(base_xml_bytes), len(ours_xml_bytes), len(theirs_xml_bytes)) \
+        and xml_streaming.is_streamable(compiled_paths_and_patterns)
+    if streaming:
+        logger.info("Using the streaming-mode.")
     #
-    # TODO Explain why remove_xmlns_from_xml_string() is used.
+    # The files are given to lxml as they are. lxml decodes them as declared, so files in other encodings than
+    # UTF-8, e.g. ISO-8859-1 or UTF-16, are read correctly. The namespaces are kept, see xml_paths. The values are
+    # replaced in theirs' bytes, see below, so theirs keeps its encoding without being decoded and encoded as a whole.
     #
-    # About encode():
+    # lxml releases the GIL while parsing. So with parse_concurrently the three documents are parsed in parallel.
+    # The evaluations of a compiled XPath are serialized by lxml, which makes sharing it by the threads safe.
     #
-    # Without encode(), lxml blames:
-    #       ValueError: Unicode strings with encoding declaration are not supported. Please use bytes input or XML
-    #       fragments without declaration.
+    # In the streaming-mode no xml_doc is kept, and the default namespace is ignored by xml_streaming.
     #
-    base_xml_doc = etree.fromstring(remove_xmlns_from_xml_string(base_xml_str).encode())
-    ours_xml_doc = etree.fromstring(remove_xmlns_from_xml_string(ours_xml_str).encode())
-    theirs_xml_doc = etree.fromstring(remove_xmlns_from_xml_string(theirs_xml_str).encode())
+    # Theirs' xml_doc is the control-doc, and its elements are replaced. So in the in-memory-mode only the
+    # paths-details of base and ours are taken from the extraction-cache. The paths-details within line-ranges aren't
+    # cached.
+    #
+    # The stage 'parse <name>' is followed by 'find paths in <name>', see metrics.py. In the streaming-mode the paths
+    # are found while parsing, so 'parse <name>' includes the search. On a hit of the extraction-cache, 'parse <name>'
+    # is the read of the cache-file.
+    #
+    def parse(name, xml_bytes):
+        xml_doc = etree.fromstring(xml_bytes)
+        budget.check(f'find paths in {name}')
+        metrics.enter(f'find paths in {name}')
+        return xml_doc
 
-    logger.debug("Getting details for base_xml_doc")
-    base_paths_details = _get_paths_details(base_xml_doc)
-    logger.debug("Getting details for ours_xml_doc")
-    ours_paths_details = _get_paths_details(ours_xml_doc)
-    logger.debug("Getting details for theirs_xml_doc")
-    theirs_paths_details = _get_paths_details(theirs_xml_doc)
+    def parse_and_get_paths_details(name_and_xml_bytes_and_line_ranges):
+        name, xml_bytes, file_line_ranges = name_and_xml_bytes_and_line_ranges
+        budget.check(f'parse {name}')
+        metrics.enter(f'parse {name}')
+        is_cached = paths_details_cache is not None and file_line_ranges is None and (streaming or name != 'theirs')
+        if streaming:
+            logger.debug(f"Getting details for {name}_xml_doc by streaming")
+            if is_cached:
+                return None, extraction_cache.get_paths_details(
+                    paths_details_cache, 'xml-streaming', xml_bytes,
+                    lambda: xml_streaming.get_paths_details(xml_bytes, compiled_paths_and_patterns))
+            return None, xml_streaming.get_paths_details(xml_bytes, compiled_paths_and_patterns, file_line_ranges)
+        if is_cached:
+            logger.debug(f"Getting details for {name}_xml_doc")
+            return None, extraction_cache.get_paths_details(
+                paths_details_cache, 'xml', xml_bytes,
+                lambda: _get_plain_paths_details(_get_paths_details(parse(name, xml_bytes),
+                                                                    compiled_paths_and_patterns)))
+        xml_doc = parse(name, xml_bytes)
+        logger.debug(f"Getting details for {name}_xml_doc")
+        return xml_doc, _get_paths_details(xml_doc, compiled_paths_and_patterns, file_line_ranges)
 
-    logger.debug(f"base_paths_details: {base_paths_details}")
-    logger.debug(f"ours_paths_details: {ours_paths_details}")
-    logger.debug(f"theirs_paths_details: {theirs_paths_details}")
+    base_line_ranges, ours_line_ranges, theirs_line_ranges = line_ranges or (None, None, None)
+    parsed = utils.map_concurrently(parse_and_get_paths_details,
+                                    [('base', base_xml_bytes, base_line_ranges),
+                                     ('ours', ours_xml_bytes, ours_line_ranges),
+                                     ('theirs', theirs_xml_bytes, theirs_line_ranges)],
+                                    parse_concurrently)
+    (_, base_paths_details), (_, ours_paths_details), (theirs_xml_doc, theirs_paths_details) = parsed
+
+    # Formatting the paths-details of large files takes its time, even if not logged.
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"base_paths_details: {base_paths_details}")
+        logger.debug(f"ours_paths_details: {ours_paths_details}")
+        logger.debug(f"theirs_paths_details: {theirs_paths_details}")
 
     #
     # Detect conflicts.
@@ -66,8 +174,13 @@ def get_prepared_theirs_str(base_xml_str: str, ours_xml_str: str, theirs_xml_str
 
     common_paths = set.intersection(
         set(base_paths_details.keys()), set(ours_paths_details.keys()), set(theirs_paths_details.keys()))
-    logger.debug(f"common_paths to base/ours/theirs: {common_paths}")
-    for common_path in common_paths:
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"common_paths to base/ours/theirs: {common_paths}")
+
+    paths_to_prepare = []
+    for common_path in sorted(common_paths):
+        budget.check('detect', common_path)
+        metrics.enter('detect', common_path, ours_paths_details[common_path].get('configured_path'))
         leaf_warning = []
         if not base_paths_details[common_path]['is_leaf']:
             leaf_warning.append('Base')
@@ -78,6 +191,10 @@ def get_prepared_theirs_str(base_xml_str: str, ours_xml_str: str, theirs_xml_str
         if leaf_warning:
             logger.warning(f"{'/'.join(leaf_warning)} file's XPath '{common_path}' is not a leaf-node."
                            + " The merge driver works only on leaf-nodes. This path is ignored.")
+            if decisions is not None:
+                decisions.append({'path': common_path,
+                                  'merge_strategy': ours_paths_details[common_path]['merge_strategy'],
+                                  'prepare_theirs': False, 'ignored': 'not a leaf-node'})
             continue
 
         base_value = base_paths_details[common_path]['value']
@@ -99,55 +216,211 @@ def get_prepared_theirs_str(base_xml_str: str, ours_xml_str: str, theirs_xml_str
                 f"common_path: {common_path}; merge_strategy: {merge_strategy}; prepare_theirs: {prepare_theirs}" +
                 f"; num_distinct_values: {num_distinct_values}")
 
+        if decisions is not None:
+            decisions.append({'path': common_path, 'merge_strategy': merge_strategy, 'base_value': base_value,
+                              'ours_value': ours_value, 'theirs_value': theirs_value,
+                              'prepare_theirs': prepare_theirs})
         if prepare_theirs:
-            theirs_value_to_search = theirs_value
-            ours_value_replacement = ours_value
-            logger.debug(
-                f"theirs_value_to_search: {theirs_value_to_search}; ours_value_replacement: {ours_value_replacement}")
+            logger.debug(f"theirs_value_to_search: {theirs_value}; ours_value_replacement: {ours_value}")
+            paths_to_prepare.append(common_path)
+
+    if not paths_to_prepare:
+        return theirs_xml_bytes
+
+    #
+    # The values are replaced in Theirs' bytes at the byte-spans of the texts of the leaf-elements. Ours' texts are
+    # taken as they are in Ours' bytes. Only if Ours has another encoding than Theirs, they are transcoded.
+    #
+    # First all replacements are collected in an edit-plan, applied in one pass, and the result is validated once
+    # against the control-doc containing all replacements. Only if that fails, or if a path has no span, the paths
+    # are replaced one by one.
+    #
+    budget.check('replace')
+    # The replacement in one pass is shared by the paths, see metrics.py.
+    metrics.enter('replace', paths_to_prepare)
+    if streaming:
+        prepared_xml_bytes = _get_prepared_theirs_bytes_by_streaming(
+            ours_xml_bytes, theirs_xml_bytes, paths_to_prepare, ours_paths_details, theirs_paths_details)
+        if prepared_xml_bytes is not None:
+            return prepared_xml_bytes
+        # The decisions are the same in both modes, and have already been made.
+        logger.info("Replacing the paths in the streaming-mode failed. Falling back to the in-memory-mode.")
+        return get_prepared_theirs_bytes(base_xml_bytes, ours_xml_bytes, theirs_xml_bytes, compiled_paths_and_patterns,
+                                         parse_concurrently=parse_concurrently, streaming_threshold=-1,
+                                         line_ranges=line_ranges, paths_details_cache=paths_details_cache)
+    theirs_encoding = xml_text_spans.get_encoding(theirs_xml_bytes)
+    ours_encoding = xml_text_spans.get_encoding(ours_xml_bytes)
+    theirs_spans = _get_leaf_text_spans(theirs_xml_bytes)
+    ours_spans = _get_leaf_text_spans(ours_xml_bytes)
+
+    # The spans are keyed by the location of the element in the document. For keyed paths the location differs
+    # from the common_path, see xml_paths.
+    theirs_locations = {common_path: theirs_paths_details[common_path]['location'] for common_path in paths_to_prepare}
+    # Take Ours' texts as they are in the file, including character-references and CDATA-sections, if any.
+    ours_texts = {}
+    for common_path in paths_to_prepare:
+        ours_span = ours_spans.get(ours_paths_details[common_path]['location'])
+        if ours_span is not None:
+            ours_texts[common_path] = _transcode(ours_xml_bytes[ours_span[0]:ours_span[1]], ours_encoding,
+                                                 theirs_encoding)
+    edits = [(theirs_spans[theirs_locations[common_path]][0], theirs_spans[theirs_locations[common_path]][1],
+              ours_texts[common_path])
+             for common_path in paths_to_prepare
+             if theirs_locations[common_path] in theirs_spans and common_path in ours_texts]
+
+    if len(edits) == len(paths_to_prepare):
+        for common_path in paths_to_prepare:
+            theirs_paths_details[common_path]['tag_object'].text = ours_paths_details[common_path]['value']
+        prepared_xml_bytes = utils.apply_edits(theirs_xml_bytes, edits)
+        if _is_equal_to_control_doc(prepared_xml_bytes, theirs_xml_doc):
+            logger.debug(f"Replaced {len(edits)} path(s) in one pass.")
+            return prepared_xml_bytes
+        logger.debug("The result of the replacements in one pass differs from the control-doc."
+                     + " Falling back to replacing path by path.")
+        for common_path in paths_to_prepare:
+            theirs_paths_details[common_path]['tag_object'].text = theirs_paths_details[common_path]['value']
+
+    # 'splices' records the (start, delta) of the replacements done so far. A replacement changes the length of
+    # the document, so the spans behind a replacement have to be shifted by its delta.
+    splices = []
+    for common_path in paths_to_prepare:
+        budget.check('replace path by path', common_path)
+        metrics.enter('replace path by path', common_path)
+        theirs_value_to_search = theirs_paths_details[common_path]['value']
+        ours_value_replacement = ours_paths_details[common_path]['value']
+
+        # Set Ours value to Theirs. 'theirs_element_reference' keeps a reference to the XML-element in
+        # theirs_xml_doc.
+        theirs_element_reference = theirs_paths_details[common_path]['tag_object']
+        theirs_element_reference.text = ours_value_replacement
+
+        #
+        # check_if_modified_xml_bytes_is_equal_to_theirs_xml_control_doc():
+        # We have the control-doc as XML-doc, and the XML to be compared against the control-doc as bytes.
+        # What possibilities of comparisons we have?
+        # The LXMLOutputChecker().checker.check_output() needs two strings.
+        # Comparison is also possible between to XML-docs with etree.tostring(xml_doc).
+        # But is there something taking one XML-doc and one XML-string? I don't know.
+        #
+        neutral_formatted_theirs_xml_bytes = etree.tostring(theirs_xml_doc)
+
+        def check_if_modified_xml_bytes_is_equal_to_theirs_xml_control_doc(xml_bytes: bytes) -> bool:
+            return neutral_formatted_theirs_xml_bytes == etree.tostring(etree.fromstring(xml_bytes))
+
+        if theirs_spans is None:
+            theirs_spans = _get_leaf_text_spans(theirs_xml_bytes)
+            splices = []
+        if theirs_locations[common_path] in theirs_spans and common_path in ours_texts:
+            start, end = theirs_spans[theirs_locations[common_path]]
+            ours_text = ours_texts[common_path]
+            shift = sum(delta for splice_start, delta in splices if splice_start < start)
+            spliced_xml_bytes = theirs_xml_bytes[:start + shift] + ours_text + theirs_xml_bytes[end + shift:]
+            if check_if_modified_xml_bytes_is_equal_to_theirs_xml_control_doc(spliced_xml_bytes):
+                logger.debug(f"common_path: {common_path}; replaced at span {(start, end)}")
+                theirs_xml_bytes = spliced_xml_bytes
+                splices.append((start, len(ours_text) - (end - start)))
+                continue
+
+        # Fallback for texts without span, e.g. '<version/>'. Search the value in the whole, decoded document.
+        logger.debug(f"common_path: {common_path}; no valid span, falling back to replace_token()")
+        theirs_xml_str = utils.replace_token(
+            theirs_xml_bytes.decode(theirs_encoding), theirs_value_to_search, ours_value_replacement,
+            lambda xml_str: check_if_modified_xml_bytes_is_equal_to_theirs_xml_control_doc(
+                xml_str.encode(theirs_encoding, 'xmlcharrefreplace')))
+        theirs_xml_bytes = theirs_xml_str.encode(theirs_encoding, 'xmlcharrefreplace')
+        # The positions of the replacement is unknown. So the spans are outdated.
+        theirs_spans = None
+
+    return theirs_xml_bytes
+
+
+def _get_plain_paths_details(paths_details):
+    # Without the elements, as cached by extraction_cache.
+    return {path: {key: value for key, value in details.items() if key != 'tag_object'}
+            for path, details in paths_details.items()}
+
+
+def _get_leaf_text_spans(xml_bytes, ordinals=None):
+    # Expat doesn't support multi-byte encodings other than UTF-8 and UTF-16, e.g. Shift_JIS. The values of such
+    # documents are replaced path by path by replace_token().
+    try:
+        return xml_text_spans.get_leaf_text_spans(xml_bytes, ordinals)
+    except (ValueError, xml.parsers.expat.ExpatError) as e:
+        logger.debug(f"No text-spans: {e}")
+        return {}
+
 
-            # Set Ours value to Theirs. 'theirs_element_reference' keeps a reference to the XML-element in
-            # theirs_xml_doc.
-            theirs_element_reference = theirs_paths_details[common_path]['tag_object']
-            theirs_element_reference.text = ours_value
+def _transcode(text_bytes, from_encoding, to_encoding):
+    if from_encoding == to_encoding:
+        return text_bytes
+    # Characters not encodable in to_encoding are replaced by character-references.
+    return text_bytes.decode(from_encoding).encode(to_encoding, 'xmlcharrefreplace')
 
-            #
-            # check_if_modified_xml_str_is_equal_to_theirs_xml_control_doc():
-            # We have the control-doc as XML-doc, and the XML to be compared against the control-doc as string.
-            # What possibilities of comparisons we have?
-            # The LXMLOutputChecker().checker.check_output() needs two strings.
-            # Comparison is also possible between to XML-docs with etree.tostring(xml_doc).
-            # But is there something taking one XML-doc and one XML-string? I don't know.
-            #
-            neutral_formatted_theirs_xml_str = etree.tostring(theirs_xml_doc)
 
-            def check_if_modified_xml_str_is_equal_to_theirs_xml_control_doc(xml_str: str) -> bool:
-                neutral_formatted_prepared_xml_str = \
-                    etree.tostring(etree.fromstring(remove_xmlns_from_xml_string(xml_str).encode()))
-                return neutral_formatted_theirs_xml_str == neutral_formatted_prepared_xml_str
+def _get_prepared_theirs_bytes_by_streaming(ours_xml_bytes, theirs_xml_bytes, paths_to_prepare, ours_paths_details,
+                                            theirs_paths_details):
+    # The edit-plan of get_prepared_theirs_bytes(), with the spans looked up by the ordinals of the elements. There is
+    # no fallback replacing path by path in the streaming-mode.
+    # :return: The prepared theirs, or None if a path has no span or the result isn't as expected.
+    theirs_ordinals = {common_path: theirs_paths_details[common_path]['ordinal'] for common_path in paths_to_prepare}
+    ours_ordinals = {common_path: ours_paths_details[common_path]['ordinal'] for common_path in paths_to_prepare}
+    theirs_spans = _get_leaf_text_spans(theirs_xml_bytes, set(theirs_ordinals.values()))
+    ours_spans = _get_leaf_text_spans(ours_xml_bytes, set(ours_ordinals.values()))
+    ours_encoding = xml_text_spans.get_encoding(ours_xml_bytes)
+    theirs_encoding = xml_text_spans.get_encoding(theirs_xml_bytes)
+    edits = [(theirs_spans[theirs_ordinals[common_path]][0], theirs_spans[theirs_ordinals[common_path]][1],
+              _transcode(ours_xml_bytes[ours_spans[ours_ordinals[common_path]][0]:
+                                        ours_spans[ours_ordinals[common_path]][1]], ours_encoding, theirs_encoding))
+             for common_path in paths_to_prepare
+             if theirs_ordinals[common_path] in theirs_spans and ours_ordinals[common_path] in ours_spans]
+    if len(edits) != len(paths_to_prepare):
+        logger.debug("Not all paths have a span.")
+        return None
+    prepared_xml_bytes = utils.apply_edits(theirs_xml_bytes, edits)
+    expected_texts = {theirs_ordinals[common_path]: ours_paths_details[common_path]['value']
+                      for common_path in paths_to_prepare}
+    if not xml_streaming.has_expected_texts(prepared_xml_bytes, expected_texts):
+        logger.debug("The result of the replacements hasn't the expected texts.")
+        return None
+    logger.debug(f"Replaced {len(edits)} path(s) in one pass.")
+    return prepared_xml_bytes
 
-            theirs_xml_str = utils.replace_token(theirs_xml_str, theirs_value_to_search, ours_value_replacement,
-                                                 check_if_modified_xml_str_is_equal_to_theirs_xml_control_doc)
 
-    return theirs_xml_str
+def _is_equal_to_control_doc(xml_bytes: bytes, control_xml_doc) -> bool:
+    # See check_if_modified_xml_bytes_is_equal_to_theirs_xml_control_doc() in get_prepared_theirs_bytes().
+    return etree.tostring(control_xml_doc) == etree.tostring(etree.fromstring(xml_bytes))
 
 
-def _get_paths_details(xml_doc):
+def _get_paths_details(xml_doc, compiled_paths_and_patterns, line_ranges=None):
     xml_doc_tree = etree.ElementTree(xml_doc)
     paths_info = {}
+    # The keyed sibling indexes and the namespace-map of this document, shared by all paths. See xml_paths.
+    keyed_indexes = {}
+    namespaces = xml_paths.get_namespaces(xml_doc)
     # TODO: Assure tags are unique.
-    for path_and_pattern in g_paths_and_patterns:
-        merge_strategy = path_and_pattern['merge_strategy']
-        xpath = path_and_pattern['path']
-        tag_pattern = path_and_pattern['pattern']
-        tag_objects = xml_doc.findall(xpath)
-        logger.debug(f"_get_paths_details(); xpath: {xpath}; matching tags count: {len(tag_objects)}")
-        for tag_object in tag_objects:
-            if not tag_pattern or re.match(tag_pattern, tag_object.tag):
-                full_path = xml_doc_tree.getpath(tag_object)
-                tag_name = tag_object.tag
-                value = tag_object.text
-                is_leaf = True if len(tag_object) == 0 else False
-                paths_info.update({full_path: {
-                    'merge_strategy': merge_strategy, 'tag_name': tag_name,
-                    'value': value, 'tag_object': tag_object, 'is_leaf': is_leaf}})
+    for compiled_path_and_pattern in compiled_paths_and_patterns:
+        merge_strategy = compiled_path_and_pattern['merge_strategy']
+        xpath = compiled_path_and_pattern['path']
+        # The search is attributed to the configured path, see metrics.py.
+        metrics.set_path(xpath)
+        # The tag-pattern is already applied by find_elements().
+        tag_objects_and_identities = xml_paths.find_elements(xml_doc, compiled_path_and_pattern, keyed_indexes,
+                                                             namespaces)
+        logger.debug(f"_get_paths_details(); xpath: {xpath}; matching tags count: {len(tag_objects_and_identities)}")
+        for tag_object, identity in tag_objects_and_identities:
+            # lxml's sourceline is the line the start-tag ends in, where the text begins.
+            if line_ranges is not None and not utils.is_in_line_ranges(
+                    tag_object.sourceline, tag_object.sourceline + (tag_object.text or '').count('\n'), line_ranges):
+                continue
+            # 'location' is the position-based path of the element in this document, 'full_path' identifies the
+            # element across base, ours and theirs. They differ for keyed paths only.
+            location = xml_paths.get_path(xml_doc_tree, tag_object, namespaces)
+            full_path = identity or location
+            tag_name = xml_paths.get_tag_name(tag_object.tag, namespaces)
+            value = tag_object.text
+            is_leaf = True if len(tag_object) == 0 else False
+            paths_info.update({full_path: {
+                'merge_strategy': merge_strategy, 'tag_name': tag_name,
+                'value': value, 'tag_object': tag_object, 'is_leaf': is_leaf, 'location': location,
+                'configured_path': xpath}})
     return paths_info
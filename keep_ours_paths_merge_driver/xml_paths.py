@@ -0,0 +1,360 @@
+import functools
+import logging
+import re
+
+from lxml import etree
+
+logger = logging.getLogger()
+
+
+#
+# The paths are given in ElementPath-syntax as used by findall(). ElementPath is mostly a subset of XPath, so a path
+# is compiled into an etree.XPath object once, and that object is evaluated on the three documents base, ours and
+# theirs. The only ElementPath-syntax used in the paths-config which is not XPath is the trailing slash, e.g.
+# './properties/', meaning all children. It is translated into './properties/*'.
+#
+# Paths not compilable as XPath, e.g. ElementPath's namespace-syntax '{*}version', are evaluated by findall() as
+# before.
+#
+# Namespaces:
+#
+# The documents are parsed as they are, with their namespaces. The paths are given without namespace also for
+# documents declaring a default namespace, e.g. './version' for '<project xmlns="http://maven.apache.org/POM/4.0.0">'.
+# In XPath an unprefixed name matches only elements without namespace. So the namespace-map of a document, that of
+# its root-element, is detected once, the default namespace is bound to DEFAULT_NAMESPACE_PREFIX, and the path is
+# compiled with the unprefixed names prefixed by it, e.g. './kop-default:version'. The paths are compiled once per
+# namespace-map, which is mostly the same for all documents. Prefixed names in the paths, e.g. './x:extension', refer
+# to the prefixes declared by the root-element.
+#
+# The tag-names and the locations of the elements are given without the default namespace, e.g. 'version' and
+# '/project/version', see get_tag_name() and get_path().
+#
+# Keyed paths:
+#
+# Paths selecting an element by the values of its children, e.g.
+#
+#   ./dependencies/dependency[groupId='x'][artifactId='y']/version
+#
+# are looked up in a keyed sibling index instead of evaluating the predicates on each sibling. The index is built
+# once per document for the base-path './dependencies/dependency' and the key-children ('groupId', 'artifactId'). It
+# maps the key-values, e.g. ('x', 'y'), to the matching elements. All paths sharing the base-path and key-children
+# share the index.
+#
+# The elements found by a keyed path are identified by their keys rather than by their position, e.g.
+# "/project/dependencies/dependency[groupId='x'][artifactId='y']/version" instead of
+# '/project/dependencies/dependency[5]/version'. So the same dependency is found in base, ours and theirs, even if
+# dependencies have been inserted before it.
+#
+# Streamable paths:
+#
+# Paths consisting of child-steps only, e.g. './dependencies/dependency/version', './properties/' or
+# '/project/*/version', optionally keyed, can be matched while streaming through a document, see xml_streaming. They
+# are compiled into the tuple of the names of the steps ('*' for any element). Paths using other XPath-syntax, e.g.
+# '//version', positions like 'd[2]' or attributes, are evaluated on the whole document only.
+#
+
+# base-path, one or more predicates [child='value'], and an optional rest-path.
+_KEYED_PATH_PATTERN = re.compile(
+    r'^(?P<base>[^\[\]{}]*[^\[\]{}/])'
+    r'(?P<predicates>(?:\[\s*[\w\-]+\s*=\s*(?:\'[^\']*\'|"[^"]*")\s*])+)'
+    r'(?P<rest>(?:/[^\[\]{}]*)?)$')
+_PREDICATE_PATTERN = re.compile(r'\[\s*([\w\-]+)\s*=\s*(?:\'([^\']*)\'|"([^"]*)")\s*]')
+# A name-test of a streamable step. Prefixed names aren't streamable, their namespaces are unknown.
+_STEP_NAME_PATTERN = re.compile(r'^(?:\*|[^\W\d][\w\-.]*)$')
+# An XPath-token: A string-literal, a name (optionally prefixed, or 'prefix:*'), '::', '..', '//', whitespace, or any
+# other character.
+_XPATH_TOKEN_PATTERN = re.compile(
+    r'"[^"]*"|\'[^\']*\'|[^\W\d][\w\-.]*(?::(?:[^\W\d][\w\-.]*|\*))?|::|\.\.|//|\s+|.')
+_NAMESPACE_PATTERN = re.compile(r'{([^}]*)}')
+
+# The prefix the default namespace of a document is bound to in the compiled paths.
+DEFAULT_NAMESPACE_PREFIX = 'kop-default'
+
+
+def _to_xpath(path, namespaces=None):
+    path = path + '*' if path.endswith('/') else path
+    if namespaces and DEFAULT_NAMESPACE_PREFIX in namespaces:
+        path = _prefix_names(path, DEFAULT_NAMESPACE_PREFIX)
+    return etree.XPath(path, namespaces=namespaces)
+
+
+def _prefix_names(path, prefix):
+    # E.g. "./a/b[c='x']/@d" to "./p:a/p:b[p:c='x']/@d". The names of functions, node-types, axes, operators,
+    # attributes and variables, and prefixed names are kept. A name following an operand is an operator, e.g. 'and'.
+    tokens = _XPATH_TOKEN_PATTERN.findall(path)
+    significant_indexes = [i for i, token in enumerate(tokens) if not token.isspace()]
+    follows_operand = False
+    previous_token = axis = None
+    for n, i in enumerate(significant_indexes):
+        token = tokens[i]
+        next_token = tokens[significant_indexes[n + 1]] if n + 1 < len(significant_indexes) else None
+        if token == '*':
+            # A wildcard, or a multiplication following an operand.
+            follows_operand = not follows_operand
+        elif token[0].isalpha() or token[0] == '_':
+            if follows_operand:
+                follows_operand = False
+            elif next_token == '::':
+                axis = token
+            elif next_token != '(':
+                if ':' not in token and previous_token not in ('@', '$') and axis not in ('attribute', 'namespace'):
+                    tokens[i] = f'{prefix}:{token}'
+                axis = None
+                follows_operand = True
+        else:
+            follows_operand = token[0] in '"\'0123456789.)]'
+        previous_token = token
+    return ''.join(tokens)
+
+
+@functools.lru_cache(maxsize=256)
+def _to_namespaced_xpath(path, namespaces_items):
+    # The path compiled for a namespace-map. Thread-safe, as are the evaluations of the XPath, see xml_merge_driver.
+    return _to_xpath(path, {DEFAULT_NAMESPACE_PREFIX if prefix is None else prefix: uri
+                            for prefix, uri in namespaces_items})
+
+
+def _get_xpath(xpath, path, namespaces):
+    if not namespaces:
+        return xpath
+    return _to_namespaced_xpath(path, tuple(sorted(namespaces.items(), key=lambda item: item[0] or '')))
+
+
+def get_namespaces(xml_doc) -> dict:
+    """
+    :param xml_doc: The document's root-element.
+    :return: The namespace-map of the document, as lxml's nsmap. The key of the default namespace is None.
+    """
+    return xml_doc.nsmap
+
+
+def get_tag_name(tag, namespaces):
+    """
+    :return: The tag without the default namespace, e.g. 'version' for '{http://maven.apache.org/POM/4.0.0}version'.
+        Tags in other namespaces are kept.
+    """
+    default_namespace = namespaces.get(None)
+    if default_namespace is not None and tag.startswith('{' + default_namespace + '}'):
+        return tag[len(default_namespace) + 2:]
+    return tag
+
+
+def get_path(xml_doc_tree, element, namespaces):
+    """
+    :return: The location of the element, as lxml's getpath() gives it for a document without default namespace, e.g.
+        '/project/dependencies/dependency[2]/version'. Elements in other namespaces are given with their prefix, e.g.
+        '/project/x:extension'. This is the XPath of the text-spans, see xml_text_spans.
+    """
+    prefixes = {uri: f'{prefix}:' if prefix else '' for prefix, uri in namespaces.items()}
+
+    def to_prefixed(match):
+        return prefixes.get(match.group(1), match.group())
+
+    path = '/' + _NAMESPACE_PATTERN.sub(to_prefixed, xml_doc_tree.getroot().tag)
+    # getelementpath() is relative to the root-element, with the positions among the siblings of the same tag.
+    element_path = xml_doc_tree.getelementpath(element)
+    if element_path != '.':
+        path += '/' + _NAMESPACE_PATTERN.sub(to_prefixed, element_path)
+    return path
+
+
+def compile_paths_and_patterns(paths_and_patterns):
+    """
+    Compile the paths and patterns as given by config.get_paths_and_patterns().
+
+    :return: List of dicts with the keys of paths_and_patterns, and in addition 'xpath' (the compiled path, or None if
+        the path has to be evaluated by findall()) and 'tag_regex' (the compiled pattern, or None if no pattern is
+        given).
+    """
+    compiled_paths_and_patterns = []
+    for path_and_pattern in paths_and_patterns or []:
+        path = path_and_pattern['path']
+        pattern = path_and_pattern['pattern']
+        try:
+            xpath = _to_xpath(path)
+        except etree.XPathSyntaxError:
+            logger.debug(f"compile_paths_and_patterns(); path '{path}' is not an XPath, using findall().")
+            xpath = None
+        keyed = _compile_keyed_path(path) if xpath is not None else None
+        compiled_paths_and_patterns.append({
+            'merge_strategy': path_and_pattern['merge_strategy'], 'path': path, 'pattern': pattern,
+            'xpath': xpath, 'keyed': keyed,
+            'tag_regex': re.compile(pattern) if pattern else None,
+            'streaming': _compile_streaming_path(path, keyed) if xpath is not None else None})
+    return compiled_paths_and_patterns
+
+
+def dump_compiled_paths_and_patterns(compiled_paths_and_patterns) -> list:
+    """
+    :return: The compiled paths and patterns as plain data, see config_cache. The XPath-objects are replaced by their
+        XPath-strings, and the tag_regex by its pattern.
+    """
+    dumped = []
+    for compiled_path_and_pattern in compiled_paths_and_patterns:
+        tag_regex = compiled_path_and_pattern['tag_regex']
+        compiled_path_and_pattern = dict(compiled_path_and_pattern,
+                                         xpath=_dump_xpath(compiled_path_and_pattern['xpath']),
+                                         tag_regex=tag_regex.pattern if tag_regex is not None else None)
+        keyed = compiled_path_and_pattern['keyed']
+        if keyed is not None:
+            compiled_path_and_pattern['keyed'] = dict(keyed, base_xpath=_dump_xpath(keyed['base_xpath']),
+                                                      rest_xpath=_dump_xpath(keyed['rest_xpath']))
+        dumped.append(compiled_path_and_pattern)
+    return dumped
+
+
+def load_compiled_paths_and_patterns(dumped) -> list:
+    """
+    :param dumped: As returned by dump_compiled_paths_and_patterns().
+    :return: The compiled paths and patterns as returned by compile_paths_and_patterns().
+    """
+    compiled_paths_and_patterns = []
+    for compiled_path_and_pattern in dumped:
+        tag_regex = compiled_path_and_pattern['tag_regex']
+        compiled_path_and_pattern = dict(compiled_path_and_pattern,
+                                         xpath=_load_xpath(compiled_path_and_pattern['xpath']),
+                                         tag_regex=re.compile(tag_regex) if tag_regex is not None else None)
+        keyed = compiled_path_and_pattern['keyed']
+        if keyed is not None:
+            compiled_path_and_pattern['keyed'] = dict(keyed, base_xpath=_load_xpath(keyed['base_xpath']),
+                                                      rest_xpath=_load_xpath(keyed['rest_xpath']))
+        compiled_paths_and_patterns.append(compiled_path_and_pattern)
+    return compiled_paths_and_patterns
+
+
+def _dump_xpath(xpath):
+    return None if xpath is None else xpath.path
+
+
+def _load_xpath(xpath_str):
+    # The XPath-strings have been compiled before, and without namespaces, see _to_xpath().
+    return None if xpath_str is None else etree.XPath(xpath_str)
+
+
+def _compile_steps(path):
+    # E.g. './a/*/b' to (False, ('a', '*', 'b')), '/a/b/' to (True, ('a', 'b', '*')), '.' to (False, ()).
+    if path.endswith('/'):
+        path += '*'
+    if path.startswith('//'):
+        return None
+    is_absolute = path.startswith('/')
+    steps = path[1:].split('/') if is_absolute else path.split('/')
+    if not is_absolute and steps[0] == '.':
+        steps = steps[1:]
+    if not all(_STEP_NAME_PATTERN.match(step) for step in steps):
+        return None
+    return is_absolute, tuple(steps)
+
+
+def _compile_streaming_path(path, keyed):
+    """
+    :return: A dict with 'is_absolute' (the path starts at the document, not at the root-element), 'steps' (the
+        names of the steps), and 'keyed_depth' (for keyed paths the number of steps up to the keyed element, otherwise
+        None). None if the path isn't streamable.
+    """
+    if keyed is None:
+        compiled_steps = _compile_steps(path)
+        if compiled_steps is None:
+            return None
+        is_absolute, steps = compiled_steps
+        return {'is_absolute': is_absolute, 'steps': steps, 'keyed_depth': None}
+    compiled_base_steps = _compile_steps(keyed['base'])
+    compiled_rest_steps = _compile_steps('.' + keyed['rest']) if keyed['rest'] else (False, ())
+    if compiled_base_steps is None or compiled_rest_steps is None:
+        return None
+    is_absolute, base_steps = compiled_base_steps
+    return {'is_absolute': is_absolute, 'steps': base_steps + compiled_rest_steps[1],
+            'keyed_depth': len(base_steps)}
+
+
+def _compile_keyed_path(path):
+    m = _KEYED_PATH_PATTERN.match(path)
+    if not m:
+        return None
+    predicates = _PREDICATE_PATTERN.findall(m.group('predicates'))
+    key_names = tuple(name for name, _, _ in predicates)
+    if len(set(key_names)) != len(key_names):
+        # E.g. [a='1'][a='2']. Not a key.
+        return None
+    rest = m.group('rest')
+    try:
+        return {
+            'base': m.group('base'), 'base_xpath': _to_xpath(m.group('base')),
+            'key_names': key_names,
+            'key_values': tuple(single_quoted or double_quoted for _, single_quoted, double_quoted in predicates),
+            'predicates': m.group('predicates').replace(' ', ''), 'rest': rest,
+            'rest_xpath': _to_xpath('.' + rest) if rest else None}
+    except etree.XPathSyntaxError:
+        return None
+
+
+def find_elements(xml_doc, compiled_path_and_pattern, keyed_indexes=None, namespaces=None):
+    """
+    Find the elements matching the compiled path and pattern.
+
+    :param xml_doc: The document's root-element.
+    :param compiled_path_and_pattern: An item of the result of compile_paths_and_patterns().
+    :param keyed_indexes: A dict holding the keyed sibling indexes of xml_doc. The indexes are built on demand and
+        added to the dict. Give the same dict for all paths evaluated on xml_doc. If None, no keyed index is used.
+    :param namespaces: The namespace-map of xml_doc, see get_namespaces(). Detected if None.
+    :return: A list of tuples (element, identity). The identity is the key-based path of the element for keyed
+        paths, otherwise None.
+    """
+    if namespaces is None:
+        namespaces = get_namespaces(xml_doc)
+    path = compiled_path_and_pattern['path']
+    keyed = compiled_path_and_pattern['keyed']
+    if keyed is not None and keyed_indexes is not None:
+        elements_and_identities = _find_keyed_elements(xml_doc, keyed, keyed_indexes, namespaces)
+    else:
+        xpath = compiled_path_and_pattern['xpath']
+        if xpath is None:
+            elements = xml_doc.findall(path, namespaces)
+        else:
+            elements = _only_elements(_get_xpath(xpath, path, namespaces)(xml_doc))
+        elements_and_identities = [(element, None) for element in elements]
+    tag_regex = compiled_path_and_pattern['tag_regex']
+    if tag_regex is None:
+        return elements_and_identities
+    return [(element, identity) for element, identity in elements_and_identities
+            if tag_regex.match(get_tag_name(element.tag, namespaces))]
+
+
+def _only_elements(xpath_result):
+    # An XPath may also select text, attributes, or comments. Only elements are of interest.
+    return [result for result in xpath_result if isinstance(result, etree._Element) and isinstance(result.tag, str)]
+
+
+def _find_keyed_elements(xml_doc, keyed, keyed_indexes, namespaces):
+    index_key = (keyed['base'], keyed['key_names'])
+    index = keyed_indexes.get(index_key)
+    if index is None:
+        index = {}
+        for element in _only_elements(_get_xpath(keyed['base_xpath'], keyed['base'], namespaces)(xml_doc)):
+            # [groupId='x'] compares the string-value of the (first) child groupId.
+            key_values = []
+            for key_name in keyed['key_names']:
+                key_child = element.find(key_name, namespaces)
+                key_values.append(None if key_child is None else ''.join(key_child.itertext()))
+            index.setdefault(tuple(key_values), []).append(element)
+        keyed_indexes[index_key] = index
+
+    xml_doc_tree = etree.ElementTree(xml_doc)
+    keyed_elements = index.get(keyed['key_values'], [])
+    elements_and_identities = []
+    for position, keyed_element in enumerate(keyed_elements, start=1):
+        parent = keyed_element.getparent()
+        identity = (get_path(xml_doc_tree, parent, namespaces) if parent is not None else '') \
+            + '/' + get_tag_name(keyed_element.tag, namespaces) + keyed['predicates']
+        if len(keyed_elements) > 1:
+            identity += f'[{position}]'
+        if keyed['rest_xpath'] is None:
+            elements_and_identities.append((keyed_element, identity))
+        else:
+            keyed_element_path = get_path(xml_doc_tree, keyed_element, namespaces)
+            rest_xpath = _get_xpath(keyed['rest_xpath'], '.' + keyed['rest'], namespaces)
+            for element in _only_elements(rest_xpath(keyed_element)):
+                # The path of the element relative to the keyed element, e.g. '/version'.
+                relative_path = get_path(xml_doc_tree, element, namespaces)[len(keyed_element_path):]
+                elements_and_identities.append((element, identity + relative_path))
+    return elements_and_identities
@@ -0,0 +1,253 @@
+import io
+import logging
+
+from lxml import etree
+
+from keep_ours_paths_merge_driver import budget
+from keep_ours_paths_merge_driver import utils
+
+logger = logging.getLogger()
+
+#
+# The streaming-mode for large XML-documents.
+#
+# In the in-memory-mode each document is parsed into a whole lxml-tree, and the paths are evaluated on it. The tree
+# takes a multiple of the size of the document. In the streaming-mode the document is parsed by iterparse(), and the
+# streamable paths (see xml_paths) are matched step by step while the elements are parsed. Each element is cleared
+# and removed from the tree as soon as it has been parsed, except for the key-children of keyed paths until their
+# values are known. So the tree holds only the elements currently open, and the memory needed is proportional to the
+# details of the matching elements rather than to the size of the document.
+#
+# The result is the same as of xml_merge_driver._get_paths_details() on the whole tree, but without the elements
+# themselves. Instead, each detail has the 'ordinal' of its element, the 0-based position in document-order. The
+# ordinals are used to look up the spans of the texts, see xml_text_spans.get_leaf_text_spans(), and to validate the
+# prepared document, see has_expected_texts().
+#
+# As in the in-memory-mode, the tags are matched without the default namespace of the root-element, see xml_paths.
+#
+
+
+class _Frame:
+    __slots__ = ('parent', 'tag', 'position', 'ordinal', 'sibling_counts', 'is_leaf', 'states', 'value', 'path',
+                 'key_names', 'key_values', 'is_key_child', 'keeps_subtree', 'sourceline')
+
+    def __init__(self, parent, tag, position, ordinal):
+        self.parent = parent
+        self.tag = tag
+        # 1-based position among the siblings with the same tag.
+        self.position = position
+        self.ordinal = ordinal
+        # Number of children per tag.
+        self.sibling_counts = {}
+        self.is_leaf = True
+        # Set of tuples (index of the path, number of steps matched up to this element).
+        self.states = frozenset()
+        self.value = None
+        self.path = None
+        # For the elements keyed by a path: The names of the key-children, and their values.
+        self.key_names = frozenset()
+        self.key_values = {}
+        self.is_key_child = False
+        # The subtree of a key-child is kept until the key-child has been parsed.
+        self.keeps_subtree = False
+        self.sourceline = None
+
+
+def is_streamable(compiled_paths_and_patterns) -> bool:
+    return all(compiled_path_and_pattern['streaming'] is not None
+               for compiled_path_and_pattern in compiled_paths_and_patterns)
+
+
+def _get_path(frame):
+    # As in lxml's getpath() and xml_text_spans._get_path().
+    if frame.path is None:
+        if frame.parent is None:
+            frame.path = '/' + frame.tag
+        else:
+            path_part = frame.tag
+            if frame.parent.sibling_counts[frame.tag] > 1:
+                path_part += f'[{frame.position}]'
+            frame.path = _get_path(frame.parent) + '/' + path_part
+    return frame.path
+
+
+def _remove_previous_siblings(node):
+    parent = node.getparent()
+    if parent is not None:
+        while node.getprevious() is not None:
+            del parent[0]
+
+
+def get_paths_details(xml_bytes: bytes, compiled_paths_and_patterns, line_ranges=None) -> dict:
+    """
+    Get the details of the elements matching the paths, streaming through the document.
+
+    :param xml_bytes: The XML-document.
+    :param compiled_paths_and_patterns: As returned by xml_paths.compile_paths_and_patterns(). All paths have to be
+        streamable, see is_streamable().
+    :param line_ranges: If given, only the elements within these lines are considered. Sorted list of tuples of the
+        lines [begin, end), see merge.get_line_ranges().
+    :return: The paths-details as returned by xml_merge_driver._get_paths_details(), but with 'ordinal' instead of
+        'tag_object'.
+    """
+    streaming_paths = [compiled_path_and_pattern['streaming'] for compiled_path_and_pattern in
+                       compiled_paths_and_patterns]
+    # Per path the frames of the matching elements, and for keyed paths the frames of the keyed elements whose
+    # key-values match, in document-order.
+    matching_frames = [[] for _ in streaming_paths]
+    keyed_frames = [[] for _ in streaming_paths]
+    default_namespace = None
+    stack = []
+    elements_count = 0
+
+    for event, node in etree.iterparse(io.BytesIO(xml_bytes), events=('start-ns', 'start', 'end', 'comment', 'pi')):
+        if event == 'start-ns':
+            prefix, uri = node
+            if not prefix and not stack:
+                default_namespace = '{' + uri + '}'
+            continue
+
+        parent = stack[-1] if stack else None
+        if event in ('comment', 'pi'):
+            # Comments and processing-instructions are children in lxml. So the element isn't a leaf anymore.
+            if parent is None:
+                if stack:
+                    _remove_previous_siblings(node)
+            else:
+                parent.is_leaf = False
+                if not parent.keeps_subtree:
+                    _remove_previous_siblings(node)
+            continue
+
+        if event == 'start':
+            elements_count += 1
+            if not elements_count % 4096:
+                budget.check()
+            if stack and parent is None:
+                # Within an element not on the way to a matching element.
+                stack.append(None)
+                _remove_previous_siblings(node)
+                continue
+            tag = node.tag
+            if default_namespace is not None and tag.startswith(default_namespace):
+                tag = tag[len(default_namespace):]
+            if not stack:
+                frame = _Frame(None, tag, 1, elements_count - 1)
+                # Relative paths start at the root-element, absolute paths at the document.
+                frame.states = frozenset(
+                    [(i, 0) for i, streaming_path in enumerate(streaming_paths) if not streaming_path['is_absolute']]
+                    + [(i, 1) for i, streaming_path in enumerate(streaming_paths)
+                       if streaming_path['is_absolute'] and streaming_path['steps'][:1] in [(tag,), ('*',)]])
+            else:
+                parent.is_leaf = False
+                position = parent.sibling_counts.get(tag, 0) + 1
+                parent.sibling_counts[tag] = position
+                states = frozenset(
+                    (i, matched_steps_count + 1) for i, matched_steps_count in parent.states
+                    if matched_steps_count < len(streaming_paths[i]['steps'])
+                    and streaming_paths[i]['steps'][matched_steps_count] in (tag, '*'))
+                # The key-child is the first child of the keyed element with the key's name.
+                is_key_child = tag in parent.key_names and tag not in parent.key_values
+                if not parent.keeps_subtree:
+                    _remove_previous_siblings(node)
+                    if not states and not is_key_child:
+                        stack.append(None)
+                        continue
+                frame = _Frame(parent, tag, position, elements_count - 1)
+                frame.states = states
+                if is_key_child:
+                    parent.key_values[tag] = None
+                    frame.is_key_child = True
+                frame.keeps_subtree = parent.keeps_subtree or is_key_child
+            frame.sourceline = node.sourceline
+            frame.key_names = frozenset(
+                key_name for i, matched_steps_count in frame.states
+                if matched_steps_count == streaming_paths[i]['keyed_depth']
+                for key_name in compiled_paths_and_patterns[i]['keyed']['key_names'])
+            stack.append(frame)
+            continue
+
+        # The end-event. The element is complete.
+        frame = stack.pop()
+        if frame is None:
+            node.clear(keep_tail=True)
+            continue
+        if frame.is_key_child:
+            # [groupId='x'] compares the string-value of the (first) child groupId.
+            frame.parent.key_values[frame.tag] = ''.join(node.itertext())
+        for i, matched_steps_count in frame.states:
+            streaming_path = streaming_paths[i]
+            if matched_steps_count == len(streaming_path['steps']):
+                tag_regex = compiled_paths_and_patterns[i]['tag_regex']
+                if tag_regex is None or tag_regex.match(frame.tag):
+                    frame.value = node.text
+                    matching_frames[i].append(frame)
+            if matched_steps_count == streaming_path['keyed_depth']:
+                keyed = compiled_paths_and_patterns[i]['keyed']
+                if tuple(frame.key_values.get(key_name) for key_name in keyed['key_names']) == keyed['key_values']:
+                    keyed_frames[i].append(frame)
+        if not frame.keeps_subtree or frame.is_key_child:
+            node.clear(keep_tail=True)
+
+    paths_details = {}
+    for i, compiled_path_and_pattern in enumerate(compiled_paths_and_patterns):
+        merge_strategy = compiled_path_and_pattern['merge_strategy']
+        streaming_path = streaming_paths[i]
+        keyed_positions = {frame: position for position, frame in enumerate(keyed_frames[i], start=1)}
+        logger.debug(f"get_paths_details(); xpath: {compiled_path_and_pattern['path']};"
+                     + f" matching tags count: {len(matching_frames[i])}")
+        for frame in matching_frames[i]:
+            if line_ranges is not None and not utils.is_in_line_ranges(
+                    frame.sourceline, frame.sourceline + (frame.value or '').count('\n'), line_ranges):
+                continue
+            location = _get_path(frame)
+            full_path = location
+            if streaming_path['keyed_depth'] is not None:
+                # The identity of the element as built by xml_paths._find_keyed_elements().
+                keyed_frame = frame
+                for _ in range(len(streaming_path['steps']) - streaming_path['keyed_depth']):
+                    keyed_frame = keyed_frame.parent
+                position = keyed_positions.get(keyed_frame)
+                if position is None:
+                    continue
+                full_path = (_get_path(keyed_frame.parent) if keyed_frame.parent is not None else '') \
+                    + '/' + keyed_frame.tag + compiled_path_and_pattern['keyed']['predicates']
+                if len(keyed_positions) > 1:
+                    full_path += f'[{position}]'
+                full_path += location[len(_get_path(keyed_frame)):]
+            paths_details.update({full_path: {
+                'merge_strategy': merge_strategy, 'tag_name': frame.tag,
+                'value': frame.value, 'ordinal': frame.ordinal, 'is_leaf': frame.is_leaf, 'location': location,
+                'configured_path': compiled_path_and_pattern['path']}})
+    return paths_details
+
+
+def has_expected_texts(xml_bytes: bytes, expected_texts: dict) -> bool:
+    """
+    Validate a prepared document by streaming through it.
+
+    The prepared document differs from theirs only in the replaced spans of the texts, see
+    xml_text_spans.get_leaf_text_spans(). So instead of comparing it with a control-document as in the in-memory-mode,
+    it is checked that it is well-formed, and that the elements replaced are leaf-elements having the expected texts.
+    Markup brought in by a replacement, e.g. by an entity defined differently, would add children to or change the
+    text of the element replaced.
+
+    :param expected_texts: Dict of the ordinals of the elements replaced to their expected texts.
+    """
+    elements_count = 0
+    ordinals = []
+    try:
+        for event, node in etree.iterparse(io.BytesIO(xml_bytes), events=('start', 'end')):
+            if event == 'start':
+                ordinals.append(elements_count)
+                elements_count += 1
+                continue
+            ordinal = ordinals.pop()
+            if ordinal in expected_texts and (len(node) or node.text != expected_texts[ordinal]):
+                return False
+            node.clear(keep_tail=True)
+            _remove_previous_siblings(node)
+    except etree.XMLSyntaxError as e:
+        logger.debug(f"has_expected_texts(); {e}")
+        return False
+    return True
@@ -0,0 +1,165 @@
+import codecs
+import re
+import xml.parsers.expat
+
+
+#
+# The byte-span index maps the XPath of each leaf-element to the location of its text in the XML-document.
+#
+# The XPaths are built the same way as xml_paths.get_path() builds them, without the default namespace:
+# '/project/properties/revision', or with a 1-based index in case of multiple siblings having the same tag, e.g.
+# '/project/dependencies/dependency[2]/version'.
+#
+# A span is a tuple (start, end) of byte-offsets into the XML-document as it is, in the encoding it declares. The text
+# of an element is located between the end of its start-tag and the start of its end-tag, e.g. for
+# '<version>1.0</version>' the span covers '1.0'. An empty element '<version></version>' has a span of length 0.
+# Empty-element-tags like '<version/>' have no span, because there is no place to put text into without rewriting the
+# tag.
+#
+# Only leaf-elements get a span. An element containing child-elements, comments or processing-instructions is not a
+# leaf (this is the same as lxml's len(element) == 0).
+#
+# For large documents the spans of only some elements can be requested by their ordinals, the 0-based positions of the
+# elements in document-order. Then the index doesn't grow with the document. See xml_streaming.
+#
+
+# The encoding-declaration is part of the XML-declaration at the very beginning of the document, e.g.
+# '<?xml version="1.0" encoding="ISO-8859-1"?>'.
+ENCODING_DECLARATION_MAX_LENGTH = 200
+_ENCODING_DECLARATION_PATTERN = re.compile(rb'<\?xml[^>]*?\sencoding\s*=\s*["\']([A-Za-z][\w.\-]*)["\']')
+
+
+class _Element:
+    __slots__ = ('parent', 'tag', 'position', 'start_tag_index', 'text_start', 'text_end', 'is_leaf',
+                 'sibling_counts', 'path', 'ordinal')
+
+    def __init__(self, parent, tag, position, start_tag_index, ordinal):
+        self.parent = parent
+        self.tag = tag
+        # 1-based position among the siblings with the same tag.
+        self.position = position
+        self.start_tag_index = start_tag_index
+        self.text_start = None
+        self.text_end = None
+        self.is_leaf = True
+        # Number of children per tag.
+        self.sibling_counts = {}
+        self.path = None
+        self.ordinal = ordinal
+
+
+def _get_path(element):
+    if element.path is None:
+        if element.parent is None:
+            element.path = '/' + element.tag
+        else:
+            path_part = element.tag
+            if element.parent.sibling_counts[element.tag] > 1:
+                path_part += f'[{element.position}]'
+            element.path = _get_path(element.parent) + '/' + path_part
+    return element.path
+
+
+def get_encoding(xml_bytes: bytes) -> str:
+    """
+    Get the encoding of the XML-document by its byte-order-mark or its encoding-declaration, as the XML-parsers do.
+
+    :return: The name of the Python-codec. For UTF-16 the byte-order is part of the name, e.g. 'utf-16-le'. So
+        decoding and encoding the document keeps its byte-order-mark, and parts of it can be decoded as well.
+        Defaults to 'utf-8'.
+    """
+    if xml_bytes.startswith((codecs.BOM_UTF16_LE, b'<\0')):
+        return 'utf-16-le'
+    if xml_bytes.startswith((codecs.BOM_UTF16_BE, b'\0<')):
+        return 'utf-16-be'
+    start = len(codecs.BOM_UTF8) if xml_bytes.startswith(codecs.BOM_UTF8) else 0
+    m = _ENCODING_DECLARATION_PATTERN.match(xml_bytes, start, start + ENCODING_DECLARATION_MAX_LENGTH)
+    if m:
+        try:
+            return codecs.lookup(m.group(1).decode('ascii')).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+
+def get_leaf_text_spans(xml_bytes: bytes, ordinals=None) -> dict:
+    """
+    Get the spans of the texts of all leaf-elements.
+
+    :param xml_bytes: The XML-document in the encoding it declares.
+    :param ordinals: If given, a set of ordinals of the elements to get the spans of.
+    :return: A dict of XPath to span (start, end), or of ordinal to span if ordinals are given. The offsets are
+        byte-offsets into xml_bytes.
+    """
+    # Expat decodes the document as declared, and reports the byte-offsets into the document as it is.
+    encoding = get_encoding(xml_bytes)
+    parser = xml.parsers.expat.ParserCreate()
+    leaf_elements = []
+    stack = []
+    elements_count = 0
+
+    def start_element(tag, _attributes):
+        nonlocal elements_count
+        parent = stack[-1] if stack else None
+        position = 1
+        if parent is not None:
+            parent.is_leaf = False
+            position = parent.sibling_counts.get(tag, 0) + 1
+            parent.sibling_counts[tag] = position
+        stack.append(_Element(parent, tag, position, parser.CurrentByteIndex, elements_count))
+        elements_count += 1
+
+    def end_element(_tag):
+        element = stack.pop()
+        if not element.is_leaf or (ordinals is not None and element.ordinal not in ordinals):
+            return
+        end_index = parser.CurrentByteIndex
+        if element.text_start is None:
+            # No text. Distinguish '<a></a>' from '<a/>'. For the empty-element-tag Expat reports the end-index
+            # behind the '/>'.
+            if _is_empty_element_tag(xml_bytes[element.start_tag_index:end_index].decode(encoding)):
+                return
+            element.text_start = end_index
+        element.text_end = end_index
+        leaf_elements.append(element)
+
+    def text_content(_data=None):
+        # The first text- or CDATA-event marks the begin of the text. Subsequent events are part of the same text
+        # as long as no child-element occurs.
+        element = stack[-1] if stack else None
+        if element is not None and element.text_start is None:
+            element.text_start = parser.CurrentByteIndex
+
+    def non_text_content(*_args):
+        # Comments and processing-instructions are children in lxml. So the element isn't a leaf anymore.
+        if stack:
+            stack[-1].is_leaf = False
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = text_content
+    parser.StartCdataSectionHandler = text_content
+    parser.CommentHandler = non_text_content
+    parser.ProcessingInstructionHandler = non_text_content
+    parser.Parse(xml_bytes, True)
+
+    if ordinals is not None:
+        return {element.ordinal: (element.text_start, element.text_end) for element in leaf_elements}
+    return {_get_path(element): (element.text_start, element.text_end) for element in leaf_elements}
+
+
+def _is_empty_element_tag(tag_str):
+    # The tag_str is either the start-tag, e.g. '<a x="1">', or an empty-element-tag, e.g. '<a x="1"/>'.
+    # Search the '>' closing the tag. Attribute-values may contain '>' and '/>', so skip quoted parts.
+    if not tag_str.endswith('/>'):
+        return False
+    quote = None
+    for i, c in enumerate(tag_str):
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif c in '"\'':
+            quote = c
+        elif c == '>':
+            return i == len(tag_str) - 1
+    return False
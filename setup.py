@@ -18,6 +18,7 @@ setup(
     packages=['keep_ours_paths_merge_driver'],
     install_requires=install_requires,
     entry_points={
-        'console_scripts': ['keep_ours_paths_merge_driver=keep_ours_paths_merge_driver.__main__:main'],
+        'console_scripts': ['keep_ours_paths_merge_driver=keep_ours_paths_merge_driver.__main__:main',
+                            'git-merge-kop=keep_ours_paths_merge_driver.strategy:main'],
     },
 )
@@ -0,0 +1,71 @@
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+class TestBatch(unittest.TestCase):
+    abs_project_root_path = os.getcwd()
+    resources_path = pathlib.Path(abs_project_root_path, 'tests', 'integration', 'resources', 'test_xml')
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        for file_name in ['pom_03_base.xml', 'pom_03_ours.xml', 'pom_03_theirs.xml']:
+            shutil.copy(pathlib.Path(self.resources_path, file_name), self.temp_dir.name)
+        self.env = dict(os.environ, PYTHONPATH=str(self.abs_project_root_path))
+        self.env.pop('KOP_MERGE_DRVIER_PATHSPATTERNS', None)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def run_batch(self, args, manifest_str):
+        return subprocess.run(
+            [sys.executable, '-m', 'keep_ours_paths_merge_driver', 'batch', '-', '-j', '2',
+             '-p', './version', './properties/:(some-app1|some-app2)[.]version'] + args,
+            input=manifest_str, env=self.env, cwd=self.temp_dir.name, stdout=subprocess.PIPE, text=True)
+
+    def assert_merged(self, output_file_name):
+        with open(pathlib.Path(self.resources_path, 'pom_03_expected_merged.xml')) as f:
+            expected_merged_str = f.read()
+        with open(pathlib.Path(self.temp_dir.name, output_file_name)) as f:
+            self.assertEqual(expected_merged_str, f.read())
+
+    def test_batch_jsonl_manifest(self):
+        manifest_str = '\n'.join(json.dumps(entry) for entry in [
+            {'base': 'pom_03_base.xml', 'ours': 'pom_03_ours.xml', 'theirs': 'pom_03_theirs.xml',
+             'output': 'merged_1.xml'},
+            {'base': 'missing.xml', 'ours': 'pom_03_ours.xml', 'theirs': 'pom_03_theirs.xml',
+             'output': 'merged_2.xml'},
+            {'base': 'pom_03_base.xml', 'ours': 'pom_03_ours.xml', 'theirs': 'pom_03_theirs.xml',
+             'output': 'merged_3.xml'}])
+        for executor in ['process', 'thread']:
+            for merge_file in ['git', 'builtin']:
+                with self.subTest(executor=executor, merge_file=merge_file):
+                    completed_process = self.run_batch(['--executor', executor, '-m', merge_file], manifest_str)
+
+                    self.assertEqual(2, completed_process.returncode)
+                    results = [json.loads(line) for line in completed_process.stdout.splitlines()]
+                    self.assertEqual(['merged_1.xml', 'merged_2.xml', 'merged_3.xml'],
+                                     [result['output'] for result in results])
+                    self.assertEqual([0, -1, 0], [result['exit_status'] for result in results])
+                    self.assertIn('FileNotFoundError', results[1]['error'])
+                    self.assert_merged('merged_1.xml')
+                    self.assert_merged('merged_3.xml')
+
+    def test_batch_nul_manifest_output_defaults_to_ours(self):
+        manifest_str = 'pom_03_base.xml\0pom_03_ours.xml\0pom_03_theirs.xml\0\0'
+
+        completed_process = self.run_batch(['--manifest-format', 'nul'], manifest_str)
+
+        self.assertEqual(0, completed_process.returncode)
+        self.assertEqual({'ours': 'pom_03_ours.xml', 'output': 'pom_03_ours.xml', 'exit_status': 0},
+                         {k: v for k, v in json.loads(completed_process.stdout).items() if k != 'seconds'})
+        self.assert_merged('pom_03_ours.xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
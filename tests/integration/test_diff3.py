@@ -0,0 +1,67 @@
+import os
+import random
+import subprocess
+import tempfile
+import unittest
+
+from keep_ours_paths_merge_driver import diff3
+
+
+class TestDiff3(unittest.TestCase):
+    """
+    Compare the builtin merge with git merge-file on generated files.
+    """
+
+    LINES = ['a\n', 'b\n', 'c\n', '{\n', '}\n', '\n', '  <version>1.0</version>\n', 'foo\n', 'bar\n', 'a\r\n']
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def change(self, lines, rnd):
+        lines = list(lines)
+        for _ in range(rnd.randint(0, 6)):
+            operation = rnd.random()
+            if operation < 0.3 and lines:
+                del lines[rnd.randrange(len(lines))]
+            elif operation < 0.6:
+                lines.insert(rnd.randint(0, len(lines)), rnd.choice(self.LINES))
+            elif lines:
+                lines[rnd.randrange(len(lines))] = rnd.choice(self.LINES)
+        # Sometimes without the final line-ending.
+        if lines and rnd.random() < 0.1:
+            lines[-1] = lines[-1].rstrip('\r\n') or 'x'
+        return ''.join(lines)
+
+    def git_merge_file(self, base_str, ours_str, theirs_str, conflict_style):
+        filepaths = []
+        for name, file_str in [('ours', ours_str), ('base', base_str), ('theirs', theirs_str)]:
+            filepath = os.path.join(self.temp_dir.name, name)
+            with open(filepath, mode='w', newline='') as f:
+                f.write(file_str)
+            filepaths.append(filepath)
+        style_args = ['--diff3'] if conflict_style == diff3.CONFLICT_STYLE_DIFF3 else []
+        completed_process = subprocess.run(
+            ['git', 'merge-file', '-p'] + style_args + ['-L', 'ours', '-L', 'base', '-L', 'theirs'] + filepaths,
+            stdout=subprocess.PIPE)
+        return completed_process.stdout.decode(), completed_process.returncode
+
+    def test_same_result_as_git_merge_file(self):
+        for seed in range(200):
+            rnd = random.Random(seed)
+            base_lines = [rnd.choice(self.LINES) for _ in range(rnd.randint(0, 30))]
+            base_str = ''.join(base_lines)
+            ours_str = self.change(base_lines, rnd)
+            theirs_str = self.change(base_lines, rnd)
+            for conflict_style in diff3.CONFLICT_STYLES:
+                with self.subTest(seed=seed, conflict_style=conflict_style):
+                    merged_str, conflicts_count = diff3.merge(base_str, ours_str, theirs_str,
+                                                              conflict_style=conflict_style)
+                    self.assertEqual(self.git_merge_file(base_str, ours_str, theirs_str, conflict_style),
+                                     (merged_str, min(conflicts_count, diff3.MAX_EXIT_CODE)))
+
+
+if __name__ == '__main__':
+    unittest.main()
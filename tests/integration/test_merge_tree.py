@@ -0,0 +1,74 @@
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from keep_ours_paths_merge_driver import config
+from keep_ours_paths_merge_driver import merge
+
+
+class TestMergeTree(unittest.TestCase):
+    abs_project_root_path = os.getcwd()
+    resources_path = pathlib.Path(abs_project_root_path, 'tests', 'integration', 'resources', 'test_xml')
+    paths_and_patterns_args = ['-p', './version', './properties/:(some-app1|some-app2)[.]version']
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.env = dict(os.environ, PYTHONPATH=str(self.abs_project_root_path))
+        self.env.pop('KOP_MERGE_DRVIER_PATHSPATTERNS', None)
+        # Create the branches in a repository with worktree, and clone it bare.
+        worktree_path = pathlib.Path(self.temp_dir.name, 'worktree')
+        self.git(['init', str(worktree_path)])
+        for branch, file_name in [('base', 'pom_03_base.xml'), ('theirs', 'pom_03_theirs.xml'),
+                                  ('ours', 'pom_03_ours.xml')]:
+            if branch != 'base':
+                self.git(['checkout', '-b', branch, 'base'], cwd=worktree_path)
+            shutil.copyfile(pathlib.Path(self.resources_path, file_name), pathlib.Path(worktree_path, 'pom.xml'))
+            self.git(['add', 'pom.xml'], cwd=worktree_path)
+            self.git(['-c', 'user.name=test', '-c', 'user.email=test@localhost', 'commit', '-m', branch],
+                     cwd=worktree_path)
+            if branch == 'base':
+                self.git(['branch', 'base'], cwd=worktree_path)
+        self.bare_path = pathlib.Path(self.temp_dir.name, 'bare.git')
+        self.git(['clone', '--bare', str(worktree_path), str(self.bare_path)])
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def git(self, args, cwd=None):
+        return subprocess.run(['git'] + args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              check=True).stdout.decode()
+
+    def run_merge_tree(self, args):
+        return subprocess.run([sys.executable, '-m', 'keep_ours_paths_merge_driver', 'merge-tree',
+                               '-C', str(self.bare_path)] + args, env=self.env, stdout=subprocess.PIPE, text=True)
+
+    def test_prepared_theirs_blobs(self):
+        completed_process = self.run_merge_tree(['base', 'ours', 'theirs', 'pom.xml', 'missing.xml']
+                                                + self.paths_and_patterns_args)
+
+        self.assertEqual(0, completed_process.returncode)
+        oid, path = completed_process.stdout.strip().split('\t')
+        self.assertEqual('pom.xml', path)
+        file_strs = [merge.read_file(pathlib.Path(self.resources_path, f'pom_03_{name}.xml'))
+                     for name in ['base', 'ours', 'theirs']]
+        merge_driver = merge.get_merge_driver('XML')
+        merge_driver.set_paths_and_patterns(config.get_paths_and_patterns(None, self.paths_and_patterns_args[1:]))
+        self.assertEqual(merge_driver.get_prepared_theirs_str(*file_strs),
+                         self.git(['cat-file', 'blob', oid], cwd=self.bare_path))
+
+    def test_write_tree(self):
+        completed_process = self.run_merge_tree(['--write-tree', 'base', 'ours', 'theirs', 'pom.xml']
+                                                + self.paths_and_patterns_args)
+
+        self.assertEqual(0, completed_process.returncode)
+        tree = completed_process.stdout.splitlines()[0]
+        self.assertEqual(merge.read_file(pathlib.Path(self.resources_path, 'pom_03_expected_merged.xml')),
+                         self.git(['cat-file', 'blob', f'{tree}:pom.xml'], cwd=self.bare_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
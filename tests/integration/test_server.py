@@ -0,0 +1,155 @@
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from keep_ours_paths_merge_driver import client
+
+
+class TestServer(unittest.TestCase):
+    abs_project_root_path = os.getcwd()
+    unit_resources_path = pathlib.Path(abs_project_root_path, 'tests', 'unit', 'resources')
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.temp_dir.name, 'kop.sock')
+        self.env = dict(os.environ, PYTHONPATH=str(self.abs_project_root_path),
+                        KOP_MERGE_DRIVER_SOCKET=self.socket_path)
+        self.env.pop('KOP_MERGE_DRVIER_PATHSPATTERNS', None)
+        self.server_process = None
+
+    def tearDown(self) -> None:
+        if self.server_process is not None and self.server_process.poll() is None:
+            self.server_process.terminate()
+            self.server_process.wait()
+        self.temp_dir.cleanup()
+
+    def start_server(self, idle_timeout):
+        self.server_process = subprocess.Popen(
+            [sys.executable, '-m', 'keep_ours_paths_merge_driver', 'serve', '--idle-timeout', str(idle_timeout)],
+            env=self.env, stderr=subprocess.DEVNULL)
+        for _ in range(100):
+            if os.path.exists(self.socket_path):
+                return
+            time.sleep(0.05)
+        self.fail('The server has not created its socket.')
+
+    def copy_resources(self, file_names):
+        for file_name in file_names:
+            shutil.copy(pathlib.Path(self.unit_resources_path, file_name), self.temp_dir.name)
+
+    def run_merge_driver(self, args):
+        return subprocess.run([sys.executable, '-m', 'keep_ours_paths_merge_driver'] + args, env=self.env,
+                              cwd=self.temp_dir.name, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    def test_merge_driver_call_is_served(self):
+        self.copy_resources(['pom_01_base.xml', 'pom_01_ours.xml', 'pom_01_theirs.xml'])
+        self.start_server(idle_timeout=30)
+
+        completed_process = self.run_merge_driver(
+            ['-O', 'pom_01_base.xml', '-A', 'pom_01_ours.xml', '-B', 'pom_01_theirs.xml', '-p', './version',
+             '-l', 'DEBUG'])
+
+        # The client writes the server's log-records to its stderr.
+        self.assertIn("paths_and_patterns: [{'merge_strategy': 'onconflict-ours', 'path': './version'",
+                      completed_process.stderr)
+        self.assertNotIn('forward(); server', completed_process.stderr)
+        with open(pathlib.Path(self.unit_resources_path, 'pom_01_theirs_expected_replace_only_no_merge.xml')) as f:
+            prepared_theirs_str_expected = f.read()
+        with open(pathlib.Path(self.temp_dir.name, 'pom_01_theirs.xml')) as f:
+            self.assertEqual(prepared_theirs_str_expected, f.read())
+
+    def test_merge_driver_calls_are_served_concurrently(self):
+        self.start_server(idle_timeout=30)
+        args_by_name = {
+            'pom_01': ['-p', './version'],
+            'pom_02': ['-p', './version', './properties/:some-app.+'],
+        }
+
+        # Many calls at once, with different paths-configs and log-levels, each on its own files.
+        processes = []
+        for i in range(8):
+            for name, paths_args in args_by_name.items():
+                call_dir = pathlib.Path(self.temp_dir.name, f'{name}_{i}')
+                call_dir.mkdir()
+                for file_name in [f'{name}_base.xml', f'{name}_ours.xml', f'{name}_theirs.xml']:
+                    shutil.copy(pathlib.Path(self.unit_resources_path, file_name), call_dir)
+                processes.append((name, i % 2 == 1, subprocess.Popen(
+                    [sys.executable, '-m', 'keep_ours_paths_merge_driver', '-O', f'{name}_base.xml',
+                     '-A', f'{name}_ours.xml', '-B', f'{name}_theirs.xml', '-l', 'DEBUG' if i % 2 else 'WARNING']
+                    + paths_args,
+                    env=self.env, cwd=call_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True),
+                    call_dir))
+        for name, is_debug, process, call_dir in processes:
+            _, stderr = process.communicate(timeout=60)
+            with open(pathlib.Path(self.unit_resources_path, f'{name}_theirs_expected_replace_only_no_merge.xml')) as f:
+                prepared_theirs_str_expected = f.read()
+            with open(pathlib.Path(call_dir, f'{name}_theirs.xml')) as f:
+                self.assertEqual(prepared_theirs_str_expected, f.read())
+            self.assertNotIn('forward(); server', stderr)
+            # The log-records of a call are its own, at its log-level.
+            self.assertEqual(1 if is_debug else 0, stderr.count('paths_and_patterns: '))
+            self.assertEqual(is_debug and name == 'pom_02', './properties/' in stderr)
+
+    def test_whole_merge_driver_call_is_served(self):
+        self.copy_resources(['pom_01_base.xml', 'pom_01_ours.xml', 'pom_01_theirs.xml'])
+        self.start_server(idle_timeout=30)
+
+        completed_process = self.run_merge_driver(
+            ['-O', 'pom_01_base.xml', '-A', 'pom_01_ours.xml', '-B', 'pom_01_theirs.xml', '-p', './version'])
+
+        # The client has forwarded the call before parsing it, and has run git merge-file.
+        self.assertEqual(0, completed_process.returncode)
+        self.assertIn('Merge-driver triggered', completed_process.stderr)
+        self.assertEqual(1, completed_process.stderr.count('Merge-driver triggered'))
+
+    def test_declined_merge_driver_call_is_served(self):
+        self.copy_resources(['pom_01_base.xml', 'pom_01_ours.xml', 'pom_01_theirs.xml'])
+        self.start_server(idle_timeout=30)
+
+        # The client writes the prepared theirs to its stdout. So the server prepares the theirs-file only.
+        completed_process = self.run_merge_driver(
+            ['-O', 'pom_01_base.xml', '-A', 'pom_01_ours.xml', '-B', 'pom_01_theirs.xml', '-p', './version',
+             '--stdout', '-l', 'DEBUG'])
+
+        self.assertIn('paths_and_patterns: ', completed_process.stderr)
+        self.assertNotIn('forward(); server', completed_process.stderr)
+        with open(pathlib.Path(self.unit_resources_path, 'pom_01_theirs_expected_replace_only_no_merge.xml')) as f:
+            self.assertEqual(f.read(), completed_process.stdout)
+
+    def test_merge_driver_call_falls_back_to_in_process_on_server_error(self):
+        self.copy_resources(['pom_01_base.xml', 'pom_01_ours.xml', 'pom_01_theirs.xml'])
+        self.start_server(idle_timeout=30)
+        # The server can't read the base-file, because it doesn't exist. So the client falls back to in-process, which
+        # fails the same way.
+        completed_process = self.run_merge_driver(
+            ['-O', 'missing_base.xml', '-A', 'pom_01_ours.xml', '-B', 'pom_01_theirs.xml', '-p', './version',
+             '-l', 'DEBUG'])
+
+        self.assertIn('forward(); server failed: FileNotFoundError', completed_process.stderr)
+        self.assertNotEqual(0, completed_process.returncode)
+        # The server is still serving.
+        self.assertIsNone(self.server_process.poll())
+
+    def test_forward_without_server(self):
+        os.environ['KOP_MERGE_DRIVER_SOCKET'] = self.socket_path
+        try:
+            self.assertIsNone(client.forward(['-O', 'b', '-A', 'o', '-B', 't'], None))
+        finally:
+            del os.environ['KOP_MERGE_DRIVER_SOCKET']
+
+    def test_idle_timeout(self):
+        self.start_server(idle_timeout=0.5)
+
+        self.server_process.wait(timeout=10)
+
+        self.assertEqual(0, self.server_process.returncode)
+        self.assertFalse(os.path.exists(self.socket_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
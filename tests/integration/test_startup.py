@@ -0,0 +1,123 @@
+import json
+import os
+import pathlib
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+
+class TestStartup(unittest.TestCase):
+    """
+    Git starts the merge-driver once per file to merge. These tests check the modules a call to the merge-driver
+    imports the way 'python -X importtime' reports them, against resources/test_startup/imported_modules.json:
+
+      - The modules of the merge-driver imported by a call of the file-type, exactly.
+      - The modules a call must not import, e.g. modules the merge-driver imports only in other modes.
+
+    The set of modules doesn't depend on the load of the machine as the import-time does. The import-times are printed
+    for information, see 'pytest -s'. The import-time is the sum of the cumulative times of the top-level imports,
+    without the imports done by the interpreter's startup (site, encodings, ...).
+    """
+    abs_project_root_path = os.getcwd()
+    resources_path = pathlib.Path(abs_project_root_path, 'tests', 'integration', 'resources', 'test_startup')
+    # 'import time: <self [us]> | <cumulative [us]> | <module>'. Nested imports have their module indented.
+    IMPORT_TIME_LINE_PATTERN = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$')
+    PACKAGE_NAME = 'keep_ours_paths_merge_driver'
+
+    def setUp(self) -> None:
+        with open(pathlib.Path(self.resources_path, 'imported_modules.json')) as f:
+            self.imported_modules = json.load(f)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.env = dict(os.environ, PYTHONPATH=str(self.abs_project_root_path))
+        self.env.pop('KOP_MERGE_DRVIER_PATHSPATTERNS', None)
+        self.env.pop('KOP_MERGE_DRIVER_SOCKET', None)
+        self.env.pop('XDG_RUNTIME_DIR', None)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def get_imports(self, args) -> tuple:
+        """
+        :return: Tuple of a dict of the top-level modules imported by the call and their cumulative import-time in us,
+            and the set of all modules imported by the call.
+        """
+        completed_process = subprocess.run([sys.executable, '-X', 'importtime'] + args, env=self.env,
+                                           cwd=self.temp_dir.name, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                           text=True)
+        top_level_imports = {}
+        modules = set()
+        for line in completed_process.stderr.splitlines():
+            m = self.IMPORT_TIME_LINE_PATTERN.match(line)
+            if m:
+                modules.add(m.group(3))
+                if not m.group(2):
+                    top_level_imports[m.group(3)] = int(m.group(1))
+        return top_level_imports, modules
+
+    def get_merge_driver_modules(self, file_type, file_content) -> set:
+        for name in ['base', 'ours', 'theirs']:
+            with open(pathlib.Path(self.temp_dir.name, name), 'w') as f:
+                f.write(file_content)
+        interpreter_imports, _ = self.get_imports(['-c', 'pass'])
+        top_level_imports, modules = self.get_imports(
+            ['-m', self.PACKAGE_NAME, '-t', file_type, '-O', 'base', '-A', 'ours', '-B', 'theirs',
+             '-p', 'version' if file_type == 'JSON' else './version'])
+        import_time = sum(t for module, t in top_level_imports.items() if module not in interpreter_imports)
+        print(f"{file_type}: import-time [us]: {import_time}")
+        return modules
+
+    def assert_modules(self, expected_package_modules, modules):
+        self.assertEqual(sorted(expected_package_modules),
+                         sorted(module for module in modules if module.split('.')[0] == self.PACKAGE_NAME))
+        self.assertEqual([], sorted(module for module in modules
+                                    if any(module == not_imported or module.startswith(not_imported + '.')
+                                           for not_imported in self.imported_modules['not_imported'])))
+
+    def test_xml_imported_modules(self):
+        modules = self.get_merge_driver_modules('XML', '<project><version>1.0</version></project>\n')
+        self.assert_modules(self.imported_modules['XML'], modules)
+        self.assertIn('lxml', modules)
+
+    def test_json_imported_modules(self):
+        modules = self.get_merge_driver_modules('JSON', '{\n  "version": "1.0"\n}\n')
+        self.assert_modules(self.imported_modules['JSON'], modules)
+        self.assertNotIn('lxml', modules)
+
+    def test_forwarded_imported_modules(self):
+        # A server responding to one call, see server.py.
+        socket_path = os.path.join(self.temp_dir.name, 'kop.sock')
+        self.env['KOP_MERGE_DRIVER_SOCKET'] = socket_path
+        requests = []
+
+        def serve_once(server_socket):
+            connection, _ = server_socket.accept()
+            with connection:
+                requests.append(json.loads(connection.makefile('rb').readline()))
+                connection.sendall(json.dumps({'prepared': True, 'log': [],
+                                               'merge_file_cmd': [sys.executable, '-c', 'pass']}).encode() + b'\n')
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server_socket:
+            server_socket.bind(socket_path)
+            server_socket.listen()
+            server_socket.settimeout(30)
+            thread = threading.Thread(target=serve_once, args=(server_socket,))
+            thread.start()
+            _, modules = self.get_imports(['-m', self.PACKAGE_NAME, '-O', 'base', '-A', 'ours', '-B', 'theirs',
+                                           '-p', './version'])
+            thread.join()
+
+        self.assertEqual(1, len(requests))
+        self.assertTrue(requests[0]['call'])
+        # The call has been forwarded before the merge-driver's modules, argparse and logging have been imported.
+        self.assertEqual(sorted(self.imported_modules['forwarded']),
+                         sorted(module for module in modules if module.split('.')[0] == self.PACKAGE_NAME))
+        self.assertNotIn('argparse', modules)
+        self.assertNotIn('logging', modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
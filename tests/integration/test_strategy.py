@@ -0,0 +1,67 @@
+import filecmp
+import os
+import pathlib
+import shutil
+import stat
+import unittest
+
+from tests.integration.test_base import TestBase
+
+
+class TestStrategy(TestBase):
+
+    def setUp(self) -> None:
+        super(TestStrategy, self).setUp()
+        self.resources_path = pathlib.Path(self.abs_project_root_path, 'tests', 'integration', 'resources', 'test_xml')
+        # Git finds the merge-strategy kop as executable git-merge-kop in the PATH.
+        self.bin_path = pathlib.Path(self.abs_test_dir_path, 'bin')
+        os.makedirs(self.bin_path)
+        git_merge_kop_path = pathlib.Path(self.bin_path, 'git-merge-kop')
+        with open(git_merge_kop_path, 'w') as f:
+            f.write(f'#!/bin/sh\nexec {self.PYTHON_BINARY} {self.merge_driver_executable_path} strategy "$@"\n')
+        os.chmod(git_merge_kop_path, os.stat(git_merge_kop_path).st_mode | stat.S_IXUSR)
+
+    def copy_files_to_existing_branch_and_commit(self, branch_name, src_file_name, dst_file_names) -> None:
+        self.exec_cmd(['git', 'checkout', branch_name])
+        for dst_file_name in dst_file_names:
+            os.makedirs(os.path.dirname(dst_file_name), exist_ok=True)
+            shutil.copyfile(pathlib.Path(self.resources_path, src_file_name), dst_file_name)
+        self.exec_cmd(['git', 'add', '.'])
+        self.exec_cmd(['git', 'commit', '-m', f'Add files {dst_file_names} to branch {branch_name}'])
+
+    def test_merge_strategy_prepares_all_files_in_one_call(self):
+        """
+        The same merge as in test_xml.test_xpaths_given_on_command_line_using_default_merge_strategy(), but on two
+        pom.xml-files by the merge-strategy instead of the merge-driver.
+        """
+        pom_paths = ['module-a/pom.xml', 'module-b/pom.xml']
+
+        self.git_init()
+
+        self.copy_files_to_existing_branch_and_commit(self.main_branch_name, 'pom_03_base.xml', pom_paths)
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.exec_cmd(['git', 'checkout', '-b', 'theirs-branch'])
+        self.copy_files_to_existing_branch_and_commit('theirs-branch', 'pom_03_theirs.xml', pom_paths)
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.exec_cmd(['git', 'checkout', '-b', 'ours-branch'])
+        self.copy_files_to_existing_branch_and_commit('ours-branch', 'pom_03_ours.xml', pom_paths)
+
+        self.install_merge_driver("-p './version' './properties/:(some-app1|some-app2)[.]version'")
+
+        env = os.environ.copy()
+        env['SHIV_ROOT'] = str(pathlib.Path(self.abs_project_root_path, 'target', 'shiv'))
+        env['PATH'] = f'{self.bin_path}{os.pathsep}{env["PATH"]}'
+        r = self.exec_cmd(['git', 'merge', '-s', 'kop', '--no-ff', '--no-edit', 'theirs-branch'], env=env,
+                          stderr_to_stdout=True)
+
+        # The merge-strategy prepares theirs itself, and doesn't call the merge-driver per file.
+        self.assertIn(b"Merge made by the 'kop' strategy.", r.stdout)
+        self.assertNotIn(b'Merge-driver triggered', r.stdout)
+        for pom_path in pom_paths:
+            self.assertTrue(filecmp.cmp(pathlib.Path(self.resources_path, 'pom_03_expected_merged.xml'), pom_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
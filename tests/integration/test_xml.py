@@ -1,4 +1,5 @@
 import filecmp
+import json
 import os
 import pathlib
 import unittest
@@ -70,6 +71,183 @@ class TestXml(TestBase):
         #    open(pathlib.Path(self.resources_path, 'pom_03_expected_merged.xml')).read(), open('pom.xml').read())
         self.assertTrue(filecmp.cmp(pathlib.Path(self.resources_path, 'pom_03_expected_merged.xml'), 'pom.xml'))
 
+    def test_xpaths_given_on_command_line_using_builtin_merge_file(self):
+        """
+        Same as test_xpaths_given_on_command_line_using_default_merge_strategy(), but merge the files by the builtin
+        merge instead of git merge-file.
+        """
+
+        self.git_init()
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.copy_file_to_existing_branch_and_commit(self.main_branch_name, 'pom_03_base.xml', 'pom.xml')
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.exec_cmd(['git', 'checkout', '-b', 'theirs-branch'])
+        self.copy_file_to_existing_branch_and_commit('theirs-branch', 'pom_03_theirs.xml', 'pom.xml')
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.exec_cmd(['git', 'checkout', '-b', 'ours-branch'])
+        self.copy_file_to_existing_branch_and_commit('ours-branch', 'pom_03_ours.xml', 'pom.xml')
+
+        self.install_merge_driver("-m builtin -p './version' './properties/:(some-app1|some-app2)[.]version'")
+
+        env = os.environ.copy()
+        env['SHIV_ROOT'] = str(pathlib.Path(self.abs_project_root_path, 'target', 'shiv'))
+        self.exec_cmd(['git', 'merge', '--no-ff', '--no-edit', 'theirs-branch'], env=env)
+
+        self.exec_cmd(['git', 'status'])
+        self.assertTrue(filecmp.cmp(pathlib.Path(self.resources_path, 'pom_03_expected_merged.xml'), 'pom.xml'))
+
+    def test_iso_8859_1_encoded_files(self):
+        """
+        Same as test_xpaths_given_on_command_line_using_default_merge_strategy(), but the files are encoded in
+        ISO-8859-1 as they declare, and the values have umlauts.
+        """
+        self._merge_iso_8859_1_encoded_files('')
+
+    def test_iso_8859_1_encoded_files_using_builtin_merge_file(self):
+        self._merge_iso_8859_1_encoded_files('-m builtin ')
+
+    def _merge_iso_8859_1_encoded_files(self, merge_file_option):
+        self.git_init()
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.copy_file_to_existing_branch_and_commit(self.main_branch_name, 'pom_41_base.xml', 'pom.xml')
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.exec_cmd(['git', 'checkout', '-b', 'theirs-branch'])
+        self.copy_file_to_existing_branch_and_commit('theirs-branch', 'pom_41_theirs.xml', 'pom.xml')
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.exec_cmd(['git', 'checkout', '-b', 'ours-branch'])
+        self.copy_file_to_existing_branch_and_commit('ours-branch', 'pom_41_ours.xml', 'pom.xml')
+
+        self.install_merge_driver(merge_file_option + "-p './version' './properties/:(some-app1|some-app2)[.]version'")
+
+        env = os.environ.copy()
+        env['SHIV_ROOT'] = str(pathlib.Path(self.abs_project_root_path, 'target', 'shiv'))
+        self.exec_cmd(['git', 'merge', '--no-ff', '--no-edit', 'theirs-branch'], env=env)
+
+        self.assertTrue(filecmp.cmp(pathlib.Path(self.resources_path, 'pom_41_expected_merged.xml'), 'pom.xml'))
+
+    def test_scope_hunks(self):
+        """
+        Same as test_xpaths_given_on_command_line_using_default_merge_strategy(), but merge first and prepare only the
+        paths within the conflicts.
+        """
+        self._merge_using_scope_hunks('pom_03', "-p './version' './properties/:(some-app1|some-app2)[.]version'")
+
+    def test_scope_hunks_using_builtin_merge_file(self):
+        self._merge_using_scope_hunks(
+            'pom_03', "-m builtin -p './version' './properties/:(some-app1|some-app2)[.]version'")
+
+    def test_scope_hunks_using_merge_strategy_always_ours(self):
+        """
+        Same as test_xpaths_given_on_command_line_using_merge_strategy_always_ours(). The merge has no conflicts, but
+        takes values of always-ours-paths from theirs.
+        """
+        self._merge_using_scope_hunks(
+            'pom_13', "-p 'always-ours:./version' 'always-ours:./properties/:(some-app1|some-app2)[.]version'")
+
+    def _merge_using_scope_hunks(self, resources_prefix, options):
+        self.git_init()
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.copy_file_to_existing_branch_and_commit(self.main_branch_name, f'{resources_prefix}_base.xml', 'pom.xml')
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.exec_cmd(['git', 'checkout', '-b', 'theirs-branch'])
+        self.copy_file_to_existing_branch_and_commit('theirs-branch', f'{resources_prefix}_theirs.xml', 'pom.xml')
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.exec_cmd(['git', 'checkout', '-b', 'ours-branch'])
+        self.copy_file_to_existing_branch_and_commit('ours-branch', f'{resources_prefix}_ours.xml', 'pom.xml')
+
+        self.install_merge_driver('--scope hunks ' + options)
+
+        env = os.environ.copy()
+        env['SHIV_ROOT'] = str(pathlib.Path(self.abs_project_root_path, 'target', 'shiv'))
+        self.exec_cmd(['git', 'merge', '--no-ff', '--no-edit', 'theirs-branch'], env=env)
+
+        self.assertTrue(
+            filecmp.cmp(pathlib.Path(self.resources_path, f'{resources_prefix}_expected_merged.xml'), 'pom.xml'))
+
+    def test_result_memo(self):
+        """
+        Merge, undo the merge, and merge again. The second merge takes the prepared theirs from the result-memo.
+        """
+        self.git_init()
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.copy_file_to_existing_branch_and_commit(self.main_branch_name, 'pom_03_base.xml', 'pom.xml')
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.exec_cmd(['git', 'checkout', '-b', 'theirs-branch'])
+        self.copy_file_to_existing_branch_and_commit('theirs-branch', 'pom_03_theirs.xml', 'pom.xml')
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.exec_cmd(['git', 'checkout', '-b', 'ours-branch'])
+        self.copy_file_to_existing_branch_and_commit('ours-branch', 'pom_03_ours.xml', 'pom.xml')
+
+        self.install_merge_driver(
+            "--result-memo-size 1048576 -p './version' './properties/:(some-app1|some-app2)[.]version'")
+
+        env = os.environ.copy()
+        env['SHIV_ROOT'] = str(pathlib.Path(self.abs_project_root_path, 'target', 'shiv'))
+        memo_cmd = [self.PYTHON_BINARY, self.merge_driver_executable_path, 'memo']
+        for _ in range(2):
+            r = self.exec_cmd(['git', 'merge', '--no-ff', '--no-edit', 'theirs-branch'], env=env,
+                              stderr_to_stdout=True)
+            self.assertTrue(
+                filecmp.cmp(pathlib.Path(self.resources_path, 'pom_03_expected_merged.xml'), 'pom.xml'))
+            self.assertIn('Entries: 1;', self.exec_cmd(memo_cmd, env=env).stdout.decode())
+            self.exec_cmd(['git', 'reset', '--hard', 'HEAD~1'])
+        self.assertIn('Taking the prepared theirs from the result-memo.', r.stdout.decode())
+
+        self.assertIn('Removed 1 memo-files', self.exec_cmd(memo_cmd + ['clear'], env=env).stdout.decode())
+        self.assertIn('Entries: 0;', self.exec_cmd(memo_cmd + ['show'], env=env).stdout.decode())
+
+    def test_metrics_file(self):
+        """
+        Merge with --metrics-file, and aggregate the record by the stats-command.
+        """
+        self.git_init()
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.copy_file_to_existing_branch_and_commit(self.main_branch_name, 'pom_03_base.xml', 'pom.xml')
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.exec_cmd(['git', 'checkout', '-b', 'theirs-branch'])
+        self.copy_file_to_existing_branch_and_commit('theirs-branch', 'pom_03_theirs.xml', 'pom.xml')
+
+        self.exec_cmd(['git', 'checkout', self.main_branch_name])
+        self.exec_cmd(['git', 'checkout', '-b', 'ours-branch'])
+        self.copy_file_to_existing_branch_and_commit('ours-branch', 'pom_03_ours.xml', 'pom.xml')
+
+        metrics_filepath = str(pathlib.Path(self.abs_test_dir_path, 'metrics.jsonl'))
+        self.install_merge_driver(
+            f"--metrics-file {metrics_filepath} -p './version' './properties/:(some-app1|some-app2)[.]version'")
+
+        env = os.environ.copy()
+        env['SHIV_ROOT'] = str(pathlib.Path(self.abs_project_root_path, 'target', 'shiv'))
+        self.exec_cmd(['git', 'merge', '--no-ff', '--no-edit', 'theirs-branch'], env=env)
+        with open(metrics_filepath) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(1, len(records))
+        self.assertEqual('./pom.xml', records[0]['path'])
+        self.assertEqual(0, records[0]['returncode'])
+        self.assertEqual(['./version', './properties/'], records[0]['configured_paths'])
+        for stage in ['read', 'parse base', 'find paths in theirs', 'detect', 'merge-file']:
+            self.assertIn(stage, records[0]['stages'])
+        self.assertIn('detect', records[0]['paths']['/project/version'])
+        self.assertEqual('./version', records[0]['matched_paths']['/project/version'])
+        self.assertEqual('./properties/', records[0]['matched_paths']['/project/properties/some-app1.version'])
+
+        r = self.exec_cmd([self.PYTHON_BINARY, self.merge_driver_executable_path, 'stats', metrics_filepath], env=env)
+        self.assertIn('Calls: 1;', r.stdout.decode())
+        self.assertRegex(r.stdout.decode(), r'configured  \./version')
+
     def test_xpaths_given_on_command_line_using_merge_strategy_onconflict_ours(self):
         """
         Set the merge-strategy "onconflict-ours" explicitly (is default).
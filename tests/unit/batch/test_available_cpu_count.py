@@ -0,0 +1,46 @@
+import os
+import pathlib
+import tempfile
+import unittest
+
+import keep_ours_paths_merge_driver.batch as batch
+
+
+class TestBatchAvailableCpuCount(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cgroup_root = tempfile.TemporaryDirectory()
+        self.affinity_count = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+
+    def tearDown(self) -> None:
+        self.cgroup_root.cleanup()
+
+    def write_cgroup_file(self, relative_path, content):
+        path = pathlib.Path(self.cgroup_root.name, relative_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+    def test_without_cgroup_limit(self):
+        self.assertEqual(self.affinity_count, batch.available_cpu_count(self.cgroup_root.name))
+
+        self.write_cgroup_file('cpu.max', 'max 100000\n')
+        self.assertEqual(self.affinity_count, batch.available_cpu_count(self.cgroup_root.name))
+
+    def test_cgroup_v2_quota(self):
+        # A quota of 0.5 CPUs is rounded up to 1.
+        self.write_cgroup_file('cpu.max', '50000 100000\n')
+
+        self.assertEqual(1, batch.available_cpu_count(self.cgroup_root.name))
+
+    def test_cgroup_v1_quota(self):
+        self.write_cgroup_file('cpu/cpu.cfs_quota_us', '150000\n')
+        self.write_cgroup_file('cpu/cpu.cfs_period_us', '100000\n')
+
+        self.assertEqual(min(2, self.affinity_count), batch.available_cpu_count(self.cgroup_root.name))
+
+        self.write_cgroup_file('cpu/cpu.cfs_quota_us', '-1\n')
+        self.assertEqual(self.affinity_count, batch.available_cpu_count(self.cgroup_root.name))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import logging
+import unittest
+
+import keep_ours_paths_merge_driver.batch as batch
+
+BASE = b'<project><version>1.0.0</version></project>'
+OURS = b'<project><version>1.0.1</version></project>'
+THEIRS = b'<project><version>2.0.0</version></project>'
+
+
+class TestBatchPrepareTheirsContents(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.root_logger = logging.getLogger()
+        self.saved_level = self.root_logger.level
+        self.root_logger.setLevel(logging.ERROR)
+
+    def tearDown(self) -> None:
+        self.root_logger.setLevel(self.saved_level)
+
+    def test_thread_workers_keep_the_logging(self):
+        handlers = list(self.root_logger.handlers)
+
+        prepared_theirs = batch.prepare_theirs_contents(
+            [(BASE, OURS, THEIRS)], 'XML', [{'merge_strategy': 'onconflict-ours', 'path': './version', 'pattern': ''}],
+            executor=batch.EXECUTOR_THREAD, workers=2, loglevel='DEBUG')
+
+        self.assertEqual([b'<project><version>1.0.1</version></project>'], prepared_theirs)
+        # The threads share the root logger of the caller. They must not reconfigure it.
+        self.assertEqual(logging.ERROR, self.root_logger.level)
+        self.assertEqual(handlers, self.root_logger.handlers)
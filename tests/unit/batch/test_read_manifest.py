@@ -0,0 +1,36 @@
+import unittest
+
+import keep_ours_paths_merge_driver.batch as batch
+
+
+class TestBatchReadManifest(unittest.TestCase):
+
+    def test_jsonl(self):
+        manifest_str = '{"base": "b1", "ours": "o1", "theirs": "t1", "output": "m1"}\n' \
+                       + '\n' \
+                       + '{"base": "b2", "ours": "o2", "theirs": "t2"}\n'
+
+        entries = batch.read_manifest(manifest_str, batch.MANIFEST_FORMAT_JSONL)
+
+        self.assertEqual([{'base': 'b1', 'ours': 'o1', 'theirs': 't1', 'output': 'm1'},
+                          {'base': 'b2', 'ours': 'o2', 'theirs': 't2', 'output': 'o2'}], entries)
+
+    def test_jsonl_missing_field(self):
+        with self.assertRaisesRegex(ValueError, 'line 1: Missing theirs'):
+            batch.read_manifest('{"base": "b1", "ours": "o1"}', batch.MANIFEST_FORMAT_JSONL)
+
+    def test_nul(self):
+        manifest_str = 'b 1\0o 1\0t 1\0m 1\0b2\0o2\0t2\0\0'
+
+        entries = batch.read_manifest(manifest_str, batch.MANIFEST_FORMAT_NUL)
+
+        self.assertEqual([{'base': 'b 1', 'ours': 'o 1', 'theirs': 't 1', 'output': 'm 1'},
+                          {'base': 'b2', 'ours': 'o2', 'theirs': 't2', 'output': 'o2'}], entries)
+
+    def test_nul_incomplete(self):
+        with self.assertRaisesRegex(ValueError, 'multiple of 4'):
+            batch.read_manifest('b\0o\0t\0', batch.MANIFEST_FORMAT_NUL)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import signal
+import threading
+import time
+import unittest
+import unittest.mock
+
+import keep_ours_paths_merge_driver.budget as budget
+import keep_ours_paths_merge_driver.utils as utils
+
+
+class TestBudgetCheck(unittest.TestCase):
+
+    def tearDown(self) -> None:
+        budget.stop()
+
+    def test_without_budgets(self):
+        budget.start()
+        self.assertEqual({}, budget._budget.get())
+        budget.check('parse base')
+        budget.start(0, 0)
+        budget.check('parse base')
+
+    def test_time_budget_interrupts_the_main_thread(self):
+        budget.start(seconds=0.05)
+        budget.check('replace path by path', '/project/version')
+        with self.assertRaisesRegex(budget.BudgetExceeded,
+                                    "time-budget .* in stage 'replace path by path' at path '/project/version'"):
+            # A stall without checkpoints, e.g. a catastrophic regex.
+            time.sleep(5)
+
+    def test_time_budget_checked_in_other_threads(self):
+        raised = []
+
+        def prepare():
+            budget.start(seconds=0.01)
+            time.sleep(0.05)
+            try:
+                budget.check('detect', '/project/version')
+            except budget.BudgetExceeded as e:
+                raised.append(str(e))
+
+        thread = threading.Thread(target=prepare)
+        thread.start()
+        thread.join()
+        self.assertEqual(1, len(raised))
+        self.assertIn("in stage 'detect' at path '/project/version'", raised[0])
+
+    def test_memory_budget(self):
+        budget.start(memory_bytes=16 * 1024 * 1024)
+        budget.check('parse ours')
+        memory = bytearray(64 * 1024 * 1024)
+        with self.assertRaisesRegex(budget.BudgetExceeded, "memory-budget .* in stage 'parse ours'"):
+            budget.check()
+        del memory
+
+    def test_stop_ends_the_budgets(self):
+        budget.start(seconds=0.01)
+        budget.stop()
+        time.sleep(0.05)
+        budget.check('replace')
+
+    def test_timer_firing_within_stop(self):
+        previous_handler = signal.getsignal(signal.SIGALRM)
+        setitimer = signal.setitimer
+        fired = []
+
+        def setitimer_after_the_signal(which, seconds):
+            if seconds == 0 and not fired:
+                # As if the timer-signal fired just before it is disarmed. It fires once.
+                fired.append(True)
+                budget._on_timer(signal.SIGALRM, None)
+            return setitimer(which, seconds)
+
+        budget.start(seconds=60)
+        with unittest.mock.patch('signal.setitimer', side_effect=setitimer_after_the_signal):
+            budget.stop()
+
+        self.assertEqual([True], fired)
+        self.assertEqual({}, budget._timer)
+        self.assertEqual({}, budget._budget.get())
+        self.assertEqual(previous_handler, signal.getsignal(signal.SIGALRM))
+
+    def test_budgets_are_per_call(self):
+        # The budgets of the main thread aren't seen by another call on another thread.
+        budget.start(memory_bytes=16 * 1024 * 1024)
+        memory = bytearray(64 * 1024 * 1024)
+        raised = []
+
+        def prepare():
+            try:
+                budget.check('detect', '/project/version')
+            except budget.BudgetExceeded as e:
+                raised.append(str(e))
+
+        thread = threading.Thread(target=prepare)
+        thread.start()
+        thread.join()
+        self.assertEqual([], raised)
+        with self.assertRaises(budget.BudgetExceeded):
+            budget.check('detect', '/project/version')
+        del memory
+
+    def test_budgets_are_checked_by_the_threads_parsing_concurrently(self):
+        budget.start(memory_bytes=16 * 1024 * 1024)
+        memory = bytearray(64 * 1024 * 1024)
+
+        def parse(name):
+            if name == 'ours':
+                budget.check(f'parse {name}')
+            else:
+                # The other threads are still parsing.
+                time.sleep(2)
+
+        began = time.monotonic()
+        with self.assertRaisesRegex(budget.BudgetExceeded, "memory-budget .* in stage 'parse ours'"):
+            utils.map_concurrently(parse, ['base', 'ours', 'theirs'])
+        # The exception doesn't wait for the other threads.
+        self.assertLess(time.monotonic() - began, 1)
+        del memory
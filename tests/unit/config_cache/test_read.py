@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+
+import keep_ours_paths_merge_driver.config_cache as config_cache
+
+
+class TestConfigCacheRead(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.worktree = tempfile.TemporaryDirectory()
+        os.mkdir(os.path.join(self.worktree.name, '.git'))
+        self.raw_config = config_cache.get_raw_config('XML', ':', None, ['./version'])
+        self.paths_and_patterns = [{'merge_strategy': 'onconflict-ours', 'path': './version', 'pattern': None}]
+
+    def tearDown(self) -> None:
+        self.worktree.cleanup()
+
+    def get_cache_filenames(self):
+        return os.listdir(config_cache.get_cache_dir(self.worktree.name))
+
+    def test_without_git_dir(self):
+        with tempfile.TemporaryDirectory() as cwd:
+            self.assertIsNone(config_cache.get_cache_dir(cwd))
+            config_cache.write(self.raw_config, self.paths_and_patterns, [{'path': './version'}], cwd)
+            self.assertIsNone(config_cache.read(self.raw_config, cwd))
+            self.assertEqual([], os.listdir(cwd))
+
+    def test_linked_worktree(self):
+        with tempfile.TemporaryDirectory() as cwd:
+            with open(os.path.join(cwd, '.git'), 'w') as f:
+                f.write(f'gitdir: {self.worktree.name}/.git/worktrees/wt\n')
+            self.assertEqual(os.path.join(cwd, self.worktree.name, '.git', 'worktrees', 'wt', 'kop-cache'),
+                             config_cache.get_cache_dir(cwd))
+
+    def test_write_and_read(self):
+        self.assertIsNone(config_cache.read(self.raw_config, self.worktree.name))
+
+        config_cache.write(self.raw_config, self.paths_and_patterns, [{'path': './version'}], self.worktree.name)
+
+        cached = config_cache.read(self.raw_config, self.worktree.name)
+        self.assertEqual(self.paths_and_patterns, cached['paths_and_patterns'])
+        self.assertEqual([{'path': './version'}], cached['compiled_paths_and_patterns'])
+        # The temp-file has been renamed.
+        self.assertEqual(1, len(self.get_cache_filenames()))
+        self.assertTrue(self.get_cache_filenames()[0].endswith(config_cache.CACHE_FILENAME_SUFFIX))
+
+    def test_the_raw_config_is_the_key(self):
+        config_cache.write(self.raw_config, self.paths_and_patterns, [], self.worktree.name)
+
+        self.assertIsNone(config_cache.read(config_cache.get_raw_config('JSON', ':', None, ['./version']),
+                                            self.worktree.name))
+        # The environment variable takes precedence even if empty.
+        self.assertIsNone(config_cache.read(config_cache.get_raw_config('XML', ':', '', ['./version']),
+                                            self.worktree.name))
+
+    def test_a_cache_file_of_another_raw_config_is_ignored(self):
+        # E.g. a hash collision.
+        other_raw_config = config_cache.get_raw_config('XML', ':', None, ['./name'])
+        config_cache.write(other_raw_config, [], None, self.worktree.name)
+        cache_dir = config_cache.get_cache_dir(self.worktree.name)
+        os.replace(os.path.join(cache_dir, self.get_cache_filenames()[0]),
+                   config_cache._get_cache_filepath(cache_dir, self.raw_config))
+
+        self.assertIsNone(config_cache.read(self.raw_config, self.worktree.name))
+
+    def test_an_unreadable_cache_file_is_ignored(self):
+        cache_dir = config_cache.get_cache_dir(self.worktree.name)
+        os.mkdir(cache_dir)
+        with open(config_cache._get_cache_filepath(cache_dir, self.raw_config), 'wb') as f:
+            f.write(b'\x00garbage')
+
+        self.assertIsNone(config_cache.read(self.raw_config, self.worktree.name))
+
+    def test_writing_removes_the_cache_files_of_other_versions(self):
+        other_version_raw_config = self.raw_config.replace(config_cache.config.__version__, '0.0.1', 1)
+        self.assertNotEqual(self.raw_config, other_version_raw_config)
+        config_cache.write(other_version_raw_config, [], None, self.worktree.name)
+        self.assertIsNotNone(config_cache.read(other_version_raw_config, self.worktree.name))
+
+        config_cache.write(self.raw_config, self.paths_and_patterns, [], self.worktree.name)
+
+        self.assertIsNone(config_cache.read(other_version_raw_config, self.worktree.name))
+        self.assertEqual(1, len(self.get_cache_filenames()))
+
+    def test_writing_keeps_the_cache_files_of_other_configs(self):
+        other_raw_config = config_cache.get_raw_config('XML', ':', None, ['./name'])
+        config_cache.write(other_raw_config, [], None, self.worktree.name)
+
+        config_cache.write(self.raw_config, self.paths_and_patterns, [], self.worktree.name)
+
+        self.assertIsNotNone(config_cache.read(other_raw_config, self.worktree.name))
+        self.assertIsNotNone(config_cache.read(self.raw_config, self.worktree.name))
@@ -0,0 +1,27 @@
+import unittest
+
+import keep_ours_paths_merge_driver.diff3 as diff3
+
+
+class TestDiff3GetHunksLineRanges(unittest.TestCase):
+
+    def test_conflict_and_change_from_theirs(self):
+        # Line b is a conflict, line d is changed by Theirs, and line f by Ours only.
+        hunks = diff3.get_hunks_line_ranges('a\nb\nc\nd\ne\nf\n', 'a\nB1\nc\nd\ne\nF\n', 'a\nB2\nB3\nc\nD\ne\nf\n')
+
+        self.assertEqual([{'is_conflict': True, 'base': (1, 2), 'ours': (1, 2), 'theirs': (1, 3)},
+                          {'is_conflict': False, 'base': (3, 4), 'ours': (3, 4), 'theirs': (4, 5)}], hunks)
+
+    def test_conflicts_are_not_refined(self):
+        # merge() refines the conflict to the lines of x, but the lines cover the whole change.
+        hunks = diff3.get_hunks_line_ranges('a\nb\nc\n', 'a\nB\nx1\nc\n', 'a\nB\nx2\nc\n')
+
+        self.assertEqual([{'is_conflict': True, 'base': (1, 2), 'ours': (1, 3), 'theirs': (1, 3)}], hunks)
+
+    def test_clean_merge_without_changes_from_theirs(self):
+        self.assertEqual([], diff3.get_hunks_line_ranges('a\nb\n', 'A\nb\n', 'a\nb\n'))
+        self.assertEqual([], diff3.get_hunks_line_ranges('a\nb\n', 'a\nb\n', 'a\nb\n'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+
+import keep_ours_paths_merge_driver.diff3 as diff3
+
+
+class TestDiff3Merge(unittest.TestCase):
+
+    # The expected merge-results are those of "git merge-file -p -L ours -L base -L theirs ours base theirs".
+
+    def test_clean_merge(self):
+        merged_str, conflicts_count = diff3.merge('a\nb\nc\nd\n', 'A\nb\nc\nd\n', 'a\nb\nc\nD\n')
+
+        self.assertEqual('A\nb\nc\nD\n', merged_str)
+        self.assertEqual(0, conflicts_count)
+
+    def test_identical_changes_are_no_conflict(self):
+        merged_str, conflicts_count = diff3.merge('a\nb\nc\n', 'a\nB\nc\n', 'a\nB\nc\n')
+
+        self.assertEqual('a\nB\nc\n', merged_str)
+        self.assertEqual(0, conflicts_count)
+
+    def test_conflict(self):
+        merged_str, conflicts_count = diff3.merge('a\nb\nc\n', 'a\nB1\nc\n', 'a\nB2\nc\n')
+
+        self.assertEqual('a\n<<<<<<< ours\nB1\n=======\nB2\n>>>>>>> theirs\nc\n', merged_str)
+        self.assertEqual(1, conflicts_count)
+
+    def test_conflict_diff3_style(self):
+        merged_str, conflicts_count = diff3.merge('a\nb\nc\n', 'a\nB1\nc\n', 'a\nB2\nc\n',
+                                                  conflict_style=diff3.CONFLICT_STYLE_DIFF3)
+
+        self.assertEqual('a\n<<<<<<< ours\nB1\n||||||| base\nb\n=======\nB2\n>>>>>>> theirs\nc\n', merged_str)
+        self.assertEqual(1, conflicts_count)
+
+    def test_conflicts_separated_by_up_to_3_lines_are_joined(self):
+        merged_str, conflicts_count = diff3.merge('1\nx\n2\n3\n4\ny\n', '1\nX1\n2\n3\n4\nY1\n',
+                                                  '1\nX2\n2\n3\n4\nY2\n')
+
+        self.assertEqual('1\n<<<<<<< ours\nX1\n2\n3\n4\nY1\n=======\nX2\n2\n3\n4\nY2\n>>>>>>> theirs\n', merged_str)
+        self.assertEqual(1, conflicts_count)
+
+    def test_common_lines_of_a_conflict_are_moved_out(self):
+        merged_str, conflicts_count = diff3.merge('a\nb\n', 'a\nx\nb1\n', 'a\nx\nb2\n')
+
+        self.assertEqual('a\nx\n<<<<<<< ours\nb1\n=======\nb2\n>>>>>>> theirs\n', merged_str)
+        self.assertEqual(1, conflicts_count)
+
+    def test_conflict_markers_take_crlf_line_endings(self):
+        merged_str, conflicts_count = diff3.merge('a\r\nb\r\n', 'a\r\nB1\r\n', 'a\r\nB2\r\n')
+
+        self.assertEqual('a\r\n<<<<<<< ours\r\nB1\r\n=======\r\nB2\r\n>>>>>>> theirs\r\n', merged_str)
+        self.assertEqual(1, conflicts_count)
+
+    def test_split_lines_keeps_line_endings(self):
+        self.assertEqual(['a\n', 'b\r\n', 'c'], diff3.split_lines('a\nb\r\nc'))
+        self.assertEqual([], diff3.split_lines(''))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import concurrent.futures
+import unittest
+
+from keep_ours_paths_merge_driver import budget
+from keep_ours_paths_merge_driver import metrics
+from keep_ours_paths_merge_driver.engine import Engine
+
+
+def read_resources(*file_names):
+    contents = []
+    for file_name in file_names:
+        with open('tests/unit/resources/' + file_name) as f:
+            contents.append(f.read())
+    return contents
+
+
+class TestEnginePrepareTheirs(unittest.TestCase):
+
+    def test_prepare_theirs_str(self):
+        base_xml_str, ours_xml_str, theirs_xml_str, prepared_theirs_str_expected = read_resources(
+            'pom_01_base.xml', 'pom_01_ours.xml', 'pom_01_theirs.xml',
+            'pom_01_theirs_expected_replace_only_no_merge.xml')
+        engine = Engine(['./version'])
+
+        prepared_theirs_str, report = engine.prepare_theirs(base_xml_str, ours_xml_str, theirs_xml_str)
+
+        self.assertEqual(prepared_theirs_str_expected, prepared_theirs_str)
+        self.assertTrue(report['prepared'])
+        self.assertEqual(1, len(report['decisions']))
+        decision = report['decisions'][0]
+        self.assertEqual('onconflict-ours', decision['merge_strategy'])
+        self.assertTrue(decision['prepare_theirs'])
+        self.assertEqual(3, len({decision['base_value'], decision['ours_value'], decision['theirs_value']}))
+
+    def test_prepare_theirs_bytes(self):
+        base_json_str, ours_json_str, theirs_json_str, prepared_theirs_str_expected = read_resources(
+            'package_01_base.json', 'package_01_ours.json', 'package_01_theirs.json',
+            'package_01_theirs_expected_replace_only_no_merge.json')
+        engine = Engine([{'merge_strategy': 'onconflict-ours', 'path': '$.version', 'pattern': None}], 'JSON')
+
+        prepared_theirs_bytes, report = engine.prepare_theirs(
+            base_json_str.encode(), ours_json_str.encode(), theirs_json_str.encode())
+
+        self.assertEqual(prepared_theirs_str_expected.encode(), prepared_theirs_bytes)
+        self.assertTrue(report['prepared'])
+
+    def test_empty_file_is_skipped(self):
+        prepared_theirs_str, report = Engine(['./version']).prepare_theirs('', '<a/>', '<b/>')
+
+        self.assertEqual('<b/>', prepared_theirs_str)
+        self.assertEqual({'prepared': False, 'decisions': [], 'skipped': 'empty file'}, report)
+
+    def test_engines_with_different_configs_concurrently(self):
+        file_strs_1 = read_resources('pom_01_base.xml', 'pom_01_ours.xml', 'pom_01_theirs.xml')
+        file_strs_2 = read_resources('pom_02_base.xml', 'pom_02_ours.xml', 'pom_02_theirs.xml')
+        expected_1, expected_2 = read_resources('pom_01_theirs_expected_replace_only_no_merge.xml',
+                                                'pom_02_theirs_expected_replace_only_no_merge.xml')
+        engine_1 = Engine(['./version'])
+        engine_2 = Engine(['./version', './properties/:some-app.+'])
+
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            futures = [executor.submit(engine.prepare_theirs, *file_strs)
+                       for _ in range(50)
+                       for engine, file_strs in [(engine_1, file_strs_1), (engine_2, file_strs_2)]]
+            results = [future.result()[0] for future in futures]
+
+        self.assertEqual([expected_1, expected_2] * 50, results)
+
+    def test_engines_concurrently_with_a_budget_on_the_main_thread(self):
+        file_strs = read_resources('pom_02_base.xml', 'pom_02_ours.xml', 'pom_02_theirs.xml')
+        expected, = read_resources('pom_02_theirs_expected_replace_only_no_merge.xml')
+        engines = [Engine(['./version', './properties/:some-app.+'], parse_concurrently=parse_concurrently)
+                   for parse_concurrently in [False, True]]
+        # A call on the main thread with its budgets and metrics. The budgets are exceeded at once.
+        budget.start(seconds=60, memory_bytes=1)
+        metrics.start('/repository')
+        memory = bytearray(16 * 1024 * 1024)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(8) as executor:
+                futures = [executor.submit(engine.prepare_theirs, *file_strs) for _ in range(20) for engine in engines]
+                results = [future.result()[0] for future in futures]
+            with self.assertRaises(budget.BudgetExceeded):
+                budget.check('detect')
+        finally:
+            budget.stop()
+            record = metrics.stop()
+            del memory
+
+        # Neither the budgets nor the metrics of the main thread's call are those of the engines' calls.
+        self.assertEqual([expected] * 40, results)
+        self.assertEqual({}, record['stages'])
+        self.assertEqual({}, record['paths'])
+
+    def test_engine_is_immutable(self):
+        engine = Engine(['./version'])
+
+        with self.assertRaises(AttributeError):
+            engine.filetype = 'JSON'
+        engine.paths_and_patterns[0]['path'] = './changed'
+        self.assertEqual([{'merge_strategy': 'onconflict-ours', 'path': './version', 'pattern': ''}],
+                         engine.paths_and_patterns)
+
+    def test_unknown_filetype(self):
+        with self.assertRaises(ValueError):
+            Engine(['./version'], 'YAML')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+
+import keep_ours_paths_merge_driver.extraction_cache as extraction_cache
+
+
+class TestExtractionCacheEvict(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.cache_dir.cleanup()
+
+    def write_entries(self, cache, count):
+        # Per entry its key, with ascending last use.
+        keys = []
+        for i in range(count):
+            key = extraction_cache.get_key(cache, 'xml', str(i).encode())
+            extraction_cache.write(cache, key, {'/a': {'value': 'x' * 1000}})
+            cache_filepath = extraction_cache._get_cache_filepath(cache, key)
+            os.utime(cache_filepath, (1000 + i, 1000 + i))
+            keys.append(key)
+        return keys
+
+    def test_nothing_to_evict_below_the_max_size(self):
+        cache = extraction_cache.get_extraction_cache(self.cache_dir.name, 'config', 1024 * 1024)
+        keys = self.write_entries(cache, 4)
+
+        self.assertEqual(0, extraction_cache.evict(cache))
+        self.assertTrue(all(extraction_cache.read(cache, key) is not None for key in keys))
+
+    def test_evicts_the_least_recently_used(self):
+        cache = extraction_cache.get_extraction_cache(self.cache_dir.name, 'config', 10 * 1024 * 1024)
+        keys = self.write_entries(cache, 10)
+        # A hit marks an entry as recently used.
+        self.assertIsNotNone(extraction_cache.read(cache, keys[0]))
+        entry_size = os.path.getsize(extraction_cache._get_cache_filepath(cache, keys[0]))
+
+        removed_count = extraction_cache.evict(cache, target_size=5 * entry_size)
+
+        self.assertEqual(5, removed_count)
+        self.assertEqual([True] + [False] * 5 + [True] * 4,
+                         [extraction_cache.read(cache, key) is not None for key in keys])
+
+    def test_evicts_to_the_target_ratio_of_the_max_size(self):
+        cache = extraction_cache.get_extraction_cache(self.cache_dir.name, 'config', 1024 * 1024)
+        self.write_entries(cache, 3)
+        cache['max_size'] = 3 * 1000
+
+        extraction_cache.evict(cache)
+
+        sizes = [entry.stat().st_size for shard in os.scandir(cache['entries_dir']) for entry in os.scandir(shard.path)]
+        self.assertLessEqual(sum(sizes), 3 * 1000 * extraction_cache.EVICTION_TARGET_RATIO)
+        self.assertTrue(sizes)
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+
+import keep_ours_paths_merge_driver.extraction_cache as extraction_cache
+
+
+class TestExtractionCacheGetPathsDetails(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.extraction_cache = extraction_cache.get_extraction_cache(self.cache_dir.name, 'config', 1024 * 1024)
+        self.paths_details = {'/project/version': {'merge_strategy': 'onconflict-ours', 'tag_name': 'version',
+                                                   'value': '1.0', 'is_leaf': True, 'location': '/project/version'}}
+        self.calls_count = 0
+
+    def tearDown(self) -> None:
+        self.cache_dir.cleanup()
+
+    def get_paths_details(self):
+        self.calls_count += 1
+        return self.paths_details
+
+    def test_switched_off(self):
+        self.assertIsNone(extraction_cache.get_extraction_cache(None, 'config', 1024))
+        self.assertIsNone(extraction_cache.get_extraction_cache(self.cache_dir.name, 'config', 0))
+
+    def test_miss_and_hit(self):
+        for _ in range(2):
+            self.assertEqual(self.paths_details, extraction_cache.get_paths_details(
+                self.extraction_cache, 'xml', b'<project/>', self.get_paths_details))
+        self.assertEqual(1, self.calls_count)
+
+    def test_the_key_depends_on_the_config_the_mode_and_the_content(self):
+        key = extraction_cache.get_key(self.extraction_cache, 'xml', b'<project/>')
+        other_config = extraction_cache.get_extraction_cache(self.cache_dir.name, 'other config', 1024)
+        self.assertEqual(40, len(key))
+        self.assertEqual(key, extraction_cache.get_key(self.extraction_cache, 'xml', b'<project/>'))
+        self.assertNotEqual(key, extraction_cache.get_key(other_config, 'xml', b'<project/>'))
+        self.assertNotEqual(key, extraction_cache.get_key(self.extraction_cache, 'xml-streaming', b'<project/>'))
+        self.assertNotEqual(key, extraction_cache.get_key(self.extraction_cache, 'xml', b'<project />'))
+
+    def test_an_unreadable_cache_file_is_a_miss(self):
+        key = extraction_cache.get_key(self.extraction_cache, 'xml', b'<project/>')
+        cache_filepath = extraction_cache._get_cache_filepath(self.extraction_cache, key)
+        os.makedirs(os.path.dirname(cache_filepath))
+        with open(cache_filepath, 'wb') as f:
+            f.write(b'\x00garbage')
+
+        self.assertEqual(self.paths_details, extraction_cache.get_paths_details(
+            self.extraction_cache, 'xml', b'<project/>', self.get_paths_details))
+        self.assertEqual(1, self.calls_count)
+        # Overwritten by the valid cache-file.
+        self.assertEqual(self.paths_details, extraction_cache.read(self.extraction_cache, key))
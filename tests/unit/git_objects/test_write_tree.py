@@ -0,0 +1,44 @@
+import pathlib
+import subprocess
+import tempfile
+import unittest
+
+import keep_ours_paths_merge_driver.git_objects as git_objects
+
+
+class TestGitObjectsWriteTree(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.repository = self.temp_dir.name
+        subprocess.run(['git', 'init', '-q', self.repository], check=True)
+        for path, content in [('pom.xml', 'root'), ('app/pom.xml', 'app'), ('app/lib/pom.xml', 'lib'),
+                              ('doc/README', 'doc')]:
+            pathlib.Path(self.repository, path).parent.mkdir(parents=True, exist_ok=True)
+            pathlib.Path(self.repository, path).write_text(content)
+        subprocess.run(['git', 'add', '-A'], cwd=self.repository, check=True)
+        subprocess.run(['git', '-c', 'user.name=test', '-c', 'user.email=test@localhost', 'commit', '-q', '-m', 'init'],
+                       cwd=self.repository, check=True)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_blobs_replaced_in_nested_trees(self):
+        oids = git_objects.write_blobs([b'prepared app', b'prepared lib'], self.repository)
+
+        tree = git_objects.write_tree('HEAD', {'app/pom.xml': ('100644', oids[0]),
+                                               'app/lib/pom.xml': ('100644', oids[1])}, self.repository)
+
+        expected_entries = dict(git_objects.ls_tree('HEAD', [], self.repository))
+        expected_entries.update({'app/pom.xml': ('100644', oids[0]), 'app/lib/pom.xml': ('100644', oids[1])})
+        self.assertEqual(expected_entries, git_objects.ls_tree(tree, [], self.repository))
+        self.assertEqual(b'prepared lib', git_objects.git(['cat-file', 'blob', f'{tree}:app/lib/pom.xml'],
+                                                          cwd=self.repository))
+        # The unchanged subtrees are kept as they are.
+        self.assertEqual(git_objects.git(['rev-parse', 'HEAD:doc'], cwd=self.repository),
+                         git_objects.git(['rev-parse', f'{tree}:doc'], cwd=self.repository))
+
+    def test_without_entries(self):
+        self.assertEqual([], git_objects.write_blobs([], self.repository))
+        self.assertEqual(git_objects.git(['rev-parse', 'HEAD^{tree}'], cwd=self.repository).decode().strip(),
+                         git_objects.write_tree('HEAD', {}, self.repository))
@@ -151,5 +151,60 @@ class TestJsonMergeDriverGetPreparedTheirsStr(unittest.TestCase):
         self.assertEqual(prepared_theirs_str_expected, prepared_theirs_str)
 
 
+    def test_parse_concurrently(self):
+        testfiles_base_path = 'tests/unit/resources/'
+        with open(testfiles_base_path + 'package_01_base.json') as f_base:
+            base_json_str = f_base.read()
+        with open(testfiles_base_path + 'package_01_ours.json') as f_ours:
+            ours_json_str = f_ours.read()
+        with open(testfiles_base_path + 'package_01_theirs.json') as f_theirs:
+            theirs_json_str = f_theirs.read()
+
+        import keep_ours_paths_merge_driver.json_merge_driver as json_merge_driver
+        json_merge_driver.set_paths_and_patterns([
+            {'merge_strategy': 'onconflict-ours', 'path': '$.version', 'pattern': None}])
+
+        with open(testfiles_base_path + 'package_01_theirs_expected_replace_only_no_merge.json') as f_expected:
+            prepared_theirs_str_expected = f_expected.read()
+
+        prepared_theirs_str = json_merge_driver.get_prepared_theirs_str(base_json_str, ours_json_str, theirs_json_str,
+                                                                        parse_concurrently=True)
+        self.assertEqual(prepared_theirs_str_expected, prepared_theirs_str)
+
+
+    def test_line_ranges(self):
+        import keep_ours_paths_merge_driver.json_merge_driver as json_merge_driver
+        json_merge_driver.set_paths_and_patterns([
+            {'merge_strategy': 'onconflict-ours', 'path': '$.version', 'pattern': None},
+            {'merge_strategy': 'onconflict-ours', 'path': '$.revision', 'pattern': None}])
+        json_strs = [f'{{\n  "version": "{version}",\n  "name": "app",\n  "revision": "{revision}"\n}}\n'
+                     for version, revision in [('1.0', 'r1'), ('1.1', 'r2'), ('2.0', 'r3')]]
+
+        # Only the revision is within the lines.
+        prepared_theirs_str = json_merge_driver.get_prepared_theirs_str(
+            *json_strs, line_ranges=([(4, 5)], [(4, 5)], [(4, 5)]))
+        self.assertEqual(json_strs[2].replace('r3', 'r2'), prepared_theirs_str)
+
+
+    def test_paths_details_cache(self):
+        import tempfile
+        import keep_ours_paths_merge_driver.extraction_cache as extraction_cache
+        import keep_ours_paths_merge_driver.json_merge_driver as json_merge_driver
+        json_merge_driver.set_paths_and_patterns([
+            {'merge_strategy': 'onconflict-ours', 'path': '$.version', 'pattern': None}])
+        json_strs = [f'{{\n  "version": "{version}",\n  "deps": {{"a": 1}}\n}}\n' for version in ['1.0', '1.1', '2.0']]
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            paths_details_cache = extraction_cache.get_extraction_cache(cache_dir, 'config', 1024 * 1024)
+            # The first call fills the cache, the second takes base and ours from it.
+            for _ in range(2):
+                prepared_theirs_str = json_merge_driver.get_prepared_theirs_str(
+                    *json_strs, paths_details_cache=paths_details_cache)
+                self.assertEqual(json_strs[2].replace('2.0', '1.1'), prepared_theirs_str)
+            cached = extraction_cache.read(paths_details_cache,
+                                           extraction_cache.get_key(paths_details_cache, 'json', json_strs[1].encode()))
+            self.assertEqual('1.1', cached['version']['value'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+import keep_ours_paths_merge_driver.json_paths as json_paths
+
+
+class TestJsonPathsCompilePath(unittest.TestCase):
+
+    def test_compile_supported_paths(self):
+        self.assertEqual(('version',), json_paths.compile_path('version'))
+        self.assertEqual(('version',), json_paths.compile_path('$.version'))
+        self.assertEqual((), json_paths.compile_path('$'))
+        self.assertEqual(('dependencies', json_paths.ANY_FIELD), json_paths.compile_path('dependencies.*'))
+        self.assertEqual(('dependencies', '@mycompany/app1-version'),
+                         json_paths.compile_path('$.dependencies."@mycompany/app1-version"'))
+        self.assertEqual(('dependencies', 'zone.js'), json_paths.compile_path("dependencies.'zone.js'"))
+        self.assertEqual(('dependencies', 'zone.js'), json_paths.compile_path('dependencies["zone.js"]'))
+        self.assertEqual(('files', 1, 'name'), json_paths.compile_path('files[1].name'))
+        self.assertEqual(('files', 1, 'name'), json_paths.compile_path('$."files".[1].name'))
+        self.assertEqual(('files', json_paths.ANY_INDEX), json_paths.compile_path('files[*]'))
+        # A quoted '*' is a field-name, not a wildcard.
+        self.assertEqual(('a', '*'), json_paths.compile_path('a."*"'))
+
+    def test_compile_unsupported_paths_raises_error(self):
+        for jpath in ['a..b', 'a.', '.a', 'a[-1]', 'a[0:2]', 'a[?(@.b)]', 'a.b,c', 'a.b|a.c', 'a[0]b']:
+            with self.assertRaises(json_paths.UnsupportedJsonPathError, msg=jpath):
+                json_paths.compile_path(jpath)
+
+
+if __name__ == '__main__':
+    unittest.main()
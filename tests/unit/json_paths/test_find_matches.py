@@ -0,0 +1,65 @@
+import json
+import unittest
+
+import keep_ours_paths_merge_driver.json_paths as json_paths
+
+
+class TestJsonPathsFindMatches(unittest.TestCase):
+
+    def test_find_matches_of_all_paths_in_one_walk(self):
+        testfiles_base_path = 'tests/unit/resources/'
+        with open(testfiles_base_path + 'package_02_theirs.json') as f_theirs:
+            json_doc = json.load(f_theirs)
+
+        compiled = json_paths.compile_paths_and_patterns([
+            {'merge_strategy': 'onconflict-ours', 'path': '$.version', 'pattern': None},
+            {'merge_strategy': 'onconflict-ours', 'path': 'dependencies.*', 'pattern': '@mycompany/.+'},
+            {'merge_strategy': 'onconflict-ours', 'path': 'dependencies."zone.js"', 'pattern': None},
+            {'merge_strategy': 'onconflict-ours', 'path': 'not.present', 'pattern': None}])
+
+        matches = json_paths.find_matches(compiled, json_doc)
+
+        self.assertEqual([(('version',), 'NEW_VALUE_ON_THEIRS')], matches[0])
+        # The pattern is not applied by find_matches().
+        self.assertEqual(7, len(matches[1]))
+        self.assertIn((('dependencies', '@mycompany/some-app1'), 'NEW_VALUE_ON_THEIRS'), matches[1])
+        self.assertEqual([(('dependencies', 'zone.js'), '~0.10.3')], matches[2])
+        self.assertEqual([], matches[3])
+
+    def test_find_matches_in_lists(self):
+        json_doc = {'files': [{'name': 'a'}, {'name': 'b'}], 'obj': {'name': 'c'}}
+
+        compiled = json_paths.compile_paths_and_patterns([
+            {'merge_strategy': 'onconflict-ours', 'path': 'files[*].name', 'pattern': None},
+            {'merge_strategy': 'onconflict-ours', 'path': 'files[1]', 'pattern': None},
+            {'merge_strategy': 'onconflict-ours', 'path': 'files[5]', 'pattern': None},
+            # The field-wildcard doesn't match list-items.
+            {'merge_strategy': 'onconflict-ours', 'path': 'files.*', 'pattern': None}])
+
+        matches = json_paths.find_matches(compiled, json_doc)
+
+        self.assertEqual([(('files', 0, 'name'), 'a'), (('files', 1, 'name'), 'b')], matches[0])
+        self.assertEqual([(('files', 1), {'name': 'b'})], matches[1])
+        self.assertEqual([], matches[2])
+        self.assertEqual([], matches[3])
+
+    def test_unsupported_path_falls_back_to_jsonpath_ng(self):
+        json_doc = {'files': [{'name': 'a'}, {'name': 'b'}]}
+
+        compiled = json_paths.compile_paths_and_patterns([
+            {'merge_strategy': 'onconflict-ours', 'path': '$..name', 'pattern': None}])
+
+        self.assertIsNone(compiled['paths_and_patterns'][0]['segments'])
+        matches = json_paths.find_matches(compiled, json_doc)
+        self.assertEqual([(('files', 0, 'name'), 'a'), (('files', 1, 'name'), 'b')], matches[0])
+
+    def test_format_key_path(self):
+        self.assertEqual('$', json_paths.format_key_path(()))
+        self.assertEqual('dependencies.@mycompany/app1',
+                         json_paths.format_key_path(('dependencies', '@mycompany/app1')))
+        self.assertEqual("dependencies.'zone.js'", json_paths.format_key_path(('dependencies', 'zone.js')))
+        self.assertEqual('files.[0].name', json_paths.format_key_path(('files', 0, 'name')))
+
+
+if __name__ == '__main__':
+    unittest.main()
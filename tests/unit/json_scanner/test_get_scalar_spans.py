@@ -0,0 +1,40 @@
+import unittest
+
+import keep_ours_paths_merge_driver.json_scanner as json_scanner
+
+
+class TestJsonScannerGetScalarSpans(unittest.TestCase):
+
+    def test_spans_cover_the_value_tokens(self):
+        testfiles_base_path = 'tests/unit/resources/'
+        with open(testfiles_base_path + 'package_02_theirs.json') as f_theirs:
+            theirs_json_str = f_theirs.read()
+
+        spans = json_scanner.get_scalar_spans(theirs_json_str, [
+            ('version',), ('dependencies', '@mycompany/some-app1'), ('private',), ('not-present',)])
+
+        def token_at(key_path):
+            start, end = spans[key_path]
+            return theirs_json_str[start:end]
+
+        self.assertEqual('"NEW_VALUE_ON_THEIRS"', token_at(('version',)))
+        self.assertEqual('"NEW_VALUE_ON_THEIRS"', token_at(('dependencies', '@mycompany/some-app1')))
+        self.assertEqual('true', token_at(('private',)))
+        self.assertNotIn(('not-present',), spans)
+
+    def test_spans_in_lists_and_of_non_scalars(self):
+        json_str = '{"a": [1, {"b": "x\\"y"}, [2.5e3]], "c": {"d": null}, "e": "\\u00e4"}'
+
+        spans = json_scanner.get_scalar_spans(json_str, [('a', 0), ('a', 1, 'b'), ('a', 2, 0), ('c',), ('e',)])
+
+        self.assertEqual('1', json_str[slice(*spans[('a', 0)])])
+        self.assertEqual('"x\\"y"', json_str[slice(*spans[('a', 1, 'b')])])
+        self.assertEqual('2.5e3', json_str[slice(*spans[('a', 2, 0)])])
+        # The token is taken as written, escapes are not resolved.
+        self.assertEqual('"\\u00e4"', json_str[slice(*spans[('e',)])])
+        # Objects and lists have no span.
+        self.assertNotIn(('c',), spans)
+
+
+if __name__ == '__main__':
+    unittest.main()
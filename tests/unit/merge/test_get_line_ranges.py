@@ -0,0 +1,31 @@
+import unittest
+
+import keep_ours_paths_merge_driver.merge as merge
+
+
+class TestMergeGetLineRanges(unittest.TestCase):
+
+    BASE = b'<p>\n<v>1</v>\n<w>1</w>\n<x>1</x>\n</p>\n'
+    OURS = b'<p>\n<v>2</v>\n<w>1</w>\n<x>1</x>\n</p>\n'
+    THEIRS = b'<p>\n<v>3</v>\n<w>1</w>\n<x>3</x>\n</p>\n'
+
+    def test_conflicts(self):
+        # The lines are 1-based.
+        self.assertEqual(([(2, 3)], [(2, 3)], [(2, 3)]),
+                         merge.get_line_ranges(self.BASE, self.OURS, self.THEIRS, False))
+
+    def test_with_changes_from_theirs(self):
+        self.assertEqual(([(2, 3), (4, 5)], [(2, 3), (4, 5)], [(2, 3), (4, 5)]),
+                         merge.get_line_ranges(self.BASE, self.OURS, self.THEIRS, True))
+
+    def test_adjacent_line_ranges_are_joined(self):
+        theirs = self.THEIRS.replace(b'<w>1</w>', b'<w>3</w>')
+
+        self.assertEqual(([(2, 5)], [(2, 5)], [(2, 5)]), merge.get_line_ranges(self.BASE, self.OURS, theirs, True))
+
+    def test_without_conflicts(self):
+        self.assertEqual(([], [], []), merge.get_line_ranges(self.BASE, self.OURS, self.BASE, True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+
+import keep_ours_paths_merge_driver.config as config
+import keep_ours_paths_merge_driver.merge as merge
+
+
+class TestMergePrepareTheirs(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.contents = [f'<project>\n<version>{version}</version>\n</project>\n'.encode()
+                         for version in ['1.0', '1.1', '2.0']]
+
+    def get_cl_args(self, options):
+        return config.init_argument_parser().parse_args(
+            ['-O', 'base', '-A', 'ours', '-B', 'theirs', '-p', './version'] + options)
+
+    def test_within_budgets(self):
+        prepared_theirs = merge.prepare_theirs(
+            self.get_cl_args(['--time-budget', '60', '--memory-budget', str(1024 * 1024 * 1024)]), None,
+            *self.contents)
+        self.assertEqual(self.contents[1], prepared_theirs)
+
+    def test_exceeding_a_budget_merges_unprepared(self):
+        # The value is repeated, so the fallback path by path has many trials.
+        contents = [content.replace(b'</project>', b'<a>2.0</a>' * 2000 + b'</project>') for content in self.contents]
+        with self.assertLogs(level='WARNING') as logs:
+            prepared_theirs = merge.prepare_theirs(self.get_cl_args(['--time-budget', '0.000001']), None, *contents)
+        self.assertIsNone(prepared_theirs)
+        self.assertIn('Abandoning the preparation, merging unprepared.', logs.output[-1])
@@ -0,0 +1,121 @@
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import keep_ours_paths_merge_driver.metrics as metrics
+import keep_ours_paths_merge_driver.utils as utils
+
+
+class TestMetricsStop(unittest.TestCase):
+
+    def tearDown(self) -> None:
+        metrics.stop()
+
+    def test_not_recording(self):
+        metrics.enter('parse base')
+        metrics.count(metrics.REPLACE_TOKEN_ATTEMPTS)
+        metrics.leave()
+        self.assertIsNone(metrics.stop())
+
+    def test_stages_and_paths(self):
+        metrics.start('/repo', 'pom.xml', 'XML', ['./version'])
+        metrics.enter('parse base')
+        time.sleep(0.02)
+        metrics.set_path('./version')
+        metrics.enter('detect', '/project/version')
+        metrics.enter('replace path by path', '/project/version')
+        for _ in range(3):
+            metrics.count(metrics.REPLACE_TOKEN_ATTEMPTS)
+        metrics.enter('merge-file')
+        record = metrics.stop(1)
+
+        self.assertEqual(['parse base', 'detect', 'replace path by path', 'merge-file'], list(record['stages']))
+        self.assertGreaterEqual(record['stages']['parse base'], 0.02)
+        self.assertEqual({'./version', '/project/version'}, set(record['paths']))
+        self.assertEqual(['parse base'], list(record['paths']['./version']))
+        self.assertEqual(3, record['paths']['/project/version'][metrics.REPLACE_TOKEN_ATTEMPTS])
+        self.assertEqual(1, record['returncode'])
+        self.assertGreaterEqual(record['seconds'], sum(record['stages'].values()))
+
+    def test_stage_shared_by_paths(self):
+        metrics.start('/repo', 'pom.xml', 'XML', ['./version', './revision'])
+        metrics.enter('detect', '/project/version', './version')
+        metrics.enter('detect', '/project/revision', './revision')
+        metrics.enter('replace', ['/project/version', '/project/revision'])
+        time.sleep(0.02)
+        record = metrics.stop()
+
+        self.assertEqual({'/project/version': './version', '/project/revision': './revision'},
+                         record['matched_paths'])
+        self.assertAlmostEqual(record['stages']['replace'] / 2, record['paths']['/project/version']['replace'])
+        self.assertAlmostEqual(record['stages']['replace'] / 2, record['paths']['/project/revision']['replace'])
+
+    def test_stages_on_threads(self):
+        metrics.start('/repo')
+        metrics.enter('pre-screen')
+
+        def parse(name):
+            metrics.enter(f'parse {name}')
+            time.sleep(0.05)
+
+        utils.map_concurrently(parse, ['base', 'ours', 'theirs'])
+        metrics.enter('detect')
+        record = metrics.stop()
+        for name in ['base', 'ours', 'theirs']:
+            self.assertGreaterEqual(record['stages'][f'parse {name}'], 0.05)
+        # The main thread has waited for the parses outside of a stage.
+        self.assertLess(record['stages']['pre-screen'], 0.05)
+
+    def test_write_jsonl_and_aggregate(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            metrics_filepath = os.path.join(temp_dir, 'metrics.jsonl')
+            for repository in ['/repo1', '/repo2', '/repo2']:
+                metrics.start(repository, 'pom.xml', 'XML', ['./version'])
+                metrics.enter('parse base')
+                metrics.set_path('./version')
+                metrics.enter('detect', '/project/version', './version')
+                time.sleep(0.01)
+                metrics.enter('replace path by path', '/project/version')
+                metrics.count(metrics.REPLACE_TOKEN_ATTEMPTS)
+                metrics.write(metrics.stop(0), metrics_filepath)
+            records = metrics.read_records([metrics_filepath])
+        self.assertEqual(3, len(records))
+        self.assertEqual(records[0], json.loads(json.dumps(records[0])))
+
+        aggregates = metrics.aggregate(records)
+        self.assertEqual({'/repo1': 1, '/repo2': 2},
+                         {name: row['calls'] for name, row in aggregates['repositories'].items()})
+        self.assertEqual(3, aggregates['stages']['detect']['calls'])
+        self.assertTrue(aggregates['paths']['./version']['configured'])
+        self.assertFalse(aggregates['paths']['/project/version']['configured'])
+        # The matched path is rolled up to its configured path.
+        self.assertEqual(3, aggregates['paths']['./version']['calls'])
+        self.assertEqual(3, aggregates['paths']['./version'][metrics.REPLACE_TOKEN_ATTEMPTS])
+        matched_seconds = aggregates['paths']['/project/version']['seconds']
+        self.assertGreaterEqual(matched_seconds, 0.03)
+        self.assertGreater(aggregates['paths']['./version']['seconds'], matched_seconds)
+
+        stream = io.StringIO()
+        metrics.print_stats(aggregates, stream=stream)
+        self.assertIn('Calls: 3;', stream.getvalue())
+        self.assertRegex(stream.getvalue(), r'configured  \./version')
+
+    def test_write_prometheus_textfile(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            metrics_filepath = os.path.join(temp_dir, 'kop.prom')
+            for _ in range(2):
+                metrics.start('/repo "1"')
+                metrics.enter('replace path by path', '/project/version')
+                metrics.count(metrics.REPLACE_TOKEN_ATTEMPTS)
+                metrics.write(metrics.stop(0), metrics_filepath)
+            with open(metrics_filepath) as f:
+                content = f.read()
+        self.assertIn('# TYPE kop_merge_driver_calls_total counter\n', content)
+        self.assertIn('kop_merge_driver_calls_total{repository="/repo \\"1\\""} 2', content)
+        self.assertIn('kop_merge_driver_replace_token_attempts_total{path="/project/version",'
+                      + 'repository="/repo \\"1\\""} 2', content)
+        self.assertIn('kop_merge_driver_path_seconds_total{path="/project/version",repository="/repo \\"1\\"",'
+                      + 'stage="replace path by path"} ', content)
@@ -0,0 +1,20 @@
+import unittest
+
+import keep_ours_paths_merge_driver.prescreen as prescreen
+
+
+class TestPrescreenGetShortcut(unittest.TestCase):
+
+    def test_shortcuts(self):
+        self.assertEqual('theirs equals ours', prescreen.get_shortcut(b'1', b'2', b'2', {'onconflict-ours'}))
+        self.assertEqual('theirs equals base', prescreen.get_shortcut('1', '2', '1', {'always-ours'}))
+        self.assertEqual('ours equals base', prescreen.get_shortcut(b'1', b'1', b'2', {'onconflict-ours'}))
+
+    def test_no_shortcut(self):
+        self.assertIsNone(prescreen.get_shortcut(b'1', b'2', b'3', {'onconflict-ours'}))
+        # always-ours reverts theirs' values to ours'.
+        self.assertIsNone(prescreen.get_shortcut(b'1', b'1', b'2', {'onconflict-ours', 'always-ours'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import unittest
+
+import keep_ours_paths_merge_driver.prescreen as prescreen
+import keep_ours_paths_merge_driver.xml_paths as xml_paths
+
+BASE_XML_BYTES = b'''<?xml version="1.0" encoding="UTF-8"?>
+<project xmlns="urn:x">
+  <version>1</version>
+  <properties>
+    <a.version>1</a.version>
+    <b.version/>
+  </properties>
+  <name>a</name>
+</project>
+'''
+DEPENDENCIES_XML_BYTES = b'''<?xml version="1.0" encoding="UTF-8"?>
+<project xmlns="urn:x">
+  <version>1</version>
+  <dependencies>
+    <dependency>
+      <groupId>g</groupId>
+      <artifactId>a</artifactId>
+      <version>1.0</version>
+    </dependency>
+    <dependency>
+      <groupId>h</groupId>
+      <artifactId>a</artifactId>
+      <version>1.0</version>
+    </dependency>
+  </dependencies>
+</project>
+'''
+UTF_8 = ['UTF-8'] * 3
+
+
+def compile_paths_and_patterns(*paths_and_patterns):
+    return xml_paths.compile_paths_and_patterns(
+        [{'merge_strategy': merge_strategy, 'path': path, 'pattern': pattern}
+         for merge_strategy, path, pattern in paths_and_patterns])
+
+
+class TestPrescreenGetXmlShortcut(unittest.TestCase):
+
+    def setUp(self):
+        self.compiled_paths_and_patterns = compile_paths_and_patterns(
+            ('onconflict-ours', './version', None), ('always-ours', './properties/*', r'.+\.version'))
+        self.ours_xml_bytes = BASE_XML_BYTES.replace(b'<version>1', b'<version>2')
+
+    def get_xml_shortcut(self, theirs_xml_bytes, encodings=UTF_8):
+        return prescreen.get_xml_shortcut(BASE_XML_BYTES, self.ours_xml_bytes, theirs_xml_bytes,
+                                          self.compiled_paths_and_patterns, encodings)
+
+    def test_one_change_without_values(self):
+        self.compiled_paths_and_patterns = compile_paths_and_patterns(
+            ('onconflict-ours', './version', None),
+            ('onconflict-ours', "./dependencies/dependency[groupId='g']/version", None))
+        self.ours_xml_bytes = DEPENDENCIES_XML_BYTES.replace(b'<version>1', b'<version>2')
+
+        self.assertEqual("theirs' values equal base's", prescreen.get_xml_shortcut(
+            DEPENDENCIES_XML_BYTES, self.ours_xml_bytes,
+            DEPENDENCIES_XML_BYTES.replace(b'<artifactId>a</artifactId>', b'<artifactId>b</artifactId>', 1),
+            self.compiled_paths_and_patterns, UTF_8))
+        self.assertEqual("theirs' values equal base's", prescreen.get_xml_shortcut(
+            DEPENDENCIES_XML_BYTES, self.ours_xml_bytes,
+            DEPENDENCIES_XML_BYTES.replace(b'<dependency>', b'<dependency scope="test">', 1),
+            self.compiled_paths_and_patterns, UTF_8))
+
+    def test_one_change_with_values(self):
+        self.compiled_paths_and_patterns = compile_paths_and_patterns(
+            ('onconflict-ours', './version', None),
+            ('onconflict-ours', "./dependencies/dependency[groupId='g']/version", None))
+        self.ours_xml_bytes = DEPENDENCIES_XML_BYTES.replace(b'<version>1', b'<version>2')
+
+        for theirs_xml_bytes in [
+                # The text of a path, of a key-child, and the tag-name.
+                DEPENDENCIES_XML_BYTES.replace(b'<version>1.0', b'<version>1.1'),
+                DEPENDENCIES_XML_BYTES.replace(b'<groupId>g', b'<groupId>i'),
+                DEPENDENCIES_XML_BYTES.replace(b'<artifactId>a</artifactId>', b'<artifact>a</artifact>', 1),
+                # The namespace, and an empty-element-tag instead of a start-tag.
+                DEPENDENCIES_XML_BYTES.replace(b'urn:x', b'urn:y'),
+                DEPENDENCIES_XML_BYTES.replace(b'<artifactId>a</artifactId>', b'<artifactId/>a<x/>', 1)]:
+            with self.subTest(theirs_xml_bytes=theirs_xml_bytes):
+                self.assertIsNone(prescreen.get_xml_shortcut(DEPENDENCIES_XML_BYTES, self.ours_xml_bytes,
+                                                             theirs_xml_bytes, self.compiled_paths_and_patterns,
+                                                             UTF_8))
+
+    def test_values_cant_differ(self):
+        theirs_xml_bytes = BASE_XML_BYTES.replace(b'<name>a', b'<name>b')
+
+        self.assertEqual("values can't differ", self.get_xml_shortcut(theirs_xml_bytes))
+        # The same texts, moved elsewhere.
+        self.assertEqual("values can't differ", self.get_xml_shortcut(
+            theirs_xml_bytes.replace(b'<version>1</version>', b'')
+            .replace(b'</project>', b'<version>1</version></project>')))
+        # Elements with children are ignored by the merge-driver.
+        self.assertEqual("values can't differ", self.get_xml_shortcut(
+            theirs_xml_bytes.replace(b'<version>1</version>', b'<version>3<!-- comment --></version>')))
+
+    def test_values_may_differ(self):
+        # A conflict on the onconflict-ours path.
+        self.assertIsNone(self.get_xml_shortcut(BASE_XML_BYTES.replace(b'<version>1', b'<version>3')))
+        # A change of theirs on the always-ours path.
+        self.assertIsNone(self.get_xml_shortcut(
+            BASE_XML_BYTES.replace(b'<name>a', b'<name>b').replace(b'<b.version/>', b'<b.version>2</b.version>')))
+
+    def test_union_paths(self):
+        theirs_xml_bytes = BASE_XML_BYTES.replace(b'<version>1', b'<version>3')
+
+        # A conflict on the tag-name of any branch of the union.
+        for path in ['./version|./foo', './foo|./version', './foo | ./version[1]', "./foo[@a='|']|./version"]:
+            self.compiled_paths_and_patterns = compile_paths_and_patterns(('onconflict-ours', path, None))
+            self.assertIsNone(self.get_xml_shortcut(theirs_xml_bytes), path)
+        self.compiled_paths_and_patterns = compile_paths_and_patterns(('onconflict-ours', './name|./foo', None))
+        self.assertEqual("values can't differ", self.get_xml_shortcut(theirs_xml_bytes))
+        # A branch of an unknown tag-name.
+        self.compiled_paths_and_patterns = compile_paths_and_patterns(('onconflict-ours', '(./name|./foo)', None))
+        self.assertIsNone(self.get_xml_shortcut(theirs_xml_bytes))
+
+    def test_gives_up(self):
+        theirs_xml_bytes = BASE_XML_BYTES.replace(b'<name>a', b'<name>b')
+
+        self.assertIsNone(self.get_xml_shortcut(theirs_xml_bytes.replace(b'<version>1', b'<version><![CDATA[1]]>')))
+        self.assertIsNone(self.get_xml_shortcut(
+            b'<!DOCTYPE project [<!ENTITY v "1">]>' + theirs_xml_bytes.replace(b'<version>1', b'<version>&v;')))
+        self.assertIsNone(self.get_xml_shortcut(theirs_xml_bytes, ['UTF-8', 'UTF-8', 'UTF-16']))
+        self.compiled_paths_and_patterns = compile_paths_and_patterns(('onconflict-ours', './version/.', None))
+        self.assertIsNone(self.get_xml_shortcut(theirs_xml_bytes))
+
+    def test_texts_in_different_encodings(self):
+        # The same bytes are different values in different encodings.
+        self.ours_xml_bytes = BASE_XML_BYTES.replace(b'<version>1', '<version>ä'.encode('UTF-8'))
+        theirs_xml_bytes = BASE_XML_BYTES.replace(b'UTF-8', b'ISO-8859-1') \
+            .replace(b'<version>1', '<version>ä'.encode('UTF-8'))
+
+        self.assertIsNone(self.get_xml_shortcut(theirs_xml_bytes, ['UTF-8', 'UTF-8', 'ISO-8859-1']))
+
+    def test_namespaced_names_match_any_pattern(self):
+        # The tag of an element in another namespace has the namespace, see xml_paths.get_tag_name().
+        self.compiled_paths_and_patterns = compile_paths_and_patterns(('always-ours', './properties/*', r'a\.version'))
+        self.ours_xml_bytes = BASE_XML_BYTES.replace(b'<b.version/>', b'<y:b xmlns:y="urn:y">1</y:b>')
+        theirs_xml_bytes = BASE_XML_BYTES.replace(b'<b.version/>', b'<y:b xmlns:y="urn:y">2</y:b>')
+
+        self.assertIsNone(self.get_xml_shortcut(theirs_xml_bytes))
+        self.assertIsNone(self.get_xml_shortcut(
+            theirs_xml_bytes.replace(b'<y:b xmlns:y="urn:y">2</y:b>', b'<b xmlns="urn:y">2</b>')))
+        # In the default namespace of the root-element, the tag doesn't match.
+        self.ours_xml_bytes = BASE_XML_BYTES.replace(b'<b.version/>', b'<b>1</b>')
+        self.assertEqual("values can't differ", self.get_xml_shortcut(
+            theirs_xml_bytes.replace(b'<y:b xmlns:y="urn:y">2</y:b>', b'<b>2</b>')))
+
+
+if __name__ == '__main__':
+    unittest.main()
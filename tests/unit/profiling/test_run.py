@@ -0,0 +1,86 @@
+import io
+import os
+import pstats
+import re
+import tempfile
+import time
+import unittest
+
+import keep_ours_paths_merge_driver.profiling as profiling
+
+
+def busy():
+    deadline = time.process_time() + 0.2
+    while time.process_time() < deadline:
+        pass
+    return 'merged'
+
+
+def merge_and_exit():
+    busy()
+    raise SystemExit(1)
+
+
+class TestProfilingRun(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.profile_dir = os.path.join(self.temp_dir.name, 'profiles')
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_get_dump_name(self):
+        self.assertRegex(profiling.get_dump_name(['-O', 'b', '-A', 'a', '-B', 't', '-P', 'module 1/pom.xml']),
+                         r'^\d{8}T\d{6}\.\d{3}-\d+-module_1_pom\.xml$')
+        self.assertTrue(profiling.get_dump_name(['--path=pom.xml']).endswith('-pom.xml'))
+        self.assertTrue(profiling.get_dump_name(['batch', 'manifest.jsonl']).endswith('-batch'))
+        self.assertTrue(profiling.get_dump_name(['-O', 'b']).endswith('-merge'))
+
+    def test_cprofile(self):
+        env = {profiling.PROFILE_DIR_ENV_VAR: self.profile_dir}
+        self.assertEqual('merged', profiling.run(busy, env, ['-P', 'pom.xml']))
+        filenames = os.listdir(self.profile_dir)
+        self.assertEqual(1, len(filenames))
+        self.assertTrue(filenames[0].endswith('-pom.xml.pstats'))
+        stats = pstats.Stats(os.path.join(self.profile_dir, filenames[0]), stream=io.StringIO())
+        self.assertIn('busy', [function for _, _, function in stats.stats])
+
+    def test_sampling_on_exit(self):
+        env = {profiling.PROFILE_DIR_ENV_VAR: self.profile_dir, profiling.PROFILE_MODE_ENV_VAR: profiling.MODE_SAMPLING}
+        with self.assertRaises(SystemExit):
+            profiling.run(merge_and_exit, env, ['-P', 'pom.xml'])
+        filenames = os.listdir(self.profile_dir)
+        self.assertEqual(1, len(filenames))
+        self.assertTrue(filenames[0].endswith('-pom.xml.stacks'))
+        stacks = profiling.read_collapsed(os.path.join(self.profile_dir, filenames[0]))
+        busy_samples = sum(count for stack, count in stacks.items()
+                           if re.search(r'merge_and_exit \(test_run\.py:\d+\);busy \(test_run\.py:\d+\)$', stack))
+        self.assertGreater(busy_samples, 0)
+
+    def test_main_merges_dumps(self):
+        env = {profiling.PROFILE_DIR_ENV_VAR: self.profile_dir}
+        profiling.run(busy, env, ['-P', 'pom.xml'])
+        profiling.run(busy, env, ['-P', 'module/pom.xml'])
+        env[profiling.PROFILE_MODE_ENV_VAR] = profiling.MODE_SAMPLING
+        profiling.run(busy, env, ['-P', 'pom.xml'])
+        profiling.run(busy, env, ['-P', 'module/pom.xml'])
+
+        report_filepath = os.path.join(self.temp_dir.name, 'report.txt')
+        self.assertEqual(0, profiling.main([self.profile_dir, '--sort', 'tottime', '--limit', '5',
+                                            '-o', report_filepath]))
+        with open(report_filepath) as f:
+            report = f.read()
+        self.assertIn('cProfile-dumps: 2', report)
+        self.assertIn('Sampling-dumps: 2', report)
+        self.assertRegex(report, r'busy \(test_run\.py:\d+\)')
+
+        collapsed_filepath = os.path.join(self.temp_dir.name, 'collapsed.txt')
+        self.assertEqual(0, profiling.main([self.profile_dir, '--format', 'collapsed', '-o', collapsed_filepath]))
+        merged_stacks = profiling.read_collapsed(collapsed_filepath)
+        _, stacks_filepaths = profiling.find_dumps([self.profile_dir])
+        self.assertEqual(sum(profiling.merge_collapsed(stacks_filepaths).values()), sum(merged_stacks.values()))
+
+    def test_get_function_samples(self):
+        stacks = {'main;merge;parse': 3, 'main;merge': 1, 'main;parse;parse': 2}
+        self.assertEqual({'main': [6, 0], 'merge': [4, 1], 'parse': [5, 5]}, profiling.get_function_samples(stacks))
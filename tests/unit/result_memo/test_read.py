@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+import keep_ours_paths_merge_driver.extraction_cache as extraction_cache
+import keep_ours_paths_merge_driver.result_memo as result_memo
+
+
+class TestResultMemoRead(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.memo = result_memo.get_result_memo(self.cache_dir.name, 'config', 1024 * 1024, 60)
+        self.triple = (b'<a>1</a>', b'<a>2</a>', b'<a>3</a>')
+
+    def tearDown(self) -> None:
+        self.cache_dir.cleanup()
+
+    def test_switched_off(self):
+        self.assertIsNone(result_memo.get_result_memo(None, 'config', 1024))
+        self.assertIsNone(result_memo.get_result_memo(self.cache_dir.name, 'config', 0))
+
+    def test_the_key_depends_on_the_config_the_scope_and_all_contents(self):
+        key = result_memo.get_key(self.memo, 'file', *self.triple)
+        other_config = result_memo.get_result_memo(self.cache_dir.name, 'other config', 1024)
+        self.assertEqual(key, result_memo.get_key(self.memo, 'file', *self.triple))
+        self.assertNotEqual(key, result_memo.get_key(other_config, 'file', *self.triple))
+        self.assertNotEqual(key, result_memo.get_key(self.memo, 'hunks', *self.triple))
+        self.assertNotEqual(key, result_memo.get_key(self.memo, 'file', b'<a>1</a>', b'<a>3</a>', b'<a>2</a>'))
+        # The contents are separated.
+        self.assertNotEqual(result_memo.get_key(self.memo, 'file', b'ab', b'c', b'd'),
+                            result_memo.get_key(self.memo, 'file', b'a', b'bc', b'd'))
+
+    def test_write_and_read(self):
+        for prepared_theirs in [b'<a>2</a>', None, self.triple[2]]:
+            with self.subTest(prepared_theirs=prepared_theirs):
+                key = result_memo.get_key(self.memo, 'file', *self.triple[:2], prepared_theirs or b'')
+                self.assertIsNone(result_memo.read(self.memo, key, self.triple[2]))
+
+                result_memo.write(self.memo, key, prepared_theirs, self.triple[2])
+
+                self.assertEqual({'prepared_theirs': prepared_theirs}, result_memo.read(self.memo, key, self.triple[2]))
+
+    def test_expires_by_age(self):
+        key = result_memo.get_key(self.memo, 'file', *self.triple)
+        result_memo.write(self.memo, key, b'<a>2</a>', self.triple[2])
+        extraction_cache.evict(self.memo)
+        self.assertIsNotNone(result_memo.read(self.memo, key, self.triple[2]))
+
+        cache_filepath = extraction_cache._get_cache_filepath(self.memo, key)
+        os.utime(cache_filepath, (os.path.getmtime(cache_filepath) - 61,) * 2)
+        self.assertEqual(1, extraction_cache.evict(self.memo))
+        self.assertIsNone(result_memo.read(self.memo, key, self.triple[2]))
+
+    def test_clear(self):
+        for i in range(3):
+            result_memo.write(self.memo, result_memo.get_key(self.memo, 'file', *self.triple[:2], str(i).encode()),
+                              None, b'')
+
+        self.assertEqual(3, result_memo.clear(self.memo['entries_dir']))
+        self.assertEqual([], extraction_cache.get_entries(self.memo['entries_dir']))
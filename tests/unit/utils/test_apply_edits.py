@@ -0,0 +1,31 @@
+import unittest
+
+import keep_ours_paths_merge_driver.utils as utils
+
+
+class TestUtilsApplyEdits(unittest.TestCase):
+
+    def test_apply_edits(self):
+        input_str = "aa bb cc aa bb cc"
+
+        self.assertEqual(input_str, utils.apply_edits(input_str, []))
+
+        # The offsets refer to the unedited string, regardless of the order of the edits and the lengths of the
+        # replacements.
+        replaced_str = utils.apply_edits(input_str, [(9, 11, 'xxxx'), (0, 2, 'x'), (6, 6, '-')])
+        self.assertEqual("x bb -cc xxxx bb cc", replaced_str)
+
+        replaced_str = utils.apply_edits(input_str, [(0, 17, '')])
+        self.assertEqual("", replaced_str)
+
+    def test_apply_edits_on_bytes(self):
+        replaced_bytes = utils.apply_edits('<a>ä</a><b>ö</b>'.encode(), [(3, 5, b'1'), (12, 14, b'2')])
+        self.assertEqual(b'<a>1</a><b>2</b>', replaced_bytes)
+
+    def test_apply_overlapping_edits_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            utils.apply_edits("aa bb cc", [(0, 4, 'x'), (3, 5, 'y')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+import keep_ours_paths_merge_driver.utils as utils
+
+
+class TestUtilsIsInLineRanges(unittest.TestCase):
+
+    def test_is_in_line_ranges(self):
+        line_ranges = [(2, 4), (7, 8)]
+
+        self.assertFalse(utils.is_in_line_ranges(1, 1, line_ranges))
+        self.assertTrue(utils.is_in_line_ranges(2, 2, line_ranges))
+        self.assertTrue(utils.is_in_line_ranges(3, 3, line_ranges))
+        self.assertFalse(utils.is_in_line_ranges(4, 6, line_ranges))
+        self.assertTrue(utils.is_in_line_ranges(7, 7, line_ranges))
+        self.assertFalse(utils.is_in_line_ranges(8, 8, line_ranges))
+
+        # An element spanning lines is within if any of its lines is.
+        self.assertTrue(utils.is_in_line_ranges(1, 2, line_ranges))
+        self.assertTrue(utils.is_in_line_ranges(3, 9, line_ranges))
+        self.assertTrue(utils.is_in_line_ranges(5, 7, line_ranges))
+
+        self.assertFalse(utils.is_in_line_ranges(1, 1, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
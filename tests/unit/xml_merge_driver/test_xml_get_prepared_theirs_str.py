@@ -1,4 +1,5 @@
 import unittest
+import unittest.mock
 
 
 class TestXmlMergeDriverGetPreparedTheirsStr(unittest.TestCase):
@@ -224,5 +225,168 @@ class TestXmlMergeDriverGetPreparedTheirsStr(unittest.TestCase):
         self.assertEqual(prepared_theirs_str_expected, prepared_theirs_str)
 
 
+    def test_keyed_path_with_dependency_inserted_in_theirs(self):
+        base_xml_str = '<project><dependencies>\n' \
+                       '<dependency><artifactId>lib-a</artifactId><version>1.0</version></dependency>\n' \
+                       '</dependencies></project>\n'
+        ours_xml_str = base_xml_str.replace('1.0', '1.1-ours')
+        # Theirs inserts a dependency before lib-a, so lib-a's position differs from Base and Ours.
+        theirs_xml_str = '<project><dependencies>\n' \
+                         '<dependency><artifactId>lib-0</artifactId><version>1.0</version></dependency>\n' \
+                         '<dependency><artifactId>lib-a</artifactId><version>1.2-theirs</version></dependency>\n' \
+                         '</dependencies></project>\n'
+        prepared_theirs_str_expected = theirs_xml_str.replace('1.2-theirs', '1.1-ours')
+
+        import keep_ours_paths_merge_driver.xml_merge_driver as xml_merge_driver
+        xml_merge_driver.set_paths_and_patterns([
+            {'merge_strategy': 'onconflict-ours', 'path': "./dependencies/dependency[artifactId='lib-a']/version",
+             'pattern': None}])
+
+        prepared_theirs_str = xml_merge_driver.get_prepared_theirs_str(base_xml_str, ours_xml_str, theirs_xml_str)
+        self.assertEqual(prepared_theirs_str_expected, prepared_theirs_str)
+
+    def test_parse_concurrently(self):
+        testfiles_base_path = 'tests/unit/resources/'
+        with open(testfiles_base_path + 'pom_03_base.xml') as f_base:
+            base_xml_str = f_base.read()
+        with open(testfiles_base_path + 'pom_03_ours.xml') as f_ours:
+            ours_xml_str = f_ours.read()
+        with open(testfiles_base_path + 'pom_03_theirs.xml') as f_theirs:
+            theirs_xml_str = f_theirs.read()
+
+        with open(testfiles_base_path + 'pom_03_theirs_expected_replace_only_no_merge.xml') as f_expected:
+            prepared_theirs_str_expected = f_expected.read()
+
+        import keep_ours_paths_merge_driver.xml_merge_driver as xml_merge_driver
+        xml_merge_driver.set_paths_and_patterns([
+            {'merge_strategy': 'onconflict-ours', 'path': './version', 'pattern': None},
+            {'merge_strategy': 'onconflict-ours', 'path': './properties/', 'pattern': 'some-app1.version'},
+            {'merge_strategy': 'onconflict-ours', 'path': './properties/', 'pattern': 'some-app2.version'}])
+
+        prepared_theirs_str = xml_merge_driver.get_prepared_theirs_str(base_xml_str, ours_xml_str, theirs_xml_str,
+                                                                       parse_concurrently=True)
+        self.assertEqual(prepared_theirs_str_expected, prepared_theirs_str)
+
+    def test_streaming_mode(self):
+        testfiles_base_path = 'tests/unit/resources/'
+        with open(testfiles_base_path + 'pom_03_base.xml') as f_base:
+            base_xml_str = f_base.read()
+        with open(testfiles_base_path + 'pom_03_ours.xml') as f_ours:
+            ours_xml_str = f_ours.read()
+        with open(testfiles_base_path + 'pom_03_theirs.xml') as f_theirs:
+            theirs_xml_str = f_theirs.read()
+
+        with open(testfiles_base_path + 'pom_03_theirs_expected_replace_only_no_merge.xml') as f_expected:
+            prepared_theirs_str_expected = f_expected.read()
+
+        import keep_ours_paths_merge_driver.xml_merge_driver as xml_merge_driver
+        xml_merge_driver.set_paths_and_patterns([
+            {'merge_strategy': 'onconflict-ours', 'path': './version', 'pattern': None},
+            {'merge_strategy': 'onconflict-ours', 'path': './properties/', 'pattern': 'some-app1.version'},
+            {'merge_strategy': 'onconflict-ours', 'path': './properties/', 'pattern': 'some-app2.version'}])
+
+        # All files are larger than the threshold.
+        with self.assertLogs(level='INFO') as logs:
+            prepared_theirs_str = xml_merge_driver.get_prepared_theirs_str(base_xml_str, ours_xml_str,
+                                                                           theirs_xml_str, streaming_threshold=0)
+        self.assertEqual(prepared_theirs_str_expected, prepared_theirs_str)
+        self.assertIn('streaming-mode', '\n'.join(logs.output))
+
+    def test_line_ranges(self):
+        import keep_ours_paths_merge_driver.xml_merge_driver as xml_merge_driver
+        xml_merge_driver.set_paths_and_patterns([
+            {'merge_strategy': 'onconflict-ours', 'path': './version', 'pattern': None},
+            {'merge_strategy': 'onconflict-ours', 'path': './revision', 'pattern': None}])
+        xml_strs = [f'<project>\n<version>{version}</version>\n<name>app</name>\n<revision>{revision}</revision>\n'
+                    + '</project>\n' for version, revision in [('1.0', 'r1'), ('1.1', 'r2'), ('2.0', 'r3')]]
+
+        for streaming_threshold in [-1, 0]:
+            with self.subTest(streaming_threshold=streaming_threshold):
+                # Only the version is within the lines.
+                prepared_theirs_str = xml_merge_driver.get_prepared_theirs_str(
+                    *xml_strs, streaming_threshold=streaming_threshold, line_ranges=([(2, 3)], [(2, 3)], [(2, 3)]))
+                self.assertEqual(xml_strs[2].replace('2.0', '1.1'), prepared_theirs_str)
+
+    def test_line_ranges_with_streaming_mode_failing(self):
+        import keep_ours_paths_merge_driver.xml_merge_driver as xml_merge_driver
+        xml_merge_driver.set_paths_and_patterns([
+            {'merge_strategy': 'onconflict-ours', 'path': './version', 'pattern': None},
+            {'merge_strategy': 'onconflict-ours', 'path': './revision', 'pattern': None}])
+        xml_strs = [f'<project>\n<version>{version}</version>\n<name>app</name>\n<revision>{revision}</revision>\n'
+                    + '</project>\n' for version, revision in [('1.0', 'r1'), ('1.1', 'r2'), ('2.0', 'r3')]]
+
+        # The fallback to the in-memory-mode keeps the line-ranges. Only the version is within the lines.
+        with unittest.mock.patch.object(xml_merge_driver, '_get_prepared_theirs_bytes_by_streaming',
+                                        return_value=None) as streaming_mock, \
+                self.assertLogs(level='INFO') as logs:
+            prepared_theirs_str = xml_merge_driver.get_prepared_theirs_str(
+                *xml_strs, streaming_threshold=0, line_ranges=([(2, 3)], [(2, 3)], [(2, 3)]))
+        self.assertEqual(xml_strs[2].replace('2.0', '1.1'), prepared_theirs_str)
+        streaming_mock.assert_called_once()
+        self.assertIn('Falling back to the in-memory-mode', '\n'.join(logs.output))
+
+    def test_bytes_in_declared_encoding(self):
+        import keep_ours_paths_merge_driver.xml_merge_driver as xml_merge_driver
+        xml_merge_driver.set_paths_and_patterns([
+            {'merge_strategy': 'onconflict-ours', 'path': './version', 'pattern': None}])
+
+        for encoding, ours_version in [('ISO-8859-1', '1.1-\u00e4'), ('UTF-16', '1.1-\u00e4\u65e5'),
+                                       ('Shift_JIS', '1.1-\u65e5\u672c')]:
+            xml_strs = [f'<?xml version="1.0" encoding="{encoding}"?>\n'
+                        + f'<project><name>\u540d-\u00e9</name><version>{version}</version></project>\n'
+                        for version in ['1.0', ours_version, '2.0']]
+            if encoding == 'Shift_JIS':
+                xml_strs = [xml_str.replace('-\u00e9', '') for xml_str in xml_strs]
+            elif encoding == 'ISO-8859-1':
+                xml_strs = [xml_str.replace('\u540d-', '') for xml_str in xml_strs]
+            for streaming_threshold in [-1, 0]:
+                with self.subTest(encoding=encoding, streaming_threshold=streaming_threshold):
+                    prepared_theirs_bytes = xml_merge_driver.get_prepared_theirs_bytes(
+                        *(xml_str.encode(encoding) for xml_str in xml_strs), streaming_threshold=streaming_threshold)
+                    self.assertEqual(xml_strs[1].encode(encoding), prepared_theirs_bytes)
+
+    def test_bytes_with_ours_in_another_encoding(self):
+        import keep_ours_paths_merge_driver.xml_merge_driver as xml_merge_driver
+        xml_merge_driver.set_paths_and_patterns([
+            {'merge_strategy': 'onconflict-ours', 'path': './version', 'pattern': None}])
+
+        base_xml_bytes = b'<?xml version="1.0"?>\n<project><version>1.0</version></project>\n'
+        ours_xml_bytes = '<?xml version="1.0"?>\n<project><version>1.1-\u00e4\u20ac</version></project>\n'.encode()
+        theirs_xml_bytes = b'<?xml version="1.0" encoding="ISO-8859-1"?>\n<project><version>2.0</version></project>\n'
+
+        prepared_theirs_bytes = xml_merge_driver.get_prepared_theirs_bytes(base_xml_bytes, ours_xml_bytes,
+                                                                           theirs_xml_bytes)
+        # Theirs keeps its encoding. The euro-sign isn't in ISO-8859-1, so it becomes a character-reference.
+        self.assertEqual(b'<?xml version="1.0" encoding="ISO-8859-1"?>\n'
+                         + b'<project><version>1.1-\xe4&#8364;</version></project>\n', prepared_theirs_bytes)
+
+
+    def test_paths_details_cache(self):
+        import tempfile
+        import keep_ours_paths_merge_driver.extraction_cache as extraction_cache
+        import keep_ours_paths_merge_driver.xml_merge_driver as xml_merge_driver
+        xml_merge_driver.set_paths_and_patterns([
+            {'merge_strategy': 'onconflict-ours', 'path': './version', 'pattern': None}])
+        xml_strs = [f'<project>\n<version>{version}</version>\n</project>\n' for version in ['1.0', '1.1', '2.0']]
+
+        for streaming_threshold in [-1, 0]:
+            with self.subTest(streaming_threshold=streaming_threshold), tempfile.TemporaryDirectory() as cache_dir:
+                paths_details_cache = extraction_cache.get_extraction_cache(cache_dir, 'config', 1024 * 1024)
+                # The first call fills the cache, the second takes base and ours from it.
+                for _ in range(2):
+                    prepared_theirs_str = xml_merge_driver.get_prepared_theirs_str(
+                        *xml_strs, streaming_threshold=streaming_threshold, paths_details_cache=paths_details_cache)
+                    self.assertEqual(xml_strs[2].replace('2.0', '1.1'), prepared_theirs_str)
+                mode = 'xml-streaming' if streaming_threshold == 0 else 'xml'
+                for xml_str in xml_strs[:2]:
+                    key = extraction_cache.get_key(paths_details_cache, mode, xml_str.encode())
+                    cached = extraction_cache.read(paths_details_cache, key)
+                    self.assertEqual(['/project/version'], list(cached))
+                # Theirs' elements are replaced, so in the in-memory-mode theirs isn't cached.
+                self.assertEqual(streaming_threshold == 0, extraction_cache.read(
+                    paths_details_cache, extraction_cache.get_key(paths_details_cache, mode, xml_strs[2].encode()))
+                                 is not None)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+
+from lxml import etree
+
+import keep_ours_paths_merge_driver.xml_paths as xml_paths
+
+
+class TestXmlPathsCompilePathsAndPatterns(unittest.TestCase):
+
+    def test_compiled_paths_find_the_same_elements_as_findall(self):
+        testfiles_base_path = 'tests/unit/resources/'
+        with open(testfiles_base_path + '01_theirs.xml', 'rb') as f_theirs:
+            xml_doc = etree.fromstring(f_theirs.read())
+
+        paths = ['./b2', './b4/c2', './b4/c4/d[2]', './b4/c4/', './b4/c4/d[last()]', ".//*[@attr1='da.1_attr']"]
+        compiled_paths_and_patterns = xml_paths.compile_paths_and_patterns(
+            [{'merge_strategy': 'onconflict-ours', 'path': path, 'pattern': None} for path in paths])
+
+        for path, compiled_path_and_pattern in zip(paths, compiled_paths_and_patterns):
+            self.assertIsNotNone(compiled_path_and_pattern['xpath'])
+            self.assertEqual(xml_doc.findall(path),
+                             [element for element, _ in xml_paths.find_elements(xml_doc, compiled_path_and_pattern)])
+
+    def test_pattern_filters_the_tags(self):
+        xml_doc = etree.fromstring(b'<a><b><c1>1</c1><c2>2</c2><d>3</d></b></a>')
+
+        compiled_paths_and_patterns = xml_paths.compile_paths_and_patterns(
+            [{'merge_strategy': 'onconflict-ours', 'path': './b/', 'pattern': 'c[0-9]'}])
+
+        elements_and_identities = xml_paths.find_elements(xml_doc, compiled_paths_and_patterns[0])
+        self.assertEqual(['c1', 'c2'], [element.tag for element, _ in elements_and_identities])
+
+    def test_elementpath_only_syntax_falls_back_to_findall(self):
+        xml_doc = etree.fromstring(b'<a xmlns="urn:x"><b>1</b></a>')
+
+        compiled_paths_and_patterns = xml_paths.compile_paths_and_patterns(
+            [{'merge_strategy': 'onconflict-ours', 'path': './{*}b', 'pattern': ''}])
+
+        self.assertIsNone(compiled_paths_and_patterns[0]['xpath'])
+        elements_and_identities = xml_paths.find_elements(xml_doc, compiled_paths_and_patterns[0])
+        self.assertEqual(['1'], [element.text for element, _ in elements_and_identities])
+
+    def test_paths_on_document_with_default_namespace(self):
+        xml_doc = etree.fromstring(
+            b'<p xmlns="urn:p" xmlns:x="urn:x"><deps>'
+            b'<dep><g>x</g><v>1.0</v></dep>'
+            b'<dep><g>y</g><v>2.0</v><x:v>3.0</x:v></dep>'
+            b'</deps></p>')
+
+        paths = ['./deps/dep/v', '/p/deps/dep[2]/x:v', "./deps/dep[g='y']/v", './deps/dep[v="1.0"]/g', './deps/dep[2]/']
+        compiled_paths_and_patterns = xml_paths.compile_paths_and_patterns(
+            [{'merge_strategy': 'onconflict-ours', 'path': path, 'pattern': None} for path in paths])
+
+        # The unprefixed names refer to the default namespace, the document is parsed as it is.
+        namespaces = {None: 'urn:p', 'x': 'urn:x'}
+        expected = [['1.0', '2.0'], ['3.0'], ['2.0'], ['x'], ['y', '2.0', '3.0']]
+        keyed_indexes = {}
+        for compiled_path_and_pattern, expected_texts in zip(compiled_paths_and_patterns, expected):
+            elements_and_identities = xml_paths.find_elements(xml_doc, compiled_path_and_pattern, keyed_indexes)
+            self.assertEqual(expected_texts, [element.text for element, _ in elements_and_identities])
+            self.assertEqual(elements_and_identities, xml_paths.find_elements(
+                xml_doc, compiled_path_and_pattern, keyed_indexes, namespaces))
+        self.assertEqual("/p/deps/dep[g='y']/v",
+                         xml_paths.find_elements(xml_doc, compiled_paths_and_patterns[2], keyed_indexes)[0][1])
+
+    def test_pattern_filters_the_tags_without_default_namespace(self):
+        xml_doc = etree.fromstring(b'<a xmlns="urn:a"><b><c1>1</c1><c2>2</c2><d>3</d></b></a>')
+
+        compiled_paths_and_patterns = xml_paths.compile_paths_and_patterns(
+            [{'merge_strategy': 'onconflict-ours', 'path': './b/', 'pattern': 'c[0-9]$'}])
+
+        elements_and_identities = xml_paths.find_elements(xml_doc, compiled_paths_and_patterns[0])
+        self.assertEqual(['1', '2'], [element.text for element, _ in elements_and_identities])
+
+    def test_keyed_paths_find_the_same_elements_as_findall(self):
+        xml_doc = etree.fromstring(
+            b'<p><deps>'
+            b'<dep><g>x</g><a>1</a><v>1.0</v></dep>'
+            b'<dep><g>x</g><a>2</a><v>2.0</v></dep>'
+            b'<dep><g>y</g><a>1</a><v>3.0</v></dep>'
+            b'</deps></p>')
+
+        paths = ["./deps/dep[g='x'][a='2']/v", './deps/dep[g="y"][a="1"]', "./deps/dep[g='x']/", "./deps/dep[g='z']/v"]
+        compiled_paths_and_patterns = xml_paths.compile_paths_and_patterns(
+            [{'merge_strategy': 'onconflict-ours', 'path': path, 'pattern': None} for path in paths])
+
+        keyed_indexes = {}
+        for path, compiled_path_and_pattern in zip(paths, compiled_paths_and_patterns):
+            self.assertIsNotNone(compiled_path_and_pattern['keyed'])
+            elements_and_identities = xml_paths.find_elements(xml_doc, compiled_path_and_pattern, keyed_indexes)
+            self.assertEqual(xml_doc.findall(path), [element for element, _ in elements_and_identities])
+        # The paths on ./deps/dep with key g share the index.
+        self.assertEqual(2, len(keyed_indexes))
+
+    def test_keyed_paths_identify_elements_by_key(self):
+        xml_doc = etree.fromstring(
+            b'<p><deps><dep><g>y</g><v>0.1</v></dep><dep><g>x</g><v>1.0</v></dep></deps></p>')
+
+        compiled_paths_and_patterns = xml_paths.compile_paths_and_patterns(
+            [{'merge_strategy': 'onconflict-ours', 'path': "./deps/dep[g='x']/v", 'pattern': None}])
+
+        elements_and_identities = xml_paths.find_elements(xml_doc, compiled_paths_and_patterns[0], {})
+        # The identity doesn't depend on the position of the dependency.
+        self.assertEqual([("/p/deps/dep[g='x']/v", '1.0')],
+                         [(identity, element.text) for element, identity in elements_and_identities])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from lxml import etree
+
+import keep_ours_paths_merge_driver.xml_paths as xml_paths
+import keep_ours_paths_merge_driver.xml_text_spans as xml_text_spans
+
+
+class TestXmlPathsGetPath(unittest.TestCase):
+
+    def test_same_as_getpath_without_default_namespace(self):
+        xml_doc = etree.fromstring(b'<a><b/><c><d>1</d><d>2</d></c><b/></a>')
+        xml_doc_tree = etree.ElementTree(xml_doc)
+
+        for element in xml_doc.iter():
+            self.assertEqual(xml_doc_tree.getpath(element), xml_paths.get_path(xml_doc_tree, element, {}))
+
+    def test_without_default_namespace(self):
+        xml_bytes = b'<a xmlns="urn:a" xmlns:x="urn:x"><b/><c><d>1</d><x:d>2</x:d><d>3</d></c></a>'
+        xml_doc = etree.fromstring(xml_bytes)
+        xml_doc_tree = etree.ElementTree(xml_doc)
+        namespaces = xml_paths.get_namespaces(xml_doc)
+
+        self.assertEqual(['/a', '/a/b', '/a/c', '/a/c/d[1]', '/a/c/x:d', '/a/c/d[2]'],
+                         [xml_paths.get_path(xml_doc_tree, element, namespaces) for element in xml_doc.iter()])
+        # The same as the locations of the text-spans. The empty-element-tag '<b/>' has no span.
+        self.assertEqual({'/a/c/d[1]', '/a/c/x:d', '/a/c/d[2]'}, set(xml_text_spans.get_leaf_text_spans(xml_bytes)))
+        self.assertEqual('d', xml_paths.get_tag_name(xml_doc[1][0].tag, namespaces))
+        self.assertEqual('{urn:x}d', xml_paths.get_tag_name(xml_doc[1][1].tag, namespaces))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import marshal
+import unittest
+
+from lxml import etree
+
+import keep_ours_paths_merge_driver.xml_paths as xml_paths
+
+
+class TestXmlPathsLoadCompiledPathsAndPatterns(unittest.TestCase):
+
+    def test_dumped_paths_are_plain_data_and_load_the_same(self):
+        xml_doc = etree.fromstring(
+            b'<a><b>1</b><deps><dep><id>x</id><v>1</v></dep><dep><id>y</id><v>2</v></dep></deps><c1>3</c1></a>')
+        paths_and_patterns = [
+            {'merge_strategy': 'onconflict-ours', 'path': './b', 'pattern': None},
+            {'merge_strategy': 'always-ours', 'path': "./deps/dep[id='y']/v", 'pattern': None},
+            {'merge_strategy': 'onconflict-ours', 'path': './', 'pattern': 'c[0-9]'},
+            {'merge_strategy': 'onconflict-ours', 'path': './{*}b', 'pattern': None}]
+        compiled_paths_and_patterns = xml_paths.compile_paths_and_patterns(paths_and_patterns)
+
+        dumped = xml_paths.dump_compiled_paths_and_patterns(compiled_paths_and_patterns)
+        # Fails for other than plain data.
+        loaded = xml_paths.load_compiled_paths_and_patterns(marshal.loads(marshal.dumps(dumped)))
+
+        for compiled_path_and_pattern, loaded_path_and_pattern in zip(compiled_paths_and_patterns, loaded):
+            self.assertEqual(xml_paths.find_elements(xml_doc, compiled_path_and_pattern),
+                             xml_paths.find_elements(xml_doc, loaded_path_and_pattern))
+        self.assertEqual(dumped, xml_paths.dump_compiled_paths_and_patterns(loaded))
@@ -0,0 +1,74 @@
+import unittest
+
+from lxml import etree
+
+import keep_ours_paths_merge_driver.xml_merge_driver as xml_merge_driver
+import keep_ours_paths_merge_driver.xml_paths as xml_paths
+import keep_ours_paths_merge_driver.xml_streaming as xml_streaming
+
+
+class TestXmlStreamingGetPathsDetails(unittest.TestCase):
+
+    def assert_same_details_as_in_memory(self, xml_str, paths):
+        compiled_paths_and_patterns = xml_paths.compile_paths_and_patterns(
+            [{'merge_strategy': 'onconflict-ours', 'path': path, 'pattern': None} for path in paths])
+        self.assertTrue(xml_streaming.is_streamable(compiled_paths_and_patterns))
+
+        xml_doc = etree.fromstring(xml_str.encode())
+        paths_details = xml_merge_driver._get_paths_details(xml_doc, compiled_paths_and_patterns)
+        streamed_paths_details = xml_streaming.get_paths_details(xml_str.encode(), compiled_paths_and_patterns)
+
+        self.assertEqual(
+            {path: {key: value for key, value in details.items() if key != 'tag_object'}
+             for path, details in paths_details.items()},
+            {path: {key: value for key, value in details.items() if key != 'ordinal'}
+             for path, details in streamed_paths_details.items()})
+        return streamed_paths_details
+
+    def test_same_details_as_in_memory(self):
+        testfiles_base_path = 'tests/unit/resources/'
+        for filename in ['01_theirs.xml', 'pom_01_theirs.xml', 'pom_03_theirs.xml', 'pom_31_theirs.xml']:
+            with open(testfiles_base_path + filename) as f:
+                xml_str = f.read()
+            for paths in [['./version'], ['./version', './properties/'], ['/project/*/version', './b4/c4/'],
+                          ['.'], ['./*/']]:
+                with self.subTest(filename=filename, paths=paths):
+                    self.assert_same_details_as_in_memory(xml_str, paths)
+
+    def test_keyed_paths(self):
+        xml_str = '<project xmlns="urn:x"><dependencies>\n' \
+                  '<dependency><artifactId>lib-a</artifactId><version>1.0</version></dependency>\n' \
+                  '<dependency><artifactId>lib-<!-- c -->b</artifactId><version>2.0</version></dependency>\n' \
+                  '<dependency><artifactId>lib-a</artifactId><version>3.0</version></dependency>\n' \
+                  '</dependencies></project>\n'
+
+        paths_details = self.assert_same_details_as_in_memory(
+            xml_str, ["./dependencies/dependency[artifactId='lib-b']/version",
+                      "./dependencies/dependency[artifactId='lib-a']/version",
+                      "./dependencies/dependency[artifactId='lib-b']"])
+
+        self.assertEqual('2.0', paths_details["/project/dependencies/dependency[artifactId='lib-b']/version"]['value'])
+        self.assertEqual('3.0',
+                         paths_details["/project/dependencies/dependency[artifactId='lib-a'][2]/version"]['value'])
+        self.assertFalse(paths_details["/project/dependencies/dependency[artifactId='lib-b']"]['is_leaf'])
+
+    def test_ordinals_are_the_positions_in_document_order(self):
+        compiled_paths_and_patterns = xml_paths.compile_paths_and_patterns(
+            [{'merge_strategy': 'onconflict-ours', 'path': './b/', 'pattern': 'c[0-9]'}])
+
+        paths_details = xml_streaming.get_paths_details(b'<a><x/><b><c1>1</c1><d/><c2>2</c2></b></a>',
+                                                        compiled_paths_and_patterns)
+
+        self.assertEqual({'/a/b/c1': 3, '/a/b/c2': 5},
+                         {path: details['ordinal'] for path, details in paths_details.items()})
+
+    def test_paths_not_streamable(self):
+        for path in ['//version', './modules/module[2]', './{*}version', './@id', "./a[b='1']//c"]:
+            with self.subTest(path=path):
+                compiled_paths_and_patterns = xml_paths.compile_paths_and_patterns(
+                    [{'merge_strategy': 'onconflict-ours', 'path': path, 'pattern': None}])
+                self.assertFalse(xml_streaming.is_streamable(compiled_paths_and_patterns))
+
+
+if __name__ == '__main__':
+    unittest.main()
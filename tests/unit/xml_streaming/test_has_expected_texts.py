@@ -0,0 +1,22 @@
+import unittest
+
+import keep_ours_paths_merge_driver.xml_streaming as xml_streaming
+
+
+class TestXmlStreamingHasExpectedTexts(unittest.TestCase):
+
+    def test_expected_texts(self):
+        self.assertTrue(xml_streaming.has_expected_texts(b'<a><b>1</b><c>x&amp;y</c></a>', {1: '1', 2: 'x&y'}))
+
+    def test_unexpected_text(self):
+        self.assertFalse(xml_streaming.has_expected_texts(b'<a><b>1</b><c>2</c></a>', {2: '1'}))
+
+    def test_markup_brought_in(self):
+        self.assertFalse(xml_streaming.has_expected_texts(b'<a><b>1<!-- c --></b></a>', {1: '1'}))
+
+    def test_not_well_formed(self):
+        self.assertFalse(xml_streaming.has_expected_texts(b'<a><b>&undefined;</b></a>', {1: ''}))
+
+
+if __name__ == '__main__':
+    unittest.main()
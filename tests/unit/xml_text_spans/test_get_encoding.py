@@ -0,0 +1,28 @@
+import codecs
+import unittest
+
+import keep_ours_paths_merge_driver.xml_text_spans as xml_text_spans
+
+
+class TestXmlTextSpansGetEncoding(unittest.TestCase):
+
+    def test_declared_encoding(self):
+        self.assertEqual('iso8859-1', xml_text_spans.get_encoding(
+            b'<?xml version="1.0" encoding="ISO-8859-1"?>\n<a/>'))
+        self.assertEqual('cp1252', xml_text_spans.get_encoding(b"<?xml version='1.0' encoding='windows-1252'?><a/>"))
+        self.assertEqual('utf-8', xml_text_spans.get_encoding(codecs.BOM_UTF8 + b'<?xml version="1.0"?><a/>'))
+
+    def test_utf_16(self):
+        xml_str = '<?xml version="1.0" encoding="UTF-16"?><a/>'
+        self.assertEqual('utf-16-le', xml_text_spans.get_encoding(codecs.BOM_UTF16_LE + xml_str.encode('utf-16-le')))
+        self.assertEqual('utf-16-be', xml_text_spans.get_encoding(codecs.BOM_UTF16_BE + xml_str.encode('utf-16-be')))
+        # Without BOM, the byte-order is given by the first character '<'.
+        self.assertEqual('utf-16-be', xml_text_spans.get_encoding(xml_str.encode('utf-16-be')))
+
+    def test_default_is_utf_8(self):
+        self.assertEqual('utf-8', xml_text_spans.get_encoding(b'<a>\xc3\xa4</a>'))
+        self.assertEqual('utf-8', xml_text_spans.get_encoding(b''))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+import keep_ours_paths_merge_driver.xml_text_spans as xml_text_spans
+
+
+class TestXmlTextSpansGetLeafTextSpans(unittest.TestCase):
+
+    def test_spans_cover_the_leaf_texts(self):
+        testfiles_base_path = 'tests/unit/resources/'
+        with open(testfiles_base_path + '01_theirs.xml') as f_theirs:
+            theirs_xml_bytes = f_theirs.read().encode()
+
+        spans = xml_text_spans.get_leaf_text_spans(theirs_xml_bytes)
+
+        def text_at(path):
+            start, end = spans[path]
+            return theirs_xml_bytes[start:end].decode()
+
+        self.assertEqual('b1_value', text_at('/a1/b1'))
+        self.assertEqual('c1_value_THEIRS', text_at('/a1/b4/c2'))
+        # Siblings having the same tag are indexed 1-based, like lxml's getpath() does.
+        self.assertEqual('d[2]_value_THEIRS', text_at('/a1/b4/c4/d[2]'))
+        self.assertEqual('da_value', text_at('/a1/b4/c4/da'))
+        # Non-leaf-nodes have no span.
+        self.assertNotIn('/a1/b4', spans)
+        self.assertNotIn('/a1/b4/c4', spans)
+
+    def test_spans_of_special_texts(self):
+        xml_bytes = '<a><b>ä&amp;ö</b><c><![CDATA[<x>]]></c><d></d><e/><f><!-- comment -->f</f></a>'.encode()
+
+        spans = xml_text_spans.get_leaf_text_spans(xml_bytes)
+
+        # The spans are byte-offsets. The span includes references and CDATA-sections as they are in the document.
+        self.assertEqual('ä&amp;ö'.encode(), xml_bytes[spans['/a/b'][0]:spans['/a/b'][1]])
+        self.assertEqual(b'<![CDATA[<x>]]>', xml_bytes[spans['/a/c'][0]:spans['/a/c'][1]])
+        # An empty element has an empty span right before its end-tag.
+        self.assertEqual(xml_bytes.index(b'</d>'), spans['/a/d'][0])
+        self.assertEqual(spans['/a/d'][0], spans['/a/d'][1])
+        # An empty-element-tag has no span.
+        self.assertNotIn('/a/e', spans)
+        # An element with a comment is not a leaf.
+        self.assertNotIn('/a/f', spans)
+
+    def test_value_repeated_in_document(self):
+        xml_bytes = b'<a><b>1.0</b><c>1.0</c><d><b>1.0</b><b>1.0</b></d></a>'
+
+        spans = xml_text_spans.get_leaf_text_spans(xml_bytes)
+
+        self.assertEqual((6, 9), spans['/a/b'])
+        self.assertEqual((16, 19), spans['/a/c'])
+        self.assertEqual((29, 32), spans['/a/d/b[1]'])
+        self.assertEqual((39, 42), spans['/a/d/b[2]'])
+
+    def test_spans_by_ordinals(self):
+        xml_bytes = b'<a><b>1.0</b><c>1.0</c><d><b>1.0</b><b>1.0</b></d></a>'
+
+        # The ordinal 3 is the non-leaf d, it has no span.
+        spans = xml_text_spans.get_leaf_text_spans(xml_bytes, {1, 3, 5})
+
+        self.assertEqual({1: (6, 9), 5: (39, 42)}, spans)
+
+
+if __name__ == '__main__':
+    unittest.main()